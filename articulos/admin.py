@@ -41,6 +41,16 @@ class StockArticuloAdmin(admin.ModelAdmin):
     readonly_fields = ['fecha_actualizacion']
     ordering = ['articulo__nombre']
 
+    # Obsoleto: el stock se mueve sólo por el ledger (inventario.services.postear_documento)
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(Articulo)
 class ArticuloAdmin(admin.ModelAdmin):
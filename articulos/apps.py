@@ -4,4 +4,8 @@ from django.apps import AppConfig
 class ArticulosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'articulos'
-    verbose_name = 'Artículos'
\ No newline at end of file
+    verbose_name = 'Artículos'
+    
+    def ready(self):
+        """Importar señales cuando la app esté lista"""
+        import articulos.signals
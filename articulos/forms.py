@@ -1,13 +1,41 @@
 from django import forms
 from django.core.exceptions import ValidationError
 from decimal import Decimal
+from .numeros import decimal_chileno, formato_entrada, parsear_numero
+from .reglas_precios import BASES_CALCULO, TIPOS_REGLA, ReglaPrecio
 from .models import Articulo, CategoriaArticulo, UnidadMedida, StockArticulo, ImpuestoEspecifico, ListaPrecio, PrecioArticulo, HomologacionCodigo, KitOferta, KitOfertaItem
 from proveedores.models import Proveedor
 
 
+class DecimalChilenoField(forms.DecimalField):
+    """
+    Número escrito en formato chileno (1.234,56) en un campo de texto. Se
+    muestra con coma decimal y sin separador de miles, que es lo que escribe
+    y lee el JavaScript del formulario.
+    """
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return parsear_numero(value, miles_con_punto=True)
+        except ValueError:
+            raise ValidationError(self.error_messages['invalid'], code='invalid')
+
+    def prepare_value(self, value):
+        if isinstance(value, (Decimal, int, float)):
+            return formato_entrada(value)
+        return value
+
+
 class ArticuloForm(forms.ModelForm):
     """Formulario para crear y editar artículos"""
     
+    # Campos numéricos que pueden quedar vacíos (se guarda el valor por defecto del modelo)
+    CAMPOS_NUMERICOS = [
+        'precio_costo', 'precio_venta', 'precio_final', 'margen_porcentaje', 'impuesto_especifico',
+        'stock_minimo', 'stock_maximo',
+    ]
     
     class Meta:
         model = Articulo
@@ -19,6 +47,13 @@ class ArticuloForm(forms.ModelForm):
             'fecha_inicio_oferta', 'fecha_fin_oferta', 'descripcion_oferta',
             'activo'
         ]
+        field_classes = {
+            'precio_costo': DecimalChilenoField,
+            'precio_venta': DecimalChilenoField,
+            'precio_final': DecimalChilenoField,
+            'margen_porcentaje': DecimalChilenoField,
+            'impuesto_especifico': DecimalChilenoField,
+        }
         widgets = {
             'categoria': forms.Select(attrs={'class': 'form-select'}),
             'unidad_medida': forms.Select(attrs={'class': 'form-select'}),
@@ -70,6 +105,9 @@ class ArticuloForm(forms.ModelForm):
         self.fields['categoria'].label = 'Familia'
         self.fields['categoria'].label_suffix = ''
         
+        for campo in self.CAMPOS_NUMERICOS:
+            self.fields[campo].required = False
+        
     
     def clean_codigo(self):
         codigo = self.cleaned_data['codigo']
@@ -88,51 +126,6 @@ class ArticuloForm(forms.ModelForm):
             raise ValidationError('El nombre debe tener al menos 3 caracteres.')
         return nombre.strip()
     
-    def clean_precio_costo(self):
-        precio_costo = self.cleaned_data.get('precio_costo')
-        if precio_costo:
-            # Solo validar que no esté vacío
-            return str(precio_costo).strip()
-        return '0.00'
-    
-    def clean_precio_venta(self):
-        precio_venta = self.cleaned_data.get('precio_venta')
-        if precio_venta:
-            # Solo validar que no esté vacío
-            return str(precio_venta).strip()
-        return '0.00'
-    
-    def clean_margen_porcentaje(self):
-        margen = self.cleaned_data.get('margen_porcentaje')
-        if margen:
-            # Convertir a string y limpiar
-            margen_str = str(margen).strip()
-            # Si está vacío, usar valor por defecto
-            if not margen_str:
-                return '30.00'
-            return margen_str
-        return '30.00'
-    
-    
-    def clean_impuesto_especifico(self):
-        impuesto = self.cleaned_data.get('impuesto_especifico')
-        # Siempre retornar un valor, nunca None
-        if impuesto is None or impuesto == '':
-            return '0.00'
-        
-        # Convertir a string y limpiar
-        impuesto_str = str(impuesto).strip()
-        # Si está vacío, usar valor por defecto
-        if not impuesto_str:
-            return '0.00'
-        
-        # Validar que sea un número válido
-        try:
-            float(impuesto_str.replace(',', '.'))
-            return impuesto_str
-        except (ValueError, AttributeError):
-            return '0.00'
-    
     def clean_precio_oferta(self):
         """Validar precio de oferta"""
         precio_oferta = self.cleaned_data.get('precio_oferta')
@@ -150,6 +143,12 @@ class ArticuloForm(forms.ModelForm):
     def clean(self):
         """Validación global del formulario incluyendo lógica de ofertas"""
         cleaned_data = super().clean()
+        
+        # Campos numéricos vacíos: valor por defecto del modelo
+        for campo in self.CAMPOS_NUMERICOS:
+            if campo in cleaned_data and cleaned_data[campo] is None:
+                cleaned_data[campo] = Articulo._meta.get_field(campo).get_default()
+        
         en_oferta = cleaned_data.get('en_oferta')
         precio_oferta = cleaned_data.get('precio_oferta')
         porcentaje_descuento = cleaned_data.get('porcentaje_descuento_oferta')
@@ -160,8 +159,8 @@ class ArticuloForm(forms.ModelForm):
         # Si está en oferta, validar que tenga al menos precio de oferta o porcentaje
         if en_oferta:
             try:
-                precio_oferta_decimal = Decimal(str(precio_oferta).replace(',', '.')) if precio_oferta else Decimal('0')
-                porcentaje_decimal = Decimal(str(porcentaje_descuento).replace(',', '.')) if porcentaje_descuento else Decimal('0')
+                precio_oferta_decimal = decimal_chileno(precio_oferta)
+                porcentaje_decimal = decimal_chileno(porcentaje_descuento)
                 
                 if precio_oferta_decimal <= 0 and porcentaje_decimal <= 0:
                     raise ValidationError(
@@ -170,8 +169,7 @@ class ArticuloForm(forms.ModelForm):
                 
                 # Validar que el precio de oferta sea menor al precio de venta
                 if precio_oferta_decimal > 0 and precio_venta:
-                    precio_venta_decimal = Decimal(str(precio_venta).replace(',', '.'))
-                    if precio_oferta_decimal >= precio_venta_decimal:
+                    if precio_oferta_decimal >= precio_venta:
                         raise ValidationError(
                             'El precio de oferta debe ser menor al precio de venta normal.'
                         )
@@ -181,7 +179,7 @@ class ArticuloForm(forms.ModelForm):
                     raise ValidationError(
                         'El porcentaje de descuento debe estar entre 0 y 100.'
                     )
-            except (ValueError, TypeError, Decimal.InvalidOperation):
+            except (ValueError, TypeError):
                 raise ValidationError('Los precios y porcentajes deben ser valores numéricos válidos.')
         
         # Validar fechas de oferta
@@ -192,46 +190,6 @@ class ArticuloForm(forms.ModelForm):
                 )
         
         return cleaned_data
-    
-    def clean_stock_maximo(self):
-        stock_maximo = self.cleaned_data.get('stock_maximo')
-        if stock_maximo:
-            return str(stock_maximo).strip()
-        return '0.00'
-    
-    def clean(self):
-        # Convertir valores de formato chileno a decimales antes de guardar
-        cleaned_data = super().clean()
-        
-        # Convertir precios de formato chileno a decimal
-        if 'precio_costo' in cleaned_data and cleaned_data['precio_costo']:
-            cleaned_data['precio_costo'] = self._string_to_decimal(cleaned_data['precio_costo'])
-        
-        if 'precio_venta' in cleaned_data and cleaned_data['precio_venta']:
-            cleaned_data['precio_venta'] = self._string_to_decimal(cleaned_data['precio_venta'])
-        
-        if 'precio_final' in cleaned_data and cleaned_data['precio_final']:
-            cleaned_data['precio_final'] = self._string_to_decimal(cleaned_data['precio_final'])
-        
-        if 'margen_porcentaje' in cleaned_data and cleaned_data['margen_porcentaje']:
-            cleaned_data['margen_porcentaje'] = self._string_to_decimal(cleaned_data['margen_porcentaje'])
-        
-        if 'impuesto_especifico' in cleaned_data and cleaned_data['impuesto_especifico']:
-            cleaned_data['impuesto_especifico'] = self._string_to_decimal(cleaned_data['impuesto_especifico'])
-        
-        return cleaned_data
-    
-    def _string_to_decimal(self, value):
-        """Convierte string a Decimal manejando formato chileno"""
-        if not value:
-            return Decimal('0')
-        
-        try:
-            # Convertir formato chileno a decimal
-            value_str = str(value).replace('.', '').replace(',', '.')
-            return Decimal(value_str)
-        except:
-            return Decimal('0')
 
 
 class CategoriaArticuloForm(forms.ModelForm):
@@ -368,6 +326,67 @@ class ListaPrecioForm(forms.ModelForm):
         }
 
 
+class ReglaPrecioForm(forms.Form):
+    """Regla de precios masiva sobre los artículos activos de una lista"""
+    
+    REDONDEOS = [('', 'Sin redondeo'), ('1', 'A $1'), ('10', 'A $10'), ('50', 'A $50'), ('100', 'A $100'), ('1000', 'A $1.000')]
+    
+    tipo = forms.ChoiceField(
+        choices=TIPOS_REGLA,
+        label='Regla',
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+    valor = DecimalChilenoField(
+        max_digits=12,
+        decimal_places=2,
+        required=False,
+        label='Valor',
+        widget=forms.TextInput(attrs={'class': 'form-control form-control-sm', 'placeholder': '-10'})
+    )
+    base = forms.ChoiceField(
+        choices=BASES_CALCULO,
+        initial='neto',
+        label='Base de cálculo',
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+    redondeo = forms.TypedChoiceField(
+        choices=REDONDEOS,
+        coerce=int,
+        empty_value=None,
+        required=False,
+        label='Redondeo del precio final',
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+    categoria = forms.ModelChoiceField(
+        queryset=CategoriaArticulo.objects.none(),
+        required=False,
+        empty_label='-- Todas las Categorías --',
+        label='Categoría',
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+    
+    def __init__(self, *args, **kwargs):
+        empresa = kwargs.pop('empresa', None)
+        super().__init__(*args, **kwargs)
+        if empresa:
+            self.fields['categoria'].queryset = CategoriaArticulo.objects.filter(empresa=empresa).order_by('nombre')
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.errors:
+            return cleaned_data
+        try:
+            cleaned_data['regla'] = ReglaPrecio(
+                cleaned_data['tipo'],
+                cleaned_data.get('valor'),
+                cleaned_data['base'],
+                cleaned_data.get('redondeo'),
+            )
+        except ValueError as e:
+            raise ValidationError(str(e))
+        return cleaned_data
+
+
 class PrecioArticuloForm(forms.ModelForm):
     """Formulario para asignar precios a artículos en listas"""
     
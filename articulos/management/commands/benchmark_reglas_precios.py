@@ -0,0 +1,145 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from articulos.models import Articulo, CategoriaArticulo, ListaPrecio, PrecioArticulo, UnidadMedida
+from articulos.reglas_precios import (
+    ReglaPrecio, aplicar_cambios, calcular_cambios, guardar_precios, resumen_cambios,
+)
+from empresas.models import Empresa
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide las reglas de precios masivas (vista previa y upsert por lotes) sobre una lista de '
+        'precios de prueba y las compara con el update_or_create por artículo anterior'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articulos', type=int, default=50000, help='Artículos de la lista de prueba')
+        parser.add_argument('--muestra', type=int, default=1000,
+                            help='Artículos con los que se mide el update_or_create por artículo (se extrapola)')
+        parser.add_argument('--manuales', type=int, default=5000, help='Precios editados a mano en la grilla')
+
+    def handle(self, *args, **options):
+        total = options['articulos']
+        if total < 1 or options['muestra'] < 1:
+            raise CommandError('--articulos y --muestra deben ser mayores que 0')
+
+        empresa, lista = self._crear_datos(total)
+        try:
+            filas = self._medir(empresa, lista, options)
+            errores = self._verificar(lista, total)
+        finally:
+            self.stdout.write('Eliminando datos de prueba...')
+            PrecioArticulo.objects.filter(lista_precio__empresa=empresa).delete()
+            Articulo.objects.filter(empresa=empresa).delete()
+            empresa.delete()
+
+        self.stdout.write('')
+        self.stdout.write(f"{'Operación':<44} {'Artículos':>10} {'Segundos':>9} {'Art/s':>9}")
+        for nombre, cantidad, segundos in filas:
+            self.stdout.write(f"{nombre:<44} {cantidad:>10} {segundos:>9.2f} {cantidad / max(segundos, 1e-9):>9.0f}")
+        self.stdout.write('')
+
+        if errores:
+            for error in errores:
+                self.stdout.write(self.style.ERROR(f'✗ {error}'))
+            raise CommandError('Los precios de la lista no son consistentes')
+        self.stdout.write(self.style.SUCCESS(f'✓ Precios de {total} artículos consistentes'))
+
+    def _crear_datos(self, total):
+        sufijo = int(time.time() * 1000) % 10_000_000
+        empresa = Empresa.objects.create(nombre=f'Prueba precios {sufijo}', rut=f'{sufijo}-0')
+        categorias = [
+            CategoriaArticulo.objects.create(empresa=empresa, codigo='AFE', nombre='Afecta'),
+            CategoriaArticulo.objects.create(empresa=empresa, codigo='EXE', nombre='Exenta', exenta_iva=True),
+        ]
+        unidad = UnidadMedida.objects.create(empresa=empresa, nombre='Unidad', simbolo='UN')
+        azar = random.Random(total)
+        articulos = []
+        for n in range(total):
+            categoria = categorias[n % 2]
+            costo = Decimal(azar.randint(100, 50000))
+            neto = (costo * Decimal('1.35')).quantize(Decimal('0.01'))
+            factor = Decimal('1.19') if not categoria.exenta_iva else Decimal('1')
+            articulos.append(Articulo(
+                empresa=empresa, categoria=categoria, unidad_medida=unidad,
+                codigo=f'BP{n:06d}', nombre=f'Artículo {n:06d}',
+                precio_costo=costo, precio_venta=neto, precio_final=(neto * factor).quantize(Decimal('1')),
+            ))
+        self.stdout.write(f'Creando {total} artículos de prueba...')
+        Articulo.objects.bulk_create(articulos, batch_size=2000)
+        lista = ListaPrecio.objects.create(empresa=empresa, nombre='Lista benchmark')
+        return empresa, lista
+
+    def _medir(self, empresa, lista, options):
+        filas = []
+        articulos = Articulo.objects.filter(empresa=empresa, activo=True)
+
+        # update_or_create por artículo (implementación anterior) sobre una muestra
+        muestra = list(articulos.order_by('id')[:options['muestra']])
+        lista_muestra = ListaPrecio.objects.create(empresa=empresa, nombre='Lista muestra')
+        inicio = time.perf_counter()
+        with transaction.atomic():
+            for articulo in muestra:
+                nuevo_precio = float(articulo.precio_venta) * (1 - 10 / 100)
+                PrecioArticulo.objects.update_or_create(
+                    articulo=articulo,
+                    lista_precio=lista_muestra,
+                    defaults={'precio': Decimal(str(round(nuevo_precio, 2)))}
+                )
+        segundos = time.perf_counter() - inicio
+        filas.append(('update_or_create por artículo (muestra)', len(muestra), segundos))
+        estimado = segundos / len(muestra) * articulos.count()
+        filas.append(('  estimado para toda la lista', articulos.count(), estimado))
+
+        # Vista previa y aplicación: todos los precios son nuevos (INSERT)
+        regla = ReglaPrecio('porcentaje', Decimal('-10'), 'neto')
+        inicio = time.perf_counter()
+        cambios = calcular_cambios(lista, articulos, regla)
+        filas.append(('Vista previa -10% neto (lista vacía)', len(cambios), time.perf_counter() - inicio))
+        inicio = time.perf_counter()
+        aplicar_cambios(lista, cambios)
+        filas.append(('Upsert -10% neto (inserta)', len(cambios), time.perf_counter() - inicio))
+
+        # Segunda regla sobre la lista: todos los precios existen (ON CONFLICT DO UPDATE)
+        regla = ReglaPrecio('porcentaje', Decimal('5'), 'lista', redondeo=10)
+        inicio = time.perf_counter()
+        cambios = calcular_cambios(lista, articulos, regla)
+        filas.append(('Vista previa +5% lista, redondeo $10', len(cambios), time.perf_counter() - inicio))
+        self.stdout.write(f'Vista previa: {resumen_cambios(cambios)}')
+        inicio = time.perf_counter()
+        aplicar_cambios(lista, cambios)
+        filas.append(('Upsert +5% lista (actualiza)', len(cambios), time.perf_counter() - inicio))
+
+        regla = ReglaPrecio('margen', Decimal('40'))
+        inicio = time.perf_counter()
+        cambios = calcular_cambios(lista, articulos, regla)
+        aplicar_cambios(lista, cambios)
+        filas.append(('Margen 40% sobre costo (previa + upsert)', len(cambios), time.perf_counter() - inicio))
+
+        # Grilla manual: precios editados y algunos vaciados
+        ids = list(articulos.order_by('id').values_list('id', flat=True)[:options['manuales']])
+        precios = {articulo_id: (None if n % 10 == 0 else Decimal(1000 + n)) for n, articulo_id in enumerate(ids)}
+        inicio = time.perf_counter()
+        guardados, eliminados = guardar_precios(lista, precios)
+        filas.append((f'Grilla manual ({guardados} guardados, {eliminados} eliminados)', len(precios), time.perf_counter() - inicio))
+        return filas
+
+    def _verificar(self, lista, total):
+        errores = []
+        precios = PrecioArticulo.objects.filter(lista_precio=lista).select_related('articulo__categoria__impuesto_especifico')
+        eliminados = len([n for n in range(min(total, 5000)) if n % 10 == 0])
+        if precios.count() != total - eliminados:
+            errores.append(f'La lista tiene {precios.count()} precios, se esperaban {total - eliminados}')
+        for precio in precios.order_by('?')[:500]:
+            if precio.precio_final != precio.calcular_precio_final():
+                errores.append(
+                    f'Artículo {precio.articulo.codigo}: precio_final {precio.precio_final} '
+                    f'en vez de {precio.calcular_precio_final()}'
+                )
+        return errores
@@ -1,13 +1,16 @@
 from django.core.management.base import BaseCommand
-from articulos.models import Articulo, StockArticulo
-from inventario.models import Stock
+from articulos.models import Articulo
+from inventario.models import Inventario, Stock
 
 
 class Command(BaseCommand):
-    help = 'Verifica el stock del artículo 2144'
+    help = 'Verifica el stock de un artículo (Stock contra la suma de su ledger Inventario)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('articulo_id', nargs='?', type=int, default=2144, help='ID del artículo')
 
     def handle(self, *args, **options):
-        articulo_id = 2144
+        articulo_id = options['articulo_id']
         
         self.stdout.write('=' * 70)
         self.stdout.write(self.style.SUCCESS(f'VERIFICANDO STOCK DEL ARTÍCULO {articulo_id}'))
@@ -19,21 +22,6 @@ class Command(BaseCommand):
             self.stdout.write(f'Empresa: {articulo.empresa.nombre}')
             self.stdout.write(f'Control Stock: {"Sí" if articulo.control_stock else "No"}')
             
-            # Verificar en StockArticulo
-            self.stdout.write('\n' + '-' * 70)
-            self.stdout.write(self.style.WARNING('Stock en StockArticulo:'))
-            stocks_articulo = StockArticulo.objects.filter(articulo=articulo)
-            self.stdout.write(f'Total registros: {stocks_articulo.count()}')
-            
-            if stocks_articulo.exists():
-                for stock in stocks_articulo:
-                    self.stdout.write(f'\n  Sucursal: {stock.sucursal.nombre}')
-                    self.stdout.write(f'  Disponible: {stock.cantidad_disponible}')
-                    self.stdout.write(f'  Reservada: {stock.cantidad_reservada}')
-                    self.stdout.write(f'  Total: {stock.cantidad_total}')
-            else:
-                self.stdout.write(self.style.ERROR('  ❌ No hay registros en StockArticulo'))
-            
             # Verificar en Stock (inventario)
             self.stdout.write('\n' + '-' * 70)
             self.stdout.write(self.style.WARNING('Stock en Inventario (Stock):'))
@@ -47,6 +35,31 @@ class Command(BaseCommand):
                     self.stdout.write(f'  Última actualización: {stock.fecha_actualizacion}')
             else:
                 self.stdout.write(self.style.ERROR('  ❌ No hay registros en Stock (inventario)'))
-                
+
+            # Verificar contra el ledger (StockArticulo está obsoleto y ya no se consulta)
+            self.stdout.write('\n' + '-' * 70)
+            self.stdout.write(self.style.WARNING('Saldo según movimientos (Inventario):'))
+            movimientos = Inventario.objects.filter(articulo=articulo, estado='confirmado')
+            saldos = {}
+            for bodega_id, cantidad in movimientos.filter(bodega_destino__isnull=False).values_list('bodega_destino_id', 'cantidad'):
+                saldos[bodega_id] = saldos.get(bodega_id, 0) + cantidad
+            for bodega_id, cantidad in movimientos.filter(bodega_origen__isnull=False).values_list('bodega_origen_id', 'cantidad'):
+                saldos[bodega_id] = saldos.get(bodega_id, 0) - cantidad
+
+            diferencias = 0
+            for stock in stocks_inventario:
+                saldo = saldos.pop(stock.bodega_id, 0)
+                if saldo != stock.cantidad:
+                    diferencias += 1
+                    self.stdout.write(self.style.ERROR(
+                        f'  ❌ {stock.bodega.nombre}: Stock {stock.cantidad} != movimientos {saldo}'
+                    ))
+            for bodega_id, saldo in saldos.items():
+                if saldo:
+                    diferencias += 1
+                    self.stdout.write(self.style.ERROR(f'  ❌ Bodega {bodega_id}: sin Stock, movimientos {saldo}'))
+            if not diferencias:
+                self.stdout.write(self.style.SUCCESS('  ✓ Stock coincide con los movimientos'))
+
         except Articulo.DoesNotExist:
             self.stdout.write(self.style.ERROR(f'\n❌ Artículo {articulo_id} no existe'))
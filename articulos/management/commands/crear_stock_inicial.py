@@ -1,20 +1,23 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from articulos.models import Articulo
+from bodegas.models import Bodega
 from empresas.models import Sucursal
-from articulos.models import StockArticulo
+from inventario.models import Stock
+from inventario.services import LineaStock, postear_documento
 from decimal import Decimal
 
 class Command(BaseCommand):
-    help = 'Crear stock inicial para todos los artículos'
+    help = 'Crear stock inicial para todos los artículos (movimientos de entrada en la bodega principal)'
 
     def handle(self, *args, **options):
         # Obtener todas las empresas
         from empresas.models import Empresa
         empresas = Empresa.objects.all()
-        
+
         for empresa in empresas:
             self.stdout.write(f'Procesando empresa: {empresa.nombre}')
-            
+
             # Obtener o crear sucursal principal
             from datetime import time
             sucursal, created = Sucursal.objects.get_or_create(
@@ -34,26 +37,44 @@ class Command(BaseCommand):
                     'estado': 'activa'
                 }
             )
-            
+
             if created:
                 self.stdout.write(f'  Creada sucursal: {sucursal.nombre}')
-            
-            # Obtener todos los artículos de la empresa
-            articulos = Articulo.objects.filter(empresa=empresa, activo=True)
-            
-            for articulo in articulos:
-                # Crear stock inicial de 100 unidades
-                stock_obj, created = StockArticulo.objects.get_or_create(
-                    articulo=articulo,
-                    sucursal=sucursal,
-                    defaults={
-                        'cantidad_disponible': Decimal('100.00')
-                    }
+
+            # Bodega principal: la primera activa (la misma de la que descuentan las ventas)
+            bodega = Bodega.objects.filter(empresa=empresa, activa=True).first()
+            if not bodega:
+                bodega, created = Bodega.objects.get_or_create(
+                    empresa=empresa,
+                    codigo='PRINCIPAL',
+                    defaults={'nombre': 'Bodega Principal', 'sucursal': sucursal}
                 )
-                
                 if created:
-                    self.stdout.write(f'  Creado stock para: {articulo.nombre} - 100 unidades')
-                else:
-                    self.stdout.write(f'  Stock ya existe para: {articulo.nombre}')
-        
+                    self.stdout.write(f'  Creada bodega: {bodega.nombre}')
+
+            # Artículos de la empresa que aún no tienen stock en la bodega
+            articulos = Articulo.objects.filter(empresa=empresa, activo=True, control_stock=True).exclude(
+                id__in=Stock.objects.filter(empresa=empresa, bodega=bodega).values('articulo_id')
+            )
+
+            # El stock se carga por el ledger: una entrada de 100 unidades por
+            # artículo (idempotente por artículo), nunca escribiendo el saldo directo
+            with transaction.atomic():
+                for articulo in articulos:
+                    creados = postear_documento(
+                        empresa=empresa,
+                        bodega=bodega,
+                        lineas=[LineaStock(articulo, Decimal('100.00'), articulo.precio_costo)],
+                        tipo_movimiento='entrada',
+                        documento_tipo='stock_inicial',
+                        documento_id=articulo.id,
+                        descripcion='Stock inicial',
+                        motivo='Stock inicial',
+                    )
+
+                    if creados:
+                        self.stdout.write(f'  Creado stock para: {articulo.nombre} - 100 unidades')
+                    else:
+                        self.stdout.write(f'  Stock ya existe para: {articulo.nombre}')
+
         self.stdout.write(self.style.SUCCESS('Stock inicial creado exitosamente'))
@@ -16,8 +16,8 @@ class Command(BaseCommand):
         actualizados = 0
         
         for articulo in articulos:
-            precio_venta = Decimal(str(articulo.precio_venta).replace(',', '.'))
-            precio_final_anterior = Decimal(str(articulo.precio_final).replace(',', '.'))
+            precio_venta = articulo.precio_venta
+            precio_final_anterior = articulo.precio_final
             
             # Recalcular precio final
             precio_final_nuevo = articulo.calcular_precio_final()
@@ -30,7 +30,7 @@ class Command(BaseCommand):
                 self.stdout.write(f"Precio Final DESPUÉS: ${precio_final_nuevo}")
                 
                 # Guardar
-                articulo.save()
+                articulo.save(update_fields=['precio_final'])
                 actualizados += 1
         
         self.stdout.write(self.style.SUCCESS(f'\n✓ {actualizados} artículos actualizados'))
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:18
+
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import migrations, models
+
+
+def calcular_precios_finales(apps, schema_editor):
+    """Calcula precio_final (neto + IVA + impuesto específico) de los precios existentes"""
+    PrecioArticulo = apps.get_model('articulos', 'PrecioArticulo')
+    
+    actualizados = []
+    precios = PrecioArticulo.objects.select_related('articulo__categoria__impuesto_especifico')
+    for precio in precios.iterator(chunk_size=1000):
+        categoria = precio.articulo.categoria
+        factor = Decimal('1.00') if categoria.exenta_iva else Decimal('1.19')
+        if categoria.impuesto_especifico:
+            try:
+                factor += Decimal(str(categoria.impuesto_especifico.porcentaje).replace(',', '.')) / Decimal('100')
+            except Exception:
+                pass
+        precio.precio_final = (precio.precio * factor).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+        actualizados.append(precio)
+        if len(actualizados) >= 1000:
+            PrecioArticulo.objects.bulk_update(actualizados, ['precio_final'])
+            actualizados = []
+    if actualizados:
+        PrecioArticulo.objects.bulk_update(actualizados, ['precio_final'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articulos', '0018_agregar_sistema_ofertas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='precioarticulo',
+            name='precio_final',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Precio Final'),
+        ),
+        migrations.RunPython(calcular_precios_finales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Primer paso de la conversión de precios y stocks de Articulo a DecimalField:
+    columnas numéricas nuevas (nulas) junto a las de texto. 0021 copia los
+    valores y 0022 reemplaza las columnas de texto.
+    """
+
+    dependencies = [
+        ('articulos', '0019_precioarticulo_precio_final'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='articulo',
+            name='precio_costo_num',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='articulo',
+            name='precio_venta_num',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='articulo',
+            name='precio_final_num',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='articulo',
+            name='margen_porcentaje_num',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='articulo',
+            name='impuesto_especifico_num',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='articulo',
+            name='stock_minimo_num',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='articulo',
+            name='stock_maximo_num',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+    ]
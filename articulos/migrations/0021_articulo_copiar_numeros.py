@@ -0,0 +1,98 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:10
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, transaction
+
+from articulos.numeros import parsear_numero
+
+
+TRAMO = 2000
+MAX_REPORTADOS = 200
+
+# campo: (max_digits, decimal_places, valor por defecto, 1.234 son miles)
+# En los precios (pesos) un texto como 12.990 son miles; en margen y stock
+# el punto es el decimal (1.5 kg), como los leía Articulo._string_to_decimal.
+CAMPOS = {
+    'precio_costo': (16, 4, Decimal('0'), True),
+    'precio_venta': (16, 4, Decimal('0'), True),
+    'precio_final': (14, 2, Decimal('0'), True),
+    'margen_porcentaje': (10, 2, Decimal('30'), False),
+    'impuesto_especifico': (12, 2, Decimal('0'), False),
+    'stock_minimo': (12, 2, Decimal('0'), False),
+    'stock_maximo': (12, 2, Decimal('0'), False),
+}
+
+
+def convertir(valor, max_digits, decimal_places, defecto, miles_con_punto):
+    """
+    Returns:
+        tuple: (Decimal, aviso) con aviso None si el texto no era ambiguo ni inválido
+    """
+    try:
+        numero = parsear_numero(valor, miles_con_punto=miles_con_punto)
+    except ValueError:
+        return defecto, 'no es un número'
+    if numero is None:
+        return defecto, None
+    numero = numero.quantize(Decimal(1).scaleb(-decimal_places), rounding=ROUND_HALF_UP)
+    if abs(numero) >= Decimal(10) ** (max_digits - decimal_places):
+        return defecto, 'fuera de rango'
+    if miles_con_punto and numero != parsear_numero(valor):
+        return numero, 'se interpreta con punto de miles'
+    return numero, None
+
+
+def copiar_numeros(apps, schema_editor):
+    """
+    Copia los precios y stocks de texto a las columnas numéricas por tramos
+    de ID, cada tramo en su propia transacción. Sólo procesa los artículos
+    sin copiar (precio_costo_num nulo): si se interrumpe, volver a ejecutar
+    migrate continúa donde quedó. Los valores que no se pueden interpretar
+    quedan con el valor por defecto y se informan, junto con los precios
+    ambiguos (12.990) que se leen como miles.
+    """
+    Articulo = apps.get_model('articulos', 'Articulo')
+    alias = schema_editor.connection.alias
+    pendientes = Articulo.objects.using(alias).filter(precio_costo_num__isnull=True).order_by('id')
+    nuevos = [f'{campo}_num' for campo in CAMPOS]
+
+    ultimo_id = 0
+    convertidos = 0
+    avisos = 0
+    while True:
+        articulos = list(pendientes.filter(id__gt=ultimo_id).only('id', 'codigo', *CAMPOS)[:TRAMO])
+        if not articulos:
+            break
+        for articulo in articulos:
+            for campo, (max_digits, decimal_places, defecto, miles_con_punto) in CAMPOS.items():
+                valor = getattr(articulo, campo)
+                numero, aviso = convertir(valor, max_digits, decimal_places, defecto, miles_con_punto)
+                setattr(articulo, f'{campo}_num', numero)
+                if aviso:
+                    avisos += 1
+                    if avisos <= MAX_REPORTADOS:
+                        print(f"[MIGRACIÓN] Artículo {articulo.id} ({articulo.codigo}) {campo}={valor!r} {aviso}: {numero}")
+        with transaction.atomic(using=alias):
+            Articulo.objects.using(alias).bulk_update(articulos, nuevos)
+        convertidos += len(articulos)
+        ultimo_id = articulos[-1].id
+
+    if avisos > MAX_REPORTADOS:
+        print(f"[MIGRACIÓN] ... y {avisos - MAX_REPORTADOS} valores más para revisar")
+    if convertidos:
+        print(f"[MIGRACIÓN] Precios y stocks numéricos copiados para {convertidos} artículos ({avisos} valores para revisar)")
+
+
+class Migration(migrations.Migration):
+    """Sin transacción global: cada tramo de artículos se confirma por separado"""
+
+    atomic = False
+
+    dependencies = [
+        ('articulos', '0020_articulo_campos_numericos'),
+    ]
+
+    operations = [
+        migrations.RunPython(copiar_numeros, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:10
+
+from decimal import Decimal
+from importlib import import_module
+
+from django.db import migrations, models
+
+
+copia = import_module('articulos.migrations.0021_articulo_copiar_numeros')
+
+
+def copiar_pendientes(apps, schema_editor):
+    """Artículos creados después de 0021 (p. ej. mientras corría la copia)"""
+    copia.copiar_numeros(apps, schema_editor)
+
+
+def restaurar_texto(apps, schema_editor):
+    """Reversa: vuelve a escribir los números en las columnas de texto"""
+    Articulo = apps.get_model('articulos', 'Articulo')
+    alias = schema_editor.connection.alias
+    articulos = []
+    for articulo in Articulo.objects.using(alias).only('id', *[f'{campo}_num' for campo in copia.CAMPOS]).iterator(chunk_size=copia.TRAMO):
+        for campo in copia.CAMPOS:
+            numero = getattr(articulo, f'{campo}_num')
+            setattr(articulo, campo, None if numero is None else str(numero))
+        articulos.append(articulo)
+        if len(articulos) >= copia.TRAMO:
+            Articulo.objects.using(alias).bulk_update(articulos, list(copia.CAMPOS))
+            articulos = []
+    if articulos:
+        Articulo.objects.using(alias).bulk_update(articulos, list(copia.CAMPOS))
+
+
+class Migration(migrations.Migration):
+    """Reemplaza las columnas de texto por las numéricas copiadas en 0021"""
+
+    dependencies = [
+        ('articulos', '0021_articulo_copiar_numeros'),
+    ]
+
+    operations = [
+        migrations.RunPython(copiar_pendientes, restaurar_texto),
+        migrations.RemoveField(model_name='articulo', name='precio_costo'),
+        migrations.RemoveField(model_name='articulo', name='precio_venta'),
+        migrations.RemoveField(model_name='articulo', name='precio_final'),
+        migrations.RemoveField(model_name='articulo', name='margen_porcentaje'),
+        migrations.RemoveField(model_name='articulo', name='impuesto_especifico'),
+        migrations.RemoveField(model_name='articulo', name='stock_minimo'),
+        migrations.RemoveField(model_name='articulo', name='stock_maximo'),
+        migrations.RenameField(model_name='articulo', old_name='precio_costo_num', new_name='precio_costo'),
+        migrations.RenameField(model_name='articulo', old_name='precio_venta_num', new_name='precio_venta'),
+        migrations.RenameField(model_name='articulo', old_name='precio_final_num', new_name='precio_final'),
+        migrations.RenameField(model_name='articulo', old_name='margen_porcentaje_num', new_name='margen_porcentaje'),
+        migrations.RenameField(model_name='articulo', old_name='impuesto_especifico_num', new_name='impuesto_especifico'),
+        migrations.RenameField(model_name='articulo', old_name='stock_minimo_num', new_name='stock_minimo'),
+        migrations.RenameField(model_name='articulo', old_name='stock_maximo_num', new_name='stock_maximo'),
+        migrations.AlterField(
+            model_name='articulo',
+            name='precio_costo',
+            field=models.DecimalField(decimal_places=4, default=Decimal('0'), max_digits=16, verbose_name='Precio de Costo'),
+        ),
+        migrations.AlterField(
+            model_name='articulo',
+            name='precio_venta',
+            field=models.DecimalField(decimal_places=4, default=Decimal('0'), max_digits=16, verbose_name='Precio de Venta'),
+        ),
+        migrations.AlterField(
+            model_name='articulo',
+            name='precio_final',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=14, verbose_name='Precio Final'),
+        ),
+        migrations.AlterField(
+            model_name='articulo',
+            name='margen_porcentaje',
+            field=models.DecimalField(decimal_places=2, default=Decimal('30'), max_digits=10, verbose_name='Margen de Ganancia (%)'),
+        ),
+        migrations.AlterField(
+            model_name='articulo',
+            name='impuesto_especifico',
+            field=models.DecimalField(blank=True, decimal_places=2, default=Decimal('0'), max_digits=12, null=True, verbose_name='Impuesto Específico'),
+        ),
+        migrations.AlterField(
+            model_name='articulo',
+            name='stock_minimo',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12, verbose_name='Stock Mínimo'),
+        ),
+        migrations.AlterField(
+            model_name='articulo',
+            name='stock_maximo',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12, verbose_name='Stock Máximo'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def calcular_costos(apps, schema_editor):
+    """Calcula el costo guardado de todas las recetas existentes"""
+    from produccion.services import costear_recetas
+
+    RecetaProduccion = apps.get_model('articulos', 'RecetaProduccion')
+    InsumoReceta = apps.get_model('articulos', 'InsumoReceta')
+
+    empresas = RecetaProduccion.objects.order_by().values_list('empresa_id', flat=True).distinct()
+    total = 0
+    ahora = timezone.now()
+    for empresa_id in empresas:
+        recetas = RecetaProduccion.objects.filter(empresa_id=empresa_id)
+        lineas = {receta_id: [] for receta_id in recetas.values_list('id', flat=True)}
+        costos_articulo = {}
+        for insumo_id, receta_id, articulo_id, cantidad, precio_costo in InsumoReceta.objects.filter(
+            receta__empresa_id=empresa_id
+        ).values_list('id', 'receta_id', 'articulo_id', 'cantidad', 'articulo__precio_costo'):
+            lineas[receta_id].append((insumo_id, articulo_id, cantidad))
+            costos_articulo[articulo_id] = precio_costo or Decimal('0')
+
+        sub_recetas = {}
+        for producto_id, receta_id, cantidad_producir in recetas.filter(activo=True).order_by('codigo', 'id').values_list(
+            'producto_final_id', 'id', 'cantidad_producir'
+        ):
+            sub_recetas.setdefault(producto_id, (receta_id, cantidad_producir, None))
+
+        costos, unitarios, _ciclos = costear_recetas(lineas, sub_recetas, costos_articulo)
+        RecetaProduccion.objects.bulk_update(
+            [RecetaProduccion(id=receta_id, costo_insumos=costo, costo_actualizado=ahora) for receta_id, costo in costos.items()],
+            ['costo_insumos', 'costo_actualizado'],
+            batch_size=500,
+        )
+        InsumoReceta.objects.bulk_update(
+            [InsumoReceta(id=insumo_id, costo_unitario_calculado=costo) for insumo_id, costo in unitarios.items()],
+            ['costo_unitario_calculado'],
+            batch_size=500,
+        )
+        total += len(costos)
+
+    print(f"\n[MIGRACIÓN] Costo calculado para {total} recetas de producción")
+
+
+class Migration(migrations.Migration):
+    """
+    Costo acumulado de las recetas (incluye sub-recetas), guardado en la receta
+    y en cada insumo para no recalcularlo en cada acceso.
+    """
+
+    dependencies = [
+        ('articulos', '0022_articulo_precios_decimales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recetaproduccion',
+            name='costo_insumos',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='Costo de los insumos de la receta, incluidas las sub-recetas', max_digits=16, null=True, verbose_name='Costo de Insumos'),
+        ),
+        migrations.AddField(
+            model_name='recetaproduccion',
+            name='costo_actualizado',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Costo Actualizado'),
+        ),
+        migrations.AddField(
+            model_name='insumoreceta',
+            name='costo_unitario_calculado',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='Costo del insumo al último cálculo de la receta (costo de su sub-receta si la tiene)', max_digits=16, null=True, verbose_name='Costo Unitario Calculado'),
+        ),
+        migrations.RunPython(calcular_costos, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,9 @@
 from django.db import models
 from django.core.validators import MinValueValidator
 from django.utils import timezone
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 from empresas.models import Empresa, Sucursal
+from .numeros import decimal_chileno
 
 
 class ImpuestoEspecifico(models.Model):
@@ -109,33 +110,38 @@ class Articulo(models.Model):
     logo = models.ImageField(upload_to='articulos/logos/', blank=True, null=True, verbose_name="Logo del Artículo")
     
     # Precios
-    precio_costo = models.CharField(
-        max_length=50, 
-        default='0.00',
+    precio_costo = models.DecimalField(
+        max_digits=16,
+        decimal_places=4,
+        default=Decimal('0'),
         verbose_name="Precio de Costo"
     )
-    precio_venta = models.CharField(
-        max_length=50, 
-        default='0.00',
+    precio_venta = models.DecimalField(
+        max_digits=16,
+        decimal_places=4,
+        default=Decimal('0'),
         verbose_name="Precio de Venta"
     )
-    precio_final = models.CharField(
-        max_length=50, 
-        default='0.00',
+    precio_final = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0'),
         verbose_name="Precio Final"
     )
     
     # Margen de ganancia
-    margen_porcentaje = models.CharField(
-        max_length=50, 
-        default='30.00',
+    margen_porcentaje = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=Decimal('30'),
         verbose_name="Margen de Ganancia (%)"
     )
     
     # Impuesto específico
-    impuesto_especifico = models.CharField(
-        max_length=50, 
-        default='0.00',
+    impuesto_especifico = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0'),
         blank=True,
         null=True,
         verbose_name="Impuesto Específico"
@@ -143,14 +149,16 @@ class Articulo(models.Model):
     
     # Control de stock
     control_stock = models.BooleanField(default=True, verbose_name="Control de Stock")
-    stock_minimo = models.CharField(
-        max_length=50, 
-        default='0.00',
+    stock_minimo = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0'),
         verbose_name="Stock Mínimo"
     )
-    stock_maximo = models.CharField(
-        max_length=50, 
-        default='0.00',
+    stock_maximo = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0'),
         verbose_name="Stock Máximo"
     )
     
@@ -330,7 +338,8 @@ class Articulo(models.Model):
         
         # Precio final = Precio venta + IVA + Impuesto Específico
         precio_final_calculado = precio_venta + iva_monto + impuesto_especifico_monto
-        self.precio_final = str(precio_final_calculado)
+        precio_final_calculado = precio_final_calculado.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        self.precio_final = precio_final_calculado
         
         return precio_final_calculado
     
@@ -354,7 +363,7 @@ class Articulo(models.Model):
         # Precio Venta = Precio Final / (1 + IVA% + Imp.Esp%)
         factor_total = Decimal('1.00') + (iva_porcentaje / Decimal('100.00')) + impuesto_especifico_decimal
         precio_venta_calculado = precio_final / factor_total
-        self.precio_venta = str(precio_venta_calculado)
+        self.precio_venta = precio_venta_calculado.quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP)
         
         return precio_final
     
@@ -365,8 +374,8 @@ class Articulo(models.Model):
         
         if precio_costo > 0:
             precio_venta_calculado = precio_costo * (1 + margen_porcentaje / 100)
-            self.precio_venta = str(precio_venta_calculado)
-            return precio_venta_calculado
+            self.precio_venta = precio_venta_calculado.quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP)
+            return self.precio_venta
         return Decimal('0.00')
     
     def save(self, *args, **kwargs):
@@ -442,32 +451,16 @@ class Articulo(models.Model):
         return precio_oferta.quantize(Decimal('0.01'))
     
     def _string_to_decimal(self, value):
-        """Convierte string a Decimal manejando formato chileno"""
-        if not value:
-            return Decimal('0')
-        
-        try:
-            value_str = str(value).strip()
-            if ',' in value_str:
-                # Caso típico chileno: 1.234,56 o 1234,56
-                value_str = value_str.replace('.', '')  # quitar separador de miles
-                value_str = value_str.replace(',', '.')  # usar punto decimal
-            elif '.' in value_str:
-                # Asumir punto como decimal y coma (si hubiera) como miles
-                value_str = value_str.replace(',', '')
-            return Decimal(value_str)
-        except Exception:
-            return Decimal('0')
+        """Convierte a Decimal los campos de oferta (texto en formato chileno) y los numéricos"""
+        return decimal_chileno(value)
     
     @property
     def stock_actual(self):
         """Retorna el stock actual del artículo (suma de todas las bodegas)"""
         try:
-            from inventario.models import Stock
-            # Obtener el stock total de todas las bodegas
-            stocks = Stock.objects.filter(articulo=self, empresa=self.empresa)
-            total_stock = sum(float(stock.cantidad) for stock in stocks)
-            return int(total_stock)
+            from inventario.services import saldo_stock
+            # Una sola consulta agregada sobre el saldo materializado
+            return int(saldo_stock(self.empresa_id, self.id))
         except Exception as e:
             print(f"DEBUG - Error calculando stock para artículo {self.id}: {e}")
             return 0
@@ -478,6 +471,27 @@ class Articulo(models.Model):
         return self.stock_actual
 
 
+def factor_impuestos_categoria(categoria):
+    """Factor neto -> final de la categoría: 1 + IVA + impuesto específico"""
+    factor = Decimal('1.00')
+    if categoria:
+        factor += categoria.get_iva_porcentaje() / Decimal('100.00')
+        factor += categoria.get_impuesto_especifico_porcentaje()
+    else:
+        factor += Decimal('0.19')
+    return factor
+
+
+def calcular_precio_final_categoria(precio_neto, categoria):
+    """
+    Calcula el precio final (neto + IVA + impuesto específico) de un precio neto
+    según la configuración de impuestos de la categoría, redondeado a pesos.
+    """
+    precio_neto = Decimal(str(precio_neto or 0))
+    factor = factor_impuestos_categoria(categoria)
+    return (precio_neto * factor).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+
+
 class ListaPrecio(models.Model):
     """Listas de precios para artículos"""
     
@@ -516,6 +530,13 @@ class PrecioArticulo(models.Model):
         validators=[MinValueValidator(Decimal('0.00'))],
         verbose_name="Precio"
     )
+    # Precio con IVA e impuesto específico ya aplicados (calculado al guardar)
+    precio_final = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        verbose_name="Precio Final"
+    )
     fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
     fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name="Fecha de Actualización")
     
@@ -527,10 +548,49 @@ class PrecioArticulo(models.Model):
     
     def __str__(self):
         return f"{self.articulo.nombre} - {self.lista_precio.nombre}: ${self.precio}"
+    
+    def save(self, *args, **kwargs):
+        """Calcula el precio final según los impuestos de la categoría del artículo"""
+        self.precio_final = self.calcular_precio_final()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'precio' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'precio_final'}
+        super().save(*args, **kwargs)
+    
+    def calcular_precio_final(self):
+        """Precio neto + IVA + impuesto específico, redondeado a pesos"""
+        return calcular_precio_final_categoria(self.precio, self.articulo.categoria)
+    
+    @classmethod
+    def recalcular_precios_finales(cls, queryset, batch_size=1000):
+        """
+        Recalcula precio_final de los precios indicados (ej: al cambiar los
+        impuestos de una categoría). Retorna la cantidad de precios actualizados.
+        """
+        actualizados = []
+        total = 0
+        for precio in queryset.select_related('articulo__categoria__impuesto_especifico').iterator(chunk_size=batch_size):
+            nuevo = precio.calcular_precio_final()
+            if nuevo != precio.precio_final:
+                precio.precio_final = nuevo
+                actualizados.append(precio)
+            if len(actualizados) >= batch_size:
+                cls.objects.bulk_update(actualizados, ['precio_final'])
+                total += len(actualizados)
+                actualizados = []
+        if actualizados:
+            cls.objects.bulk_update(actualizados, ['precio_final'])
+            total += len(actualizados)
+        return total
 
 
 class StockArticulo(models.Model):
-    """Stock de artículos por sucursal"""
+    """
+    Stock de artículos por sucursal.
+    
+    OBSOLETO: el stock autoritativo es inventario.Stock (saldo por bodega del
+    ledger Inventario). Se mantiene sólo para consultar datos históricos.
+    """
     
     articulo = models.ForeignKey(Articulo, on_delete=models.CASCADE, related_name='stock_articulos', verbose_name="Artículo")
     sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, verbose_name="Sucursal")
@@ -718,8 +778,7 @@ class KitOferta(models.Model):
         """Calcula el precio total de los items individuales"""
         total = Decimal('0.00')
         for item in self.items.all():
-            # Convertir precio_final string a Decimal
-            precio_final = Decimal(item.articulo.precio_final.replace(',', '')) if item.articulo.precio_final else Decimal('0.00')
+            precio_final = item.articulo.precio_final or Decimal('0.00')
             total += precio_final * item.cantidad
         return int(total)
     
@@ -793,7 +852,7 @@ class KitOfertaItem(models.Model):
     @property
     def subtotal(self):
         """Calcula el subtotal del item"""
-        precio_final = Decimal(self.articulo.precio_final.replace(',', '')) if self.articulo.precio_final else Decimal('0.00')
+        precio_final = self.articulo.precio_final or Decimal('0.00')
         return int(precio_final * self.cantidad)
 
 
@@ -854,6 +913,17 @@ class RecetaProduccion(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Creación")
     fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name="Fecha de Actualización")
     
+    # Costo acumulado (produccion.services.recalcular_costos_recetas)
+    costo_insumos = models.DecimalField(
+        max_digits=16,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        verbose_name="Costo de Insumos",
+        help_text="Costo de los insumos de la receta, incluidas las sub-recetas"
+    )
+    costo_actualizado = models.DateTimeField(null=True, blank=True, verbose_name="Costo Actualizado")
+    
     class Meta:
         verbose_name = "Receta de Producción"
         verbose_name_plural = "Recetas de Producción"
@@ -875,11 +945,11 @@ class RecetaProduccion(models.Model):
     
     @property
     def costo_total_insumos(self):
-        """Calcula el costo total de los insumos"""
-        total = Decimal('0.00')
-        for item in self.insumos.all():
-            total += item.costo_total
-        return total
+        """Costo total de los insumos (guardado; se calcula si la receta aún no tiene costo)"""
+        if self.costo_insumos is not None:
+            return self.costo_insumos
+        from produccion.services import costo_receta
+        return costo_receta(self)
     
     @property
     def costo_unitario(self):
@@ -924,6 +994,15 @@ class InsumoReceta(models.Model):
         help_text="Notas sobre este insumo en la receta"
     )
     
+    costo_unitario_calculado = models.DecimalField(
+        max_digits=16,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        verbose_name="Costo Unitario Calculado",
+        help_text="Costo del insumo al último cálculo de la receta (costo de su sub-receta si la tiene)"
+    )
+    
     class Meta:
         verbose_name = "Insumo de Receta"
         verbose_name_plural = "Insumos de Receta"
@@ -936,10 +1015,9 @@ class InsumoReceta(models.Model):
     @property
     def costo_unitario(self):
         """Retorna el costo unitario del insumo"""
-        try:
-            return Decimal(self.articulo.precio_costo.replace(',', '.'))
-        except:
-            return Decimal('0.00')
+        if self.costo_unitario_calculado is not None:
+            return self.costo_unitario_calculado
+        return self.articulo.precio_costo or Decimal('0.00')
     
     @property
     def costo_total(self):
@@ -0,0 +1,82 @@
+"""
+Conversión de números escritos en formato chileno (1.234,56) a Decimal.
+
+Los precios y stocks de Articulo se guardaban como texto y cada consumidor
+los interpretaba a su manera (quitando puntos, cambiando la coma, etc.). La
+migración a DecimalField y el formulario de artículos usan estas funciones
+para interpretar el texto de una sola forma.
+"""
+import re
+from decimal import Decimal
+
+
+_MILES = re.compile(r'^\d{1,3}(\.\d{3})+$')
+_DECIMAL = re.compile(r'^[-+]?(\d+\.?\d*|\.\d+)$')
+
+
+def parsear_numero(valor, miles_con_punto=False):
+    """
+    Interpreta un número en formato chileno o con punto decimal.
+
+    - Con coma: los puntos son separadores de miles y la coma es el decimal
+      (1.234,56 / 1234,56).
+    - Con varios puntos: separadores de miles (1.234.567).
+    - Con un solo punto: punto decimal (1234.56), salvo que miles_con_punto
+      sea True y el número tenga la forma 1.234 (lo que escribe un usuario
+      en el formulario).
+
+    Args:
+        valor: Texto, número o None
+        miles_con_punto: Interpretar 1.234 como mil doscientos treinta y cuatro
+
+    Returns:
+        Decimal o None si el valor está vacío
+
+    Raises:
+        ValueError: Si el texto no es un número
+    """
+    if valor is None:
+        return None
+    if isinstance(valor, Decimal):
+        return valor
+    if isinstance(valor, (int, float)):
+        return Decimal(str(valor))
+
+    texto = str(valor).strip().replace('$', '').replace('\xa0', '').replace(' ', '')
+    if not texto:
+        return None
+
+    if ',' in texto:
+        if texto.count(',') > 1:
+            raise ValueError(f"Número inválido: {valor!r}")
+        entero, decimales = texto.split(',')
+        if '.' in entero and not _MILES.match(entero.lstrip('-')):
+            raise ValueError(f"Número inválido: {valor!r}")
+        texto = f"{entero.replace('.', '')}.{decimales}"
+    elif texto.count('.') > 1 or (miles_con_punto and _MILES.match(texto.lstrip('-'))):
+        if not _MILES.match(texto.lstrip('-')):
+            raise ValueError(f"Número inválido: {valor!r}")
+        texto = texto.replace('.', '')
+
+    if not _DECIMAL.match(texto):
+        raise ValueError(f"Número inválido: {valor!r}")
+    return Decimal(texto)
+
+
+def decimal_chileno(valor, defecto=Decimal('0')):
+    """Como parsear_numero, pero retorna `defecto` si el valor está vacío o no es un número"""
+    try:
+        numero = parsear_numero(valor)
+    except ValueError:
+        return defecto
+    return defecto if numero is None else numero
+
+
+def formato_entrada(valor):
+    """Número para un campo de texto editable: coma decimal y sin separador de miles (1234,5)"""
+    if valor is None or valor == '':
+        return ''
+    numero = decimal_chileno(valor)
+    if numero == numero.to_integral_value():
+        return str(numero.quantize(Decimal('1')))
+    return format(numero.normalize(), 'f').replace('.', ',')
@@ -0,0 +1,301 @@
+"""
+Reglas de precios masivas para las listas de precios.
+
+La aplicación masiva de descuentos recorría todos los artículos activos y
+llamaba a PrecioArticulo.objects.update_or_create() por cada uno (un SELECT
+y un INSERT o UPDATE por artículo, con aritmética en float). Ahora:
+
+- calcular_cambios() lee los artículos filtrados y los precios actuales de
+  la lista en dos consultas y calcula en Decimal el nuevo precio neto y el
+  precio final de cada artículo según una ReglaPrecio (porcentaje, monto
+  fijo, redondeo o margen sobre el costo).
+- La vista muestra primero la vista previa (resumen y diferencias) y sólo
+  al confirmar se llama a aplicar_cambios(), que escribe los precios con
+  INSERT ... ON CONFLICT DO UPDATE (bulk_create con update_conflicts) por
+  lotes dentro de una transacción.
+- La firma de la vista previa permite detectar al confirmar que los precios
+  cambiaron entre la vista previa y la aplicación.
+
+El comando benchmark_reglas_precios mide el cálculo y la aplicación sobre
+una lista de 50.000 artículos.
+"""
+import hashlib
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Articulo, CategoriaArticulo, PrecioArticulo, factor_impuestos_categoria
+
+
+TIPOS_REGLA = [
+    ('porcentaje', 'Porcentaje (+ sube / - baja)'),
+    ('monto', 'Monto fijo (+ sube / - baja)'),
+    ('redondeo', 'Sólo redondear'),
+    ('margen', 'Margen sobre el costo (%)'),
+]
+
+BASES_CALCULO = [
+    ('neto', 'Precio neto del artículo'),
+    ('final', 'Precio final del artículo (con impuestos)'),
+    ('lista', 'Precio actual en la lista'),
+]
+
+LOTE = 2000
+MAX_VISTA_PREVIA = 200  # Filas de diferencias que se muestran en la vista previa
+CENTAVOS = Decimal('0.01')
+
+
+class ReglaPrecio:
+    """
+    Regla que se aplica a cada artículo:
+
+    - porcentaje: base * (1 + valor / 100)
+    - monto: base + valor
+    - redondeo: la base sin cambios (sólo se aplica el redondeo)
+    - margen: precio de costo * (1 + valor / 100), siempre sobre el neto
+
+    La base 'final' opera sobre el precio con impuestos y el resultado se
+    convierte a neto con el factor de la categoría. Con `redondeo` (p. ej.
+    10, 50, 100) el precio final se redondea a ese múltiplo.
+    """
+
+    __slots__ = ('tipo', 'valor', 'base', 'redondeo')
+
+    def __init__(self, tipo, valor=Decimal('0'), base='neto', redondeo=None):
+        if tipo not in dict(TIPOS_REGLA):
+            raise ValueError(f"Tipo de regla desconocido: {tipo}")
+        if base not in dict(BASES_CALCULO):
+            raise ValueError(f"Base de cálculo desconocida: {base}")
+        self.tipo = tipo
+        self.valor = Decimal(str(valor or 0))
+        self.base = 'neto' if tipo == 'margen' else base
+        self.redondeo = int(redondeo) if redondeo else None
+        if self.redondeo is not None and self.redondeo < 1:
+            raise ValueError("El redondeo debe ser un múltiplo mayor que 0")
+        if tipo == 'porcentaje' and self.valor <= -100:
+            raise ValueError("El porcentaje no puede bajar el precio en 100% o más")
+        if tipo == 'redondeo' and self.redondeo is None:
+            raise ValueError("Indique el múltiplo al que se redondea el precio final")
+
+    def __str__(self):
+        texto = {
+            'porcentaje': f"{self.valor:+}% sobre el precio {self.base}",
+            'monto': f"{self.valor:+} sobre el precio {self.base}",
+            'redondeo': f"redondear el precio {self.base}",
+            'margen': f"margen de {self.valor}% sobre el costo",
+        }[self.tipo]
+        if self.redondeo:
+            texto += f", precio final redondeado a {self.redondeo}"
+        return texto
+
+    def aplicar(self, base):
+        """Precio resultante (en el mismo dominio neto/final que la base)"""
+        if self.tipo in ('porcentaje', 'margen'):
+            return base * (Decimal('1') + self.valor / Decimal('100'))
+        if self.tipo == 'monto':
+            return base + self.valor
+        return base
+
+
+class CambioPrecio:
+    """Precio nuevo de un artículo en la lista"""
+
+    __slots__ = ('articulo_id', 'codigo', 'nombre', 'precio_actual', 'precio_nuevo', 'precio_final')
+
+    def __init__(self, articulo_id, codigo, nombre, precio_actual, precio_nuevo, precio_final):
+        self.articulo_id = articulo_id
+        self.codigo = codigo
+        self.nombre = nombre
+        self.precio_actual = precio_actual
+        self.precio_nuevo = precio_nuevo
+        self.precio_final = precio_final
+
+    @property
+    def diferencia(self):
+        return self.precio_nuevo - (self.precio_actual or Decimal('0'))
+
+    @property
+    def diferencia_porcentaje(self):
+        if not self.precio_actual:
+            return None
+        return (self.diferencia / self.precio_actual * Decimal('100')).quantize(CENTAVOS)
+
+
+def factores_impuestos(empresa):
+    """{categoria_id: factor neto -> final} de todas las categorías de la empresa"""
+    categorias = CategoriaArticulo.objects.filter(empresa=empresa).select_related('impuesto_especifico')
+    return {categoria.id: factor_impuestos_categoria(categoria) for categoria in categorias}
+
+
+def _redondear(valor, multiplo):
+    return (valor / multiplo).quantize(Decimal('1'), rounding=ROUND_HALF_UP) * multiplo
+
+
+def _neto_y_final(neto, factor, redondeo=None):
+    """Precio neto (centavos) y final (pesos) de la lista, como PrecioArticulo.save()"""
+    if redondeo:
+        final = _redondear(neto * factor, redondeo)
+        neto = (final / factor).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+    else:
+        neto = neto.quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+    return neto, (neto * factor).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+
+
+def precios_lista(lista, articulo_ids=None):
+    """{articulo_id: precio} de la lista (una consulta)"""
+    precios = PrecioArticulo.objects.filter(lista_precio=lista)
+    if articulo_ids is not None:
+        precios = precios.filter(articulo_id__in=articulo_ids)
+    return dict(precios.values_list('articulo_id', 'precio'))
+
+
+def calcular_cambios(lista, articulos, regla):
+    """
+    Calcula los precios que la regla deja en la lista para los artículos
+    indicados, sin escribir nada.
+
+    Args:
+        lista: ListaPrecio
+        articulos: QuerySet de Articulo ya filtrado
+        regla: ReglaPrecio
+
+    Returns:
+        list: CambioPrecio de los artículos cuyo precio cambia (o que no
+        tenían precio en la lista), ordenados por nombre
+    """
+    factores = factores_impuestos(lista.empresa_id)
+    actuales = precios_lista(lista)
+    cambios = []
+    filas = articulos.order_by('nombre', 'id').values_list(
+        'id', 'codigo', 'nombre', 'categoria_id', 'precio_costo', 'precio_venta', 'precio_final'
+    )
+    for articulo_id, codigo, nombre, categoria_id, costo, neto, final in filas.iterator(chunk_size=LOTE):
+        factor = factores.get(categoria_id) or factor_impuestos_categoria(None)
+        actual = actuales.get(articulo_id)
+
+        if regla.tipo == 'margen':
+            base = costo
+        elif regla.base == 'lista':
+            base = actual
+        elif regla.base == 'final':
+            base = final
+        else:
+            base = neto
+        if not base or base <= 0:
+            continue  # Sin precio base (o sin costo) no se calcula
+
+        nuevo = regla.aplicar(base)
+        if regla.base == 'final':
+            nuevo = nuevo / factor
+        if nuevo <= 0:
+            continue
+
+        nuevo, precio_final = _neto_y_final(nuevo, factor, regla.redondeo)
+        if nuevo <= 0 or nuevo == actual:
+            continue
+        cambios.append(CambioPrecio(articulo_id, codigo, nombre, actual, nuevo, precio_final))
+    return cambios
+
+
+def resumen_cambios(cambios):
+    """Totales de la vista previa"""
+    resumen = {'total': len(cambios), 'nuevos': 0, 'suben': 0, 'bajan': 0}
+    for cambio in cambios:
+        if cambio.precio_actual is None:
+            resumen['nuevos'] += 1
+        elif cambio.precio_nuevo > cambio.precio_actual:
+            resumen['suben'] += 1
+        else:
+            resumen['bajan'] += 1
+    return resumen
+
+
+def firma_cambios(cambios):
+    """Huella de la vista previa (artículo, precio actual y nuevo)"""
+    contenido = '|'.join(f'{c.articulo_id}:{c.precio_actual}:{c.precio_nuevo}' for c in cambios)
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+
+def aplicar_cambios(lista, cambios, lote=LOTE):
+    """
+    Escribe los precios nuevos en la lista con INSERT ... ON CONFLICT DO
+    UPDATE por lotes, en una sola transacción.
+
+    Returns:
+        int: Cantidad de precios escritos
+    """
+    ahora = timezone.now()
+    precios = [
+        PrecioArticulo(
+            articulo_id=cambio.articulo_id,
+            lista_precio=lista,
+            precio=cambio.precio_nuevo,
+            precio_final=cambio.precio_final,
+            fecha_creacion=ahora,
+            fecha_actualizacion=ahora,
+        )
+        for cambio in cambios
+    ]
+    with transaction.atomic():
+        PrecioArticulo.objects.bulk_create(
+            precios,
+            batch_size=lote,
+            update_conflicts=True,
+            unique_fields=['articulo', 'lista_precio'],
+            update_fields=['precio', 'precio_final', 'fecha_actualizacion'],
+        )
+        lista.save(update_fields=['fecha_actualizacion'])
+        _notificar_indice_pos(lista, [cambio.articulo_id for cambio in cambios])
+    return len(precios)
+
+
+def _notificar_indice_pos(lista, articulo_ids):
+    """
+    El upsert masivo no dispara los post_save de PrecioArticulo: se avisa al
+    índice de búsqueda del POS al confirmar la transacción
+    """
+    from ventas import busqueda_pos
+
+    if articulo_ids:
+        transaction.on_commit(lambda: busqueda_pos.notificar_precios_masivo(lista.empresa_id, articulo_ids))
+
+
+def guardar_precios(lista, precios):
+    """
+    Guarda los precios ingresados a mano en la grilla de la lista: un solo
+    upsert para los precios que cambian y un solo DELETE para los vaciados.
+
+    Args:
+        lista: ListaPrecio
+        precios: {articulo_id: Decimal o None}; None o 0 quita el artículo de la lista
+
+    Returns:
+        tuple: (guardados, eliminados)
+    """
+    articulos = Articulo.objects.filter(empresa_id=lista.empresa_id, pk__in=list(precios)).values_list(
+        'id', 'codigo', 'nombre', 'categoria_id'
+    )
+    factores = factores_impuestos(lista.empresa_id)
+    actuales = precios_lista(lista, list(precios))
+
+    cambios = []
+    quitar = []
+    for articulo_id, codigo, nombre, categoria_id in articulos:
+        precio = precios[articulo_id]
+        if not precio or precio <= 0:
+            if articulo_id in actuales:
+                quitar.append(articulo_id)
+            continue
+        factor = factores.get(categoria_id) or factor_impuestos_categoria(None)
+        neto, final = _neto_y_final(precio, factor)
+        if neto != actuales.get(articulo_id):
+            cambios.append(CambioPrecio(articulo_id, codigo, nombre, actuales.get(articulo_id), neto, final))
+
+    eliminados = 0
+    with transaction.atomic():
+        if quitar:
+            eliminados, _ = PrecioArticulo.objects.filter(lista_precio=lista, articulo_id__in=quitar).delete()
+            _notificar_indice_pos(lista, quitar)
+        aplicar_cambios(lista, cambios)
+    return len(cambios), eliminados
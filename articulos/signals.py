@@ -0,0 +1,29 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import Articulo, CategoriaArticulo, ImpuestoEspecifico, PrecioArticulo
+
+
+@receiver(post_save, sender=Articulo)
+def recalcular_precios_articulo(sender, instance, created, **kwargs):
+    """Recalcula los precios finales por lista si cambió la categoría del artículo"""
+    if created:
+        return
+    PrecioArticulo.recalcular_precios_finales(PrecioArticulo.objects.filter(articulo=instance))
+
+
+@receiver(post_save, sender=CategoriaArticulo)
+def recalcular_precios_categoria(sender, instance, created, **kwargs):
+    """Recalcula los precios finales por lista al cambiar los impuestos de la categoría"""
+    if created:
+        return
+    PrecioArticulo.recalcular_precios_finales(PrecioArticulo.objects.filter(articulo__categoria=instance))
+
+
+@receiver(post_save, sender=ImpuestoEspecifico)
+def recalcular_precios_impuesto(sender, instance, created, **kwargs):
+    """Recalcula los precios finales por lista de las categorías que usan el impuesto"""
+    if created:
+        return
+    PrecioArticulo.recalcular_precios_finales(
+        PrecioArticulo.objects.filter(articulo__categoria__impuesto_especifico=instance)
+    )
@@ -1,3 +1,59 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from articulos.numeros import decimal_chileno, formato_entrada, parsear_numero
+
+
+class ParsearNumeroTest(SimpleTestCase):
+    """Interpretación única de los números escritos en formato chileno o con punto decimal"""
+
+    def test_formatos_validos(self):
+        casos = {
+            '1.234,56': '1234.56',
+            '1234,56': '1234.56',
+            '-1.234,5': '-1234.5',
+            '1.234.567': '1234567',
+            '1234.56': '1234.56',
+            '1.234': '1.234',
+            '0,5': '0.5',
+            ',5': '0.5',
+            '.5': '0.5',
+            '$1.990,00': '1990.00',
+            '\xa01 000\xa0': '1000',
+            '+15': '15',
+            '10.': '10',
+        }
+        for texto, esperado in casos.items():
+            with self.subTest(texto=texto):
+                self.assertEqual(parsear_numero(texto), Decimal(esperado))
+
+    def test_miles_con_punto(self):
+        self.assertEqual(parsear_numero('1.234', miles_con_punto=True), Decimal('1234'))
+        self.assertEqual(parsear_numero('-12.345', miles_con_punto=True), Decimal('-12345'))
+        # Un punto que no separa grupos de tres sigue siendo decimal
+        self.assertEqual(parsear_numero('12.5', miles_con_punto=True), Decimal('12.5'))
+        self.assertEqual(parsear_numero('1.2345', miles_con_punto=True), Decimal('1.2345'))
+
+    def test_vacios_y_numeros(self):
+        self.assertIsNone(parsear_numero(None))
+        self.assertIsNone(parsear_numero(''))
+        self.assertIsNone(parsear_numero('  $ '))
+        self.assertEqual(parsear_numero(Decimal('1.50')), Decimal('1.50'))
+        self.assertEqual(parsear_numero(7), Decimal('7'))
+        self.assertEqual(parsear_numero(0.1), Decimal('0.1'))
+
+    def test_textos_invalidos(self):
+        for texto in ('abc', '1,2,3', '12.34,5', '1.23.4', '1..2', '1-2', '--1', '1e3', 'NaN', ','):
+            with self.subTest(texto=texto):
+                with self.assertRaises(ValueError):
+                    parsear_numero(texto)
+
+    def test_decimal_chileno_y_formato_entrada(self):
+        self.assertEqual(decimal_chileno('abc'), Decimal('0'))
+        self.assertIsNone(decimal_chileno(None, defecto=None))
+        self.assertEqual(decimal_chileno('1.234,5'), Decimal('1234.5'))
+        self.assertEqual(formato_entrada(Decimal('1234.50')), '1234,5')
+        self.assertEqual(formato_entrada(Decimal('1990.00')), '1990')
+        self.assertEqual(formato_entrada(None), '')
+        self.assertEqual(parsear_numero(formato_entrada(Decimal('0.125')), miles_con_punto=True), Decimal('0.125'))
@@ -3,10 +3,10 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
 from django.core.paginator import Paginator
-from django.db.models import Q, Sum
+from django.db.models import Count, F, Q
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse, HttpResponse
-from decimal import Decimal, InvalidOperation
+from decimal import Decimal
 import json
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
@@ -21,8 +21,10 @@ from reportlab.pdfgen import canvas
 from datetime import datetime
 import os
 from .models import Articulo, CategoriaArticulo, UnidadMedida, StockArticulo, ImpuestoEspecifico, ListaPrecio, PrecioArticulo, HomologacionCodigo, KitOferta, KitOfertaItem
-from inventario.models import Stock, Inventario
-from .forms import ArticuloForm, CategoriaArticuloForm, UnidadMedidaForm, ImpuestoEspecificoForm, ListaPrecioForm, PrecioArticuloForm, HomologacionCodigoForm, KitOfertaForm, KitOfertaItemForm
+from inventario.models import Stock
+from inventario.services import anotar_stock_total
+from .forms import ArticuloForm, CategoriaArticuloForm, UnidadMedidaForm, ImpuestoEspecificoForm, ListaPrecioForm, PrecioArticuloForm, HomologacionCodigoForm, KitOfertaForm, KitOfertaItemForm, ReglaPrecioForm
+from .numeros import formato_entrada, parsear_numero
 from core.decorators import requiere_empresa, requiere_permiso
 
 
@@ -44,14 +46,20 @@ def articulo_list(request):
         'categoria': 'categoria__nombre',
         'tipo': 'tipo_articulo',
         'precio': 'precio_final',
-        'stock': 'stock_actual',
+        'stock': 'stock_total',
         'fecha': 'fecha_creacion'
     }
     
     sort_field = allowed_sort_fields.get(sort, 'nombre')
     order_by = sort_field if direction == 'asc' else f'-{sort_field}'
+    if sort_field == 'stock_total':
+        # Los artículos sin control de stock (None) quedan al final en ambos sentidos
+        order_by = F(sort_field).asc(nulls_last=True) if direction == 'asc' else F(sort_field).desc(nulls_last=True)
     
-    articulos = articulos_base.order_by(order_by)
+    # Stock total (saldo materializado de todas las bodegas) anotado en la misma consulta de la página
+    articulos = anotar_stock_total(
+        articulos_base.select_related('categoria'), request.empresa
+    ).order_by(order_by, 'pk')
     
     # Filtros
     search = request.GET.get('search', '')
@@ -76,41 +84,17 @@ def articulo_list(request):
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
-    # Agregar stock total a cada artículo (alineado a Kardex)
-    for articulo in page_obj:
-        if articulo.control_stock:
-            # 1) Calcular por movimientos confirmados (Kardex)
-            movs = Inventario.objects.filter(
-                empresa=request.empresa,
-                articulo=articulo,
-                estado='confirmado'
-            )
-            # Entradas y ajustes suman; salidas restan; transferencias neto 0 en total global
-            entradas = movs.filter(tipo_movimiento__in=['entrada', 'ajuste']).aggregate(s=Sum('cantidad'))['s'] or 0
-            salidas = movs.filter(tipo_movimiento='salida').aggregate(s=Sum('cantidad'))['s'] or 0
-            stock_kardex = (entradas - salidas)
-
-            # 2) Fallback a tabla Stock (filtrando por empresa) si no hay movimientos
-            if stock_kardex is None:
-                stock_kardex = 0
-            if stock_kardex == 0:
-                stock_tabla = Stock.objects.filter(empresa=request.empresa, articulo=articulo).aggregate(
-                    total=Sum('cantidad')
-                )['total'] or 0
-                articulo.stock_total = stock_tabla
-            else:
-                articulo.stock_total = stock_kardex
-        else:
-            articulo.stock_total = None
-    
-    # Estadísticas reales (antes de aplicar filtros)
-    articulos_totales = Articulo.objects.filter(empresa=request.empresa)
-    total_articulos = articulos_totales.count()
-    articulos_activos = articulos_totales.filter(activo=True).count()
-    articulos_inactivos = articulos_totales.filter(activo=False).count()
-    
-    # Contar artículos con control de stock
-    articulos_con_stock = articulos_totales.filter(control_stock=True).count()
+    # Estadísticas reales (antes de aplicar filtros), en una sola consulta
+    estadisticas = articulos_base.aggregate(
+        total=Count('id'),
+        activos=Count('id', filter=Q(activo=True)),
+        inactivos=Count('id', filter=Q(activo=False)),
+        con_stock=Count('id', filter=Q(control_stock=True)),
+    )
+    total_articulos = estadisticas['total']
+    articulos_activos = estadisticas['activos']
+    articulos_inactivos = estadisticas['inactivos']
+    articulos_con_stock = estadisticas['con_stock']
     
     # Categorías para el filtro
     categorias = CategoriaArticulo.objects.filter(empresa=request.empresa, activa=True)
@@ -767,10 +751,10 @@ def buscar_por_codigo_barras(request):
                     'id': articulo.id,
                     'nombre': articulo.nombre,
                     'descripcion': articulo.descripcion,
-                    'precio_costo': str(articulo.precio_costo),
-                    'precio_venta': str(articulo.precio_venta),
-                    'precio_final': str(articulo.precio_final),
-                    'margen_porcentaje': str(articulo.margen_porcentaje),
+                    'precio_costo': formato_entrada(articulo.precio_costo),
+                    'precio_venta': formato_entrada(articulo.precio_venta),
+                    'precio_final': formato_entrada(articulo.precio_final),
+                    'margen_porcentaje': formato_entrada(articulo.margen_porcentaje),
                     'categoria_id': articulo.categoria.id if articulo.categoria else None,
                     'categoria_exenta_iva': categoria_exenta_iva,
                     'impuesto_especifico_porcentaje': impuesto_especifico_porcentaje,
@@ -1004,91 +988,58 @@ def lista_precio_gestionar_precios(request, pk):
     """Gestionar precios de artículos en una lista"""
     lista = get_object_or_404(ListaPrecio, pk=pk, empresa=request.empresa)
     
-    # Manejar aplicación masiva de descuento
-    if request.method == 'POST' and 'aplicar_descuento_masivo' in request.POST:
-        try:
-            descuento = float(request.POST.get('descuento_porcentaje', 0))
-            base_calculo = request.POST.get('base_calculo', 'neto')
-            categoria_id = request.POST.get('categoria_filtro', '')
+    from .reglas_precios import (
+        MAX_VISTA_PREVIA, aplicar_cambios, calcular_cambios, firma_cambios, guardar_precios, resumen_cambios,
+    )
+    
+    form_regla = ReglaPrecioForm(empresa=request.empresa)
+    vista_previa = None
+    
+    # Regla masiva: primero la vista previa, luego la aplicación confirmada
+    if request.method == 'POST' and ('previsualizar_regla' in request.POST or 'aplicar_regla' in request.POST):
+        form_regla = ReglaPrecioForm(request.POST, empresa=request.empresa)
+        if form_regla.is_valid():
+            regla = form_regla.cleaned_data['regla']
+            articulos_regla = Articulo.objects.filter(empresa=request.empresa, activo=True)
+            if form_regla.cleaned_data.get('categoria'):
+                articulos_regla = articulos_regla.filter(categoria=form_regla.cleaned_data['categoria'])
             
-            # Obtener artículos a actualizar
-            articulos_query = Articulo.objects.filter(empresa=request.empresa, activo=True)
-            if categoria_id:
-                articulos_query = articulos_query.filter(categoria_id=categoria_id)
+            cambios = calcular_cambios(lista, articulos_regla, regla)
+            firma = firma_cambios(cambios)
             
-            contador = 0
-            for articulo in articulos_query:
-                if base_calculo == 'neto':
-                    precio_base = float(articulo.precio_venta)
-                    nuevo_precio = precio_base * (1 - descuento / 100)
-                else:
-                    precio_base = float(articulo.precio_final)
-                    nuevo_precio = precio_base * (1 - descuento / 100)
-                    nuevo_precio = nuevo_precio / 1.19  # Convertir a neto
-                
-                if nuevo_precio > 0:
-                    PrecioArticulo.objects.update_or_create(
-                        articulo=articulo,
-                        lista_precio=lista,
-                        defaults={'precio': Decimal(str(round(nuevo_precio, 2)))}
-                    )
-                    contador += 1
+            if 'aplicar_regla' in request.POST:
+                if request.POST.get('firma') == firma:
+                    aplicados = aplicar_cambios(lista, cambios)
+                    messages.success(request, f'✅ Regla aplicada a {aplicados} artículos ({regla})')
+                    return redirect('articulos:lista_precio_gestionar_precios', pk=lista.pk)
+                messages.warning(request, 'Los precios cambiaron desde la vista previa. Revise la nueva vista previa antes de aplicar.')
             
-            lista.save(update_fields=['fecha_actualizacion'])
-            messages.success(request, f'✅ Descuento aplicado a {contador} artículos')
-            return redirect('articulos:lista_precio_gestionar_precios', pk=lista.pk)
-        except Exception as e:
-            messages.error(request, f'Error al aplicar descuento: {str(e)}')
-            return redirect('articulos:lista_precio_gestionar_precios', pk=lista.pk)
+            vista_previa = {
+                'regla': regla,
+                'resumen': resumen_cambios(cambios),
+                'cambios': cambios[:MAX_VISTA_PREVIA],
+                'omitidos': max(len(cambios) - MAX_VISTA_PREVIA, 0),
+                'firma': firma,
+            }
+        else:
+            for error in form_regla.non_field_errors():
+                messages.error(request, error)
     
-    if request.method == 'POST':
-        # Procesar los precios enviados
-        guardados = 0
-        eliminados = 0
-        
+    elif request.method == 'POST':
+        # Precios ingresados en la grilla: un upsert y un DELETE para toda la lista
+        precios = {}
         for key, value in request.POST.items():
-            if key.startswith('precio_'):
-                try:
-                    def clean_id(dirty_id):
-                        if isinstance(dirty_id, str):
-                            return ''.join(filter(str.isdigit, dirty_id))
-                        return dirty_id
-                    
-                    articulo_id_raw = key.replace('precio_', '')
-                    articulo_id = clean_id(articulo_id_raw)
-                    articulo = Articulo.objects.get(id=articulo_id, empresa=request.empresa)
-                        
-                    # Limpiar el valor: eliminar puntos (separadores de miles) y espacios
-                    if value and value.strip():
-                        value_clean = value.replace('.', '').replace(' ', '').replace(',', '.')
-                        precio_value = Decimal(value_clean) if value_clean else None
-                    else:
-                        precio_value = None
-                    
-                    if precio_value and precio_value > 0:
-                        # Crear o actualizar precio
-                        PrecioArticulo.objects.update_or_create(
-                            articulo=articulo,
-                            lista_precio=lista,
-                            defaults={'precio': precio_value}
-                        )
-                        guardados += 1
-                    else:
-                        # Eliminar precio si está vacío o es 0
-                        deleted_count, _ = PrecioArticulo.objects.filter(
-                            articulo=articulo,
-                            lista_precio=lista
-                        ).delete()
-                        if deleted_count > 0:
-                            eliminados += 1
-                            
-                except (Articulo.DoesNotExist, ValueError, InvalidOperation):
-                    print(f"ADVERTENCIA: Error al procesar precio para la clave '{key}'. Saltando...")
-                    continue
-        
-        # Actualizar fecha de modificación de la lista
-        lista.save(update_fields=['fecha_actualizacion'])
+            if not key.startswith('precio_'):
+                continue
+            articulo_id = ''.join(filter(str.isdigit, key.replace('precio_', '')))
+            if not articulo_id:
+                continue
+            try:
+                precios[int(articulo_id)] = parsear_numero(value)
+            except ValueError:
+                print(f"ADVERTENCIA: Error al procesar precio para la clave '{key}'. Saltando...")
         
+        guardados, eliminados = guardar_precios(lista, precios)
         messages.success(request, f'✅ Precios actualizados: {guardados} guardados, {eliminados} eliminados.')
         return redirect('articulos:lista_precio_detail', pk=lista.pk)
     
@@ -1115,6 +1066,8 @@ def lista_precio_gestionar_precios(request, pk):
         'lista': lista,
         'articulos': articulos_list,
         'categorias': categorias,
+        'form_regla': form_regla,
+        'vista_previa': vista_previa,
     }
     
     return render(request, 'articulos/lista_precio_gestionar.html', context)
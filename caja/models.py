@@ -208,6 +208,11 @@ class AperturaCaja(models.Model):
         
         self.save()
 
+        # Los folios reservados por la estación quedan para las demás cajas
+        if self.caja.estacion_trabajo_id:
+            from facturacion_electronica.asignador_folios import liberar_bloques
+            liberar_bloques(self.caja.estacion_trabajo_id)
+
 
 class MovimientoCaja(models.Model):
     """Modelo para registrar todos los movimientos de caja"""
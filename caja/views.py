@@ -13,10 +13,12 @@ from core.decorators import requiere_empresa, requiere_permiso
 from .models import Caja, AperturaCaja, MovimientoCaja, VentaProcesada
 from .forms import CajaForm, AperturaCajaForm, CierreCajaForm, ProcesarVentaForm, MovimientoCajaForm
 from ventas.models import Venta, VentaDetalle, FormaPago
+from ventas.documentos import copiar_detalles
 from inventario.models import Stock, Inventario
+from inventario import services as servicio_stock
 from facturacion_electronica.dte_generator import DTEXMLGenerator
-from facturacion_electronica.firma_electronica import FirmadorDTE
-from facturacion_electronica.pdf417_generator import PDF417Generator
+from facturacion_electronica.firma_electronica import obtener_firmador_empresa
+from facturacion_electronica.timbre_pdf417 import programar_timbre_pdf417
 from facturacion_electronica.models import DocumentoTributarioElectronico
 # TODO: Implementar modelos de cuenta corriente para clientes en tesoreria
 # from tesoreria.models import CuentaCorrienteCliente, MovimientoCuentaCorriente
@@ -1210,15 +1212,8 @@ def procesar_venta(request, ticket_id):
                         # Copiar detalles
                     detalles_count = ticket.ventadetalle_set.count()
                     print(f"Copiando {detalles_count} detalles...")
-                    for detalle_ticket in ticket.ventadetalle_set.all():
-                        VentaDetalle.objects.create(
-                            venta=venta_final,
-                            articulo=detalle_ticket.articulo,
-                            cantidad=detalle_ticket.cantidad,
-                            precio_unitario=detalle_ticket.precio_unitario,
-                            precio_total=detalle_ticket.precio_total,
-                            impuesto_especifico=detalle_ticket.impuesto_especifico
-                        )
+                    # En bloque: la cabecera se guarda una vez, con todas las líneas
+                    copiar_detalles(ticket, venta_final)
                     
                     # ==============================================================================
                     # REGISTRO DE MOVIMIENTOS Y VENTA PROCESADA SEGÚN ESCENARIO
@@ -1296,18 +1291,11 @@ def procesar_venta(request, ticket_id):
                     # Descontar stock (solo si NO es guía)
                     # Las guías son documentos de traslado, no de venta
                     if tipo_documento != 'guia' and apertura_activa.caja.bodega:
-                        # Deshabilitar temporalmente el signal para evitar duplicados
-                        from django.db.models.signals import post_save
-                        from ventas.signals import actualizar_stock_venta
-                        post_save.disconnect(actualizar_stock_venta, sender=Venta)
-                        
-                        try:
-                            # Descontar stock y crear movimientos de inventario
-                            descontar_stock_venta_completo(venta_final, apertura_activa.caja.bodega)
-                            venta_procesada.stock_descontado = True
-                        finally:
-                            # Re-conectar el signal
-                            post_save.connect(actualizar_stock_venta, sender=Venta)
+                        # Descontar stock y crear movimientos de inventario desde la
+                        # bodega de la caja (el signal de Venta no descuenta las
+                        # ventas procesadas en caja)
+                        descontar_stock_venta_completo(venta_final, apertura_activa.caja.bodega)
+                        venta_procesada.stock_descontado = True
                     
                     venta_procesada.save()
 
@@ -1402,7 +1390,8 @@ def procesar_venta(request, ticket_id):
                             folio_dte, caf_obtenido = FolioService.obtener_siguiente_folio(
                                 empresa=request.empresa,
                                 tipo_documento=tipo_dte,
-                                sucursal=sucursal_facturacion
+                                sucursal=sucursal_facturacion,
+                                estacion=venta_final.estacion_trabajo
                             )
                             
                             if folio_dte is None or caf_obtenido is None:
@@ -1476,7 +1465,7 @@ def procesar_venta(request, ticket_id):
                             xml_sin_firmar = generator.generar_xml_desde_dte()
 
                             # 2. Firmar XML
-                            firmador = FirmadorDTE(empresa.certificado_digital.path, empresa.password_certificado)
+                            firmador = obtener_firmador_empresa(empresa)
                             xml_firmado = firmador.firmar_xml(xml_sin_firmar)
 
                             # 3. Generar TED (usar DTEBox si está habilitado, sino generar localmente)
@@ -1526,8 +1515,9 @@ def procesar_venta(request, ticket_id):
                             dte.estado_sii = 'generado'
                             dte.save()
 
-                            # 6. Generar imagen del timbre
-                            PDF417Generator.guardar_pdf417_en_dte(dte)
+                            # 6. Imagen del timbre (al confirmar la transacción, antes de
+                            #    redirigir a la impresión, que sólo la lee del caché)
+                            programar_timbre_pdf417(dte)
                             
                             # CRÍTICO: Asignar DTE a venta_procesada y guardar INMEDIATAMENTE
                             venta_procesada.dte_generado = dte
@@ -1561,11 +1551,10 @@ def procesar_venta(request, ticket_id):
                             if debe_enviar_sii:
                                 print(f"[✓] ENVIANDO DTE AL SII EN SEGUNDO PLANO...")
                                 try:
-                                    # Usar envío en background (threading)
-                                    from facturacion_electronica.background_sender import get_background_sender
+                                    # Cola persistente de envío (se procesa al confirmar la transacción)
+                                    from facturacion_electronica.cola_envio import encolar_dte
                                     
-                                    sender = get_background_sender()
-                                    if sender.enviar_dte(dte.id, request.empresa.id):
+                                    if encolar_dte(dte.id, request.empresa.id):
                                         print(f"[OK] ✅ DTE agregado a la cola de envío (background)")
                                         if tipo_documento == 'guia':
                                             messages.success(request, f'✅ Guía de Despacho N° {dte.folio} generada y enviándose al SII. Puede tardar unos segundos.')
@@ -1900,94 +1889,9 @@ def procesar_venta(request, ticket_id):
 # FUNCIONES AUXILIARES
 # ========================================
 
-def descontar_stock_venta(venta, bodega):
-    """Descuenta el stock de los artículos vendidos (solo actualiza stock, no crea movimientos)"""
-    for detalle in venta.ventadetalle_set.all():
-        try:
-            stock = Stock.objects.get(
-                empresa=venta.empresa,
-                bodega=bodega,
-                articulo=detalle.articulo
-            )
-            
-            if stock.cantidad >= detalle.cantidad:
-                stock.cantidad -= detalle.cantidad
-                stock.save()
-            else:
-                # Si no hay suficiente stock, descontar lo que haya
-                stock.cantidad = Decimal('0.00')
-                stock.save()
-        except Stock.DoesNotExist:
-            # Si no existe el stock, crearlo con cantidad 0
-            Stock.objects.create(
-                empresa=venta.empresa,
-                bodega=bodega,
-                articulo=detalle.articulo,
-                cantidad=Decimal('0.00'),
-                precio_promedio=detalle.precio_unitario
-            )
-
-
 def descontar_stock_venta_completo(venta, bodega):
     """Descuenta el stock y crea movimientos de inventario, evitando duplicados"""
-    
-    for detalle in venta.ventadetalle_set.all():
-        articulo = detalle.articulo
-        
-        # Solo procesar si el artículo tiene control de stock
-        if not articulo.control_stock:
-            continue
-        
-        # Verificar si ya existe un movimiento de inventario para esta venta y artículo
-        movimiento_existente = Inventario.objects.filter(
-            empresa=venta.empresa,
-            bodega_origen=bodega,
-            articulo=articulo,
-            tipo_movimiento='salida',
-            numero_documento=venta.numero_venta,
-            estado='confirmado'
-        ).first()
-        
-        if movimiento_existente:
-            # Si ya existe, solo actualizar el stock si es necesario, pero no crear otro movimiento
-            print(f"[INFO] Movimiento de inventario ya existe para venta {venta.numero_venta}, artículo {articulo.nombre}. Saltando creación duplicada.")
-            continue
-        
-        # Actualizar stock
-        try:
-            stock = Stock.objects.get(
-                empresa=venta.empresa,
-                bodega=bodega,
-                articulo=articulo
-            )
-            
-            if stock.cantidad >= detalle.cantidad:
-                stock.cantidad -= detalle.cantidad
-            else:
-                stock.cantidad = Decimal('0.00')
-            stock.save()
-        except Stock.DoesNotExist:
-            stock = Stock.objects.create(
-                empresa=venta.empresa,
-                bodega=bodega,
-                articulo=articulo,
-                cantidad=Decimal('0.00'),
-                precio_promedio=detalle.precio_unitario
-            )
-        
-        # Crear movimiento de inventario
-        Inventario.objects.create(
-            empresa=venta.empresa,
-            bodega_origen=bodega,
-            articulo=articulo,
-            tipo_movimiento='salida',
-            cantidad=detalle.cantidad,
-            precio_unitario=detalle.precio_unitario,
-            descripcion=f'Venta {venta.numero_venta} - {venta.get_tipo_documento_display()}',
-            numero_documento=venta.numero_venta,
-            estado='confirmado',
-            creado_por=venta.usuario_creacion
-        )
+    return servicio_stock.descontar_stock_venta(venta, bodega)
 
 
 def actualizar_cuenta_corriente_cliente(venta, cliente):
@@ -251,23 +251,15 @@ def procesar_venta_caja(request, ticket_id):
                 # Recalcular totales de la apertura
                 apertura_activa.calcular_totales()
             
-            # 3. Descontar stock
-            from inventario.models import Stock
+            # 3. Descontar stock (un solo posteo por documento, idempotente por venta)
+            from inventario.services import descontar_stock_venta
             
             bodega_caja = apertura_activa.caja.bodega
-            for detalle in ticket.ventadetalle_set.all():
-                stock = Stock.objects.filter(
-                    empresa=request.empresa,
-                    bodega=bodega_caja,
-                    articulo=detalle.articulo
-                ).first()
-                
-                if stock:
-                    stock.cantidad -= detalle.cantidad
-                    stock.save()
-                    print(f"[CAJA] Stock descontado: {detalle.articulo.nombre} - {detalle.cantidad}")
-                else:
-                    print(f"[CAJA] ADVERTENCIA: No se encontr stock para {detalle.articulo.nombre} en bodega {bodega_caja.nombre}")
+            if bodega_caja:
+                movimientos = descontar_stock_venta(ticket, bodega_caja)
+                print(f"[CAJA] Stock descontado: {movimientos} movimientos en bodega {bodega_caja.nombre}")
+            else:
+                print(f"[CAJA] ADVERTENCIA: La caja no tiene bodega asociada, no se descuenta stock")
             
             # 4. Marcar ticket como facturado
             ticket.facturado = True
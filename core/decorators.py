@@ -9,6 +9,8 @@ from django.core.exceptions import PermissionDenied
 from django.http import JsonResponse
 import logging
 
+from empresas import tenant
+
 logger = logging.getLogger(__name__)
 
 
@@ -43,12 +45,16 @@ def requiere_empresa(view_func):
             empresa_id = request.session.get('empresa_activa')
             
             if empresa_id:
-                try:
-                    empresa = Empresa.objects.get(id=empresa_id)
+                # Reutilizar la empresa ya resuelta por el middleware o la del cache
+                empresa_request = getattr(request, 'empresa', None)
+                if empresa_request is not None and empresa_request.id == empresa_id:
+                    empresa = empresa_request
+                else:
+                    empresa = tenant.obtener_empresa(empresa_id)
+                if empresa:
                     logger.debug(f"[SUPERUSER] Empresa desde sesión: {empresa.nombre}")
-                except Empresa.DoesNotExist:
+                else:
                     logger.warning(f"[SUPERUSER] Empresa ID {empresa_id} en sesión no existe")
-                    empresa = None
             
             # Si no hay empresa en sesión, buscar empresa por defecto
             if not empresa:
@@ -81,9 +87,10 @@ def requiere_empresa(view_func):
             logger.debug(f"[USER] Acceso de usuario normal a {view_func.__name__}: {request.user.username}")
             
             try:
-                # Obtener empresa del perfil
-                if hasattr(request.user, 'perfil') and request.user.perfil:
-                    empresa = request.user.perfil.empresa
+                # Obtener empresa del perfil (ya resuelto por el middleware, ver empresas.tenant)
+                perfil = tenant.obtener_perfil(request.user)
+                if perfil:
+                    empresa = perfil.empresa
                     
                     if not empresa:
                         logger.error(f"[USER] Usuario {request.user.username} sin empresa asignada")
@@ -153,10 +160,11 @@ def requiere_empresa_json(view_func):
         if request.user.is_superuser:
             empresa_id = request.session.get('empresa_activa')
             if empresa_id:
-                try:
-                    empresa = Empresa.objects.get(id=empresa_id)
-                except Empresa.DoesNotExist:
-                    empresa = None
+                empresa_request = getattr(request, 'empresa', None)
+                if empresa_request is not None and empresa_request.id == empresa_id:
+                    empresa = empresa_request
+                else:
+                    empresa = tenant.obtener_empresa(empresa_id)
             
             if not empresa:
                 empresa = Empresa.objects.filter(nombre__icontains='Kreasoft').first()
@@ -171,8 +179,9 @@ def requiere_empresa_json(view_func):
                 request.empresa = empresa
         else:
             try:
-                if hasattr(request.user, 'perfil') and request.user.perfil:
-                    empresa = request.user.perfil.empresa
+                perfil = tenant.obtener_perfil(request.user)
+                if perfil:
+                    empresa = perfil.empresa
                     if empresa:
                         request.empresa = empresa
             except:
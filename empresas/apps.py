@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EmpresasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'empresas'
+
+    def ready(self):
+        """Importar señales cuando la app esté lista"""
+        import empresas.signals
@@ -1,4 +1,4 @@
-from .models import Empresa
+from . import tenant
 
 def empresa_context(request):
     context = {
@@ -8,12 +8,14 @@ def empresa_context(request):
     if request.user.is_authenticated:
         empresa_id = request.session.get('empresa_activa_id')
         if empresa_id:
-            try:
-                context['empresa_actual'] = Empresa.objects.get(id=empresa_id)
-            except Empresa.DoesNotExist:
-                pass
+            # Normalmente es la misma empresa que ya resolvió el middleware
+            empresa = getattr(request, 'empresa', None)
+            if empresa is not None and empresa.id == empresa_id:
+                context['empresa_actual'] = empresa
+            else:
+                context['empresa_actual'] = tenant.obtener_empresa(empresa_id)
         
         if request.user.is_superuser:
-            context['todas_las_empresas'] = list(Empresa.objects.values('id', 'nombre'))
+            context['todas_las_empresas'] = tenant.listar_empresas()
             
     return context
@@ -0,0 +1,116 @@
+import re
+
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+
+from empresas import tenant
+from empresas.models import Empresa, Sucursal
+from usuarios.models import PerfilUsuario
+
+
+# Páginas más visitadas (nombre de URL)
+PAGINAS = [
+    'dashboard',
+    'ventas:pos_seleccion',
+    'ventas:libro_ventas',
+    'ventas:cotizacion_list',
+    'ventas:vale_list',
+    'ventas:vendedor_list',
+    'articulos:articulo_list',
+    'articulos:categoria_list',
+    'inventario:stock_list',
+    'inventario:inventario_list',
+    'bodegas:bodega_list',
+    'clientes:cliente_list',
+    'proveedores:proveedor_list',
+    'compras:orden_compra_list',
+    'tesoreria:cuenta_corriente_cliente_list',
+    'tesoreria:cuenta_corriente_proveedor_list',
+    'caja:apertura_list',
+    'facturacion_electronica:dte_list',
+    'informes:dashboard',
+    'produccion:orden_list',
+]
+
+# Consultas de la resolución de empresa / sucursal / perfil (FROM de sus tablas)
+TABLAS_TENANT = re.compile(
+    'FROM "(%s)"' % '|'.join(modelo._meta.db_table for modelo in (Empresa, Sucursal, PerfilUsuario))
+)
+
+
+class Command(BaseCommand):
+    help = 'Cuenta las consultas SQL de las 20 páginas más visitadas (total y de resolución de empresa/sucursal/perfil)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', required=True, help='Nombre de usuario con el que navegar')
+        parser.add_argument('--empresa', type=int, help='ID de la empresa activa (superusuarios)')
+
+    def handle(self, *args, **options):
+        try:
+            usuario = User.objects.get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f"Usuario {options['usuario']} no encontrado")
+
+        hosts = [host for host in settings.ALLOWED_HOSTS if host not in ('*',) and not host.startswith('.')]
+        client = Client(raise_request_exception=False, HTTP_HOST=hosts[0] if hosts else 'localhost')
+        client.force_login(usuario)
+        if options.get('empresa'):
+            sesion = client.session
+            sesion['empresa_activa_id'] = options['empresa']
+            sesion['empresa_activa'] = options['empresa']
+            sesion.save()
+
+        empresa_ids = set(PerfilUsuario.objects.filter(usuario=usuario).values_list('empresa_id', flat=True))
+        if options.get('empresa'):
+            empresa_ids.add(options['empresa'])
+
+        self.stdout.write(f'Usuario: {usuario.username}')
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'Página':<45} {'Estado':>6} {'SQL frío':>9} {'tenant':>7} {'SQL cache':>10} {'tenant':>7}"
+        )
+
+        totales = [0, 0, 0, 0]
+        for nombre in PAGINAS:
+            try:
+                url = reverse(nombre)
+            except NoReverseMatch:
+                self.stdout.write(self.style.WARNING(f'{nombre:<45} (URL no encontrada)'))
+                continue
+
+            # Frío: sin entradas en el cache. Caliente: segunda visita con el cache poblado
+            self._invalidar(usuario, empresa_ids)
+            estado, frio, frio_tenant = self._medir(client, url)
+            _, caliente, caliente_tenant = self._medir(client, url)
+
+            for indice, valor in enumerate((frio, frio_tenant, caliente, caliente_tenant)):
+                totales[indice] += valor
+            self.stdout.write(
+                f'{nombre:<45} {estado:>6} {frio:>9} {frio_tenant:>7} {caliente:>10} {caliente_tenant:>7}'
+            )
+
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'TOTAL':<45} {'':>6} {totales[0]:>9} {totales[1]:>7} {totales[2]:>10} {totales[3]:>7}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Consultas de empresa/sucursal/perfil: {totales[1]} sin cache -> {totales[3]} con cache'
+        ))
+
+    def _invalidar(self, usuario, empresa_ids):
+        """Descarta las entradas cacheadas del usuario y sus empresas (sin vaciar todo el cache)"""
+        tenant.invalidar_usuario(usuario.id)
+        for empresa_id in empresa_ids:
+            tenant.invalidar_empresa(empresa_id)
+
+    def _medir(self, client, url):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = client.get(url)
+        consultas = contexto.captured_queries
+        tenant = sum(1 for consulta in consultas if TABLAS_TENANT.search(consulta['sql']))
+        return respuesta.status_code, len(consultas), tenant
@@ -1,6 +1,6 @@
 from django.utils.deprecation import MiddlewareMixin
 from django.shortcuts import redirect
-from .models import Sucursal
+from . import tenant
 from django.contrib import messages
 from django.urls import reverse
 
@@ -61,12 +61,13 @@ class SucursalMiddleware(MiddlewareMixin):
         if not request.user.is_authenticated or not hasattr(request, 'empresa'):
             return
         
+        # Perfil ya resuelto por EmpresaMiddleware (sin consultas adicionales)
+        perfil = tenant.obtener_perfil(request.user)
+        
         # Verificar si el usuario puede cambiar de sucursal manualmente
         puede_cambiar = (
             request.user.is_superuser or 
-            (hasattr(request.user, 'perfil') and 
-             hasattr(request.user.perfil, 'tipo_usuario') and 
-             request.user.perfil.tipo_usuario in ['administrador'])
+            (perfil is not None and perfil.tipo_usuario in ['administrador'])
         )
         
         request.puede_cambiar_sucursal = puede_cambiar
@@ -75,21 +76,17 @@ class SucursalMiddleware(MiddlewareMixin):
             # Superusuarios/Administradores: Pueden seleccionar sucursal manualmente
             sucursal_id = request.session.get('sucursal_filtro_id')
             
-            if sucursal_id:
-                try:
-                    sucursal = Sucursal.objects.get(
-                        id=sucursal_id,
-                        empresa=request.empresa,
-                        estado='activa'
-                    )
+            if sucursal_id and request.empresa:
+                sucursal = tenant.obtener_sucursal(request.empresa, sucursal_id, estado='activa')
+                if sucursal:
                     request.sucursal_activa = sucursal
-                except Sucursal.DoesNotExist:
+                else:
                     # Limpiar sesión si la sucursal no existe
                     if 'sucursal_filtro_id' in request.session:
                         del request.session['sucursal_filtro_id']
         else:
             # Usuarios normales: Usar sucursal de su perfil automáticamente
-            if hasattr(request.user, 'perfil') and request.user.perfil:
-                sucursal_perfil = request.user.perfil.sucursal
+            if perfil:
+                sucursal_perfil = perfil.sucursal
                 if sucursal_perfil and sucursal_perfil.estado == 'activa':
                     request.sucursal_activa = sucursal_perfil
@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from usuarios.models import PerfilUsuario
+from .models import Empresa, Sucursal
+from . import tenant
+
+
+# ========== CACHE DE EMPRESA / SUCURSAL / PERFIL ==========
+# Invalida las entradas de empresas.tenant al confirmar la transacción, para
+# que otra petición no vuelva a cachear los datos anteriores al cambio.
+
+@receiver(post_save, sender=Empresa)
+@receiver(post_delete, sender=Empresa)
+def invalidar_cache_empresa(sender, instance, **kwargs):
+    transaction.on_commit(lambda: tenant.invalidar_empresa(instance.id))
+
+
+# ========== CACHE DE FIRMADORES DTE ==========
+# El cache de facturacion_electronica.firma_electronica ya se rearma solo si
+# cambia el archivo o la contraseña del certificado; esto libera en el proceso
+# actual el firmador anterior apenas se confirma el cambio.
+
+@receiver(post_save, sender=Empresa)
+@receiver(post_delete, sender=Empresa)
+def invalidar_firmador_empresa(sender, instance, **kwargs):
+    from facturacion_electronica.firma_electronica import invalidar_firmador
+    transaction.on_commit(lambda: invalidar_firmador(instance.id))
+
+
+@receiver(post_save, sender=Sucursal)
+@receiver(post_delete, sender=Sucursal)
+def invalidar_cache_sucursal(sender, instance, **kwargs):
+    transaction.on_commit(lambda: tenant.invalidar_empresa(instance.empresa_id))
+
+
+@receiver(post_save, sender=PerfilUsuario)
+@receiver(post_delete, sender=PerfilUsuario)
+def invalidar_cache_perfil(sender, instance, **kwargs):
+    transaction.on_commit(lambda: tenant.invalidar_usuario(instance.usuario_id))
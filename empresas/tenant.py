@@ -0,0 +1,218 @@
+"""
+Resolución de empresa / sucursal / perfil del usuario con cache.
+
+Los middlewares (EmpresaMiddleware, SucursalMiddleware), el decorador
+requiere_empresa y los context processors necesitan en cada petición el
+perfil del usuario, su empresa y la sucursal activa. Antes cada uno los
+consultaba por su cuenta; ahora se resuelven aquí:
+
+- Dentro de la petición, el perfil queda en request.user.perfil (y en
+  request.user.perfil_resuelto, None si no tiene) con su empresa y sucursal
+  ya asignadas, y la empresa en request.empresa.
+- Entre peticiones, el perfil (por usuario) y la empresa con sus sucursales
+  (por empresa) se guardan en el cache de Django junto con un sello: la
+  fecha de modificación del perfil, la de la empresa y la última fecha de
+  modificación y cantidad de sus sucursales.
+- Cada petición lee los sellos vigentes con una sola consulta indexada y
+  sólo usa la entrada del cache si coincide. Un cambio (usuario desactivado,
+  empresa suspendida, sucursal cerrada) rige desde la petición siguiente en
+  todos los workers, aunque el cache sea local a cada proceso (LocMemCache).
+- Las señales de empresas/signals.py además borran la entrada al confirmar
+  el cambio, para no guardar datos viejos hasta el próximo uso.
+
+La lista de empresas del selector de superusuarios no lleva sello (sólo
+nombres): se invalida por versión y TENANT_CACHE_TTL acota su duración.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, OuterRef, Subquery
+
+
+def _ttl():
+    return getattr(settings, 'TENANT_CACHE_TTL', 120)
+
+
+# ========== SELLOS ==========
+
+def _sello_sucursales(empresa_ref):
+    """Subconsultas (última modificación, cantidad) de las sucursales de la empresa"""
+    from .models import Sucursal
+
+    sucursales = Sucursal.objects.filter(empresa_id=empresa_ref).order_by().values('empresa_id')
+    return (
+        Subquery(sucursales.annotate(ultima=Max('fecha_modificacion')).values('ultima')[:1]),
+        Subquery(sucursales.annotate(cantidad=Count('id')).values('cantidad')[:1]),
+    )
+
+
+def _sello_empresa(empresa_id):
+    """Sello vigente de la empresa y sus sucursales (una consulta), o None si no existe"""
+    from .models import Empresa
+
+    ultima, cantidad = _sello_sucursales(OuterRef('pk'))
+    fila = Empresa.objects.filter(pk=empresa_id).annotate(
+        sucursales_ultima=ultima, sucursales_cantidad=cantidad
+    ).values_list('fecha_modificacion', 'sucursales_ultima', 'sucursales_cantidad').first()
+    return tuple(fila) if fila else None
+
+
+# ========== INVALIDACIÓN ==========
+
+def _clave_perfil(usuario_id):
+    return f'tenant_perfil_{usuario_id}'
+
+
+def _clave_empresa(empresa_id):
+    return f'tenant_empresa_{empresa_id}'
+
+
+CLAVE_VERSION_EMPRESAS = 'tenant_version_empresas'
+
+
+def _incrementar_version(clave):
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        cache.set(clave, 1, None)
+        return 1
+
+
+def invalidar_usuario(usuario_id):
+    cache.delete(_clave_perfil(usuario_id))
+
+
+def invalidar_empresa(empresa_id):
+    """Invalida la empresa, sus sucursales y la lista de empresas"""
+    cache.delete(_clave_empresa(empresa_id))
+    _incrementar_version(CLAVE_VERSION_EMPRESAS)
+
+
+# ========== LECTURAS CACHEADAS ==========
+
+def _datos_empresa(empresa_id, sello=None):
+    """
+    (Empresa, [Sucursal]) de una empresa, o None si no existe. La entrada del
+    cache sólo se usa si su sello es el vigente (sello ya leído o, si no se
+    entrega, leído aquí con una consulta).
+    """
+    from .models import Empresa, Sucursal
+
+    if sello is None:
+        sello = _sello_empresa(empresa_id)
+        if sello is None:
+            return None
+
+    clave = _clave_empresa(empresa_id)
+    datos = cache.get(clave)
+    if datos is None or datos[0] != sello:
+        empresa = Empresa.objects.filter(pk=empresa_id).first()
+        if empresa is None:
+            return None
+        sucursales = list(Sucursal.objects.filter(empresa_id=empresa_id).order_by('id'))
+        datos = (sello, empresa, sucursales)
+        cache.set(clave, datos, _ttl())
+
+    _, empresa, sucursales = datos
+    for sucursal in sucursales:
+        sucursal.empresa = empresa
+    # Ya validadas: el resto de la petición no vuelve a leer el sello
+    empresa.sucursales_resueltas = sucursales
+    return empresa, sucursales
+
+
+def obtener_empresa(empresa_id):
+    """Empresa por ID (None si no existe)"""
+    if not empresa_id:
+        return None
+    datos = _datos_empresa(empresa_id)
+    return datos[0] if datos else None
+
+
+def obtener_sucursales(empresa):
+    """Sucursales de la empresa (todas, ordenadas por ID)"""
+    if hasattr(empresa, 'sucursales_resueltas'):
+        return empresa.sucursales_resueltas
+    datos = _datos_empresa(empresa.id)
+    return datos[1] if datos else []
+
+
+def obtener_sucursal(empresa, sucursal_id, estado=None):
+    """Sucursal de la empresa por ID (opcionalmente con un estado dado)"""
+    try:
+        sucursal_id = int(sucursal_id)
+    except (TypeError, ValueError):
+        return None
+    for sucursal in obtener_sucursales(empresa):
+        if sucursal.id == sucursal_id and (estado is None or sucursal.estado == estado):
+            return sucursal
+    return None
+
+
+def sucursal_por_defecto(empresa):
+    """Sucursal principal o, si no hay, la primera de la empresa"""
+    sucursales = obtener_sucursales(empresa)
+    for sucursal in sucursales:
+        if sucursal.es_principal:
+            return sucursal
+    return sucursales[0] if sucursales else None
+
+
+def obtener_perfil(usuario):
+    """
+    PerfilUsuario del usuario con empresa y sucursal asignadas (None si no
+    tiene perfil). Queda además en usuario.perfil_resuelto (y en
+    usuario.perfil si existe) para el resto de la petición.
+
+    Una consulta por petición lee los sellos del perfil, su empresa y sus
+    sucursales; el perfil y la empresa se vuelven a leer sólo si cambiaron.
+    """
+    from usuarios.models import PerfilUsuario
+
+    if hasattr(usuario, 'perfil_resuelto'):
+        return usuario.perfil_resuelto
+
+    ultima, cantidad = _sello_sucursales(OuterRef('empresa_id'))
+    fila = PerfilUsuario.objects.filter(usuario_id=usuario.id).annotate(
+        sucursales_ultima=ultima, sucursales_cantidad=cantidad
+    ).values_list(
+        'fecha_actualizacion', 'empresa_id', 'empresa__fecha_modificacion', 'sucursales_ultima', 'sucursales_cantidad'
+    ).first()
+    if fila is None:
+        usuario.perfil_resuelto = None
+        return None
+    sello_perfil, empresa_id, *sello_empresa = fila
+
+    clave = _clave_perfil(usuario.id)
+    datos = cache.get(clave)
+    if datos is None or datos[0] != sello_perfil:
+        perfil = PerfilUsuario.objects.filter(usuario_id=usuario.id).first()
+        if perfil is None:
+            usuario.perfil_resuelto = None
+            return None
+        datos = (sello_perfil, perfil)
+        cache.set(clave, datos, _ttl())
+    perfil = datos[1]
+
+    datos_empresa = _datos_empresa(empresa_id, tuple(sello_empresa))
+    if datos_empresa is not None:
+        perfil.empresa = datos_empresa[0]
+        if perfil.sucursal_id:
+            sucursal = obtener_sucursal(perfil.empresa, perfil.sucursal_id)
+            if sucursal is not None:
+                perfil.sucursal = sucursal
+    usuario.perfil = perfil
+    usuario.perfil_resuelto = perfil
+    return perfil
+
+
+def listar_empresas():
+    """[{'id', 'nombre'}] de todas las empresas (selector de superusuarios)"""
+    from .models import Empresa
+
+    version = cache.get(CLAVE_VERSION_EMPRESAS, 0)
+    clave = f'tenant_empresas_v{version}'
+    empresas = cache.get(clave)
+    if empresas is None:
+        empresas = list(Empresa.objects.values('id', 'nombre'))
+        cache.set(clave, empresas, _ttl())
+    return empresas
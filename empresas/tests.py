@@ -1,3 +1,110 @@
+from datetime import time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+
+from usuarios.models import PerfilUsuario
+from . import tenant
+from .models import Empresa, Sucursal
+
+
+def crear_sucursal(empresa, codigo, **campos):
+    return Sucursal.objects.create(
+        empresa=empresa, nombre=f'Sucursal {codigo}', codigo=codigo, direccion='Calle 1',
+        comuna='Santiago', ciudad='Santiago', region='RM', telefono='123',
+        horario_apertura=time(9), horario_cierre=time(18), **campos
+    )
+
+
+class TenantCacheTest(TestCase):
+    """
+    Las entradas del cache se validan contra los sellos de modificación: un
+    cambio hecho en otro worker (cuyas señales no borran este cache) rige
+    desde la petición siguiente. Los cambios se hacen con update() con fecha
+    explícita, que no dispara señales ni borra la entrada.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(nombre='Tenant', razon_social='Tenant SpA', rut='76.000.010-7')
+        cls.principal = crear_sucursal(cls.empresa, 'S1', es_principal=True)
+        # La señal de usuarios crea el perfil en la primera empresa
+        cls.usuario = User.objects.create_user('tenant', password='x')
+        cls.perfil = PerfilUsuario.objects.get(usuario=cls.usuario)
+        cls.perfil.sucursal = cls.principal
+        cls.perfil.save()
+        cls.sin_perfil = User.objects.create_user('sin_perfil', password='x')
+        PerfilUsuario.objects.filter(usuario=cls.sin_perfil).delete()
+
+    def setUp(self):
+        cache.clear()
+
+    def _usuario(self, usuario=None):
+        # Un objeto nuevo por petición, como request.user
+        return User.objects.get(pk=(usuario or self.usuario).pk)
+
+    def _calentar(self):
+        tenant.obtener_perfil(self._usuario())
+
+    def _despues(self):
+        return timezone.now() + timedelta(seconds=5)
+
+    def test_una_consulta_con_cache_caliente(self):
+        self._calentar()
+        usuario = self._usuario()
+        with self.assertNumQueries(1):
+            perfil = tenant.obtener_perfil(usuario)
+            self.assertEqual(perfil.empresa, self.empresa)
+            self.assertEqual(perfil.sucursal, self.principal)
+            self.assertEqual(tenant.sucursal_por_defecto(perfil.empresa), self.principal)
+            self.assertIs(usuario.perfil, perfil)
+
+    def test_perfil_resuelto_una_vez_por_peticion(self):
+        usuario = self._usuario()
+        perfil = tenant.obtener_perfil(usuario)
+        self.assertIs(usuario.perfil_resuelto, perfil)
+        with self.assertNumQueries(0):
+            self.assertIs(tenant.obtener_perfil(usuario), perfil)
+
+    def test_usuario_sin_perfil(self):
+        usuario = self._usuario(self.sin_perfil)
+        self.assertIsNone(tenant.obtener_perfil(usuario))
+        self.assertIsNone(usuario.perfil_resuelto)
+        with self.assertNumQueries(0):
+            self.assertIsNone(tenant.obtener_perfil(usuario))
+
+    def test_cambio_de_perfil_sin_invalidar(self):
+        self._calentar()
+        PerfilUsuario.objects.filter(pk=self.perfil.pk).update(es_activo=False, fecha_actualizacion=self._despues())
+        self.assertIsNotNone(cache.get(tenant._clave_perfil(self.usuario.pk)))
+        self.assertFalse(tenant.obtener_perfil(self._usuario()).es_activo)
+
+    def test_cambio_de_empresa_sin_invalidar(self):
+        self._calentar()
+        Empresa.objects.filter(pk=self.empresa.pk).update(estado='suspendida', fecha_modificacion=self._despues())
+        self.assertIsNotNone(cache.get(tenant._clave_empresa(self.empresa.pk)))
+        self.assertEqual(tenant.obtener_perfil(self._usuario()).empresa.estado, 'suspendida')
+        self.assertEqual(tenant.obtener_empresa(self.empresa.pk).estado, 'suspendida')
+
+    def test_cambio_de_sucursal_sin_invalidar(self):
+        self._calentar()
+        Sucursal.objects.filter(pk=self.principal.pk).update(estado='cerrada', fecha_modificacion=self._despues())
+        empresa = tenant.obtener_perfil(self._usuario()).empresa
+        self.assertIsNone(tenant.obtener_sucursal(empresa, self.principal.pk, estado='activa'))
+
+    def test_sucursal_nueva_y_eliminada(self):
+        self._calentar()
+        # En TestCase las señales on_commit no corren: la entrada sigue en el cache
+        nueva = crear_sucursal(self.empresa, 'S2')
+        empresa = tenant.obtener_perfil(self._usuario()).empresa
+        self.assertEqual(tenant.obtener_sucursal(empresa, nueva.pk), nueva)
+
+        # Sin señales: el borrado en bloque sólo cambia la cantidad de sucursales
+        Sucursal.objects.filter(pk=nueva.pk)._raw_delete(Sucursal.objects.db)
+        empresa = tenant.obtener_perfil(self._usuario()).empresa
+        self.assertIsNone(tenant.obtener_sucursal(empresa, nueva.pk))
 
-# Create your tests here.
+    def test_empresa_inexistente(self):
+        self.assertIsNone(tenant.obtener_empresa(0))
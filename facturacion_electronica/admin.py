@@ -4,7 +4,9 @@ from .models import (
     ArchivoCAF,
     DocumentoTributarioElectronico,
     EnvioDTE,
-    AcuseRecibo
+    AcuseRecibo,
+    ColaEnvioDTE,
+    BloqueFolios
 )
 
 
@@ -48,7 +50,7 @@ class ArchivoCAFAdmin(admin.ModelAdmin):
     ]
     list_filter = ['empresa', 'tipo_documento', 'estado', 'fecha_carga']
     search_fields = ['empresa__nombre', 'empresa__rut']
-    readonly_fields = ['fecha_carga', 'fecha_agotamiento', 'folios_utilizados', 'folio_actual']
+    readonly_fields = ['fecha_carga', 'fecha_agotamiento', 'folios_utilizados', 'folio_actual', 'rsapk_modulo', 'rsapk_exponente', 'idk']
     
     fieldsets = (
         ('Información General', {
@@ -60,6 +62,10 @@ class ArchivoCAFAdmin(admin.ModelAdmin):
         ('Archivo CAF', {
             'fields': ('archivo_xml', 'contenido_caf', 'firma_electronica', 'fecha_autorizacion')
         }),
+        ('Datos de Autorización', {
+            'fields': ('rsapk_modulo', 'rsapk_exponente', 'idk'),
+            'classes': ('collapse',)
+        }),
         ('Auditoría', {
             'fields': ('usuario_carga', 'fecha_carga', 'fecha_agotamiento')
         }),
@@ -172,6 +178,43 @@ class EnvioDTEAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(ColaEnvioDTE)
+class ColaEnvioDTEAdmin(admin.ModelAdmin):
+    list_display = [
+        'dte',
+        'empresa',
+        'estado',
+        'canal',
+        'intentos',
+        'proximo_intento',
+        'worker',
+        'lote',
+        'duracion_ms'
+    ]
+    list_filter = ['empresa', 'estado', 'canal', 'tipo_dte']
+    search_fields = ['dte__folio', 'worker', 'ultimo_error', 'lote__track_id']
+    raw_id_fields = ['dte', 'lote']
+    readonly_fields = ['fecha_creacion', 'fecha_ultimo_intento', 'fecha_envio', 'duracion_ms']
+
+
+@admin.register(BloqueFolios)
+class BloqueFoliosAdmin(admin.ModelAdmin):
+    list_display = [
+        'caf',
+        'estacion',
+        'tipo_documento',
+        'folio_desde',
+        'folio_hasta',
+        'siguiente',
+        'estado',
+        'fecha_asignacion'
+    ]
+    list_filter = ['empresa', 'tipo_documento', 'estado']
+    search_fields = ['estacion__nombre', 'estacion__numero']
+    raw_id_fields = ['caf', 'estacion']
+    readonly_fields = ['folio_desde', 'folio_hasta', 'siguiente', 'fecha_creacion', 'fecha_asignacion', 'fecha_liberacion']
+
+
 @admin.register(AcuseRecibo)
 class AcuseReciboAdmin(admin.ModelAdmin):
     list_display = [
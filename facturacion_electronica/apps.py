@@ -5,3 +5,10 @@ class FacturacionElectronicaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'facturacion_electronica'
     verbose_name = 'Facturación Electrónica'
+
+    def ready(self):
+        # Modo 'local': iniciar los workers de la cola de envío con la primera petición
+        from django.core.signals import request_started
+        from .cola_envio import iniciar_workers_al_arrancar
+
+        request_started.connect(iniciar_workers_al_arrancar, dispatch_uid='cola_envio_dte_inicio')
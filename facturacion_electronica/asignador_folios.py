@@ -0,0 +1,281 @@
+"""
+Asignación de folios de los CAF sin condiciones de carrera.
+
+El folio se obtenía leyendo ArchivoCAF.folio_actual, sumando 1 en Python y
+guardando con save(): dos ventas simultáneas leían el mismo folio_actual y
+salían con el mismo folio (de ahí los comandos corregir_folio_caf,
+resetear_folios_caf, actualizar_folio_caf, etc.). Ahora:
+
+- Los folios se reservan con un solo UPDATE ... RETURNING sobre la fila del
+  CAF (folio_actual = folio_actual + n). La base de datos serializa los
+  UPDATE de la misma fila: cada reserva recibe un rango distinto y, si la
+  transacción de la venta se revierte, el rango vuelve al CAF.
+- Las estaciones de trabajo del POS reservan bloques de
+  DTE_BLOQUE_FOLIOS[tipo] folios (BloqueFolios) y los consumen sin tocar la
+  fila del CAF, que deja de ser el punto de contención entre cajas.
+- Al cerrar la caja el bloque queda 'liberado' y la siguiente estación que
+  necesite folios lo toma antes de reservar uno nuevo: no quedan folios sin
+  usar entre bloques.
+- Cada folio usado renueva BloqueFolios.fecha_asignacion. Un bloque 'activo'
+  sin uso por más de DTE_BLOQUE_FOLIOS_PLAZO segundos (estación caída, caja
+  que nunca se cerró) lo puede tomar otra estación, igual que uno liberado.
+  Tomarlo es seguro aunque la estación original vuelva: el folio siguiente
+  se entrega con un UPDATE atómico sobre la fila del bloque.
+- Cuando un CAF se agota (o vence) se pasa al siguiente CAF activo de la
+  sucursal.
+
+El comando stress_folios ejecuta emisores en paralelo y verifica que no haya
+folios duplicados ni saltos.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import ArchivoCAF, BloqueFolios
+
+logger = logging.getLogger(__name__)
+
+
+BLOQUE_POR_DEFECTO = {'39': 10, '41': 10}
+PLAZO_BLOQUE_POR_DEFECTO = 4 * 60 * 60
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def tamano_bloque(tipo_documento):
+    """Folios por bloque de estación para el tipo de documento (1 = sin bloques)"""
+    bloques = _config('DTE_BLOQUE_FOLIOS', BLOQUE_POR_DEFECTO)
+    return max(int(bloques.get(str(tipo_documento), 1)), 1)
+
+
+def plazo_bloque():
+    """Segundos sin uso tras los cuales un bloque activo puede tomarlo otra estación"""
+    return int(_config('DTE_BLOQUE_FOLIOS_PLAZO', PLAZO_BLOQUE_POR_DEFECTO))
+
+
+def cafs_disponibles(empresa, sucursal, tipo_documento):
+    """
+    IDs de los CAF activos y vigentes de la sucursal, en el orden en que se
+    consumen. Los CAF vencidos se marcan como 'vencido'.
+    """
+    cafs = ArchivoCAF.objects.filter(
+        empresa=empresa,
+        sucursal=sucursal,
+        tipo_documento=tipo_documento,
+        estado='activo',
+        oculto=False
+    ).order_by('folio_actual').only('id', 'fecha_autorizacion', 'fecha_vencimiento')
+
+    ids = []
+    for caf in cafs:
+        if caf.esta_vigente():
+            ids.append(caf.id)
+        else:
+            logger.error("CAF vencido: ID %s. Se pasa al siguiente CAF.", caf.id)
+            ArchivoCAF.objects.filter(pk=caf.pk, estado='activo').update(estado='vencido')
+    return ids
+
+
+def reservar_folios(caf_id, cantidad=1):
+    """
+    Reserva hasta `cantidad` folios consecutivos del CAF con un UPDATE atómico.
+    Si quedan menos folios que los pedidos, entrega los que quedan.
+
+    Returns:
+        tuple: (folio_desde, folio_hasta) o None si el CAF no tiene folios
+    """
+    tabla = connection.ops.quote_name(ArchivoCAF._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {tabla} SET "
+            f"folio_actual = folio_actual + %s, "
+            f"folios_utilizados = folio_actual + %s - folio_desde + 1, "
+            f"estado = CASE WHEN folio_actual + %s >= folio_hasta THEN 'agotado' ELSE estado END "
+            f"WHERE id = %s AND estado = 'activo' "
+            f"AND folio_actual >= folio_desde - 1 AND folio_actual + %s <= folio_hasta "
+            f"RETURNING folio_actual, folio_hasta",
+            [cantidad, cantidad, cantidad, caf_id, cantidad]
+        )
+        fila = cursor.fetchone()
+
+    if fila is None:
+        # Quedan menos folios que los pedidos (o folio_actual fuera de rango)
+        return _reservar_resto(caf_id, cantidad)
+
+    hasta, folio_hasta_caf = fila
+    if hasta >= folio_hasta_caf:
+        _marcar_agotado(caf_id)
+    return hasta - cantidad + 1, hasta
+
+
+def _reservar_resto(caf_id, cantidad):
+    """Últimos folios del CAF: compara y actualiza contra el folio_actual leído"""
+    while True:
+        caf = ArchivoCAF.objects.filter(pk=caf_id).values(
+            'folio_actual', 'folio_desde', 'folio_hasta', 'estado'
+        ).first()
+        if caf is None or caf['estado'] != 'activo':
+            return None
+        if caf['folio_actual'] >= caf['folio_hasta']:
+            ArchivoCAF.objects.filter(pk=caf_id, estado='activo').update(estado='agotado')
+            _marcar_agotado(caf_id)
+            return None
+
+        desde = max(caf['folio_actual'] + 1, caf['folio_desde'])
+        hasta = min(desde + cantidad - 1, caf['folio_hasta'])
+        actualizado = ArchivoCAF.objects.filter(
+            pk=caf_id, estado='activo', folio_actual=caf['folio_actual']
+        ).update(
+            folio_actual=hasta,
+            folios_utilizados=hasta - caf['folio_desde'] + 1,
+            estado='agotado' if hasta >= caf['folio_hasta'] else 'activo',
+        )
+        if actualizado:
+            if hasta >= caf['folio_hasta']:
+                _marcar_agotado(caf_id)
+            return desde, hasta
+        # Otro proceso reservó entre la lectura y el UPDATE: reintentar
+
+
+def _marcar_agotado(caf_id):
+    ArchivoCAF.objects.filter(pk=caf_id, fecha_agotamiento__isnull=True).update(fecha_agotamiento=timezone.now())
+    logger.info("CAF ID %s agotado.", caf_id)
+
+
+def _folio_de_bloque(bloque_id):
+    """
+    Siguiente folio del bloque (UPDATE ... RETURNING) o None si se agotó.
+    Renueva la asignación del bloque a la estación.
+    """
+    tabla = connection.ops.quote_name(BloqueFolios._meta.db_table)
+    ahora = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {tabla} SET "
+            f"siguiente = siguiente + 1, "
+            f"fecha_asignacion = %s, "
+            f"estado = CASE WHEN siguiente >= folio_hasta THEN 'agotado' ELSE estado END "
+            f"WHERE id = %s AND estado = 'activo' AND siguiente <= folio_hasta "
+            f"RETURNING siguiente - 1",
+            [ahora, bloque_id]
+        )
+        fila = cursor.fetchone()
+    return fila[0] if fila else None
+
+
+def _tomar_bloques(bloques, estacion, **condicion):
+    """Asigna a la estación los bloques que sigan cumpliendo la condición al momento de tomarlos"""
+    for bloque_id, caf_id in bloques:
+        tomado = BloqueFolios.objects.filter(pk=bloque_id, **condicion).update(
+            estacion=estacion, estado='activo', fecha_asignacion=timezone.now(), fecha_liberacion=None
+        )
+        if tomado:
+            yield bloque_id, caf_id
+
+
+def _bloques_estacion(empresa, sucursal, tipo_documento, estacion):
+    """
+    Bloque activo de la estación o, si no tiene, uno liberado o uno activo
+    vencido (sin uso dentro del plazo) de otra estación, que la estación toma.
+    """
+    activos = BloqueFolios.objects.filter(
+        estacion=estacion,
+        tipo_documento=tipo_documento,
+        caf__sucursal=sucursal,
+        estado='activo'
+    ).order_by('caf__folio_desde', 'folio_desde').values_list('id', 'caf_id')
+    yield from activos
+
+    liberados = BloqueFolios.objects.filter(
+        empresa=empresa,
+        tipo_documento=tipo_documento,
+        caf__sucursal=sucursal,
+        estado='liberado'
+    ).order_by('caf__folio_desde', 'folio_desde').values_list('id', 'caf_id')
+    yield from _tomar_bloques(liberados, estacion, estado='liberado')
+
+    limite = timezone.now() - timedelta(seconds=plazo_bloque())
+    vencidos = BloqueFolios.objects.filter(
+        empresa=empresa,
+        tipo_documento=tipo_documento,
+        caf__sucursal=sucursal,
+        estado='activo',
+        fecha_asignacion__lt=limite
+    ).order_by('caf__folio_desde', 'folio_desde').values_list('id', 'caf_id')
+    for bloque_id, caf_id in _tomar_bloques(vencidos, estacion, estado='activo', fecha_asignacion__lt=limite):
+        logger.warning("Bloque de folios %s sin uso desde antes de %s: lo toma la estación %s",
+                       bloque_id, limite, getattr(estacion, 'pk', estacion))
+        yield bloque_id, caf_id
+
+
+def asignar_folio(empresa, sucursal, tipo_documento, estacion=None):
+    """
+    Asigna el siguiente folio. Debe llamarse dentro de la transacción que crea
+    el documento: si la transacción se revierte, el folio no se pierde.
+
+    Args:
+        empresa: Instancia de Empresa
+        sucursal: Sucursal cuyos CAF se consumen
+        tipo_documento: Código SII del documento
+        estacion: EstacionTrabajo del POS (usa bloques de folios si el tipo los tiene)
+
+    Returns:
+        tuple: (folio, caf) o (None, None) si no hay folios disponibles
+    """
+    bloque = tamano_bloque(tipo_documento) if estacion is not None else 1
+
+    with transaction.atomic():
+        if bloque > 1:
+            for bloque_id, caf_id in _bloques_estacion(empresa, sucursal, tipo_documento, estacion):
+                folio = _folio_de_bloque(bloque_id)
+                if folio is not None:
+                    return folio, ArchivoCAF.objects.get(pk=caf_id)
+
+        for caf_id in cafs_disponibles(empresa, sucursal, tipo_documento):
+            rango = reservar_folios(caf_id, bloque)
+            if rango is None:
+                continue  # Agotado: siguiente CAF
+            desde, hasta = rango
+            if bloque > 1 and hasta > desde:
+                BloqueFolios.objects.create(
+                    empresa=empresa,
+                    caf_id=caf_id,
+                    estacion=estacion,
+                    tipo_documento=tipo_documento,
+                    folio_desde=desde,
+                    folio_hasta=hasta,
+                    siguiente=desde + 1,
+                )
+            return desde, ArchivoCAF.objects.get(pk=caf_id)
+
+    return None, None
+
+
+def liberar_bloques(estacion):
+    """
+    Libera los bloques activos de la estación (p. ej. al cerrar la caja) para
+    que otra estación use sus folios.
+
+    Returns:
+        int: Cantidad de bloques liberados
+    """
+    return BloqueFolios.objects.filter(estacion=estacion, estado='activo').update(
+        estado='liberado', fecha_liberacion=timezone.now()
+    )
+
+
+def folios_en_bloques(empresa, tipo_documento, sucursal=None):
+    """Folios reservados en bloques que todavía no se usan"""
+    bloques = BloqueFolios.objects.filter(
+        empresa=empresa, tipo_documento=tipo_documento, estado__in=['activo', 'liberado']
+    )
+    if sucursal:
+        bloques = bloques.filter(caf__sucursal=sucursal)
+    total = bloques.aggregate(total=Sum(F('folio_hasta') - F('siguiente') + 1))['total']
+    return total or 0
@@ -0,0 +1,138 @@
+"""
+Datos de autorización de los CAF para el timbre (TED).
+
+Cada TED (boletas, facturas, NC, ND, guías y regeneraciones) volvía a leer
+el XML del CAF (de contenido_caf o del archivo en disco) y a parsearlo con un
+parser tolerante para sacar el módulo y el exponente de la clave pública.
+Ahora el CAF se parsea una sola vez al guardarlo (ArchivoCAF.save) y los
+datos quedan en campos del modelo: RSAPK (módulo y exponente), IDK y la
+clave privada RSASK. Los datos que usa el TED se guardan además por proceso,
+con una clave que incluye la firma (FRMA) del CAF: si la fila se vuelve a
+cargar con otro XML, la clave cambia también en los demás procesos.
+
+Los CAF cargados antes de estos campos (o creados con bulk_create) se
+parsean en su primer uso y se guardan, así sólo se parsean una vez.
+"""
+import logging
+import threading
+
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+
+NS_SII = '{http://www.sii.cl/SiiDte}'
+
+_datos = {}
+_datos_lock = threading.Lock()
+
+
+def _buscar(nodo, ruta):
+    """Busca con y sin el namespace del SII (los CAF vienen de ambas formas)"""
+    if nodo is None:
+        return None
+    encontrado = nodo.find(ruta)
+    if encontrado is None:
+        encontrado = nodo.find('/'.join(f'{NS_SII}{parte}' if parte.isalnum() else parte for parte in ruta.split('/')))
+    return encontrado
+
+
+def _texto(nodo, ruta):
+    elemento = _buscar(nodo, ruta)
+    return (elemento.text or '').strip() if elemento is not None else ''
+
+
+def parsear_caf(contenido):
+    """
+    Extrae del XML del CAF los datos que no están en otros campos del modelo.
+
+    Args:
+        contenido: XML del CAF (str o bytes)
+
+    Returns:
+        dict: rsapk_modulo, rsapk_exponente, idk, clave_privada
+
+    Raises:
+        ValueError: Si el XML no trae la clave pública del CAF
+    """
+    if isinstance(contenido, str):
+        # lxml no acepta str con declaración de encoding
+        contenido = contenido.encode('ISO-8859-1', errors='replace')
+
+    parser = etree.XMLParser(encoding='ISO-8859-1', recover=True)
+    root = etree.fromstring(contenido, parser=parser)
+    if root is None:
+        raise ValueError("El contenido del CAF no es XML")
+
+    rsapk = _buscar(root, './/RSAPK')
+    if rsapk is None:
+        raise ValueError("No se encontró clave RSA en el CAF")
+
+    datos = {
+        'rsapk_modulo': _texto(rsapk, 'M'),
+        'rsapk_exponente': _texto(rsapk, 'E'),
+        'idk': _texto(root, './/DA/IDK'),
+        'clave_privada': _texto(root, './/RSASK'),
+    }
+    if not datos['rsapk_modulo'] or not datos['rsapk_exponente']:
+        raise ValueError("Clave RSA incompleta en el CAF")
+    return datos
+
+
+def contenido_caf(caf):
+    """XML del CAF guardado en la base de datos o, si no está, en el archivo"""
+    if caf.contenido_caf:
+        return caf.contenido_caf
+    if caf.archivo_xml:
+        with open(caf.archivo_xml.path, 'r', encoding='ISO-8859-1') as f:
+            return f.read()
+    raise ValueError("CAF sin contenido XML")
+
+
+def _completar_campos(caf):
+    """Parsea un CAF sin los campos de RSAPK y los guarda (una sola vez)"""
+    from .models import ArchivoCAF
+
+    datos = parsear_caf(contenido_caf(caf))
+    for campo, valor in datos.items():
+        setattr(caf, campo, valor)
+    if caf.pk:
+        ArchivoCAF.objects.filter(pk=caf.pk).update(**datos)
+    logger.info(f"Datos de autorización del CAF {caf.pk} extraídos y guardados")
+
+
+def datos_caf(caf):
+    """
+    Datos de autorización del CAF para el TED, sin parsear XML (salvo el primer
+    uso de un CAF cargado antes de los campos RSAPK).
+
+    Returns:
+        dict: modulo, exponente, idk, clave_privada
+    """
+    # La FRMA identifica el contenido del CAF: otro XML en la misma fila es otra clave
+    clave = (caf.pk, caf.firma_electronica)
+    datos = _datos.get(clave)
+    if datos is not None:
+        return datos
+
+    if not caf.rsapk_modulo:
+        _completar_campos(caf)
+    datos = {
+        'modulo': caf.rsapk_modulo,
+        'exponente': caf.rsapk_exponente,
+        'idk': caf.idk,
+        'clave_privada': caf.clave_privada,
+    }
+    with _datos_lock:
+        _datos[clave] = datos
+    return datos
+
+
+def invalidar_datos_caf(caf_id=None):
+    """Descarta los datos en memoria de un CAF (o de todos)"""
+    with _datos_lock:
+        if caf_id is None:
+            _datos.clear()
+            return
+        for clave in [clave for clave in _datos if clave[0] == caf_id]:
+            del _datos[clave]
@@ -5,11 +5,51 @@ Envío y consulta de estado de DTE
 from zeep import Client
 from zeep.transports import Transport
 from requests import Session
-import requests
+from requests.adapters import HTTPAdapter
 from lxml import etree
 import base64
+import threading
 from datetime import datetime
 
+from django.conf import settings
+
+
+# ========== SESIÓN HTTP Y WSDL COMPARTIDOS ==========
+# Una sesión HTTP con pool de conexiones (keep-alive) y un cliente zeep por
+# WSDL para todo el proceso: cada ClienteSII ya no abre conexiones nuevas ni
+# vuelve a descargar y parsear el WSDL en cada envío o consulta.
+
+_sesion = None
+_transporte = None
+_clientes_soap = {}
+_lock = threading.Lock()
+
+
+def _sesion_compartida():
+    global _sesion, _transporte
+    if _sesion is None:
+        with _lock:
+            if _sesion is None:
+                sesion = Session()
+                sesion.verify = True  # Verificar certificados SSL
+                adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=getattr(settings, 'SII_HTTP_POOL', 10))
+                sesion.mount('https://', adaptador)
+                sesion.mount('http://', adaptador)
+                _transporte = Transport(session=sesion, timeout=30)
+                _sesion = sesion
+    return _sesion, _transporte
+
+
+def _cliente_soap(url_wsdl):
+    """Cliente zeep del WSDL (descargado y parseado una vez por proceso)"""
+    cliente = _clientes_soap.get(url_wsdl)
+    if cliente is None:
+        _, transporte = _sesion_compartida()
+        cliente = Client(url_wsdl, transport=transporte)
+        with _lock:
+            cliente = _clientes_soap.setdefault(url_wsdl, cliente)
+    return cliente
+
 
 class ClienteSII:
     """Cliente para interactuar con los webservices del SII"""
@@ -38,14 +78,11 @@ class ClienteSII:
             ambiente: 'certificacion' o 'produccion'
         """
         self.ambiente = ambiente
-        self.urls = self.URLS[ambiente]
-        
-        # Configurar sesión HTTP
-        self.session = Session()
-        self.session.verify = True  # Verificar certificados SSL
+        # settings.SII_URLS permite apuntar a otro servidor (p. ej. un SII de prueba local)
+        self.urls = {**self.URLS[ambiente], **getattr(settings, 'SII_URLS', {}).get(ambiente, {})}
         
-        # Configurar transporte
-        self.transport = Transport(session=self.session, timeout=30)
+        # Sesión HTTP y transporte compartidos por el proceso
+        self.session, self.transport = _sesion_compartida()
         
         print(f"Cliente SII inicializado - Ambiente: {ambiente}")
     
@@ -78,7 +115,7 @@ class ClienteSII:
                 if attempt > 0:
                     print(f"Reintentando obtener semilla (Intento {attempt + 1}/{max_retries})...")
                 
-                response = requests.post(
+                response = self.session.post(
                     url,
                     data=soap_request.encode('utf-8'),
                     headers=headers,
@@ -196,7 +233,7 @@ class ClienteSII:
                     soap_request += '</getToken>'
                     soap_request += '</soapenv:Body></soapenv:Envelope>'
                     
-                    response = requests.post(
+                    response = self.session.post(
                         url,
                         data=soap_request.encode('ISO-8859-1'),
                         headers={'Content-Type': 'text/xml; charset=ISO-8859-1', 'SOAPAction': ''},
@@ -274,8 +311,8 @@ class ClienteSII:
             xml_bytes = xml_envio.encode('ISO-8859-1')
             xml_base64 = base64.b64encode(xml_bytes).decode('ascii')
             
-            # Crear cliente SOAP para envío
-            client = Client(self.urls['envio'], transport=self.transport)
+            # Cliente SOAP para envío (WSDL compartido)
+            client = _cliente_soap(self.urls['envio'])
             
             # Enviar el DTE
             response = client.service.enviarDTE(
@@ -293,10 +330,12 @@ class ClienteSII:
             # Extraer track_id
             track_id_elem = root.find('.//TRACKID')
             estado_elem = root.find('.//ESTADO')
+            status_elem = root.find('.//STATUS')
             
             resultado = {
                 'track_id': track_id_elem.text if track_id_elem is not None else None,
                 'estado': estado_elem.text if estado_elem is not None else None,
+                'status': status_elem.text if status_elem is not None else None,
                 'respuesta_completa': response
             }
             
@@ -324,8 +363,8 @@ class ClienteSII:
             dict: Estado del DTE
         """
         try:
-            # Crear cliente SOAP
-            client = Client(self.urls['consulta'], transport=self.transport)
+            # Cliente SOAP (WSDL compartido)
+            client = _cliente_soap(self.urls['consulta'])
             
             # Consultar estado
             response = client.service.getEstDte(
@@ -374,8 +413,8 @@ class ClienteSII:
             dict: Estado del documento
         """
         try:
-            # Crear cliente SOAP
-            client = Client(self.urls['consulta'], transport=self.transport)
+            # Cliente SOAP (WSDL compartido)
+            client = _cliente_soap(self.urls['consulta'])
             
             # Consultar estado del documento
             response = client.service.getEstDte(
@@ -447,21 +486,22 @@ class ClienteSII:
         else:
             return str(dv)
     
-    def crear_set_dte(self, dtes_firmados, caratula):
+    def crear_set_dte(self, dtes_firmados, caratula, boletas=False):
         """
         Crea un SetDTE (conjunto de DTEs) para envío masivo
         
         Args:
             dtes_firmados: Lista de XML de DTEs firmados
             caratula: Diccionario con datos de la carátula
+            boletas: True para armar un EnvioBOLETA (tipos 39/41) en vez de EnvioDTE
             
         Returns:
-            str: XML del SetDTE
+            str: XML del SetDTE (sin firmar; ver FirmadorDTE.firmar_envio)
         """
         try:
-            # Crear el EnvioDTE
+            # Crear el EnvioDTE / EnvioBOLETA
             envio_dte = etree.Element(
-                "EnvioDTE",
+                "EnvioBOLETA" if boletas else "EnvioDTE",
                 version="1.0",
                 nsmap={None: "http://www.sii.cl/SiiDte"}
             )
@@ -479,15 +519,29 @@ class ClienteSII:
             etree.SubElement(caratula_elem, "NroResol").text = str(caratula['numero_resolucion'])
             etree.SubElement(caratula_elem, "TmstFirmaEnv").text = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
             
-            # Agregar DTEs al Set
+            # Parsear los DTEs y contar por tipo para SubTotDTE
+            dtes = []
+            por_tipo = {}
             for dte_xml in dtes_firmados:
                 dte_root = etree.fromstring(dte_xml.encode('ISO-8859-1'))
+                tipo = dte_root.findtext('.//{http://www.sii.cl/SiiDte}TipoDTE') or dte_root.findtext('.//TipoDTE')
+                if tipo:
+                    por_tipo[tipo] = por_tipo.get(tipo, 0) + 1
+                dtes.append(dte_root)
+            
+            for tipo, cantidad in sorted(por_tipo.items()):
+                subtotal = etree.SubElement(caratula_elem, "SubTotDTE")
+                etree.SubElement(subtotal, "TpoDTE").text = tipo
+                etree.SubElement(subtotal, "NroDTE").text = str(cantidad)
+            
+            # Agregar DTEs al Set
+            for dte_root in dtes:
                 set_dte.append(dte_root)
             
-            # Convertir a string
+            # Sin pretty_print: la indentación alteraría los documentos ya firmados
             set_dte_string = etree.tostring(
                 envio_dte,
-                pretty_print=True,
+                pretty_print=False,
                 xml_declaration=True,
                 encoding='ISO-8859-1'
             ).decode('ISO-8859-1')
@@ -0,0 +1,525 @@
+"""
+Cola persistente de envío de DTEs a DTEBox/SII.
+
+Reemplaza al BackgroundDTESender en memoria (una cola y 5 hilos por proceso,
+que perdía los envíos pendientes en cada reinicio o deploy y contaba los
+reintentos en memoria). Ahora cada envío es una fila de ColaEnvioDTE:
+
+- encolar_dte() crea (o reactiva) la fila del DTE dentro de la transacción de
+  la venta y, al confirmarla, avisa a los workers.
+- Los workers toman lotes con SELECT ... FOR UPDATE SKIP LOCKED, así varios
+  workers en varios nodos pueden trabajar sobre la misma cola sin pisarse.
+  La fila tomada queda 'procesando' con un plazo (bloqueado_hasta); si el
+  worker cae, otro la retoma al vencer el plazo.
+- Las empresas que emiten directo al SII (sin DTEBox) no se envían de a uno:
+  sus filas (canal 'sii') se agrupan por empresa, ambiente y tipo y salen en
+  un solo EnvioDTE/EnvioBOLETA firmado (ver envio_lotes).
+- El envío a DTEBox se hace fuera de la transacción. Si falla, la fila vuelve
+  a 'pendiente' con proximo_intento según un backoff exponencial; al agotar
+  los intentos queda en 'error' y el DTE queda 'pendiente' con el mensaje.
+- metricas_envio() entrega cola, throughput y latencias para el monitor.
+
+- Mientras dura el envío al proveedor, un hilo renueva el plazo de bloqueo
+  de las filas (mantener_bloqueo), así un DTEBox o SII lento no hace que
+  otro worker tome y reenvíe un documento que sigue en curso.
+
+Modo de ejecución (settings.DTE_ENVIO_MODO):
+- 'local':   DTE_ENVIO_WORKERS hilos dentro de cada proceso web. Se inician
+             con la primera petición del proceso (ver apps.py), así los envíos
+             que quedaron pendientes tras un reinicio o deploy se retoman sin
+             esperar un nuevo encolado, y revisan la cola cada
+             DTE_ENVIO_INTERVALO segundos. Como la cola está en la base de
+             datos, tener varios procesos es seguro.
+- 'celery':  cada encolado dispara la tarea procesar_cola_envios_dte y
+             celery beat la ejecuta periódicamente (CELERY_BEAT_SCHEDULE)
+             para drenar lo pendiente (si no hay broker se usan los hilos locales).
+- 'externo': sólo procesan los workers del comando procesar_cola_dte
+             (uno o más por nodo, p. ej. con systemd).
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import ColaEnvioDTE, DocumentoTributarioElectronico
+
+logger = logging.getLogger(__name__)
+
+
+MODO_LOCAL = 'local'
+MODO_CELERY = 'celery'
+MODO_EXTERNO = 'externo'
+
+
+def modo_ejecucion():
+    return getattr(settings, 'DTE_ENVIO_MODO', MODO_LOCAL)
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def max_intentos():
+    return _config('DTE_ENVIO_MAX_INTENTOS', 6)
+
+
+def espera_reintento(intentos):
+    """
+    Segundos de espera antes del siguiente intento (backoff exponencial con
+    un 10% de variación para que los reintentos no coincidan).
+    Con los valores por defecto: 5s, 20s, 80s, 320s, 1280s, 1800s...
+    """
+    base = _config('DTE_ENVIO_BACKOFF_BASE', 5)
+    factor = _config('DTE_ENVIO_BACKOFF_FACTOR', 4)
+    maximo = _config('DTE_ENVIO_BACKOFF_MAX', 1800)
+    espera = min(base * factor ** max(intentos - 1, 0), maximo)
+    return espera * random.uniform(0.9, 1.1)
+
+
+def nombre_worker():
+    """Identificador del worker: host:pid:hilo"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"[:100]
+
+
+# ========== ENCOLAR ==========
+
+def encolar_dte(dte_id, empresa_id):
+    """
+    Agrega el DTE a la cola de envío (o lo reactiva si ya estuvo en ella).
+    Los workers lo toman al confirmarse la transacción actual.
+
+    Returns:
+        bool: True si el DTE quedó en la cola
+    """
+    return encolar_multiples([dte_id], empresa_id) == 1
+
+
+def encolar_multiples(dtes_ids, empresa_id):
+    """
+    Agrega varios DTEs a la cola con un UPDATE y un bulk_create.
+    Los envíos que están siendo procesados se dejan como están.
+
+    Returns:
+        int: Cantidad de DTEs en la cola
+    """
+    from empresas.models import Empresa
+    from .envio_lotes import canal_empresa
+
+    dtes_ids = list(dict.fromkeys(dtes_ids))
+    if not dtes_ids:
+        return 0
+
+    empresa = Empresa.objects.only('dtebox_habilitado', 'ambiente_sii').get(pk=empresa_id)
+    canal = canal_empresa(empresa)
+    ambiente = empresa.ambiente_sii or 'certificacion'
+    tipos = dict(
+        DocumentoTributarioElectronico.objects.filter(pk__in=dtes_ids).values_list('id', 'tipo_dte')
+    )
+
+    ahora = timezone.now()
+    with transaction.atomic():
+        existentes = set(
+            ColaEnvioDTE.objects.filter(dte_id__in=dtes_ids).values_list('dte_id', flat=True)
+        )
+        ColaEnvioDTE.objects.filter(dte_id__in=existentes).exclude(estado='procesando').update(
+            canal=canal,
+            ambiente=ambiente,
+            lote=None,
+            estado='pendiente',
+            intentos=0,
+            proximo_intento=ahora,
+            bloqueado_hasta=None,
+            ultimo_error='',
+            fecha_creacion=ahora,
+            fecha_envio=None,
+        )
+        ColaEnvioDTE.objects.bulk_create(
+            [
+                ColaEnvioDTE(
+                    empresa_id=empresa_id,
+                    dte_id=dte_id,
+                    canal=canal,
+                    tipo_dte=tipos.get(dte_id, ''),
+                    ambiente=ambiente,
+                    proximo_intento=ahora,
+                    fecha_creacion=ahora,
+                )
+                for dte_id in dtes_ids if dte_id not in existentes
+            ],
+            ignore_conflicts=True,
+        )
+        transaction.on_commit(despertar_workers)
+
+    logger.info(f"{len(dtes_ids)} DTE(s) agregados a la cola de envío")
+    return len(dtes_ids)
+
+
+def despertar_workers():
+    """Avisa al ejecutor configurado que hay envíos nuevos"""
+    modo = modo_ejecucion()
+    if modo == MODO_EXTERNO:
+        return
+    if modo == MODO_CELERY:
+        try:
+            from .tasks import procesar_cola_envios_dte
+            procesar_cola_envios_dte.delay()
+            return
+        except Exception as e:
+            logger.error(f"No se pudo encolar el envío de DTEs en Celery: {e}. Se procesa localmente.")
+    obtener_pool_local().despertar()
+
+
+def iniciar_workers_al_arrancar(sender=None, **kwargs):
+    """
+    Receptor de request_started (conectado en apps.py): en modo 'local' inicia
+    el pool con la primera petición del proceso para drenar los envíos que
+    quedaron en la base de datos. Se desconecta después de la primera vez.
+    """
+    from django.core.signals import request_started
+
+    request_started.disconnect(dispatch_uid='cola_envio_dte_inicio')
+    if modo_ejecucion() == MODO_LOCAL and _config('DTE_ENVIO_INICIAR_AL_ARRANCAR', True):
+        obtener_pool_local().despertar()
+
+
+# ========== TOMA Y PROCESAMIENTO ==========
+
+def plazo_bloqueo():
+    return _config('DTE_ENVIO_BLOQUEO', 300)
+
+
+def renovar_bloqueo(envio_ids, worker):
+    """
+    Extiende el plazo de bloqueo de envíos que este worker sigue procesando.
+
+    Returns:
+        int: Cantidad de envíos renovados (0 si otro worker ya los retomó)
+    """
+    return ColaEnvioDTE.objects.filter(id__in=envio_ids, estado='procesando', worker=worker).update(
+        bloqueado_hasta=timezone.now() + timedelta(seconds=plazo_bloqueo())
+    )
+
+
+@contextmanager
+def mantener_bloqueo(envio_ids, worker):
+    """
+    Renueva cada tercio del plazo el bloqueo de los envíos mientras dura la
+    llamada al proveedor (en un hilo aparte, con su propia conexión).
+
+        with mantener_bloqueo([envio.pk], envio.worker):
+            resultado = DTEBoxService(empresa).timbrar_dte(...)
+    """
+    from django.db import connection
+
+    envio_ids = list(envio_ids)
+    detener = threading.Event()
+
+    def renovar():
+        try:
+            while not detener.wait(max(plazo_bloqueo() / 3, 1)):
+                try:
+                    renovar_bloqueo(envio_ids, worker)
+                except Exception as e:
+                    logger.warning(f"No se pudo renovar el bloqueo de los envíos {envio_ids}: {e}")
+        finally:
+            connection.close()
+
+    hilo = threading.Thread(target=renovar, name=f"{worker}-bloqueo"[:100], daemon=True)
+    hilo.start()
+    try:
+        yield
+    finally:
+        detener.set()
+        hilo.join()
+
+
+def envios_disponibles(ahora):
+    """Filas listas para tomar: pendientes ya vencidas o con el plazo del worker vencido"""
+    return Q(estado='pendiente', proximo_intento__lte=ahora) | Q(estado='procesando', bloqueado_hasta__lt=ahora)
+
+
+def tomar_envios(worker, lote=None, canal='dtebox', **filtros):
+    """
+    Reserva hasta `lote` envíos listos del canal para este worker
+    (`filtros` acota a un grupo, p. ej. empresa_id/ambiente/tipo_dte).
+
+    Los envíos se bloquean con FOR UPDATE SKIP LOCKED (otros workers saltan
+    las filas tomadas en vez de esperar) y se marcan 'procesando' con un
+    plazo de bloqueo. El UPDATE repite la condición, así en bases de datos sin
+    SKIP LOCKED (SQLite en desarrollo) dos workers tampoco toman la misma fila.
+
+    Returns:
+        list: IDs de ColaEnvioDTE reservados
+    """
+    lote = lote or _config('DTE_ENVIO_LOTE', 5)
+    ahora = timezone.now()
+    disponibles = envios_disponibles(ahora) & Q(canal=canal, **filtros)
+
+    with transaction.atomic():
+        ids = list(
+            ColaEnvioDTE.objects.select_for_update(skip_locked=True)
+            .filter(disponibles)
+            .order_by('proximo_intento')
+            .values_list('id', flat=True)[:lote]
+        )
+        if not ids:
+            return []
+        ColaEnvioDTE.objects.filter(disponibles, id__in=ids).update(
+            estado='procesando',
+            bloqueado_hasta=ahora + timedelta(seconds=plazo_bloqueo()),
+            worker=worker,
+            fecha_ultimo_intento=ahora,
+        )
+        return list(
+            ColaEnvioDTE.objects.filter(id__in=ids, worker=worker, fecha_ultimo_intento=ahora)
+            .values_list('id', flat=True)
+        )
+
+
+def procesar_envio(envio_id):
+    """
+    Envía a DTEBox el DTE de un envío ya reservado y registra el resultado.
+
+    Returns:
+        bool: True si DTEBox aceptó el documento
+    """
+    from .dtebox_service import DTEBoxService
+
+    envio = ColaEnvioDTE.objects.select_related('dte', 'empresa').get(pk=envio_id)
+    dte = envio.dte
+    inicio = time.perf_counter()
+
+    try:
+        # XML para enviar: según GDExpress, por POST se envía XML SIN firmar (xml_dte). Si no hay, usar xml_firmado.
+        xml_para_enviar = (dte.xml_dte or '').strip() or (dte.xml_firmado or '').strip()
+        if not xml_para_enviar:
+            logger.error(f"DTE {dte.id} no tiene XML (ni xml_dte ni xml_firmado)")
+            _registrar_fallo(envio, "XML del documento vacío. Regenera el XML desde el detalle del DTE.",
+                             inicio, reintentar=False)
+            return False
+
+        DocumentoTributarioElectronico.objects.filter(pk=dte.pk).update(estado_sii='enviando')
+        logger.info(f"[{envio.worker}] Enviando DTE {dte.folio} (intento {envio.intentos + 1}/{max_intentos()})")
+
+        # Todas las guías y DTEs se envían a DTEBox/GDExpress. Solo "enviado" si DTEBox responde OK.
+        with mantener_bloqueo([envio.pk], envio.worker):
+            resultado = DTEBoxService(envio.empresa).timbrar_dte(xml_para_enviar, dte.tipo_dte)
+    except Exception as e:
+        logger.error(f"Error al procesar DTE {dte.id}: {e}")
+        _registrar_fallo(envio, str(e), inicio)
+        return False
+
+    if not resultado['success']:
+        error_msg = resultado.get('error', 'Error desconocido')
+        logger.warning(f"[ERROR] DTE {dte.folio}: {error_msg}")
+        _registrar_fallo(envio, error_msg, inicio)
+        return False
+
+    ahora = timezone.now()
+    with transaction.atomic():
+        dte.timbre_electronico = resultado['ted']
+        dte.fecha_envio_sii = ahora
+        dte.estado_sii = 'enviado'
+        dte.error_envio = ''
+        dte.save(update_fields=['timbre_electronico', 'fecha_envio_sii', 'estado_sii', 'error_envio'])
+
+        ColaEnvioDTE.objects.filter(pk=envio.pk).update(
+            estado='enviado',
+            intentos=envio.intentos + 1,
+            bloqueado_hasta=None,
+            ultimo_error='',
+            fecha_envio=ahora,
+            duracion_ms=_duracion_ms(inicio),
+        )
+    logger.info(f"[OK] DTE {dte.folio} enviado exitosamente")
+    return True
+
+
+def _duracion_ms(inicio):
+    return int((time.perf_counter() - inicio) * 1000)
+
+
+def _registrar_fallo(envio, error_msg, inicio, reintentar=True):
+    """Programa el siguiente intento o, si se agotaron, deja el DTE pendiente con el error"""
+    intentos = envio.intentos + 1
+    campos = {
+        'intentos': intentos,
+        'bloqueado_hasta': None,
+        'ultimo_error': error_msg,
+        'duracion_ms': _duracion_ms(inicio),
+    }
+
+    if reintentar and intentos < max_intentos():
+        espera = espera_reintento(intentos)
+        campos.update(estado='pendiente', proximo_intento=timezone.now() + timedelta(seconds=espera))
+        logger.info(f"Reintentando DTE {envio.dte_id} en {espera:.0f} segundos...")
+        ColaEnvioDTE.objects.filter(pk=envio.pk).update(**campos)
+        return
+
+    with transaction.atomic():
+        ColaEnvioDTE.objects.filter(pk=envio.pk).update(estado='error', **campos)
+        DocumentoTributarioElectronico.objects.filter(pk=envio.dte_id).update(
+            estado_sii='pendiente',
+            error_envio=error_msg[:500],  # Limitar tamaño
+        )
+    logger.error(f"DTE {envio.dte_id} marcado como pendiente: {error_msg}")
+
+
+def drenar_cola(worker=None, lote=None, detener=None):
+    """
+    Procesa envíos hasta que no queden listos (o hasta que se pida detener):
+    en cada vuelta, los lotes SII que ya están listos y un grupo de envíos
+    a DTEBox.
+
+    Returns:
+        int: Cantidad de envíos procesados
+    """
+    from .envio_lotes import drenar_lotes
+
+    worker = worker or nombre_worker()
+    procesados = 0
+    while detener is None or not detener.is_set():
+        en_lotes = drenar_lotes(worker, detener)
+        procesados += en_lotes
+        ids = tomar_envios(worker, lote)
+        if not ids:
+            if en_lotes:
+                continue
+            break
+        for envio_id in ids:
+            try:
+                procesar_envio(envio_id)
+            except Exception as e:
+                logger.error(f"Error en envío {envio_id}: {e}")
+            procesados += 1
+    return procesados
+
+
+def ejecutar_worker(detener, aviso=None, lote=None, intervalo=None):
+    """
+    Loop de un worker: drena la cola y espera `intervalo` segundos (o un
+    aviso de encolado) antes de volver a revisarla. Termina con detener.set().
+    """
+    intervalo = intervalo or _config('DTE_ENVIO_INTERVALO', 5)
+    aviso = aviso or threading.Event()
+    worker = nombre_worker()
+    while not detener.is_set():
+        try:
+            drenar_cola(worker, lote, detener)
+        except Exception as e:
+            logger.error(f"Error en worker {worker}: {e}")
+        finally:
+            # Cada hilo abre su propia conexión; no dejarla abierta entre vueltas
+            close_old_connections()
+        if aviso.wait(intervalo):
+            aviso.clear()
+
+
+class _PoolLocal:
+    """Hilos workers dentro del proceso web (modo 'local')"""
+
+    def __init__(self):
+        self.detener = threading.Event()
+        self.aviso = threading.Event()
+        self.hilos = []
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        with self._lock:
+            self.hilos = [hilo for hilo in self.hilos if hilo.is_alive()]
+            for i in range(len(self.hilos), _config('DTE_ENVIO_WORKERS', 2)):
+                hilo = threading.Thread(
+                    target=ejecutar_worker,
+                    args=(self.detener, self.aviso),
+                    name=f"DTESender-{i + 1}",
+                    daemon=True,
+                )
+                hilo.start()
+                self.hilos.append(hilo)
+
+    def despertar(self):
+        self.iniciar()
+        self.aviso.set()
+
+
+_pool_local = None
+_pool_lock = threading.Lock()
+
+
+def obtener_pool_local():
+    global _pool_local
+    if _pool_local is None:
+        with _pool_lock:
+            if _pool_local is None:
+                _pool_local = _PoolLocal()
+    return _pool_local
+
+
+# ========== MÉTRICAS ==========
+
+def _percentil(valores, percentil):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    k = max(0, min(len(ordenados) - 1, int(round(percentil / 100 * len(ordenados))) - 1))
+    return ordenados[k]
+
+
+def metricas_envio(empresa=None, minutos=60):
+    """
+    Estado de la cola y rendimiento de los envíos de la empresa (o de todas)
+    en los últimos `minutos`: throughput (envíos por minuto), latencia de
+    DTEBox (duración del intento exitoso) y espera total desde el encolado.
+    """
+    ahora = timezone.now()
+    desde = ahora - timedelta(minutes=minutos)
+    cola = ColaEnvioDTE.objects.all()
+    if empresa is not None:
+        cola = cola.filter(empresa=empresa)
+
+    conteos = cola.aggregate(
+        en_cola=Count('id', filter=Q(estado__in=['pendiente', 'procesando'])),
+        procesando=Count('id', filter=Q(estado='procesando')),
+        reintentando=Count('id', filter=Q(estado='pendiente', intentos__gt=0)),
+        errores=Count('id', filter=Q(estado='error')),
+        enviados=Count('id', filter=Q(estado='enviado', fecha_envio__gte=desde)),
+        lotes_sii=Count('lote', distinct=True, filter=Q(estado='enviado', fecha_envio__gte=desde)),
+    )
+
+    recientes = list(
+        cola.filter(estado='enviado', fecha_envio__gte=desde)
+        .order_by('-fecha_envio')
+        .values_list('duracion_ms', 'fecha_creacion', 'fecha_envio')[:5000]
+    )
+    duraciones = [duracion for duracion, _, _ in recientes if duracion is not None]
+    esperas = [(envio - creacion).total_seconds() for _, creacion, envio in recientes]
+
+    # Workers de cualquier nodo que tomaron envíos en los últimos 5 minutos
+    workers_activos = ColaEnvioDTE.objects.filter(
+        fecha_ultimo_intento__gte=ahora - timedelta(minutes=5)
+    ).values('worker').distinct().count()
+
+    ultimo_error = cola.filter(estado='error').order_by('-fecha_ultimo_intento').values_list(
+        'ultimo_error', flat=True
+    ).first()
+
+    return {
+        **conteos,
+        'workers_activos': workers_activos,
+        'ultimo_error': ultimo_error,
+        'ventana_minutos': minutos,
+        'throughput_minuto': round(conteos['enviados'] / minutos, 2),
+        'latencia_p50_ms': _percentil(duraciones, 50),
+        'latencia_p95_ms': _percentil(duraciones, 95),
+        'espera_p50_s': _percentil(esperas, 50),
+        'espera_p95_s': _percentil(esperas, 95),
+    }
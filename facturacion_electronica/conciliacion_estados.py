@@ -0,0 +1,275 @@
+"""
+Conciliación del estado de los DTEs enviados (SII / DTEBox).
+
+La consulta de estado se hacía de a un documento desde la vista
+consultar_estado_dte, dentro de la petición web. Este módulo revisa en bloque
+los DTEs que todavía no tienen un estado final:
+
+- Selecciona los DTEs 'enviado' con Track ID real (usa el índice de
+  estado_sii) que no se consultaron en los últimos
+  DTE_CONCILIACION_INTERVALO minutos.
+- Consulta una vez por (empresa, Track ID): los envíos por lotes comparten
+  Track ID, así un lote de 500 boletas es una sola consulta.
+- Las consultas corren en un pool de DTE_CONCILIACION_HILOS hilos con la
+  sesión HTTP compartida y el token vigente de cada empresa, limitadas a
+  DTE_CONCILIACION_TASA consultas por segundo por proveedor ('sii', 'dtebox').
+  Si el SII rechaza el token de una empresa, el primer hilo que lo nota lo
+  invalida y pide uno nuevo, y la consulta se reintenta una vez.
+- Los resultados se guardan con bulk_update (y en el EnvioDTE del lote).
+
+Se ejecuta con el comando conciliar_estados_dte o la tarea de Celery
+conciliar_estados_dte (p. ej. desde Celery beat).
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from empresas.models import Empresa
+
+from .models import DocumentoTributarioElectronico, EnvioDTE
+from .token_sii import token_rechazado
+
+logger = logging.getLogger(__name__)
+
+
+ESTADOS_NO_FINALES = ['enviado']
+
+# Respuestas del SII / DTEBox que cierran el estado del documento
+ESTADOS_ACEPTADO = {'ACEPTADO', 'EPR', 'DOK'}
+ESTADOS_RECHAZADO = {'RECHAZADO', 'RCT', 'RFR', 'RSC'}
+
+TASA_POR_DEFECTO = {'sii': 4, 'dtebox': 10}
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def estado_local(estado):
+    """estado_sii que corresponde a la respuesta del SII/DTEBox, o None si aún no es final"""
+    estado = (estado or '').strip().upper()
+    if estado in ESTADOS_ACEPTADO or estado.startswith('ACEPTADO'):
+        return 'aceptado'
+    if estado in ESTADOS_RECHAZADO or estado.startswith('RECHAZADO'):
+        return 'rechazado'
+    return None
+
+
+class _LimiteTasa:
+    """Reparte turnos separados por 1/por_segundo entre todos los hilos"""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1.0 / por_segundo if por_segundo else 0
+        self.siguiente = 0.0
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self.siguiente)
+            self.siguiente = turno + self.intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+def dtes_por_conciliar(empresa=None, limite=None):
+    """DTEs sin estado final con Track ID consultable y sin consulta reciente"""
+    desde = timezone.now() - timedelta(minutes=_config('DTE_CONCILIACION_INTERVALO', 15))
+    dtes = (
+        DocumentoTributarioElectronico.objects.filter(estado_sii__in=ESTADOS_NO_FINALES)
+        .exclude(track_id='')
+        # Sin Track ID real (DTEBox sin TrackId en la respuesta): no hay nada que consultar
+        .exclude(track_id__startswith='DTEBOX-')
+        .filter(Q(fecha_consulta_estado__isnull=True) | Q(fecha_consulta_estado__lt=desde))
+        # Modo prueba: los DTEs de certificación con folios reutilizados no cambian de estado
+        .exclude(empresa__modo_reutilizacion_folios=True, empresa__ambiente_sii='certificacion')
+        .only('id', 'empresa_id', 'track_id', 'estado_sii', 'glosa_sii')
+        .order_by('fecha_consulta_estado', 'id')
+    )
+    if empresa is not None:
+        dtes = dtes.filter(empresa=empresa)
+    if limite:
+        dtes = dtes[:limite]
+    return list(dtes)
+
+
+class _Conciliador:
+    """Clientes, tokens y límites compartidos por los hilos de una pasada"""
+
+    def __init__(self):
+        from .cliente_sii import _sesion_compartida
+
+        self.sesion, _ = _sesion_compartida()
+        tasas = {**TASA_POR_DEFECTO, **_config('DTE_CONCILIACION_TASA', {})}
+        self.limites = {proveedor: _LimiteTasa(tasa) for proveedor, tasa in tasas.items()}
+        self._clientes = {}
+        self._tokens = {}
+        self._tokens_lock = threading.Lock()
+        self._servicios_dtebox = {}
+
+    @staticmethod
+    def proveedor(empresa):
+        return 'dtebox' if empresa.dtebox_habilitado else 'sii'
+
+    def preparar(self, empresa):
+        """Cliente y token (SII) o servicio (DTEBox) de la empresa, antes de repartir las consultas"""
+        if self.proveedor(empresa) == 'dtebox':
+            from .dtebox_service import DTEBoxService
+            if empresa.id not in self._servicios_dtebox:
+                self._servicios_dtebox[empresa.id] = DTEBoxService(empresa)
+            return
+
+        from .cliente_sii import ClienteSII
+        from .token_sii import obtener_token_sii
+
+        ambiente = empresa.ambiente_sii or 'certificacion'
+        if ambiente not in self._clientes:
+            self._clientes[ambiente] = ClienteSII(ambiente=ambiente)
+        if empresa.id not in self._tokens:
+            self._tokens[empresa.id] = obtener_token_sii(empresa, self._clientes[ambiente], ambiente=ambiente)
+
+    def consultar(self, empresa, track_id):
+        """dict con estado y glosa del envío (se ejecuta en los hilos del pool)"""
+        proveedor = self.proveedor(empresa)
+        self.limites[proveedor].esperar()
+
+        if proveedor == 'dtebox':
+            resultado = self._servicios_dtebox[empresa.id].consultar_estado(track_id, session=self.sesion)
+            if not resultado['success']:
+                raise Exception(resultado['error'])
+            return resultado
+
+        cliente = self._clientes[empresa.ambiente_sii or 'certificacion']
+        token = self._tokens[empresa.id]
+        resultado = cliente.consultar_estado_dte(track_id=track_id, token=token, rut_emisor=empresa.rut)
+        if not token_rechazado(resultado):
+            return resultado
+
+        logger.warning(f"El SII rechazó el token de la empresa {empresa.id} ({resultado.get('estado')}): se renueva")
+        token = self._renovar_token(empresa, token)
+        return cliente.consultar_estado_dte(track_id=track_id, token=token, rut_emisor=empresa.rut)
+
+    def _renovar_token(self, empresa, rechazado):
+        """Token nuevo de la empresa; si otro hilo ya lo renovó, se usa ese"""
+        from .token_sii import invalidar_token_sii, obtener_token_sii
+
+        ambiente = empresa.ambiente_sii or 'certificacion'
+        with self._tokens_lock:
+            if self._tokens[empresa.id] == rechazado:
+                invalidar_token_sii(empresa, ambiente, token=rechazado)
+                self._tokens[empresa.id] = obtener_token_sii(empresa, self._clientes[ambiente], ambiente=ambiente)
+            return self._tokens[empresa.id]
+
+
+def conciliar_estados(empresa=None, limite=None, hilos=None):
+    """
+    Consulta el estado de los DTEs pendientes de respuesta y guarda los cambios.
+
+    Args:
+        empresa: Sólo los DTEs de esta empresa (por defecto todas)
+        limite: Máximo de DTEs a revisar en esta pasada
+        hilos: Consultas simultáneas (por defecto DTE_CONCILIACION_HILOS)
+
+    Returns:
+        dict: Resumen (consultas, dtes, aceptados, rechazados, sin_cambio, errores)
+    """
+    resumen = {'consultas': 0, 'dtes': 0, 'aceptados': 0, 'rechazados': 0, 'sin_cambio': 0, 'errores': 0}
+
+    grupos = {}
+    for dte in dtes_por_conciliar(empresa, limite):
+        grupos.setdefault((dte.empresa_id, dte.track_id), []).append(dte)
+    if not grupos:
+        return resumen
+
+    empresas = Empresa.objects.in_bulk({empresa_id for empresa_id, _ in grupos})
+    conciliador = _Conciliador()
+
+    # Tokens y clientes se obtienen antes de repartir: los hilos sólo consultan
+    pendientes = {}
+    fallidas = set()
+    for (empresa_id, track_id), dtes in grupos.items():
+        if empresa_id in fallidas:
+            continue
+        try:
+            conciliador.preparar(empresas[empresa_id])
+            pendientes[(empresa_id, track_id)] = dtes
+        except Exception as e:
+            logger.error(f"No se puede consultar el estado de los DTEs de la empresa {empresa_id}: {e}")
+            fallidas.add(empresa_id)
+            resumen['errores'] += 1
+
+    resultados = {}
+    with ThreadPoolExecutor(max_workers=hilos or _config('DTE_CONCILIACION_HILOS', 8)) as pool:
+        futuros = {
+            pool.submit(conciliador.consultar, empresas[empresa_id], track_id): (empresa_id, track_id)
+            for empresa_id, track_id in pendientes
+        }
+        for futuro in as_completed(futuros):
+            clave = futuros[futuro]
+            resumen['consultas'] += 1
+            try:
+                resultados[clave] = futuro.result()
+            except Exception as e:
+                logger.error(f"Error al consultar el Track ID {clave[1]} (empresa {clave[0]}): {e}")
+                resumen['errores'] += 1
+
+    _aplicar_resultados(pendientes, resultados, resumen)
+    return resumen
+
+
+def _aplicar_resultados(grupos, resultados, resumen):
+    ahora = timezone.now()
+    actualizados = []
+    envios = []
+
+    for clave, resultado in resultados.items():
+        nuevo = estado_local(resultado.get('estado'))
+        glosa = resultado.get('glosa') or ''
+        for dte in grupos[clave]:
+            dte.fecha_consulta_estado = ahora
+            if glosa:
+                dte.glosa_sii = glosa
+            if nuevo:
+                dte.estado_sii = nuevo
+                dte.fecha_respuesta_sii = ahora
+                resumen['aceptados' if nuevo == 'aceptado' else 'rechazados'] += 1
+            else:
+                resumen['sin_cambio'] += 1
+            actualizados.append(dte)
+        if nuevo:
+            envios.append((clave, nuevo, glosa))
+
+    resumen['dtes'] = len(actualizados)
+    with transaction.atomic():
+        DocumentoTributarioElectronico.objects.bulk_update(
+            actualizados,
+            ['estado_sii', 'glosa_sii', 'fecha_consulta_estado', 'fecha_respuesta_sii'],
+            batch_size=500,
+        )
+        for (empresa_id, track_id), nuevo, glosa in envios:
+            EnvioDTE.objects.filter(empresa_id=empresa_id, track_id=track_id).update(
+                estado=nuevo,
+                glosa_respuesta=glosa,
+                fecha_respuesta=ahora,
+            )
+
+
+def ejecutar_continuo(detener, intervalo=60, **opciones):
+    """Loop de conciliación cada `intervalo` segundos hasta detener.set()"""
+    while not detener.is_set():
+        try:
+            resumen = conciliar_estados(**opciones)
+            if resumen['consultas']:
+                logger.info(f"Conciliación de estados DTE: {resumen}")
+        except Exception as e:
+            logger.error(f"Error en la conciliación de estados DTE: {e}")
+        finally:
+            close_old_connections()
+        detener.wait(intervalo)
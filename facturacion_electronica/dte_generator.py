@@ -1,7 +1,18 @@
 """
 Generador de XML para Documentos Tributarios Electrónicos (DTE)
 Según formato oficial del SII de Chile
+
+generar_xml() entrega el XML ya en la forma final que se envía a DTEBox
+(declaración con comillas dobles, sin indentación, sin firma ni TED y con
+IndTraslado/TipoDespacho válidos), así DTEBoxService._limpiar_y_preparar_xml
+lo usa tal cual en vez de parsearlo, limpiarlo y volver a serializarlo.
+El bloque Emisor se arma una vez por empresa y se reutiliza mientras no
+cambien sus datos.
 """
+import copy
+import threading
+
+import pytz
 from lxml import etree
 from datetime import datetime
 from decimal import Decimal
@@ -9,6 +20,41 @@ from django.utils import timezone
 from facturacion_electronica.models import DocumentoTributarioElectronico
 
 
+CHILE_TZ = pytz.timezone('America/Santiago')
+
+# Inicio del XML canónico (ver generar_xml y DTEBoxService._limpiar_y_preparar_xml)
+DECLARACION_XML = '<?xml version="1.0" encoding="ISO-8859-1"?>'
+RAIZ_DTE = '<DTE version="1.0" xmlns="http://www.sii.cl/SiiDte">'
+CABECERA_CANONICA = DECLARACION_XML + RAIZ_DTE
+_RAIZ_LXML = b'<DTE xmlns="http://www.sii.cl/SiiDte" version="1.0">'
+
+TIPOS_BOLETA = ('39', '41')
+
+# Bloque Emisor por (empresa, boleta o no): (datos de la empresa, elemento)
+_emisores = {}
+_emisores_lock = threading.Lock()
+
+
+def _datos_emisor(empresa):
+    """Campos de la empresa que aparecen en el bloque Emisor (si cambian, se rearma)"""
+    return (
+        empresa.rut, empresa.razon_social_sii, empresa.razon_social, empresa.giro_sii, empresa.giro,
+        empresa.telefono, empresa.email, empresa.codigo_actividad_economica,
+        empresa.direccion_casa_matriz, empresa.direccion, empresa.comuna_casa_matriz, empresa.comuna,
+        empresa.ciudad_casa_matriz, empresa.ciudad, getattr(empresa, 'codigo_vendedor', None),
+    )
+
+
+def invalidar_emisor_dte(empresa_id=None):
+    """Descarta los bloques Emisor cacheados (de una empresa o de todas)"""
+    with _emisores_lock:
+        if empresa_id is None:
+            _emisores.clear()
+        else:
+            for clave in [clave for clave in _emisores if clave[0] == empresa_id]:
+                del _emisores[clave]
+
+
 class DTEXMLGenerator:
     """Generador de XML para DTE según formato SII"""
     
@@ -37,8 +83,19 @@ class DTEXMLGenerator:
         Genera el XML completo del DTE
         
         Returns:
-            str: XML del DTE sin firmar
+            str: XML del DTE sin firmar, en forma canónica (listo para DTEBox)
         """
+        root = self._construir_arbol()
+        
+        # Una sola serialización, sin indentación: firmar_xml descarta los
+        # espacios igual, y DTEBox recibe exactamente este texto
+        xml_bytes = etree.tostring(root, encoding='ISO-8859-1', xml_declaration=False)
+        if xml_bytes.startswith(_RAIZ_LXML):
+            xml_bytes = RAIZ_DTE.encode('ISO-8859-1') + xml_bytes[len(_RAIZ_LXML):]
+        return DECLARACION_XML + xml_bytes.decode('ISO-8859-1')
+    
+    def _construir_arbol(self):
+        """Árbol lxml del DTE sin firmar"""
         # Crear el documento raíz
         root = etree.Element("DTE", version="1.0", nsmap={None: self.NS_SII})
         
@@ -56,15 +113,7 @@ class DTEXMLGenerator:
         else:
             raise ValueError(f"Tipo de DTE no soportado: {self.tipo_dte}")
         
-        # Convertir a string con formato
-        xml_string = etree.tostring(
-            root,
-            pretty_print=True,
-            xml_declaration=True,
-            encoding='ISO-8859-1'
-        ).decode('ISO-8859-1')
-        
-        return xml_string
+        return root
     
     def _generar_factura(self, root):
         """Genera XML para Factura Electrónica (33) o Factura Exenta (34)"""
@@ -175,21 +224,14 @@ class DTEXMLGenerator:
             fecha_emision = self.documento.fecha
             
         if fecha_emision:
-            from django.utils import timezone
-            import pytz
-            
             # Asegurar que la fecha esté en la zona horaria de Chile
-            chile_tz = pytz.timezone('America/Santiago')
             if hasattr(fecha_emision, 'astimezone'):
-                fecha_chile = fecha_emision.astimezone(chile_tz).date()
+                fecha_chile = fecha_emision.astimezone(CHILE_TZ).date()
                 etree.SubElement(id_doc, "FchEmis").text = fecha_chile.strftime('%Y-%m-%d')
             else:
                 etree.SubElement(id_doc, "FchEmis").text = fecha_emision.strftime('%Y-%m-%d')
         else:
-            from django.utils import timezone
-            import pytz
-            chile_tz = pytz.timezone('America/Santiago')
-            fecha_chile = timezone.now().astimezone(chile_tz).date()
+            fecha_chile = timezone.now().astimezone(CHILE_TZ).date()
             etree.SubElement(id_doc, "FchEmis").text = fecha_chile.strftime('%Y-%m-%d')
         
         # Indicador de servicio (OBLIGATORIO para boletas)
@@ -213,7 +255,10 @@ class DTEXMLGenerator:
         if self.tipo_dte == '52':
             tipo_despacho = '3'
             if hasattr(self.documento, 'tipo_despacho') and self.documento.tipo_despacho:
-                tipo_despacho = str(self.documento.tipo_despacho)
+                tipo_despacho = str(self.documento.tipo_despacho).strip()
+            # Valores aceptados por DTEBox (antes los corregía _limpiar_y_preparar_xml)
+            if tipo_despacho not in {'1', '2', '3'}:
+                tipo_despacho = '1'
             etree.SubElement(id_doc, "TipoDespacho").text = tipo_despacho
             
             ind_traslado = '1'
@@ -221,6 +266,9 @@ class DTEXMLGenerator:
                 ind_traslado = str(self.documento.tipo_traslado)
             elif hasattr(self.documento, 'tipo_despacho') and self.documento.tipo_despacho:
                 ind_traslado = str(self.documento.tipo_despacho)
+            ind_traslado = ind_traslado.strip()
+            if ind_traslado not in {'1', '2', '3', '4', '5', '6', '7', '8', '9'}:
+                ind_traslado = '1'
             etree.SubElement(id_doc, "IndTraslado").text = ind_traslado
 
         # 3. FchVenc (Si corresponde y NO es guía)
@@ -296,8 +344,19 @@ class DTEXMLGenerator:
             print(f"[WARN] Error al generar seccion Transporte: {e}")
     
     def _generar_emisor(self, encabezado):
-        """Genera datos del emisor"""
-        emisor = etree.SubElement(encabezado, "Emisor")
+        """Agrega el bloque Emisor (armado una vez por empresa y tipo de documento)"""
+        clave = (self.empresa.id, self.tipo_dte in TIPOS_BOLETA)
+        datos = _datos_emisor(self.empresa)
+        cacheado = _emisores.get(clave)
+        if cacheado is None or cacheado[0] != datos:
+            cacheado = (datos, self._construir_emisor())
+            with _emisores_lock:
+                _emisores[clave] = cacheado
+        encabezado.append(copy.deepcopy(cacheado[1]))
+    
+    def _construir_emisor(self):
+        """Bloque Emisor según los datos de la empresa"""
+        emisor = etree.Element("Emisor")
         
         # RUT sin puntos
         rut_emisor = self.empresa.rut.replace('.', '')
@@ -348,6 +407,8 @@ class DTEXMLGenerator:
             codigo_vendedor = getattr(self.empresa, 'codigo_vendedor', None) or 'OFICINA'
             etree.SubElement(emisor, "CdgVendedor").text = codigo_vendedor[:60]
         
+        return emisor
+        
     def _generar_receptor(self, encabezado):
         """Genera datos del receptor de forma robusta."""
         receptor = etree.SubElement(encabezado, "Receptor")
@@ -519,16 +580,14 @@ class DTEXMLGenerator:
             # Flujo desde POS/Despacho: los items vienen de la venta asociada al DTE
             # Primero intentar con la venta directa
             if hasattr(self.documento, 'venta') and self.documento.venta:
-                items = self.documento.venta.ventadetalle_set.all()
-                if venta_asociada and hasattr(venta_asociada, 'ventadetalle_set'):
-                    items = venta_asociada.ventadetalle_set.all()
+                items = self.documento.venta.ventadetalle_set.select_related('articulo__unidad_medida')
             # Si no hay ninguna de las anteriores, intentar con transferencias
             elif self.documento.transferencias.exists():
                 transf = self.documento.transferencias.first()
                 if transf:
                     items = transf.detalles.all()
         elif isinstance(self.documento, Venta):
-            items = self.documento.ventadetalle_set.all()
+            items = self.documento.ventadetalle_set.select_related('articulo__unidad_medida')
         elif isinstance(self.documento, NotaCredito):
             items = self.documento.items.all()
         elif isinstance(self.documento, OrdenDespacho):
@@ -559,6 +618,10 @@ class DTEXMLGenerator:
                 # Caso extremo: el documento tiene una relación venta
                 items = self.documento.venta.ventadetalle_set.all()
 
+        # Montos del documento (para decidir si los precios de facturas/guías vienen con IVA)
+        monto_total_doc = float(getattr(self.documento, 'monto_total', 0) or 0)
+        monto_neto_doc = float(getattr(self.documento, 'monto_neto', 0) or 0)
+        
         total_neto_items = 0
         for index, item in enumerate(items, start=1):
             detalle = etree.SubElement(documento, "Detalle")
@@ -640,9 +703,6 @@ class DTEXMLGenerator:
             else:
                 # Caso Factura/Guía: SII requiere precios NETOS
                 # Si sospechamos que el precio es bruto (comparando con los totales del documento), lo convertimos
-                monto_total_doc = float(getattr(self.documento, 'monto_total', 0) or 0)
-                monto_neto_doc = float(getattr(self.documento, 'monto_neto', 0) or 0)
-                
                 # Si el total coincide con la suma de precios unitarios * cantidades, es muy probable que sean brutos
                 # O si neto + iva == total y el precio_unitario es alto
                 if monto_total_doc > 0 and monto_neto_doc > 0 and monto_total_doc != monto_neto_doc:
@@ -7,10 +7,11 @@ from django.conf import settings
 from .models import DocumentoTributarioElectronico, ArchivoCAF, EnvioDTE
 from .dte_generator import DTEXMLGenerator  # Usar para boletas
 from dte_gdexpress import GeneradorFactura, GeneradorGuia, GeneradorNotaCredito, GeneradorNotaDebito, ClienteGDExpress, GestorCAF
-from .firma_electronica import FirmadorDTE
+from .firma_electronica import obtener_firmador_empresa
 from .cliente_sii import ClienteSII
+from .token_sii import con_token_sii
 from .services import FolioService
-from .pdf417_generator import PDF417Generator
+from .timbre_pdf417 import programar_timbre_pdf417
 import os
 from lxml import etree
 
@@ -54,7 +55,10 @@ class DTEService:
                 # 1. Obtener folio - IMPORTANTE: Usar la sucursal de la venta para picking de CAF
                 sucursal_venta = getattr(venta, 'sucursal', None)
                 print(f"\nPaso 1: Obteniendo folio para tipo {tipo_dte} en sucursal {sucursal_venta}")
-                folio, caf = FolioService.obtener_siguiente_folio(self.empresa, tipo_dte, sucursal=sucursal_venta)
+                folio, caf = FolioService.obtener_siguiente_folio(
+                    self.empresa, tipo_dte, sucursal=sucursal_venta,
+                    estacion=getattr(venta, 'estacion_trabajo', None)
+                )
 
                 if folio is None:
                     raise ValueError(f"No hay folios disponibles para tipo de documento {tipo_dte}")
@@ -186,9 +190,8 @@ class DTEService:
 
                 print(f"DTE guardado - ID: {dte.id}")
 
-                # 7. Generar imagen PDF417 del timbre
-                print(f"\nPaso 7: Generando imagen PDF417")
-                PDF417Generator.guardar_pdf417_en_dte(dte)
+                # 7. Imagen PDF417 del timbre (en segundo plano, después del commit)
+                programar_timbre_pdf417(dte)
 
                 print(f"\nDTE generado exitosamente: Tipo {tipo_dte}, Folio {folio}")
                 
@@ -277,8 +280,8 @@ class DTEService:
                 dte.estado_sii = 'generado'
                 dte.save()
 
-                # 6. Generar imagen PDF417 del timbre
-                PDF417Generator.guardar_pdf417_en_dte(dte)
+                # 6. Imagen PDF417 del timbre (en segundo plano, después del commit)
+                programar_timbre_pdf417(dte)
 
                 return dte
         except Exception as e:
@@ -394,8 +397,8 @@ class DTEService:
                     pdf417_data=pdf417_data
                 )
 
-                # 9. Generar imagen PDF417 del timbre
-                PDF417Generator.guardar_pdf417_en_dte(dte)
+                # 9. Imagen PDF417 del timbre (en segundo plano, después del commit)
+                programar_timbre_pdf417(dte)
 
                 # 10. Asociar DTE a la Nota de Crédito (ya está asociada en _crear_registro_dte_nc)
                 nota_credito.dte = dte
@@ -497,8 +500,8 @@ class DTEService:
                     pdf417_data=pdf417_data
                 )
 
-                # 9. Generar imagen PDF417 del timbre
-                PDF417Generator.guardar_pdf417_en_dte(dte)
+                # 9. Imagen PDF417 del timbre (en segundo plano, después del commit)
+                programar_timbre_pdf417(dte)
 
                 # 10. Asociar DTE a la Nota de Débito
                 nota_debito.dte = dte
@@ -618,10 +621,10 @@ class DTEService:
                     from .firma_electronica import FirmadorDTE
                     firmador = self._obtener_firmador()
                     dte.datos_pdf417 = firmador.generar_datos_pdf417(dte.timbre_electronico)
-                    from .pdf417_generator import PDF417Generator
-                    PDF417Generator.guardar_pdf417_en_dte(dte)
                 
                 dte.save()
+                if resultado.get('ted'):
+                    programar_timbre_pdf417(dte)
             
             return {
                 'success': True,
@@ -636,28 +639,25 @@ class DTEService:
         """Envía DTE directamente al SII (para facturas tipo 33)"""
         from .cliente_sii import ClienteSII
         cliente_sii = ClienteSII(ambiente=self.empresa.ambiente_sii or 'certificacion')
-        firmador = self._obtener_firmador()
         
-        # Obtener semilla y token
-        semilla = cliente_sii.obtener_semilla()
-        token = cliente_sii.obtener_token(semilla, firmador)
-        
-        # Construir carátula y SetDTE con un solo documento
-        caratula = {
-            'rut_emisor': self.empresa.rut,
-            'rut_envia': self.empresa.rut,
-            'rut_receptor': '60803000-K',
-            'fecha_resolucion': (self.empresa.resolucion_fecha.strftime('%Y-%m-%d') if self.empresa.resolucion_fecha else '2014-08-22'),
-            'numero_resolucion': int(self.empresa.resolucion_numero or 0),
-        }
-        set_xml = cliente_sii.crear_set_dte([xml_para_enviar], caratula)
+        # SetDTE firmado con un solo documento (los envíos de la cola van en lotes, ver envio_lotes)
+        from .envio_lotes import TIPOS_BOLETA, caratula_envio
+        set_xml = cliente_sii.crear_set_dte(
+            [xml_para_enviar], caratula_envio(self.empresa), boletas=dte.tipo_dte in TIPOS_BOLETA
+        )
+        set_xml = self._obtener_firmador().firmar_envio(set_xml)
         
-        # Enviar al SII
-        respuesta_sii = cliente_sii.enviar_dte(
-            xml_envio=set_xml,
-            token=token,
-            rut_emisor=self.empresa.rut,
-            rut_envia=self.empresa.rut
+        # Enviar al SII con el token vigente de la empresa (si el SII lo rechaza, se renueva y reintenta una vez)
+        respuesta_sii = con_token_sii(
+            self.empresa,
+            lambda token: cliente_sii.enviar_dte(
+                xml_envio=set_xml,
+                token=token,
+                rut_emisor=self.empresa.rut,
+                rut_envia=self.empresa.rut
+            ),
+            cliente_sii,
+            ambiente=cliente_sii.ambiente,
         )
         
         track_id = respuesta_sii.get('track_id')
@@ -693,16 +693,16 @@ class DTEService:
             # Inicializar cliente SII
             cliente_sii = ClienteSII(ambiente=self.empresa.ambiente_sii)
 
-            # Obtener firmador y token
-            firmador = self._obtener_firmador()
-            semilla = cliente_sii.obtener_semilla()
-            token = cliente_sii.obtener_token(semilla, firmador)
-
-            # Consultar estado
-            estado = cliente_sii.consultar_estado_dte(
-                track_id=dte.track_id,
-                token=token,
-                rut_emisor=self.empresa.rut
+            # Consultar estado con el token vigente de la empresa (si el SII lo rechaza, se renueva y reintenta una vez)
+            estado = con_token_sii(
+                self.empresa,
+                lambda token: cliente_sii.consultar_estado_dte(
+                    track_id=dte.track_id,
+                    token=token,
+                    rut_emisor=self.empresa.rut
+                ),
+                cliente_sii,
+                ambiente=cliente_sii.ambiente,
             )
 
             # Actualizar estado del DTE (solo si NO está en modo prueba)
@@ -710,11 +710,11 @@ class DTEService:
             es_certificacion = self.empresa.ambiente_sii == 'certificacion'
 
             if not (modo_reutilizacion and es_certificacion):
+                from .conciliacion_estados import estado_local
                 with transaction.atomic():
-                    if estado['estado'] == 'ACEPTADO':
-                        dte.estado_sii = 'aceptado'
-                    elif estado['estado'] == 'RECHAZADO':
-                        dte.estado_sii = 'rechazado'
+                    nuevo_estado = estado_local(estado['estado'])
+                    if nuevo_estado:
+                        dte.estado_sii = nuevo_estado
 
                     dte.glosa_sii = estado.get('glosa')
                     dte.fecha_consulta_estado = timezone.now()
@@ -729,11 +729,8 @@ class DTEService:
             raise
     
     def _obtener_firmador(self):
-        """Obtiene una instancia del firmador con el certificado de la empresa"""
-        certificado_path = self.empresa.certificado_digital.path
-        password = self.empresa.password_certificado
-        
-        return FirmadorDTE(certificado_path, password)
+        """Obtiene el firmador con el certificado de la empresa (cacheado por proceso)"""
+        return obtener_firmador_empresa(self.empresa)
     
     def _generar_ted(self, venta, tipo_dte, folio, caf, firmador):
         """Genera el TED (Timbre Electrónico Digital)"""
@@ -752,68 +749,38 @@ class DTEService:
             'item_1': 'Documento Tributario Electrónico',
         }
         
-        # Preparar datos del CAF
-        datos_caf = self._parsear_datos_caf(caf)
-        
-        caf_data = {
-            'rut_emisor': self.empresa.rut,
-            'razon_social': self.empresa.razon_social_sii or self.empresa.razon_social,
+        return firmador.generar_ted(dte_data, self._datos_caf_ted(caf, tipo_dte))
+
+    def _datos_caf_ted(self, caf, tipo_dte, empresa=None):
+        """Datos del CAF para el TED, desde los campos extraídos al cargar el CAF (sin parsear XML)"""
+        from .caf_datos import datos_caf
+
+        empresa = empresa or self.empresa
+        try:
+            datos = datos_caf(caf)
+            modulo, exponente = datos['modulo'], datos['exponente']
+        except Exception as e:
+            print(f"Error obteniendo datos del CAF: {e}")
+            # Fallback a placeholders para no romper si el XML está mal formado,
+            # pero el TED será inválido.
+            modulo = exponente = 'ERROR_PARSING_CAF'
+
+        return {
+            'rut_emisor': empresa.rut,
+            'razon_social': empresa.razon_social_sii or empresa.razon_social,
             'tipo_documento': tipo_dte,
             'folio_desde': caf.folio_desde,
             'folio_hasta': caf.folio_hasta,
             'fecha_autorizacion': caf.fecha_autorizacion.strftime('%Y-%m-%d'),
-            'modulo': datos_caf['M'],
-            'exponente': datos_caf['E'],
+            'modulo': modulo,
+            'exponente': exponente,
             'firma': caf.firma_electronica,
         }
-        
-        return firmador.generar_ted(dte_data, caf_data)
 
     def _parsear_datos_caf(self, caf):
-        """Extrae módulo y exponente del XML del CAF"""
-        try:
-            # Obtener contenido XML
-            if caf.contenido_caf:
-                content = caf.contenido_caf
-            elif caf.archivo_xml:
-                with open(caf.archivo_xml.path, 'r', encoding='ISO-8859-1') as f:
-                    content = f.read()
-            else:
-                raise ValueError("CAF sin contenido XML")
-            
-            # Parsear
-            if isinstance(content, str):
-                # Si es string, lxml prefiere bytes si hay declaración de encoding
-                content = content.encode('ISO-8859-1')
-            
-            # Usar un parser que ignore errores de encoding si es necesario o especificarlo
-            parser = etree.XMLParser(encoding='ISO-8859-1', recover=True)
-            root = etree.fromstring(content, parser=parser)
-            
-            # Buscar RSAPK
-            rsapk = root.find('.//RSAPK')
-            if rsapk is None:
-                # Intentar con namespace
-                rsapk = root.find('.//{http://www.sii.cl/SiiDte}RSAPK')
-            
-            if rsapk is None:
-                raise ValueError("No se encontró clave RSA en el CAF")
-            
-            m = rsapk.find('M')
-            if m is None: m = rsapk.find('{http://www.sii.cl/SiiDte}M')
-            
-            e = rsapk.find('E')
-            if e is None: e = rsapk.find('{http://www.sii.cl/SiiDte}E')
-            
-            return {
-                'M': m.text,
-                'E': e.text
-            }
-        except Exception as e:
-            print(f"Error parseando CAF: {e}")
-            # Fallback a placeholders para no romper si el XML está mal formado, 
-            # pero el TED será inválido.
-            return {'M': 'ERROR_PARSING_CAF', 'E': 'ERROR_PARSING_CAF'}
+        """Módulo y exponente del CAF ({'M', 'E'}), desde los campos ya extraídos"""
+        datos = self._datos_caf_ted(caf, caf.tipo_documento)
+        return {'M': datos['modulo'], 'E': datos['exponente']}
 
     def _generar_ted_nc(self, nota, tipo_dte, folio, caf, firmador):
         """Genera el TED para una Nota de Crédito"""
@@ -828,22 +795,7 @@ class DTEService:
             'item_1': 'Nota de Crédito Electrónica',
         }
         
-        # Preparar datos del CAF
-        datos_caf = self._parsear_datos_caf(caf)
-
-        caf_data = {
-            'rut_emisor': self.empresa.rut,
-            'razon_social': self.empresa.razon_social_sii or self.empresa.razon_social,
-            'tipo_documento': tipo_dte,
-            'folio_desde': caf.folio_desde,
-            'folio_hasta': caf.folio_hasta,
-            'fecha_autorizacion': caf.fecha_autorizacion.strftime('%Y-%m-%d'),
-            'modulo': datos_caf['M'],
-            'exponente': datos_caf['E'],
-            'firma': caf.firma_electronica,
-        }
-        
-        return firmador.generar_ted(dte_data, caf_data)
+        return firmador.generar_ted(dte_data, self._datos_caf_ted(caf, tipo_dte))
     
     def _crear_registro_dte(self, venta, tipo_dte, folio, caf, xml_sin_firmar, 
                            xml_firmado, ted_xml, pdf417_data, **transport_data):
@@ -983,22 +935,7 @@ class DTEService:
             'item_1': 'Nota de Débito Electrónica',
         }
         
-        # Preparar datos del CAF
-        datos_caf = self._parsear_datos_caf(caf)
-
-        caf_data = {
-            'rut_emisor': self.empresa.rut,
-            'razon_social': self.empresa.razon_social_sii or self.empresa.razon_social,
-            'tipo_documento': tipo_dte,
-            'folio_desde': caf.folio_desde,
-            'folio_hasta': caf.folio_hasta,
-            'fecha_autorizacion': caf.fecha_autorizacion.strftime('%Y-%m-%d'),
-            'modulo': datos_caf['M'],
-            'exponente': datos_caf['E'],
-            'firma': caf.firma_electronica,
-        }
-        
-        return firmador.generar_ted(dte_data, caf_data)
+        return firmador.generar_ted(dte_data, self._datos_caf_ted(caf, tipo_dte))
     
     def _crear_registro_dte_nd(self, nota_debito, tipo_dte, folio, caf, xml_sin_firmar, 
                                xml_firmado, ted_xml, pdf417_data):
@@ -1053,19 +990,5 @@ class DTEService:
             'item_1': 'Documento Tributario Electrónico',
         }
         
-        # Preparar datos del CAF
-        datos_caf = self._parsear_datos_caf(dte.caf_utilizado)
-        
-        caf_data = {
-            'rut_emisor': dte.caf_utilizado.empresa.rut,
-            'razon_social': dte.caf_utilizado.empresa.razon_social_sii or dte.caf_utilizado.empresa.razon_social,
-            'tipo_documento': dte.caf_utilizado.tipo_documento,
-            'folio_desde': dte.caf_utilizado.folio_desde,
-            'folio_hasta': dte.caf_utilizado.folio_hasta,
-            'fecha_autorizacion': dte.caf_utilizado.fecha_autorizacion.strftime('%Y-%m-%d'),
-            'modulo': datos_caf['M'],
-            'exponente': datos_caf['E'],
-            'firma': dte.caf_utilizado.firma_electronica,
-        }
-        
-        return firmador.generar_ted(dte_data, caf_data)
+        caf = dte.caf_utilizado
+        return firmador.generar_ted(dte_data, self._datos_caf_ted(caf, caf.tipo_documento, caf.empresa))
@@ -14,6 +14,11 @@ from django.conf import settings
 from datetime import datetime
 from lxml import etree
 
+
+# Elementos que DTEBox no acepta en el POST (él firma y timbra)
+_RE_NO_CANONICO = re.compile(r'<(?:\w+:)?(?:Signature|TED|TmstFirma)[\s>]')
+
+
 class DTEBoxService:
     """Servicio para comunicación con DTEBox API"""
     
@@ -60,12 +65,22 @@ class DTEBoxService:
             rut_raw.replace('-', '')    # Ejemplo: 761294865
         ]
 
+    @staticmethod
+    def _es_xml_canonico(xml):
+        """True si el XML salió de DTEXMLGenerator.generar_xml y no se firmó ni timbró después"""
+        from .dte_generator import CABECERA_CANONICA
+        return xml.startswith(CABECERA_CANONICA) and not _RE_NO_CANONICO.search(xml)
+
     def _limpiar_y_preparar_xml(self, xml_firmado, tipo_dte):
         """Prepara el XML del DTE para DTEBox (mismo criterio que KreaDTE-Cloud).
         Por POST se envía XML SIN firmar; DTEBox firma/timbra. Se quita declaración XML del Content.
         Acepta XML firmado o sin firmar: extrae el DTE, elimina firmas/TED si existen.
         Retorna (xml_clean, None) si ok, o (None, mensaje_error) si falla.
         """
+        # XML canónico de DTEXMLGenerator.generar_xml: ya está como DTEBox lo necesita
+        if isinstance(xml_firmado, str) and self._es_xml_canonico(xml_firmado):
+            return xml_firmado, None
+
         print(f"[DTEBox Debug] Preparando XML tipo {tipo_dte} (estilo KreaDTE-Cloud: POST sin firma)")
         try:
             from lxml import etree
@@ -350,6 +365,34 @@ class DTEBoxService:
             traceback.print_exc()
             return {'success': False, 'error': str(e)}
 
+    def consultar_estado(self, track_id, session=None):
+        """
+        Consulta en DTEBox el estado de un envío por Track ID.
+        Formato: [url_service]/core/GetDocumentStatus/[Ambiente]/[TrackId]
+        """
+        try:
+            url = f"{self.url_core}/GetDocumentStatus/{self.ambiente}/{track_id}"
+            headers = {'AuthKey': self.auth_key, 'Accept': 'application/json'}
+            resp = (session or requests).get(url, headers=headers, timeout=25)
+
+            if resp.status_code != 200:
+                return {'success': False, 'error': f"Error HTTP {resp.status_code} en DTEBox"}
+
+            data_b64 = resp.json().get('Data')
+            if not data_b64:
+                return {'success': False, 'error': 'DTEBox no entregó el estado del envío'}
+
+            data_xml = base64.b64decode(data_b64).decode('utf-8')
+            root = etree.fromstring(data_xml.encode('utf-8'))
+            return {
+                'success': True,
+                'estado': root.findtext('.//Estado', default=''),
+                'glosa': root.findtext('.//Glosa', default=''),
+                'xml_respuesta': data_xml,
+            }
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
     def descargar_pdf(self, dte):
         """Descarga el PDF de un DTE desde GDExpress/DTEBox."""
         try:
@@ -0,0 +1,206 @@
+"""
+Envío por lotes de DTEs directo al SII (EnvioDTE / EnvioBOLETA).
+
+Un envío al SII puede llevar muchos documentos en un solo SetDTE firmado,
+pero cada DTE se subía por separado: un sobre, una firma y un upload por
+documento (al cierre del día, miles de boletas). Para las empresas que
+emiten directo al SII (sin DTEBox) la cola de envío guarda las filas con
+canal 'sii' y los workers las agrupan:
+
+- Un grupo es (empresa, ambiente, tipo de DTE): el SII recibe un envío por
+  emisor y las boletas (39/41) van en un EnvioBOLETA separado.
+- Un grupo sale cuando junta SII_LOTE_MAX_DOCUMENTOS documentos o cuando su
+  documento más antiguo lleva SII_LOTE_ESPERA segundos esperando.
+- Se arma el sobre con los XML ya firmados, se firma el SetDTE una vez, se
+  sube con el token vigente de la empresa y el track id del envío se copia a
+  todos los DTEs del lote con un UPDATE. El lote queda registrado como un
+  EnvioDTE con sus documentos.
+
+Los DTEs de empresas con DTEBox siguen yendo de a uno: DTEBox timbra y envía
+cada documento por su cuenta.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from .cola_envio import _duracion_ms, _registrar_fallo, envios_disponibles, mantener_bloqueo, tomar_envios
+from .models import ColaEnvioDTE, DocumentoTributarioElectronico, EnvioDTE
+
+logger = logging.getLogger(__name__)
+
+
+TIPOS_BOLETA = ('39', '41')
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def lote_maximo():
+    return _config('SII_LOTE_MAX_DOCUMENTOS', 500)
+
+
+def canal_empresa(empresa):
+    """'sii' si los DTEs de la empresa se envían en lotes directo al SII, si no 'dtebox'"""
+    if _config('DTE_ENVIO_SII_LOTES', True) and not getattr(empresa, 'dtebox_habilitado', False):
+        return 'sii'
+    return 'dtebox'
+
+
+def caratula_envio(empresa):
+    """Datos de la carátula de un envío de la empresa al SII"""
+    return {
+        'rut_emisor': empresa.rut,
+        'rut_envia': empresa.rut,
+        'rut_receptor': '60803000-K',
+        'fecha_resolucion': (empresa.resolucion_fecha.strftime('%Y-%m-%d') if empresa.resolucion_fecha else '2014-08-22'),
+        'numero_resolucion': int(empresa.resolucion_numero or 0),
+    }
+
+
+def grupos_listos(ahora=None):
+    """
+    Grupos (empresa_id, ambiente, tipo_dte) con un lote listo para enviar:
+    ya juntaron lote_maximo() documentos o el más antiguo superó la espera.
+    """
+    ahora = ahora or timezone.now()
+    limite_espera = ahora - timedelta(seconds=_config('SII_LOTE_ESPERA', 30))
+    grupos = (
+        ColaEnvioDTE.objects.filter(envios_disponibles(ahora), canal='sii')
+        .values('empresa_id', 'ambiente', 'tipo_dte')
+        .annotate(cantidad=Count('id'), desde=Min('proximo_intento'))
+        .order_by('desde')
+    )
+    return [
+        (grupo['empresa_id'], grupo['ambiente'], grupo['tipo_dte'])
+        for grupo in grupos
+        if grupo['cantidad'] >= lote_maximo() or grupo['desde'] <= limite_espera
+    ]
+
+
+def enviar_lote(envio_ids):
+    """
+    Envía al SII en un solo sobre firmado los DTEs de envíos ya reservados
+    (todos del mismo grupo) y reparte el track id entre ellos.
+
+    Returns:
+        int: Cantidad de envíos procesados (enviados o con fallo registrado)
+    """
+    from .cliente_sii import ClienteSII
+    from .firma_electronica import obtener_firmador_empresa
+    from .token_sii import con_token_sii
+
+    envios = list(ColaEnvioDTE.objects.select_related('dte', 'empresa').filter(pk__in=envio_ids).order_by('dte__folio'))
+    if not envios:
+        return 0
+
+    inicio = time.perf_counter()
+    empresa = envios[0].empresa
+    ambiente = envios[0].ambiente or empresa.ambiente_sii or 'certificacion'
+    tipo_dte = envios[0].tipo_dte
+
+    # Directo al SII sólo sirve el XML firmado (con TED y firma del documento)
+    validos = []
+    for envio in envios:
+        if (envio.dte.xml_firmado or '').strip():
+            validos.append(envio)
+        else:
+            _registrar_fallo(envio, "DTE sin XML firmado. Regenera el XML desde el detalle del DTE.",
+                             inicio, reintentar=False)
+    if not validos:
+        return len(envios)
+
+    dtes_ids = [envio.dte_id for envio in validos]
+    DocumentoTributarioElectronico.objects.filter(pk__in=dtes_ids).update(estado_sii='enviando')
+    logger.info(f"Enviando lote de {len(validos)} DTE(s) tipo {tipo_dte} de la empresa {empresa.id} ({ambiente})")
+
+    try:
+        cliente_sii = ClienteSII(ambiente=ambiente)
+        set_xml = cliente_sii.crear_set_dte(
+            [envio.dte.xml_firmado.strip() for envio in validos],
+            caratula_envio(empresa),
+            boletas=tipo_dte in TIPOS_BOLETA,
+        )
+        xml_envio = obtener_firmador_empresa(empresa).firmar_envio(set_xml)
+        with mantener_bloqueo([envio.pk for envio in validos], validos[0].worker):
+            respuesta = con_token_sii(
+                empresa,
+                lambda token: cliente_sii.enviar_dte(
+                    xml_envio=xml_envio,
+                    token=token,
+                    rut_emisor=empresa.rut,
+                    rut_envia=empresa.rut
+                ),
+                cliente_sii,
+                ambiente=ambiente,
+            )
+        track_id = respuesta.get('track_id')
+        if not track_id:
+            raise Exception(f"No se recibió Track ID del SII (estado: {respuesta.get('estado')})")
+    except Exception as e:
+        logger.error(f"Error al enviar lote de {len(validos)} DTE(s) de la empresa {empresa.id}: {e}")
+        for envio in validos:
+            _registrar_fallo(envio, str(e), inicio)
+        return len(envios)
+
+    ahora = timezone.now()
+    respuesta_completa = respuesta.get('respuesta_completa') or ''
+    with transaction.atomic():
+        lote = EnvioDTE.objects.create(
+            empresa=empresa,
+            cantidad_documentos=len(validos),
+            xml_envio=xml_envio,
+            fecha_envio=ahora,
+            track_id=track_id,
+            estado='enviado',
+            xml_respuesta=respuesta_completa,
+        )
+        lote.documentos.add(*dtes_ids)
+        DocumentoTributarioElectronico.objects.filter(pk__in=dtes_ids).update(
+            estado_sii='enviado',
+            track_id=track_id,
+            fecha_envio_sii=ahora,
+            respuesta_sii=respuesta_completa,
+            error_envio='',
+        )
+        ColaEnvioDTE.objects.filter(pk__in=[envio.pk for envio in validos]).update(
+            estado='enviado',
+            intentos=F('intentos') + 1,
+            bloqueado_hasta=None,
+            ultimo_error='',
+            fecha_envio=ahora,
+            duracion_ms=_duracion_ms(inicio),
+            lote=lote,
+        )
+
+    logger.info(f"[OK] Lote {lote.id}: {len(validos)} DTE(s) enviados - Track ID: {track_id}")
+    return len(envios)
+
+
+def drenar_lotes(worker, detener=None):
+    """
+    Envía un lote por cada grupo listo.
+
+    Returns:
+        int: Cantidad de envíos procesados
+    """
+    procesados = 0
+    for empresa_id, ambiente, tipo_dte in grupos_listos():
+        if detener is not None and detener.is_set():
+            break
+        ids = tomar_envios(
+            worker, lote_maximo(), canal='sii',
+            empresa_id=empresa_id, ambiente=ambiente, tipo_dte=tipo_dte,
+        )
+        if not ids:
+            continue  # Otro worker tomó el grupo
+        try:
+            procesados += enviar_lote(ids)
+        except Exception as e:
+            logger.error(f"Error en lote de la empresa {empresa_id} tipo {tipo_dte}: {e}")
+    return procesados
@@ -100,16 +100,14 @@ def enviar_dte_seguro(dte, forzar=False):
                         
                         # Regenerar PDF417
                         try:
-                            from .firma_electronica import FirmadorDTE
-                            firmador = FirmadorDTE(
-                                dte.empresa.certificado_digital.path,
-                                dte.empresa.password_certificado
-                            )
+                            from .firma_electronica import obtener_firmador_empresa
+                            firmador = obtener_firmador_empresa(dte.empresa)
                             dte.datos_pdf417 = firmador.generar_datos_pdf417(dte.timbre_electronico)
                             
-                            from .pdf417_generator import PDF417Generator
-                            PDF417Generator.guardar_pdf417_en_dte(dte)
-                            logger.info(f"[ENVÍO SEGURO] ✓ TED y PDF417 actualizados")
+                            # La imagen se dibuja en segundo plano después del commit
+                            from .timbre_pdf417 import programar_timbre_pdf417
+                            programar_timbre_pdf417(dte)
+                            logger.info(f"[ENVÍO SEGURO] ✓ TED actualizado, PDF417 programado")
                         except Exception as e:
                             logger.warning(f"[ENVÍO SEGURO] ⚠️ Error al regenerar PDF417: {e}")
                     
@@ -9,6 +9,10 @@ from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import padding
 import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
 from datetime import datetime, timezone
 
 
@@ -179,7 +183,59 @@ class FirmadorDTE:
         except Exception as e:
             print(f"ERROR al firmar XML: {str(e)}")
             raise
-    
+
+    def firmar_envio(self, xml_string, referencia='SetDoc'):
+        """
+        Firma un EnvioDTE / EnvioBOLETA completo (referencia al SetDTE).
+        Los DTEs del set ya vienen firmados y no se modifican.
+
+        Args:
+            xml_string: XML del envío armado con ClienteSII.crear_set_dte
+            referencia: ID del SetDTE
+
+        Returns:
+            str: XML del envío firmado
+        """
+        try:
+            if isinstance(xml_string, str):
+                xml_string = xml_string.encode('ISO-8859-1')
+
+            # Sin remove_blank_text: los DTEs firmados deben quedar idénticos
+            parser = etree.XMLParser(encoding='ISO-8859-1', huge_tree=True)
+            root = etree.fromstring(xml_string, parser=parser)
+
+            # Monkey-patch para permitir SHA1 (requerido por SII Chile)
+            import signxml.signer
+            original_check = signxml.signer.XMLSigner.check_deprecated_methods
+            signxml.signer.XMLSigner.check_deprecated_methods = lambda self: None
+
+            signer = XMLSigner(
+                method=methods.enveloped,
+                signature_algorithm="rsa-sha1",
+                digest_algorithm="sha1",
+                c14n_algorithm="http://www.w3.org/TR/2001/REC-xml-c14n-20010315"
+            )
+
+            signxml.signer.XMLSigner.check_deprecated_methods = original_check
+
+            signed_root = signer.sign(
+                root,
+                key=self.private_key,
+                cert=[self.certificate],
+                reference_uri=f"#{referencia}"
+            )
+
+            return etree.tostring(
+                signed_root,
+                pretty_print=False,
+                xml_declaration=True,
+                encoding='ISO-8859-1'
+            ).decode('ISO-8859-1')
+
+        except Exception as e:
+            print(f"ERROR al firmar envío: {str(e)}")
+            raise
+
     def generar_ted(self, dte_data, caf_data):
         """
         Genera el Timbre Electrónico Digital (TED)
@@ -351,3 +407,86 @@ class FirmadorDTE:
         except Exception as e:
             print(f"ERROR al generar datos PDF417: {str(e)}")
             raise
+
+
+# ========== CACHE DE FIRMADORES ==========
+# Cargar el .p12 (leer el archivo y descifrar el PKCS#12) es de lo más caro
+# de cada documento. Los firmadores se guardan por proceso con una clave que
+# incluye la empresa, el SHA-256 del archivo del certificado y un hash de la
+# contraseña: si la empresa sube otro certificado o cambia la contraseña, la
+# clave cambia y se carga de nuevo, aun en procesos que no recibieron la
+# invalidación (empresas/signals.py sólo libera la memoria del proceso local).
+# El hash del archivo se recalcula únicamente cuando cambian su mtime o tamaño.
+
+MAX_FIRMADORES_EN_CACHE = 32
+
+_firmadores = OrderedDict()   # (empresa_id, sha256 certificado, sha256 contraseña) -> FirmadorDTE
+_huellas = {}                 # ruta -> ((mtime_ns, tamaño), sha256 certificado)
+_cache_lock = threading.Lock()
+
+
+def _huella_certificado(certificado_path):
+    """SHA-256 del archivo del certificado (recalculado sólo si cambió mtime/tamaño)"""
+    estado = os.stat(certificado_path)
+    firma_archivo = (estado.st_mtime_ns, estado.st_size)
+    conocida = _huellas.get(certificado_path)
+    if conocida and conocida[0] == firma_archivo:
+        return conocida[1]
+
+    with open(certificado_path, 'rb') as f:
+        huella = hashlib.sha256(f.read()).hexdigest()
+    _huellas[certificado_path] = (firma_archivo, huella)
+    return huella
+
+
+def obtener_firmador(certificado_path, password, empresa_id=None):
+    """
+    FirmadorDTE del certificado, reutilizado entre documentos del mismo proceso.
+
+    Args:
+        certificado_path: Ruta al archivo .p12/.pfx
+        password: Contraseña del certificado
+        empresa_id: Empresa dueña del certificado (para invalidar por empresa)
+
+    Returns:
+        FirmadorDTE: Firmador con el certificado ya cargado
+    """
+    clave = (
+        empresa_id,
+        _huella_certificado(certificado_path),
+        hashlib.sha256(repr(password).encode()).hexdigest(),
+    )
+    with _cache_lock:
+        firmador = _firmadores.get(clave)
+        if firmador is not None:
+            _firmadores.move_to_end(clave)
+            return firmador
+
+    # Fuera del lock: un certificado lento no bloquea a las demás empresas
+    firmador = FirmadorDTE(certificado_path, password)
+
+    with _cache_lock:
+        # Un certificado vigente por empresa: descartar los anteriores
+        if empresa_id is not None:
+            for anterior in [c for c in _firmadores if c[0] == empresa_id and c != clave]:
+                del _firmadores[anterior]
+        _firmadores[clave] = firmador
+        while len(_firmadores) > MAX_FIRMADORES_EN_CACHE:
+            _firmadores.popitem(last=False)
+    return firmador
+
+
+def obtener_firmador_empresa(empresa):
+    """FirmadorDTE con el certificado digital de la empresa (cacheado)"""
+    return obtener_firmador(empresa.certificado_digital.path, empresa.password_certificado, empresa.id)
+
+
+def invalidar_firmador(empresa_id=None):
+    """Descarta los firmadores cacheados de la empresa (o todos)"""
+    with _cache_lock:
+        if empresa_id is None:
+            _firmadores.clear()
+            _huellas.clear()
+            return
+        for clave in [c for c in _firmadores if c[0] == empresa_id]:
+            del _firmadores[clave]
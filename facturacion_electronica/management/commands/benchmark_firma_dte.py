@@ -0,0 +1,110 @@
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from empresas.models import Empresa
+from facturacion_electronica.firma_electronica import FirmadorDTE, invalidar_firmador, obtener_firmador
+
+
+XML_PRUEBA = (
+    '<DTE xmlns="http://www.sii.cl/SiiDte" version="1.0">'
+    '<Documento ID="F{folio}T39"><Encabezado><IdDoc><TipoDTE>39</TipoDTE><Folio>{folio}</Folio>'
+    '</IdDoc></Encabezado><Detalle><NroLinDet>1</NroLinDet><NmbItem>Producto</NmbItem>'
+    '<MontoItem>1190</MontoItem></Detalle></Documento></DTE>'
+)
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo de firmar un DTE cargando el certificado por documento vs firmador cacheado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa cuyo certificado se usa')
+        parser.add_argument('--certificado', help='Ruta a un .p12/.pfx (alternativa a --empresa)')
+        parser.add_argument('--password', default='', help='Contraseña del certificado de --certificado')
+        parser.add_argument('--documentos', type=int, default=50, help='Cantidad de documentos a firmar por método')
+
+    def handle(self, *args, **options):
+        temporal = None
+        if options.get('empresa'):
+            try:
+                empresa = Empresa.objects.get(pk=options['empresa'])
+            except Empresa.DoesNotExist:
+                raise CommandError(f"Empresa {options['empresa']} no encontrada")
+            if not empresa.certificado_digital:
+                raise CommandError('La empresa no tiene certificado digital')
+            ruta, password, empresa_id = empresa.certificado_digital.path, empresa.password_certificado, empresa.id
+        elif options.get('certificado'):
+            ruta, password, empresa_id = options['certificado'], options['password'], None
+        else:
+            # Sin certificado real: uno autofirmado RSA 2048 (mismo costo de descifrado PKCS#12)
+            temporal = self._certificado_temporal()
+            ruta, password, empresa_id = temporal, 'benchmark', None
+            self.stdout.write('Usando un certificado autofirmado temporal (RSA 2048)')
+
+        try:
+            cantidad = options['documentos']
+            self.stdout.write(f'{cantidad} documentos por método')
+
+            invalidar_firmador()
+            por_documento = self._medir(cantidad, lambda: FirmadorDTE(ruta, password))
+            cacheado = self._medir(cantidad, lambda: obtener_firmador(ruta, password, empresa_id))
+        finally:
+            if temporal:
+                os.unlink(temporal)
+
+        self.stdout.write('')
+        self.stdout.write(f"{'Método':<22} {'p50 (ms)':>10} {'prom. (ms)':>11} {'máx (ms)':>10}")
+        for nombre, tiempos in (('Carga por documento', por_documento), ('Firmador cacheado', cacheado)):
+            self.stdout.write(
+                f'{nombre:<22} {statistics.median(tiempos):>10.2f} '
+                f'{statistics.mean(tiempos):>11.2f} {max(tiempos):>10.2f}'
+            )
+
+        mejora = statistics.median(por_documento) / max(statistics.median(cacheado), 1e-6)
+        self.stdout.write(self.style.SUCCESS(f'✓ Mejora en p50 por documento: {mejora:.1f}x'))
+
+    def _medir(self, cantidad, obtener):
+        """ms por documento: obtener el firmador + firmar el XML"""
+        tiempos = []
+        for folio in range(1, cantidad + 1):
+            inicio = time.perf_counter()
+            firmador = obtener()
+            # firmar_xml imprime una línea por documento; no mezclarla con la tabla
+            with contextlib.redirect_stdout(io.StringIO()):
+                firmador.firmar_xml(XML_PRUEBA.format(folio=folio))
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return tiempos
+
+    def _certificado_temporal(self):
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.hazmat.primitives.serialization import pkcs12
+        from cryptography.x509.oid import NameOID
+
+        clave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        nombre = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'Benchmark Firma DTE')])
+        ahora = datetime.now(timezone.utc)
+        certificado = (
+            x509.CertificateBuilder()
+            .subject_name(nombre)
+            .issuer_name(nombre)
+            .public_key(clave.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(ahora)
+            .not_valid_after(ahora + timedelta(days=1))
+            .sign(clave, hashes.SHA256())
+        )
+        contenido = pkcs12.serialize_key_and_certificates(
+            b'benchmark', clave, certificado, None,
+            serialization.BestAvailableEncryption(b'benchmark'),
+        )
+        with tempfile.NamedTemporaryFile(suffix='.p12', delete=False) as archivo:
+            archivo.write(contenido)
+            return archivo.name
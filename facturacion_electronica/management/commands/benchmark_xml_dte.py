@@ -0,0 +1,134 @@
+import contextlib
+import io
+import statistics
+import time
+from datetime import date
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from lxml import etree
+
+from empresas.models import Empresa
+from facturacion_electronica.dte_generator import DTEXMLGenerator, invalidar_emisor_dte
+from facturacion_electronica.dtebox_service import DTEBoxService
+
+
+class DocumentoSintetico:
+    """Documento en memoria con la interfaz que lee DTEXMLGenerator (sin base de datos)"""
+
+    def __init__(self, lineas, tipo_dte):
+        self.fecha = date.today()
+        self.rut_receptor = '66666666-6' if tipo_dte in ('39', '41') else '11111111-1'
+        self.razon_social_receptor = 'Cliente Benchmark'
+        self.giro_receptor = 'PARTICULAR'
+        self.direccion_receptor = 'Calle Falsa 123'
+        self.comuna_receptor = 'Santiago'
+        self.items = [
+            SimpleNamespace(
+                articulo=SimpleNamespace(
+                    id=i,
+                    codigo=f'ART{i:05d}',
+                    nombre=f'Artículo de prueba {i}',
+                    descripcion=f'Descripción del artículo {i}',
+                    unidad_medida=SimpleNamespace(simbolo='UN'),
+                ),
+                cantidad=(i % 5) + 1,
+                precio_unitario=1190 + i,
+                descripcion='',
+            )
+            for i in range(1, lineas + 1)
+        ]
+        self.monto_total = sum(item.cantidad * item.precio_unitario for item in self.items)
+        self.monto_neto = round(self.monto_total / 1.19)
+        self.monto_iva = self.monto_total - self.monto_neto
+        self.monto_exento = 0
+
+
+class Command(BaseCommand):
+    help = 'Mide documentos por segundo al generar el XML para DTEBox: generar + limpiar (antes) vs XML canónico (ahora)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa emisora (por defecto una empresa en memoria)')
+        parser.add_argument('--lineas', default='1,50,500', help='Líneas por documento, separadas por coma')
+        parser.add_argument('--tipo', default='39', choices=['33', '39', '52'], help='Tipo de DTE')
+        parser.add_argument('--segundos', type=float, default=2.0, help='Tiempo de medición por caso')
+
+    def handle(self, *args, **options):
+        if options.get('empresa'):
+            try:
+                empresa = Empresa.objects.get(pk=options['empresa'])
+            except Empresa.DoesNotExist:
+                raise CommandError(f"Empresa {options['empresa']} no encontrada")
+        else:
+            empresa = Empresa(
+                nombre='Empresa Benchmark', rut='76000000-0', razon_social='EMPRESA BENCHMARK SPA',
+                giro='Comercio al por menor', direccion='Av. Siempre Viva 742', comuna='Santiago',
+                ciudad='Santiago', telefono='+56 2 2000 0000', email='benchmark@example.com',
+            )
+
+        try:
+            tamanos = [int(valor) for valor in options['lineas'].split(',') if valor.strip()]
+        except ValueError:
+            raise CommandError('--lineas debe ser una lista de enteros separados por coma')
+
+        tipo = options['tipo']
+        # _limpiar_y_preparar_xml no usa la configuración de DTEBox de la empresa
+        dtebox = DTEBoxService.__new__(DTEBoxService)
+
+        self.stdout.write(f'Tipo {tipo} | {options["segundos"]:.1f} s por caso')
+        self.stdout.write('')
+        self.stdout.write(f"{'Líneas':>7} {'Antes (doc/s)':>14} {'Ahora (doc/s)':>14} {'Mejora':>8} {'Mismo XML':>10}")
+
+        mejoras = []
+        for lineas in tamanos:
+            documento = DocumentoSintetico(lineas, tipo)
+            generador = DTEXMLGenerator(empresa, documento, tipo, 1000, None)
+
+            def antes():
+                # Emisor armado en cada documento, XML indentado y limpieza parse → limpiar → serializar
+                invalidar_emisor_dte()
+                xml = etree.tostring(
+                    generador._construir_arbol(), pretty_print=True, xml_declaration=True, encoding='ISO-8859-1'
+                ).decode('ISO-8859-1')
+                return dtebox._limpiar_y_preparar_xml(xml, tipo)[0]
+
+            def ahora():
+                return dtebox._limpiar_y_preparar_xml(generador.generar_xml(), tipo)[0]
+
+            # La limpieza imprime varias líneas por documento; no mezclarlas con la tabla
+            with contextlib.redirect_stdout(io.StringIO()):
+                mismo = self._canonico(antes()) == self._canonico(ahora())
+                por_segundo_antes = self._medir(antes, options['segundos'])
+                por_segundo_ahora = self._medir(ahora, options['segundos'])
+
+            mejora = por_segundo_ahora / max(por_segundo_antes, 1e-6)
+            mejoras.append((lineas, mejora))
+            self.stdout.write(
+                f'{lineas:>7} {por_segundo_antes:>14.1f} {por_segundo_ahora:>14.1f} '
+                f'{mejora:>7.1f}x {"sí" if mismo else "NO":>10}'
+            )
+
+        self.stdout.write('')
+        resumen = ', '.join(f'{lineas} líneas {mejora:.1f}x' for lineas, mejora in mejoras)
+        self.stdout.write(self.style.SUCCESS(f'✓ Mejora: {resumen}'))
+
+    def _medir(self, funcion, segundos):
+        """Documentos por segundo (mediana de 5 tandas)"""
+        funcion()  # calentamiento
+        tandas = []
+        for _ in range(5):
+            cantidad = 0
+            inicio = time.perf_counter()
+            while True:
+                funcion()
+                cantidad += 1
+                transcurrido = time.perf_counter() - inicio
+                if transcurrido >= segundos / 5:
+                    break
+            tandas.append(cantidad / transcurrido)
+        return statistics.median(tandas)
+
+    def _canonico(self, xml):
+        """C14N sin espacios entre elementos, para comparar contenido y no formato"""
+        parser = etree.XMLParser(remove_blank_text=True)
+        return etree.tostring(etree.fromstring(xml.encode('ISO-8859-1'), parser=parser), method='c14n')
@@ -0,0 +1,45 @@
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from empresas.models import Empresa
+from facturacion_electronica.conciliacion_estados import conciliar_estados, ejecutar_continuo
+
+
+class Command(BaseCommand):
+    help = 'Consulta en el SII/DTEBox el estado de los DTEs enviados que aún no tienen respuesta final'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa (por defecto todas)')
+        parser.add_argument('--limite', type=int, help='Máximo de DTEs a revisar por pasada')
+        parser.add_argument('--hilos', type=int, help='Consultas simultáneas')
+        parser.add_argument('--continuo', action='store_true', help='Repetir cada --intervalo segundos (Ctrl+C para detener)')
+        parser.add_argument('--intervalo', type=float, default=60, help='Segundos entre pasadas en modo continuo')
+
+    def handle(self, *args, **options):
+        empresa = None
+        if options.get('empresa'):
+            try:
+                empresa = Empresa.objects.get(pk=options['empresa'])
+            except Empresa.DoesNotExist:
+                raise CommandError(f"Empresa {options['empresa']} no encontrada")
+
+        opciones = {'empresa': empresa, 'limite': options['limite'], 'hilos': options['hilos']}
+
+        if not options['continuo']:
+            resumen = conciliar_estados(**opciones)
+            self.stdout.write(
+                f"Consultas: {resumen['consultas']} | DTEs: {resumen['dtes']} | "
+                f"Aceptados: {resumen['aceptados']} | Rechazados: {resumen['rechazados']} | "
+                f"Sin cambio: {resumen['sin_cambio']} | Errores: {resumen['errores']}"
+            )
+            self.stdout.write(self.style.SUCCESS('✓ Conciliación terminada'))
+            return
+
+        detener = threading.Event()
+        self.stdout.write(f"Conciliando estados cada {options['intervalo']:.0f} segundos (Ctrl+C para detener)")
+        try:
+            ejecutar_continuo(detener, options['intervalo'], **opciones)
+        except KeyboardInterrupt:
+            detener.set()
+        self.stdout.write(self.style.SUCCESS('✓ Conciliación detenida'))
@@ -0,0 +1,46 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from facturacion_electronica.cola_envio import drenar_cola, ejecutar_worker
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola persistente de envío de DTEs a DTEBox/SII (se puede correr en varios nodos a la vez)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Cantidad de hilos workers en este nodo')
+        parser.add_argument('--lote', type=int, help='Envíos que toma cada worker por vuelta')
+        parser.add_argument('--intervalo', type=float, help='Segundos entre revisiones de la cola cuando está vacía')
+        parser.add_argument('--una-vez', action='store_true', help='Procesar los envíos listos y terminar')
+
+    def handle(self, *args, **options):
+        if options['una_vez']:
+            procesados = drenar_cola(lote=options['lote'])
+            self.stdout.write(self.style.SUCCESS(f'✓ Envíos procesados: {procesados}'))
+            return
+
+        detener = threading.Event()
+        hilos = [
+            threading.Thread(
+                target=ejecutar_worker,
+                args=(detener,),
+                kwargs={'lote': options['lote'], 'intervalo': options['intervalo']},
+                name=f"DTESender-{i + 1}",
+            )
+            for i in range(options['workers'])
+        ]
+        for hilo in hilos:
+            hilo.start()
+        self.stdout.write(f"Procesando la cola de envío de DTEs con {len(hilos)} workers (Ctrl+C para detener)")
+
+        try:
+            while any(hilo.is_alive() for hilo in hilos):
+                for hilo in hilos:
+                    hilo.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write('Deteniendo workers...')
+            detener.set()
+            for hilo in hilos:
+                hilo.join()
+        self.stdout.write(self.style.SUCCESS('✓ Workers detenidos'))
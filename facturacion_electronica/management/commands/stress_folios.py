@@ -0,0 +1,172 @@
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from empresas.models import Empresa, Sucursal
+from facturacion_electronica.asignador_folios import asignar_folio, liberar_bloques
+from facturacion_electronica.models import ArchivoCAF, BloqueFolios
+from ventas.models import EstacionTrabajo
+
+
+class _Revertir(Exception):
+    """Simula una venta que falla después de obtener el folio"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de concurrencia del asignador de folios: emisores en paralelo consumen '
+        'CAFs de prueba hasta agotarlos y se verifica que no haya folios duplicados ni saltos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emisores', type=int, default=50, help='Emisores en paralelo (hilos)')
+        parser.add_argument('--estaciones', type=int, default=25,
+                            help='Cuántos emisores son estaciones del POS (usan bloques de folios)')
+        parser.add_argument('--folios', type=int, default=1000, help='Folios por CAF')
+        parser.add_argument('--cafs', type=int, default=2, help='CAFs consecutivos (prueba el paso al siguiente CAF)')
+        parser.add_argument('--tipo', default='39', help='Tipo de DTE de los CAFs de prueba')
+        parser.add_argument('--revertir', type=float, default=0.05,
+                            help='Fracción de ventas que fallan y revierten la transacción')
+        parser.add_argument('--liberar', type=float, default=0.02,
+                            help='Probabilidad de que una estación cierre caja (libere su bloque) tras cada folio')
+
+    def handle(self, *args, **options):
+        emisores = options['emisores']
+        if emisores < 1 or options['folios'] < 1 or options['cafs'] < 1:
+            raise CommandError('--emisores, --folios y --cafs deben ser mayores que 0')
+
+        empresa, sucursal, cafs, estaciones = self._crear_datos(options)
+        try:
+            resultado = self._ejecutar(empresa, sucursal, cafs, estaciones, options)
+            errores = self._verificar(cafs, resultado)
+        finally:
+            ArchivoCAF.objects.filter(empresa=empresa).delete()
+            EstacionTrabajo.objects.filter(empresa=empresa).delete()
+            Sucursal.objects.filter(empresa=empresa).delete()
+            empresa.delete()
+
+        if errores:
+            for error in errores:
+                self.stdout.write(self.style.ERROR(f'✗ {error}'))
+            raise CommandError('La asignación de folios no es consistente')
+
+        total = sum(len(folios) for folios in resultado['folios'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {total} folios sin duplicados ni saltos con {emisores} emisores en paralelo '
+            f'({total / resultado["segundos"]:.0f} folios/s)'
+        ))
+
+    def _crear_datos(self, options):
+        sufijo = int(time.time() * 1000) % 10_000_000
+        empresa = Empresa.objects.create(nombre=f'Prueba folios {sufijo}', rut=f'{sufijo}-0')
+        sucursal = Sucursal.objects.create(
+            empresa=empresa, nombre='Casa Matriz', codigo='PF', direccion='Sin dirección',
+            comuna='Santiago', ciudad='Santiago', region='Metropolitana', telefono='0',
+            horario_apertura='09:00', horario_cierre='18:00',
+        )
+        hoy = date.today()
+        # bulk_create: CAFs sin XML, no pasan por la validación de ArchivoCAF.save()
+        cafs = ArchivoCAF.objects.bulk_create([
+            ArchivoCAF(
+                empresa=empresa, sucursal=sucursal, tipo_documento=options['tipo'],
+                folio_desde=1 + n * options['folios'], folio_hasta=(n + 1) * options['folios'],
+                cantidad_folios=options['folios'], folio_actual=n * options['folios'],
+                contenido_caf='', archivo_xml='', firma_electronica='',
+                fecha_autorizacion=hoy, fecha_vencimiento=hoy + timedelta(days=180),
+            )
+            for n in range(options['cafs'])
+        ])
+        estaciones = EstacionTrabajo.objects.bulk_create([
+            EstacionTrabajo(empresa=empresa, numero=str(n + 1), nombre=f'Estación {n + 1}')
+            for n in range(min(options['estaciones'], options['emisores']))
+        ])
+        return empresa, sucursal, cafs, estaciones
+
+    def _ejecutar(self, empresa, sucursal, cafs, estaciones, options):
+        emisores = options['emisores']
+        tipo = options['tipo']
+        folios = [[] for _ in range(emisores)]
+        contadores = {'revertidos': 0, 'reintentos': 0, 'liberaciones': 0}
+        lock = threading.Lock()
+        barrera = threading.Barrier(emisores)
+
+        def emisor(indice):
+            estacion = estaciones[indice] if indice < len(estaciones) else None
+            azar = random.Random(indice)
+            barrera.wait()
+            try:
+                while True:
+                    try:
+                        with transaction.atomic():
+                            folio, caf = asignar_folio(empresa, sucursal, tipo, estacion=estacion)
+                            if folio is None:
+                                return
+                            if azar.random() < options['revertir']:
+                                raise _Revertir()
+                        folios[indice].append((caf.id, folio))
+                        if estacion is not None and azar.random() < options['liberar']:
+                            liberar_bloques(estacion)
+                            with lock:
+                                contadores['liberaciones'] += 1
+                    except _Revertir:
+                        with lock:
+                            contadores['revertidos'] += 1
+                    except OperationalError:
+                        # SQLite bloquea la base completa durante cada escritura
+                        with lock:
+                            contadores['reintentos'] += 1
+                        time.sleep(azar.random() / 100)
+            finally:
+                connection.close()
+
+        self.stdout.write(
+            f"{emisores} emisores ({len(estaciones)} estaciones con bloques) | "
+            f"{len(cafs)} CAF x {options['folios']} folios | tipo {tipo}"
+        )
+        inicio = time.perf_counter()
+        hilos = [threading.Thread(target=emisor, args=(n,)) for n in range(emisores)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        segundos = time.perf_counter() - inicio
+
+        total = sum(len(lista) for lista in folios)
+        self.stdout.write('')
+        self.stdout.write(f"{'Folios':>8} {'Segundos':>9} {'Folios/s':>9} {'Revertidos':>11} {'Liberaciones':>13} {'Reintentos':>11}")
+        self.stdout.write(
+            f"{total:>8} {segundos:>9.2f} {total / segundos:>9.0f} {contadores['revertidos']:>11} "
+            f"{contadores['liberaciones']:>13} {contadores['reintentos']:>11}"
+        )
+        self.stdout.write('')
+        return {'folios': folios, 'segundos': segundos}
+
+    def _verificar(self, cafs, resultado):
+        errores = []
+        emitidos = [folio for lista in resultado['folios'] for folio in lista]
+        unicos = set(emitidos)
+        if len(unicos) != len(emitidos):
+            errores.append(f'{len(emitidos) - len(unicos)} folios duplicados')
+
+        for caf in cafs:
+            esperados = set(range(caf.folio_desde, caf.folio_hasta + 1))
+            usados = {folio for caf_id, folio in unicos if caf_id == caf.id}
+            if usados - esperados:
+                errores.append(f'CAF {caf.id}: {len(usados - esperados)} folios fuera del rango autorizado')
+            if esperados - usados:
+                faltantes = sorted(esperados - usados)
+                errores.append(f'CAF {caf.id}: {len(faltantes)} folios sin emitir (saltos), p. ej. {faltantes[:10]}')
+
+        pendientes = BloqueFolios.objects.filter(caf__in=cafs, estado__in=['activo', 'liberado']).count()
+        if pendientes:
+            errores.append(f'{pendientes} bloques de folios quedaron sin usar')
+        for caf in ArchivoCAF.objects.filter(pk__in=[caf.pk for caf in cafs]):
+            if caf.estado != 'agotado' or caf.folio_actual != caf.folio_hasta:
+                errores.append(f'CAF {caf.id} quedó {caf.estado} con folio_actual {caf.folio_actual}')
+
+        self.stdout.write(f'Duplicados: {len(emitidos) - len(unicos)} | Verificación: {"OK" if not errores else "FALLA"}')
+        return errores
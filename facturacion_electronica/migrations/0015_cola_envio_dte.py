@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0028_plansaas_empresa_auto_suspender_and_more'),
+        ('facturacion_electronica', '0014_documentotributarioelectronico_nombre_chofer_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ColaEnvioDTE',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('enviado', 'Enviado'), ('error', 'Error')], default='pendiente', max_length=20, verbose_name='Estado')),
+                ('intentos', models.PositiveSmallIntegerField(default=0, verbose_name='Intentos')),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próximo Intento')),
+                ('bloqueado_hasta', models.DateTimeField(blank=True, help_text='Si el worker cae, el envío vuelve a tomarse después de esta hora', null=True, verbose_name='Bloqueado Hasta')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='Worker')),
+                ('ultimo_error', models.TextField(blank=True, verbose_name='Último Error')),
+                ('fecha_creacion', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha de Encolado')),
+                ('fecha_ultimo_intento', models.DateTimeField(blank=True, null=True, verbose_name='Último Intento')),
+                ('fecha_envio', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Envío')),
+                ('duracion_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='Duración del Último Intento (ms)')),
+                ('dte', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='envio_en_cola', to='facturacion_electronica.documentotributarioelectronico', verbose_name='DTE')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cola_envio_dte', to='empresas.empresa', verbose_name='Empresa')),
+            ],
+            options={
+                'verbose_name': 'Envío en Cola',
+                'verbose_name_plural': 'Cola de Envío de DTE',
+                'ordering': ['proximo_intento'],
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='cola_envio_dte_toma_idx'), models.Index(fields=['empresa', 'estado', 'fecha_envio'], name='cola_envio_dte_metricas_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0028_plansaas_empresa_auto_suspender_and_more'),
+        ('facturacion_electronica', '0015_cola_envio_dte'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenSII',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ambiente', models.CharField(max_length=20, verbose_name='Ambiente')),
+                ('token', models.CharField(max_length=100, verbose_name='Token')),
+                ('fecha_obtencion', models.DateTimeField(verbose_name='Fecha de Obtención')),
+                ('fecha_expiracion', models.DateTimeField(verbose_name='Fecha de Expiración')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens_sii', to='empresas.empresa', verbose_name='Empresa')),
+            ],
+            options={
+                'verbose_name': 'Token SII',
+                'verbose_name_plural': 'Tokens SII',
+                'unique_together': {('empresa', 'ambiente')},
+            },
+        ),
+    ]
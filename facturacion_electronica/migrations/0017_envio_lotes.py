@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0028_plansaas_empresa_auto_suspender_and_more'),
+        ('facturacion_electronica', '0016_token_sii'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='colaenviodte',
+            name='ambiente',
+            field=models.CharField(blank=True, max_length=20, verbose_name='Ambiente SII'),
+        ),
+        migrations.AddField(
+            model_name='colaenviodte',
+            name='canal',
+            field=models.CharField(choices=[('dtebox', 'DTEBox (un documento por envío)'), ('sii', 'SII directo (lotes EnvioDTE/EnvioBOLETA)')], default='dtebox', max_length=10, verbose_name='Canal'),
+        ),
+        migrations.AddField(
+            model_name='colaenviodte',
+            name='lote',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='envios_en_cola', to='facturacion_electronica.enviodte', verbose_name='Lote'),
+        ),
+        migrations.AddField(
+            model_name='colaenviodte',
+            name='tipo_dte',
+            field=models.CharField(blank=True, max_length=3, verbose_name='Tipo DTE'),
+        ),
+        migrations.AlterField(
+            model_name='enviodte',
+            name='usuario',
+            field=models.ForeignKey(blank=True, help_text='Vacío si el envío lo armó la cola de envío por lotes', null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='colaenviodte',
+            index=models.Index(fields=['canal', 'estado', 'empresa', 'ambiente', 'tipo_dte'], name='cola_envio_dte_lotes_idx'),
+        ),
+    ]
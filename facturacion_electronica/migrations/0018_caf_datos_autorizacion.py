@@ -0,0 +1,56 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:33
+
+from django.db import migrations, models
+
+
+def extraer_datos_autorizacion(apps, schema_editor):
+    """Parsea una vez los CAF ya cargados para llenar RSAPK, IDK y RSASK"""
+    from facturacion_electronica.caf_datos import contenido_caf, parsear_caf
+
+    ArchivoCAF = apps.get_model('facturacion_electronica', 'ArchivoCAF')
+    actualizados = []
+    for caf in ArchivoCAF.objects.filter(rsapk_modulo='').iterator():
+        try:
+            datos = parsear_caf(contenido_caf(caf))
+        except Exception as e:
+            print(f"[MIGRACIÓN] CAF {caf.pk} sin datos de autorización: {e}")
+            continue
+        for campo, valor in datos.items():
+            setattr(caf, campo, valor)
+        actualizados.append(caf)
+
+    ArchivoCAF.objects.bulk_update(
+        actualizados, ['rsapk_modulo', 'rsapk_exponente', 'idk', 'clave_privada'], batch_size=200
+    )
+    print(f"[MIGRACIÓN] Datos de autorización extraídos de {len(actualizados)} CAF")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facturacion_electronica', '0017_envio_lotes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivocaf',
+            name='clave_privada',
+            field=models.TextField(blank=True, default='', verbose_name='Clave Privada (RSASK)'),
+        ),
+        migrations.AddField(
+            model_name='archivocaf',
+            name='idk',
+            field=models.CharField(blank=True, default='', help_text='Identificador de la llave del SII con que se firmó el CAF', max_length=20, verbose_name='IDK'),
+        ),
+        migrations.AddField(
+            model_name='archivocaf',
+            name='rsapk_exponente',
+            field=models.CharField(blank=True, default='', help_text='Exponente de la clave pública del CAF (E)', max_length=20, verbose_name='Exponente RSAPK'),
+        ),
+        migrations.AddField(
+            model_name='archivocaf',
+            name='rsapk_modulo',
+            field=models.TextField(blank=True, default='', help_text='Módulo de la clave pública del CAF (M)', verbose_name='Módulo RSAPK'),
+        ),
+        migrations.RunPython(extraer_datos_autorizacion, migrations.RunPython.noop),
+    ]
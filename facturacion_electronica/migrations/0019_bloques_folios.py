@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0028_plansaas_empresa_auto_suspender_and_more'),
+        ('facturacion_electronica', '0018_caf_datos_autorizacion'),
+        ('ventas', '0037_estaciontrabajo_copias_notacredito'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloqueFolios',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_documento', models.CharField(max_length=10, verbose_name='Tipo de Documento')),
+                ('folio_desde', models.IntegerField(verbose_name='Folio Desde')),
+                ('folio_hasta', models.IntegerField(verbose_name='Folio Hasta')),
+                ('siguiente', models.IntegerField(verbose_name='Siguiente Folio')),
+                ('estado', models.CharField(choices=[('activo', 'Activo'), ('liberado', 'Liberado'), ('agotado', 'Agotado')], default='activo', max_length=20, verbose_name='Estado')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Reserva')),
+                ('fecha_liberacion', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Liberación')),
+                ('caf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bloques', to='facturacion_electronica.archivocaf', verbose_name='CAF')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bloques_folios', to='empresas.empresa', verbose_name='Empresa')),
+                ('estacion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bloques_folios', to='ventas.estaciontrabajo', verbose_name='Estación de Trabajo')),
+            ],
+            options={
+                'verbose_name': 'Bloque de Folios',
+                'verbose_name_plural': 'Bloques de Folios',
+                'ordering': ['caf', 'folio_desde'],
+                'indexes': [models.Index(fields=['estacion', 'tipo_documento', 'estado'], name='bloque_folios_estacion_idx'), models.Index(fields=['empresa', 'tipo_documento', 'estado'], name='bloque_folios_empresa_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facturacion_electronica', '0019_bloques_folios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentotributarioelectronico',
+            name='pdf417_columnas',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Columnas PDF417'),
+        ),
+        migrations.AddField(
+            model_name='documentotributarioelectronico',
+            name='pdf417_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Hash del TED del timbre'),
+        ),
+        migrations.AddField(
+            model_name='documentotributarioelectronico',
+            name='pdf417_nivel_seguridad',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Nivel de Seguridad PDF417'),
+        ),
+    ]
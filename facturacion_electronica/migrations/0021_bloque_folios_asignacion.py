@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facturacion_electronica', '0020_timbre_pdf417_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bloquefolios',
+            name='fecha_asignacion',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Se renueva con cada folio que la estación usa del bloque', verbose_name='Fecha de Asignación'),
+        ),
+    ]
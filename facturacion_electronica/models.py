@@ -114,6 +114,33 @@ class ArchivoCAF(models.Model):
     )
     firma_electronica = models.TextField(verbose_name="Firma Electrónica (FRMA)")
     
+    # DATOS DE AUTORIZACIÓN (extraídos del XML al guardar, ver caf_datos.py)
+    rsapk_modulo = models.TextField(
+        blank=True,
+        default='',
+        verbose_name="Módulo RSAPK",
+        help_text="Módulo de la clave pública del CAF (M)"
+    )
+    rsapk_exponente = models.CharField(
+        max_length=20,
+        blank=True,
+        default='',
+        verbose_name="Exponente RSAPK",
+        help_text="Exponente de la clave pública del CAF (E)"
+    )
+    idk = models.CharField(
+        max_length=20,
+        blank=True,
+        default='',
+        verbose_name="IDK",
+        help_text="Identificador de la llave del SII con que se firmó el CAF"
+    )
+    clave_privada = models.TextField(
+        blank=True,
+        default='',
+        verbose_name="Clave Privada (RSASK)"
+    )
+    
     # CONTROL DE USO
     folios_utilizados = models.IntegerField(
         default=0,
@@ -257,13 +284,36 @@ class ArchivoCAF(models.Model):
             self.fecha_vencimiento = self.fecha_autorizacion + timedelta(days=180)
 
         # 2. Ejecutar validaciones solo si es un CAF nuevo o si cambió el contenido
-        if not self.pk or 'contenido_caf' in kwargs.get('update_fields', []):
+        cambio_contenido = not self.pk or 'contenido_caf' in (kwargs.get('update_fields') or [])
+        if cambio_contenido:
             es_valido, mensaje_error = self.validar_caf_unico()
             if not es_valido:
                 from django.core.exceptions import ValidationError
                 raise ValidationError(mensaje_error)
+
+        # 3. Parsear el CAF una sola vez: el TED usa los campos RSAPK/IDK/RSASK
+        if cambio_contenido:
+            self.extraer_datos_autorizacion()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'rsapk_modulo', 'rsapk_exponente', 'idk', 'clave_privada'}
         
         super().save(*args, **kwargs)
+
+        if cambio_contenido:
+            from .caf_datos import invalidar_datos_caf
+            invalidar_datos_caf(self.pk)
+
+    def extraer_datos_autorizacion(self):
+        """Completa RSAPK (módulo y exponente), IDK y RSASK desde el XML del CAF"""
+        from .caf_datos import contenido_caf, parsear_caf
+        try:
+            datos = parsear_caf(contenido_caf(self))
+        except Exception as e:
+            # El CAF se guarda igual; datos_caf() lo reintenta al generar el TED
+            print(f"[ADVERTENCIA] No se pudieron extraer los datos de autorización del CAF: {e}")
+            return
+        for campo, valor in datos.items():
+            setattr(self, campo, valor)
     
     def folios_disponibles(self):
         """Cantidad de folios disponibles calculada dinámicamente.
@@ -453,6 +503,76 @@ class ArchivoCAF(models.Model):
         return cls.objects.filter(**filtro).delete()
 
 
+class BloqueFolios(models.Model):
+    """
+    Bloque de folios de un CAF reservado para una estación de trabajo del POS.
+    La estación consume sus folios sin tocar la fila del CAF; al cerrar la caja
+    el bloque se libera y otra estación toma los folios que quedaron. Un bloque
+    activo sin uso por más de DTE_BLOQUE_FOLIOS_PLAZO segundos (estación caída
+    o caja que no se cerró) puede ser tomado por otra estación.
+    Ver facturacion_electronica.asignador_folios.
+    """
+    
+    ESTADO_CHOICES = [
+        ('activo', 'Activo'),
+        ('liberado', 'Liberado'),
+        ('agotado', 'Agotado'),
+    ]
+    
+    empresa = models.ForeignKey(
+        Empresa,
+        on_delete=models.CASCADE,
+        related_name='bloques_folios',
+        verbose_name="Empresa"
+    )
+    caf = models.ForeignKey(
+        ArchivoCAF,
+        on_delete=models.CASCADE,
+        related_name='bloques',
+        verbose_name="CAF"
+    )
+    estacion = models.ForeignKey(
+        'ventas.EstacionTrabajo',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='bloques_folios',
+        verbose_name="Estación de Trabajo"
+    )
+    tipo_documento = models.CharField(max_length=10, verbose_name="Tipo de Documento")
+    folio_desde = models.IntegerField(verbose_name="Folio Desde")
+    folio_hasta = models.IntegerField(verbose_name="Folio Hasta")
+    siguiente = models.IntegerField(verbose_name="Siguiente Folio")
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADO_CHOICES,
+        default='activo',
+        verbose_name="Estado"
+    )
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Reserva")
+    fecha_asignacion = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Fecha de Asignación",
+        help_text="Se renueva con cada folio que la estación usa del bloque"
+    )
+    fecha_liberacion = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Liberación")
+    
+    class Meta:
+        verbose_name = "Bloque de Folios"
+        verbose_name_plural = "Bloques de Folios"
+        ordering = ['caf', 'folio_desde']
+        indexes = [
+            models.Index(fields=['estacion', 'tipo_documento', 'estado'], name='bloque_folios_estacion_idx'),
+            models.Index(fields=['empresa', 'tipo_documento', 'estado'], name='bloque_folios_empresa_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Bloque {self.folio_desde}-{self.folio_hasta} (CAF {self.caf_id}) - {self.get_estado_display()}"
+    
+    def folios_disponibles(self):
+        return max(self.folio_hasta - self.siguiente + 1, 0)
+
+
 class DocumentoTributarioElectronico(models.Model):
     """Registro de todos los DTE emitidos"""
     
@@ -584,6 +704,22 @@ class DocumentoTributarioElectronico(models.Model):
         null=True,
         verbose_name="Timbre PDF417"
     )
+    # Imagen compartida por hash del TED y parámetros con que se codificó (ver timbre_pdf417.py)
+    pdf417_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        verbose_name="Hash del TED del timbre"
+    )
+    pdf417_columnas = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Columnas PDF417"
+    )
+    pdf417_nivel_seguridad = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Nivel de Seguridad PDF417"
+    )
     
     # ESTADO SII
     estado_sii = models.CharField(
@@ -803,7 +939,13 @@ class EnvioDTE(models.Model):
     
     # AUDITORÍA
     fecha_creacion = models.DateTimeField(auto_now_add=True)
-    usuario = models.ForeignKey(User, on_delete=models.PROTECT)
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        help_text="Vacío si el envío lo armó la cola de envío por lotes"
+    )
     
     class Meta:
         verbose_name = "Envío de DTE"
@@ -846,3 +988,102 @@ class AcuseRecibo(models.Model):
     
     def __str__(self):
         return f"{self.get_tipo_acuse_display()} - DTE {self.dte.folio}"
+
+
+class ColaEnvioDTE(models.Model):
+    """
+    Cola persistente de envío de DTEs a DTEBox/SII (outbox).
+    Una fila por DTE; los workers la toman con SELECT ... FOR UPDATE SKIP LOCKED.
+    Ver facturacion_electronica.cola_envio.
+    """
+    
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('enviado', 'Enviado'),
+        ('error', 'Error'),
+    ]
+    
+    CANAL_CHOICES = [
+        ('dtebox', 'DTEBox (un documento por envío)'),
+        ('sii', 'SII directo (lotes EnvioDTE/EnvioBOLETA)'),
+    ]
+    
+    empresa = models.ForeignKey(
+        Empresa,
+        on_delete=models.CASCADE,
+        related_name='cola_envio_dte',
+        verbose_name="Empresa"
+    )
+    dte = models.OneToOneField(
+        DocumentoTributarioElectronico,
+        on_delete=models.CASCADE,
+        related_name='envio_en_cola',
+        verbose_name="DTE"
+    )
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente', verbose_name="Estado")
+    intentos = models.PositiveSmallIntegerField(default=0, verbose_name="Intentos")
+    proximo_intento = models.DateTimeField(default=timezone.now, verbose_name="Próximo Intento")
+    bloqueado_hasta = models.DateTimeField(null=True, blank=True, verbose_name="Bloqueado Hasta",
+                                           help_text="Si el worker cae, el envío vuelve a tomarse después de esta hora")
+    worker = models.CharField(max_length=100, blank=True, verbose_name="Worker")
+    ultimo_error = models.TextField(blank=True, verbose_name="Último Error")
+    
+    # Envío por lotes (ver facturacion_electronica.envio_lotes)
+    canal = models.CharField(max_length=10, choices=CANAL_CHOICES, default='dtebox', verbose_name="Canal")
+    tipo_dte = models.CharField(max_length=3, blank=True, verbose_name="Tipo DTE")
+    ambiente = models.CharField(max_length=20, blank=True, verbose_name="Ambiente SII")
+    lote = models.ForeignKey(
+        EnvioDTE,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='envios_en_cola',
+        verbose_name="Lote"
+    )
+    
+    # Métricas
+    fecha_creacion = models.DateTimeField(default=timezone.now, verbose_name="Fecha de Encolado")
+    fecha_ultimo_intento = models.DateTimeField(null=True, blank=True, verbose_name="Último Intento")
+    fecha_envio = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Envío")
+    duracion_ms = models.PositiveIntegerField(null=True, blank=True, verbose_name="Duración del Último Intento (ms)")
+    
+    class Meta:
+        verbose_name = "Envío en Cola"
+        verbose_name_plural = "Cola de Envío de DTE"
+        ordering = ['proximo_intento']
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento'], name='cola_envio_dte_toma_idx'),
+            models.Index(fields=['empresa', 'estado', 'fecha_envio'], name='cola_envio_dte_metricas_idx'),
+            models.Index(fields=['canal', 'estado', 'empresa', 'ambiente', 'tipo_dte'], name='cola_envio_dte_lotes_idx'),
+        ]
+    
+    def __str__(self):
+        return f"DTE {self.dte_id} ({self.estado}, intento {self.intentos})"
+
+
+class TokenSII(models.Model):
+    """
+    Último token de autenticación del SII por empresa y ambiente.
+    Respaldo en base de datos del cache de facturacion_electronica.token_sii,
+    compartido por todos los procesos y nodos.
+    """
+    
+    empresa = models.ForeignKey(
+        Empresa,
+        on_delete=models.CASCADE,
+        related_name='tokens_sii',
+        verbose_name="Empresa"
+    )
+    ambiente = models.CharField(max_length=20, verbose_name="Ambiente")
+    token = models.CharField(max_length=100, verbose_name="Token")
+    fecha_obtencion = models.DateTimeField(verbose_name="Fecha de Obtención")
+    fecha_expiracion = models.DateTimeField(verbose_name="Fecha de Expiración")
+    
+    class Meta:
+        verbose_name = "Token SII"
+        verbose_name_plural = "Tokens SII"
+        unique_together = ['empresa', 'ambiente']
+    
+    def __str__(self):
+        return f"Token SII {self.empresa_id} ({self.ambiente}) hasta {self.fecha_expiracion}"
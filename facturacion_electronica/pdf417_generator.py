@@ -10,51 +10,69 @@ import base64
 class PDF417Generator:
     """Generador de código de barras PDF417 para timbres electrónicos"""
     
+    # (security_level, columnas) en el orden en que se prueban: security_level 2
+    # es estándar, pero bajamos a 1 o 0 si el DTE es extremadamente grande y
+    # aumentamos columnas para aprovechar más capacidad (máx 30 columnas)
+    PARAMETROS = [(s_level, cols) for s_level in [2, 1, 0] for cols in [15, 18, 20, 25, 30]]
+
     @staticmethod
-    def generar_imagen_pdf417(ted_xml, ancho=400, alto=150):
+    def normalizar_ted(ted_xml):
         """
-        Genera una imagen PNG del código PDF417 a partir del TED
+        Bytes ISO-8859-1 del TED que van en el código
         
         Args:
-            ted_xml: XML del TED (Timbre Electrónico Digital)
-            ancho: Ancho de la imagen en píxeles
-            alto: Alto de la imagen en píxeles
+            ted_xml: XML del TED (str, bytes o str en base64)
             
         Returns:
-            bytes: Imagen PNG en bytes
+            bytes: TED codificado en ISO-8859-1
         """
-        try:
-            # Detectar si el TED viene en base64 (empieza con <TED -> PFRFRC)
-            # DTEBox y otros servicios suelen entregarlo ya codificado
-            if isinstance(ted_xml, str) and (ted_xml.startswith('PFRFRC') or ted_xml.startswith('PD')):
-                try:
-                    ted_xml = base64.b64decode(ted_xml).decode('ISO-8859-1')
-                    print(f"[PDF417] TED decodificado desde base64 (longitud: {len(ted_xml)})")
-                except:
-                    print("[PDF417] Falló decodificación base64, se usará raw")
+        # Detectar si el TED viene en base64 (empieza con <TED -> PFRFRC)
+        # DTEBox y otros servicios suelen entregarlo ya codificado
+        if isinstance(ted_xml, str) and (ted_xml.startswith('PFRFRC') or ted_xml.startswith('PD')):
+            try:
+                ted_xml = base64.b64decode(ted_xml).decode('ISO-8859-1')
+                print(f"[PDF417] TED decodificado desde base64 (longitud: {len(ted_xml)})")
+            except:
+                print("[PDF417] Falló decodificación base64, se usará raw")
 
-            # El SII requiere ISO-8859-1 para el timbre
-            if isinstance(ted_xml, str):
-                data = ted_xml.encode('ISO-8859-1', errors='replace')
-            else:
-                data = ted_xml
+        # El SII requiere ISO-8859-1 para el timbre
+        if isinstance(ted_xml, str):
+            return ted_xml.encode('ISO-8859-1', errors='replace')
+        return ted_xml
 
-            # Codificar el TED en PDF417
-            # Intentar parámetros adaptativos si falla por longitud
-            codes = None
-            # security_level 2 es estándar, pero bajamos a 1 o 0 si el DTE es extremadamente grande
-            # y aumentamos columnas para aprovechar más capacidad (máx 30 columnas)
-            for s_level in [2, 1, 0]:
-                for cols in [15, 18, 20, 25, 30]:
-                    try:
-                        codes = encode(data, columns=cols, security_level=s_level)
-                        if codes: break
-                    except Exception:
-                        continue
-                if codes: break
-            
-            if not codes:
-                raise ValueError("No se pudo encajar la información en el PDF417 ni con parámetros mínimos")
+    @staticmethod
+    def codificar(data, columnas=None, nivel_seguridad=None):
+        """
+        Codifica los datos en PDF417 probando parámetros adaptativos si falla por longitud.
+        Si se indican columnas y nivel (los de una generación anterior) se prueban primero.
+        
+        Returns:
+            tuple: (codes, columnas, nivel_seguridad)
+        """
+        parametros = PDF417Generator.PARAMETROS
+        if columnas and nivel_seguridad is not None:
+            parametros = [(nivel_seguridad, columnas)] + parametros
+        for s_level, cols in parametros:
+            try:
+                codes = encode(data, columns=cols, security_level=s_level)
+                if codes:
+                    return codes, cols, s_level
+            except Exception:
+                continue
+        raise ValueError("No se pudo encajar la información en el PDF417 ni con parámetros mínimos")
+
+    @staticmethod
+    def generar_timbre(ted_xml, ancho=400, alto=150, columnas=None, nivel_seguridad=None):
+        """
+        Genera la imagen PNG del PDF417 e informa los parámetros de codificación usados
+        
+        Returns:
+            tuple: (imagen PNG en bytes, columnas, nivel_seguridad);
+                   columnas y nivel son None si se devolvió el placeholder
+        """
+        try:
+            data = PDF417Generator.normalizar_ted(ted_xml)
+            codes, columnas, nivel_seguridad = PDF417Generator.codificar(data, columnas, nivel_seguridad)
             
             # Renderizar la imagen
             # Aumentamos scale para mejor resolución
@@ -79,14 +97,29 @@ class PDF417Generator:
             canvas.save(buffer, format='PNG')
             buffer.seek(0)
             
-            return buffer.getvalue()
+            return buffer.getvalue(), columnas, nivel_seguridad
             
         except Exception as e:
             import traceback
             error_details = traceback.format_exc()
             print(f"ERROR crítico al generar PDF417: {str(e)}\n{error_details}")
             # Generar imagen de placeholder en caso de error
-            return PDF417Generator._generar_placeholder(ancho, alto)
+            return PDF417Generator._generar_placeholder(ancho, alto), None, None
+
+    @staticmethod
+    def generar_imagen_pdf417(ted_xml, ancho=400, alto=150):
+        """
+        Genera una imagen PNG del código PDF417 a partir del TED
+        
+        Args:
+            ted_xml: XML del TED (Timbre Electrónico Digital)
+            ancho: Ancho de la imagen en píxeles
+            alto: Alto de la imagen en píxeles
+            
+        Returns:
+            bytes: Imagen PNG en bytes
+        """
+        return PDF417Generator.generar_timbre(ted_xml, ancho, alto)[0]
     
     @staticmethod
     def generar_base64_pdf417(ted_xml, ancho=400, alto=150):
@@ -153,7 +186,9 @@ class PDF417Generator:
     @staticmethod
     def guardar_pdf417_en_dte(dte):
         """
-        Genera y guarda el PDF417 en un objeto DTE
+        Genera (o toma del caché por hash del TED) y guarda el PDF417 en un objeto DTE.
+        Bloquea hasta tener la imagen: fuera de comandos usar
+        timbre_pdf417.programar_timbre_pdf417 (se genera al confirmar la transacción).
         
         Args:
             dte: Instancia de DocumentoTributarioElectronico
@@ -161,30 +196,11 @@ class PDF417Generator:
         Returns:
             bool: True si se guardó exitosamente
         """
+        from .timbre_pdf417 import generar_timbre_dte
         try:
-            # Generar imagen PDF417 (si no hay TED, usar placeholder igualmente)
-            if dte.timbre_electronico:
-                # Usar dimensiones mayores para mejor legibilidad
-                imagen_bytes = PDF417Generator.generar_imagen_pdf417(
-                    dte.timbre_electronico,
-                    ancho=400,
-                    alto=150
-                )
-            else:
-                print("[WARN] DTE no tiene TED generado. Se usara placeholder de timbre.")
-                imagen_bytes = PDF417Generator._generar_placeholder(ancho=400, alto=150)
-
-            # Guardar en el campo del modelo
-            from django.core.files.base import ContentFile
-            dte.timbre_pdf417.save(
-                f'timbre_{dte.tipo_dte}_{dte.folio}.png',
-                ContentFile(imagen_bytes),
-                save=True
-            )
-
+            generar_timbre_dte(dte)
             print(f"PDF417 generado y guardado para DTE {dte.tipo_dte}-{dte.folio}")
             return True
-
         except Exception as e:
             print(f"ERROR al guardar PDF417: {str(e)}")
             return False
@@ -13,7 +13,7 @@ class FolioService:
     """Servicio para gestionar folios de documentos tributarios"""
     
     @staticmethod
-    def obtener_siguiente_folio(empresa, tipo_documento, sucursal=None):
+    def obtener_siguiente_folio(empresa, tipo_documento, sucursal=None, estacion=None):
         """
         Obtiene el siguiente folio disponible para un tipo de documento y sucursal
         
@@ -24,11 +24,15 @@ class FolioService:
             empresa: Instancia de Empresa
             tipo_documento: Código del tipo de documento (33, 39, etc.)
             sucursal: Instancia de Sucursal (RECOMENDADO especificar)
+            estacion: EstacionTrabajo del POS (opcional). Toma el folio de
+                      un bloque reservado para la estación (ver asignador_folios)
 
         Returns:
             tuple: (folio, caf) si hay folios disponibles
             tuple: (None, None) si no hay folios disponibles
         """
+        from .asignador_folios import asignar_folio
+
         # Si no se especifica sucursal, usar casa matriz
         if sucursal is None:
             from empresas.models import Sucursal
@@ -47,56 +51,16 @@ class FolioService:
         es_certificacion = getattr(empresa, 'ambiente_sii', 'produccion') == 'certificacion'
 
         if modo_reutilizacion and es_certificacion:
-            return FolioService._obtener_folio_modo_prueba(empresa, tipo_documento, sucursal)
+            return FolioService._obtener_folio_modo_prueba(empresa, tipo_documento)
 
-        # Modo normal: consumir folios reales
-        with transaction.atomic():
-            # Intentar encontrar un CAF que tenga folios disponibles
-            while True:
-                # Usar el método del modelo para obtener CAF activo
-                caf = ArchivoCAF.obtener_caf_activo(empresa, sucursal, tipo_documento)
-                
-                if caf is None:
-                    print(f"[ERROR] No hay CAFs activos para tipo documento {tipo_documento} en sucursal {sucursal.nombre}")
-                    return None, None
-                
-                # VERIFICAR VIGENCIA DEL CAF (6 meses desde autorización)
-                if not caf.esta_vigente():
-                    print(f"[ERROR] CAF vencido: {caf.tipo_documento} ({caf.folio_desde}-{caf.folio_hasta})")
-                    caf.estado = 'vencido'
-                    caf.save()
-                    continue # Buscar el siguiente CAF
-                
-                # Calcular el siguiente folio
-                siguiente_folio = caf.folio_actual + 1
-                
-                # Verificar si el folio está dentro del rango
-                if siguiente_folio > caf.folio_hasta:
-                    print(f"[INFO] CAF ID {caf.id} llegó a su límite ({caf.folio_hasta}). Marcando como agotado.")
-                    caf.estado = 'agotado'
-                    caf.fecha_agotamiento = timezone.now()
-                    caf.save()
-                    continue # Buscar el siguiente CAF
-                
-                if siguiente_folio < caf.folio_desde:
-                    # Caso raro: folio_actual es menor que folio_desde - 1
-                    # Ajustamos al inicio del rango
-                    siguiente_folio = caf.folio_desde
-                
-                # Todo OK con este CAF: Incrementar y guardar
-                caf.folio_actual = siguiente_folio
-                caf.folios_utilizados = caf.folio_actual - caf.folio_desde + 1
-
-                # Verificar si se agotó con este último folio
-                if caf.folio_actual >= caf.folio_hasta:
-                    caf.estado = 'agotado'
-                    caf.fecha_agotamiento = timezone.now()
-                    print(f"[INFO] CAF agotado con el último folio: {caf.id} ({caf.folio_desde}-{caf.folio_hasta})")
-
-                caf.save()
-                
-                print(f"[OK] Folio asignado: {siguiente_folio} (CAF ID: {caf.id}, Rango: {caf.folio_desde}-{caf.folio_hasta})")
-                return siguiente_folio, caf
+        # Modo normal: consumir folios reales (UPDATE atómico sobre el CAF o bloque de la estación)
+        folio, caf = asignar_folio(empresa, sucursal, tipo_documento, estacion=estacion)
+        if folio is None:
+            print(f"[ERROR] No hay CAFs activos para tipo documento {tipo_documento} en sucursal {sucursal.nombre}")
+            return None, None
+
+        print(f"[OK] Folio asignado: {folio} (CAF ID: {caf.id}, Rango: {caf.folio_desde}-{caf.folio_hasta})")
+        return folio, caf
 
     @staticmethod
     def _obtener_folio_modo_prueba(empresa, tipo_documento):
@@ -178,6 +142,10 @@ class FolioService:
         
         # Filtrar por vigencia en Python para asegurar la lógica correcta
         total_disponibles = sum([caf.folios_disponibles() for caf in cafs_activos if caf.esta_vigente()])
+
+        # Folios ya reservados por las estaciones del POS que aún no se usan
+        from .asignador_folios import folios_en_bloques
+        total_disponibles += folios_en_bloques(empresa, tipo_documento, sucursal)
         return total_disponibles
     
     @staticmethod
@@ -0,0 +1,23 @@
+from celery import shared_task
+
+from .cola_envio import drenar_cola
+from .conciliacion_estados import conciliar_estados
+from .timbre_pdf417 import generar_timbres
+
+
+@shared_task(name='facturacion_electronica.procesar_cola_envios_dte')
+def procesar_cola_envios_dte():
+    """Procesa los envíos de DTE listos de la cola persistente (ver cola_envio)"""
+    drenar_cola()
+
+
+@shared_task(name='facturacion_electronica.conciliar_estados_dte')
+def conciliar_estados_dte():
+    """Consulta el estado de los DTEs enviados sin respuesta final (ver conciliacion_estados)"""
+    return conciliar_estados()
+
+
+@shared_task(name='facturacion_electronica.generar_timbres_pdf417')
+def generar_timbres_pdf417(dte_ids):
+    """Dibuja (o toma del caché) la imagen PDF417 de los DTEs (ver timbre_pdf417)"""
+    return generar_timbres(dte_ids)
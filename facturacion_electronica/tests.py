@@ -1,3 +1,468 @@
-from django.test import TestCase
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+from datetime import date, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import transaction
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from lxml import etree
+
+from empresas.models import Empresa, Sucursal
+from facturacion_electronica import asignador_folios, cola_envio, firma_electronica, timbre_pdf417, token_sii
+from facturacion_electronica.conciliacion_estados import _Conciliador
+from facturacion_electronica.dte_generator import CABECERA_CANONICA, DTEXMLGenerator
+from facturacion_electronica.dtebox_service import DTEBoxService
+from facturacion_electronica.firma_electronica import FirmadorDTE, invalidar_firmador, obtener_firmador
+from facturacion_electronica.management.commands import benchmark_firma_dte
+from facturacion_electronica.management.commands.benchmark_xml_dte import DocumentoSintetico
+from facturacion_electronica.models import (
+    ArchivoCAF, BloqueFolios, ColaEnvioDTE, DocumentoTributarioElectronico, TokenSII,
+)
+from ventas.models import EstacionTrabajo
+
+
+def crear_sucursal(empresa, codigo='S1'):
+    return Sucursal.objects.create(
+        empresa=empresa, nombre=f'Sucursal {codigo}', codigo=codigo, direccion='Calle 1', comuna='Santiago',
+        ciudad='Santiago', region='Metropolitana', telefono='123',
+        horario_apertura=time(9), horario_cierre=time(18),
+    )
+
+
+def crear_caf(empresa, sucursal, folio_desde, folio_hasta, tipo_documento='39'):
+    return ArchivoCAF.objects.create(
+        empresa=empresa, sucursal=sucursal, tipo_documento=tipo_documento,
+        folio_desde=folio_desde, folio_hasta=folio_hasta, cantidad_folios=folio_hasta - folio_desde + 1,
+        folio_actual=folio_desde - 1, contenido_caf=f'<AUTORIZACION><RNG><D>{folio_desde}</D></RNG></AUTORIZACION>',
+        firma_electronica='FRMA', fecha_autorizacion=date.today(),
+    )
+
+
+def crear_dte(empresa, folio, tipo_dte='39', caf=None):
+    caf = caf or crear_caf(empresa, crear_sucursal(empresa, f'S{folio}'), folio, folio + 99, tipo_dte)
+    return DocumentoTributarioElectronico.objects.create(
+        empresa=empresa, caf_utilizado=caf, tipo_dte=tipo_dte, folio=folio, fecha_emision=date.today(),
+        rut_receptor='66666666-6', razon_social_receptor='Cliente', monto_neto=840,
+        monto_iva=160, monto_total=1000, xml_dte='<DTE/>',
+    )
+
+
+class ColaEnvioTest(TestCase):
+    """Reintentos con backoff, plazo de bloqueo y arranque de los workers de la cola de envío"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(nombre='Empresa DTE', razon_social='Empresa DTE', rut='76.000.002-6')
+
+    def setUp(self):
+        self.dte = crear_dte(self.empresa, 1)
+        self.envio = ColaEnvioDTE.objects.create(empresa=self.empresa, dte=self.dte, canal='dtebox', tipo_dte='39')
+
+    def _enviar(self, resultado):
+        ids = cola_envio.tomar_envios('worker-a')
+        self.assertEqual(ids, [self.envio.id])
+        with mock.patch('facturacion_electronica.dtebox_service.DTEBoxService') as servicio:
+            servicio.return_value.timbrar_dte.return_value = resultado
+            return cola_envio.procesar_envio(self.envio.id)
+
+    def test_fallo_programa_reintento_con_backoff(self):
+        antes = timezone.now()
+        with self.settings(DTE_ENVIO_BACKOFF_BASE=5, DTE_ENVIO_BACKOFF_FACTOR=4):
+            self.assertFalse(self._enviar({'success': False, 'error': 'DTEBox caído'}))
+
+        self.envio.refresh_from_db()
+        self.assertEqual(self.envio.estado, 'pendiente')
+        self.assertEqual(self.envio.intentos, 1)
+        self.assertEqual(self.envio.ultimo_error, 'DTEBox caído')
+        espera = (self.envio.proximo_intento - antes).total_seconds()
+        self.assertTrue(4.5 <= espera <= 5.6, espera)
+        # Aún no vence el backoff: ningún worker lo toma
+        self.assertEqual(cola_envio.tomar_envios('worker-b'), [])
+
+    def test_espera_crece_exponencialmente_hasta_el_maximo(self):
+        with mock.patch.object(cola_envio.random, 'uniform', return_value=1.0):
+            esperas = [cola_envio.espera_reintento(n) for n in range(1, 8)]
+        self.assertEqual(esperas, [5, 20, 80, 320, 1280, 1800, 1800])
+
+    def test_intentos_agotados_dejan_el_dte_pendiente_con_error(self):
+        ColaEnvioDTE.objects.filter(pk=self.envio.pk).update(intentos=cola_envio.max_intentos() - 1)
+        self.assertFalse(self._enviar({'success': False, 'error': 'Rechazado'}))
+
+        self.envio.refresh_from_db()
+        self.dte.refresh_from_db()
+        self.assertEqual(self.envio.estado, 'error')
+        self.assertEqual(self.dte.estado_sii, 'pendiente')
+        self.assertEqual(self.dte.error_envio, 'Rechazado')
+
+    def test_envio_exitoso(self):
+        self.assertTrue(self._enviar({'success': True, 'ted': '<TED/>'}))
+        self.envio.refresh_from_db()
+        self.dte.refresh_from_db()
+        self.assertEqual(self.envio.estado, 'enviado')
+        self.assertEqual(self.dte.estado_sii, 'enviado')
+
+    def test_bloqueo_renovado_no_se_retoma(self):
+        self.assertEqual(cola_envio.tomar_envios('worker-a'), [self.envio.id])
+        # El plazo venció mientras DTEBox respondía lento...
+        ColaEnvioDTE.objects.filter(pk=self.envio.pk).update(bloqueado_hasta=timezone.now() - timedelta(seconds=1))
+        # ...pero el worker que lo envía lo renueva y otro worker no lo toma
+        self.assertEqual(cola_envio.renovar_bloqueo([self.envio.id], 'worker-a'), 1)
+        self.assertEqual(cola_envio.tomar_envios('worker-b'), [])
+        # Un worker que ya no es dueño del envío no puede renovarlo
+        self.assertEqual(cola_envio.renovar_bloqueo([self.envio.id], 'worker-b'), 0)
+
+    def test_envio_abandonado_se_retoma_al_vencer_el_plazo(self):
+        self.assertEqual(cola_envio.tomar_envios('worker-a'), [self.envio.id])
+        ColaEnvioDTE.objects.filter(pk=self.envio.pk).update(bloqueado_hasta=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(cola_envio.tomar_envios('worker-b'), [self.envio.id])
+
+    def test_primera_peticion_inicia_los_workers_locales(self):
+        request_started.connect(cola_envio.iniciar_workers_al_arrancar, dispatch_uid='cola_envio_dte_inicio')
+        with self.settings(DTE_ENVIO_MODO='local'), mock.patch.object(cola_envio, 'obtener_pool_local') as pool:
+            request_started.send(sender=None)
+            request_started.send(sender=None)
+        pool.return_value.despertar.assert_called_once_with()
+
+
+class TimbreImpresionTest(TestCase):
+    """El timbre se dibuja al crear el DTE; las vistas sólo lo leen del caché"""
+
+    TED = '<TED version="1.0"><DD><RE>76000002-6</RE><TD>39</TD><F>1</F></DD><FRMT algoritmo="SHA1withRSA">X</FRMT></TED>'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(nombre='Empresa Timbre', razon_social='Empresa Timbre', rut='76.000.003-4')
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = self.settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.dte = crear_dte(self.empresa, 1)
+        DocumentoTributarioElectronico.objects.filter(pk=self.dte.pk).update(timbre_electronico=self.TED)
+        self.dte.refresh_from_db()
+
+    def _get(self, parametros=None):
+        request = RequestFactory().get('/dte/1/ver/', parametros or {})
+        request.user = AnonymousUser()
+        return request
+
+    def test_consulta_no_dibuja_y_encola_en_segundo_plano(self):
+        with mock.patch.object(timbre_pdf417, 'encolar_timbre_pdf417') as encolar, \
+                mock.patch.object(timbre_pdf417, 'generar_timbre_dte') as generar:
+            self.assertFalse(timbre_pdf417.asegurar_timbre_pdf417(self.dte))
+        encolar.assert_called_once_with(self.dte)
+        generar.assert_not_called()
+
+    def test_creacion_dibuja_al_confirmar_y_la_impresion_solo_lee(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            timbre_pdf417.programar_timbre_pdf417(self.dte)
+
+        dte = DocumentoTributarioElectronico.objects.get(pk=self.dte.pk)
+        self.assertTrue(timbre_pdf417.timbre_vigente(dte))
+        self.assertEqual(dte.pdf417_hash, timbre_pdf417.hash_ted(self.TED))
+        self.assertIsNotNone(dte.pdf417_columnas)
+        with mock.patch.object(timbre_pdf417, 'generar_timbre_dte') as generar:
+            self.assertIsNone(timbre_pdf417.respuesta_timbre_pendiente(self._get(), dte))
+        generar.assert_not_called()
+
+    def test_impresion_sin_timbre_reintenta_y_luego_muestra_placeholder(self):
+        # Imagen de un TED anterior: no se imprime
+        DocumentoTributarioElectronico.objects.filter(pk=self.dte.pk).update(
+            timbre_pdf417='dte/timbres/ted/xx/anterior.png', pdf417_hash='anterior'
+        )
+        self.dte.refresh_from_db()
+        with self.settings(DTE_TIMBRE_REINTENTOS=2), \
+                mock.patch.object(timbre_pdf417, 'encolar_timbre_pdf417') as encolar, \
+                mock.patch.object(timbre_pdf417, 'generar_timbre_dte') as generar:
+            respuesta = timbre_pdf417.respuesta_timbre_pendiente(self._get({'auto': '1'}), self.dte)
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertContains(respuesta, '/dte/1/ver/?auto=1&amp;timbre_reintento=1')
+
+            agotado = self._get({'auto': '1', 'timbre_reintento': '2'})
+            self.assertIsNone(timbre_pdf417.respuesta_timbre_pendiente(agotado, self.dte))
+        self.assertFalse(self.dte.timbre_pdf417)
+        self.assertEqual(encolar.call_count, 2)
+        generar.assert_not_called()
+
+
+class AsignadorFoliosTest(TestCase):
+    """Reserva atómica de folios, reversión, paso al siguiente CAF y bloques de estación"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(nombre='Empresa Folios', razon_social='Empresa Folios', rut='76.000.005-0')
+        cls.sucursal = crear_sucursal(cls.empresa)
+
+    def _estacion(self, numero):
+        return EstacionTrabajo.objects.create(empresa=self.empresa, numero=numero, nombre=f'Caja {numero}')
+
+    def _asignar(self, estacion=None, tipo='33'):
+        folio, caf = asignador_folios.asignar_folio(self.empresa, self.sucursal, tipo, estacion=estacion)
+        return folio, caf.id if caf else None
+
+    def test_reversion_devuelve_el_folio_y_se_pasa_al_siguiente_caf(self):
+        primero = crear_caf(self.empresa, self.sucursal, 1, 2, '33')
+        segundo = crear_caf(self.empresa, self.sucursal, 101, 200, '33')
+
+        self.assertEqual(self._asignar(), (1, primero.id))
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.assertEqual(self._asignar(), (2, primero.id))
+                raise RuntimeError('la venta falló')
+        # El folio 2 volvió al CAF con la transacción
+        self.assertEqual(self._asignar(), (2, primero.id))
+
+        primero.refresh_from_db()
+        self.assertEqual(primero.estado, 'agotado')
+        self.assertIsNotNone(primero.fecha_agotamiento)
+        self.assertEqual(self._asignar(), (101, segundo.id))
+
+        ArchivoCAF.objects.filter(pk=segundo.pk).update(folio_actual=200)
+        self.assertEqual(self._asignar(), (None, None))
+
+    def test_estacion_consume_su_bloque_y_libera_al_cerrar(self):
+        caf = crear_caf(self.empresa, self.sucursal, 1, 100)
+        caja1, caja2 = self._estacion('1'), self._estacion('2')
+
+        with self.settings(DTE_BLOQUE_FOLIOS={'39': 5}):
+            self.assertEqual([self._asignar(caja1, '39')[0] for _ in range(3)], [1, 2, 3])
+            self.assertEqual(self._asignar(caja2, '39')[0], 6)
+            caf.refresh_from_db()
+            self.assertEqual(caf.folio_actual, 10)
+
+            self.assertEqual(asignador_folios.liberar_bloques(caja1), 1)
+            self.assertEqual(asignador_folios.folios_en_bloques(self.empresa, '39'), 6)
+            # La caja 2 termina su bloque y sigue con los folios que dejó la caja 1
+            self.assertEqual([self._asignar(caja2, '39')[0] for _ in range(6)], [7, 8, 9, 10, 4, 5])
+            self.assertEqual(self._asignar(caja2, '39')[0], 11)
+
+    def test_bloque_activo_sin_uso_lo_toma_otra_estacion(self):
+        crear_caf(self.empresa, self.sucursal, 1, 100)
+        caja1, caja2, caja3 = self._estacion('1'), self._estacion('2'), self._estacion('3')
+
+        with self.settings(DTE_BLOQUE_FOLIOS={'39': 5}, DTE_BLOQUE_FOLIOS_PLAZO=600):
+            self.assertEqual(self._asignar(caja1, '39')[0], 1)
+            # Dentro del plazo el bloque sigue siendo de la caja 1
+            self.assertEqual(self._asignar(caja2, '39')[0], 6)
+
+            bloque = BloqueFolios.objects.get(estacion=caja1)
+            BloqueFolios.objects.filter(pk=bloque.pk).update(fecha_asignacion=timezone.now() - timedelta(hours=1))
+            self.assertEqual(self._asignar(caja3, '39')[0], 2)
+
+            bloque.refresh_from_db()
+            self.assertEqual(bloque.estacion_id, caja3.id)
+            self.assertGreater(bloque.fecha_asignacion, timezone.now() - timedelta(minutes=1))
+            # La caja 1 vuelve y ya no usa ese bloque: no hay folios repetidos
+            self.assertEqual(self._asignar(caja1, '39')[0], 11)
+
+
+class SIIStub:
+    """SII de prueba: entrega tokens correlativos y rechaza los que se revocaron"""
+
+    ambiente = 'certificacion'
+
+    def __init__(self, revocados=()):
+        self.revocados = set(revocados)
+        self.emitidos = []
+        self.consultas = []
+
+    def obtener_semilla(self):
+        return '000123'
+
+    def obtener_token(self, semilla, firmador):
+        token = f'TOKEN{len(self.emitidos) + 1}'
+        self.emitidos.append(token)
+        return token
+
+    def consultar_estado_dte(self, track_id, token, rut_emisor):
+        self.consultas.append(token)
+        if token in self.revocados:
+            return {'estado': '001', 'glosa': 'TOKEN NO EXISTE'}
+        return {'estado': 'EPR', 'glosa': 'Envio Procesado'}
+
+    def enviar_dte(self, xml_envio, token, rut_emisor, rut_envia):
+        if token in self.revocados:
+            return {'track_id': None, 'estado': None, 'status': '5'}
+        return {'track_id': '4242', 'estado': None, 'status': '0'}
+
+
+class TokenSIITest(TestCase):
+    """Un token rechazado por el SII se invalida y la operación se reintenta una vez"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(
+            nombre='Empresa Token', razon_social='Empresa Token', rut='76.000.006-9', ambiente_sii='certificacion'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        firmador = mock.patch('facturacion_electronica.firma_electronica.obtener_firmador_empresa')
+        firmador.start()
+        self.addCleanup(firmador.stop)
+        ahora = timezone.now()
+        TokenSII.objects.create(
+            empresa=self.empresa, ambiente='certificacion', token='VIEJO',
+            fecha_obtencion=ahora, fecha_expiracion=ahora + timedelta(hours=1),
+        )
+
+    def _consultar(self, sii):
+        return token_sii.con_token_sii(
+            self.empresa, lambda token: sii.consultar_estado_dte('4242', token, self.empresa.rut), sii
+        )
+
+    def test_token_rechazado_se_renueva_y_reintenta(self):
+        sii = SIIStub(revocados={'VIEJO'})
+        self.assertEqual(self._consultar(sii)['estado'], 'EPR')
+        self.assertEqual(sii.consultas, ['VIEJO', 'TOKEN1'])
+        self.assertEqual(TokenSII.objects.get(empresa=self.empresa).token, 'TOKEN1')
+
+        # El token nuevo queda guardado: la siguiente operación no pide otro
+        self.assertEqual(self._consultar(sii)['estado'], 'EPR')
+        self.assertEqual(sii.emitidos, ['TOKEN1'])
+
+    def test_envio_rechazado_por_status_se_reintenta(self):
+        sii = SIIStub(revocados={'VIEJO'})
+        respuesta = token_sii.con_token_sii(
+            self.empresa, lambda token: sii.enviar_dte('<EnvioDTE/>', token, self.empresa.rut, self.empresa.rut), sii
+        )
+        self.assertEqual(respuesta['track_id'], '4242')
+
+    def test_reintenta_una_sola_vez(self):
+        sii = SIIStub(revocados={'VIEJO', 'TOKEN1'})
+        self.assertEqual(self._consultar(sii)['estado'], '001')
+        self.assertEqual(sii.consultas, ['VIEJO', 'TOKEN1'])
+
+    def test_error_http_401_se_trata_como_token_rechazado(self):
+        sii = SIIStub()
+        error = Exception('401 Unauthorized')
+        error.status_code = 401
+        operacion = mock.Mock(side_effect=[error, {'estado': 'EPR'}])
+        self.assertEqual(token_sii.con_token_sii(self.empresa, operacion, sii), {'estado': 'EPR'})
+        self.assertEqual([c.args[0] for c in operacion.call_args_list], ['VIEJO', 'TOKEN1'])
+
+    def test_invalidar_conserva_el_token_que_otro_proceso_ya_renovo(self):
+        TokenSII.objects.filter(empresa=self.empresa).update(token='NUEVO')
+        token_sii.invalidar_token_sii(self.empresa, token='VIEJO')
+        self.assertEqual(token_sii.obtener_token_sii(self.empresa, SIIStub()), 'NUEVO')
+
+    def test_conciliacion_renueva_el_token_compartido(self):
+        sii = SIIStub(revocados={'VIEJO'})
+        conciliador = _Conciliador()
+        conciliador._clientes['certificacion'] = sii
+        conciliador.preparar(self.empresa)
+
+        self.assertEqual(conciliador.consultar(self.empresa, '4242')['estado'], 'EPR')
+        self.assertEqual(conciliador.consultar(self.empresa, '4243')['estado'], 'EPR')
+        self.assertEqual(sii.consultas, ['VIEJO', 'TOKEN1', 'TOKEN1'])
+        self.assertEqual(sii.emitidos, ['TOKEN1'])
+
+
+class XMLCanonicoDTETest(TestCase):
+    """generar_xml entrega directamente lo que antes salía de generar + _limpiar_y_preparar_xml"""
+
+    def setUp(self):
+        self.empresa = Empresa(
+            nombre='Empresa XML', rut='76000000-0', razon_social='EMPRESA XML SPA',
+            giro='Comercio al por menor', direccion='Av. Siempre Viva 742', comuna='Santiago',
+            ciudad='Santiago', telefono='+56 2 2000 0000', email='xml@example.com',
+        )
+        # _limpiar_y_preparar_xml no usa la configuración de DTEBox de la empresa
+        self.dtebox = DTEBoxService.__new__(DTEBoxService)
+
+    def _canonico(self, xml):
+        parser = etree.XMLParser(remove_blank_text=True)
+        return etree.tostring(etree.fromstring(xml.encode('ISO-8859-1'), parser=parser), method='c14n')
+
+    def test_mismo_xml_c14n_que_la_limpieza(self):
+        for tipo in ('33', '39', '52'):
+            for lineas in (1, 50):
+                with self.subTest(tipo=tipo, lineas=lineas):
+                    documento = DocumentoSintetico(lineas, tipo)
+                    documento.items[0].articulo.nombre = 'Ñandú & Cía <Año>'
+                    generador = DTEXMLGenerator(self.empresa, documento, tipo, 1000, None)
+
+                    xml = generador.generar_xml()
+                    indentado = etree.tostring(
+                        generador._construir_arbol(), pretty_print=True, xml_declaration=True, encoding='ISO-8859-1'
+                    ).decode('ISO-8859-1')
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        limpio, error = self.dtebox._limpiar_y_preparar_xml(indentado, tipo)
+                        directo, _ = self.dtebox._limpiar_y_preparar_xml(xml, tipo)
+
+                    self.assertIsNone(error)
+                    self.assertTrue(xml.startswith(CABECERA_CANONICA))
+                    self.assertIs(directo, xml)
+                    self.assertEqual(self._canonico(xml), self._canonico(limpio))
+
+    def test_xml_firmado_no_se_considera_canonico(self):
+        xml = DTEXMLGenerator(self.empresa, DocumentoSintetico(1, '39'), '39', 1000, None).generar_xml()
+        firmado = xml.replace('</DTE>', '<Signature xmlns="http://www.w3.org/2000/09/xmldsig#"/></DTE>')
+        self.assertFalse(DTEBoxService._es_xml_canonico(firmado))
+
+
+class FirmadorCacheTest(TestCase):
+    """Un firmador cacheado firma igual que uno recién cargado y se descarta si cambia el certificado"""
+
+    def setUp(self):
+        invalidar_firmador()
+        self.rutas = []
+        self.addCleanup(invalidar_firmador)
+
+    def tearDown(self):
+        for ruta in self.rutas:
+            os.unlink(ruta)
+
+    def _certificado(self):
+        ruta = benchmark_firma_dte.Command()._certificado_temporal()
+        self.rutas.append(ruta)
+        return ruta
+
+    def _firmar(self, firmador, folio=1):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return firmador.firmar_xml(benchmark_firma_dte.XML_PRUEBA.format(folio=folio))
+
+    def test_reutiliza_y_firma_igual_que_sin_cache(self):
+        ruta = self._certificado()
+        firmador = obtener_firmador(ruta, 'benchmark', 1)
+        self.assertIs(obtener_firmador(ruta, 'benchmark', 1), firmador)
+        for folio in (1, 2):
+            self.assertEqual(self._firmar(firmador, folio), self._firmar(FirmadorDTE(ruta, 'benchmark'), folio))
+
+    def test_otro_certificado_en_la_misma_ruta_se_vuelve_a_cargar(self):
+        ruta = self._certificado()
+        anterior = obtener_firmador(ruta, 'benchmark', 1)
+        with open(self._certificado(), 'rb') as nuevo, open(ruta, 'wb') as destino:
+            destino.write(nuevo.read())
+        estado = os.stat(ruta)
+        os.utime(ruta, ns=(estado.st_atime_ns, estado.st_mtime_ns + 1_000_000))
+
+        # Sin invalidar (otro proceso recibió la señal): la huella del archivo cambió
+        firmador = obtener_firmador(ruta, 'benchmark', 1)
+        self.assertIsNot(firmador, anterior)
+        self.assertNotEqual(self._firmar(firmador), self._firmar(anterior))
+        # Un certificado vigente por empresa
+        self.assertEqual([clave[0] for clave in firma_electronica._firmadores], [1])
+
+    def test_invalidar_por_empresa_y_limite(self):
+        rutas = [self._certificado() for _ in range(3)]
+        firmadores = [obtener_firmador(ruta, 'benchmark', n) for n, ruta in enumerate(rutas)]
+
+        invalidar_firmador(0)
+        self.assertIsNot(obtener_firmador(rutas[0], 'benchmark', 0), firmadores[0])
+        self.assertIs(obtener_firmador(rutas[1], 'benchmark', 1), firmadores[1])
+
+        with mock.patch.object(firma_electronica, 'MAX_FIRMADORES_EN_CACHE', 2):
+            obtener_firmador(rutas[2], 'benchmark', 3)
+        # Se descartan los usados hace más tiempo (empresas 2 y 0)
+        self.assertEqual(sorted(clave[0] for clave in firma_electronica._firmadores), [1, 3])
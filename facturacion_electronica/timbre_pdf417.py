@@ -0,0 +1,260 @@
+"""
+Imagen PDF417 del timbre de los DTE: caché por hash del TED y generación en
+segundo plano.
+
+La imagen se generaba dentro de la petición (al crear el DTE y de nuevo en
+ver_factura_electronica si faltaba o parecía un placeholder), probando hasta
+15 combinaciones de (security_level, columnas) y luego redimensionando y
+codificando el PNG. Ahora:
+
+- La imagen se guarda una sola vez en dte/timbres/ted/<hash>.png, donde
+  <hash> es el SHA-256 del TED: el mismo TED nunca se vuelve a dibujar y el
+  DTE sólo apunta al archivo (timbre_pdf417, pdf417_hash).
+- Las columnas y el nivel de seguridad con que se codificó quedan en el DTE
+  y se prueban primero si hay que volver a generarla.
+- Al crear el DTE (o cambiar su TED) se llama a programar_timbre_pdf417(),
+  que genera la imagen al confirmar la transacción, en el mismo proceso y
+  antes de responder: la redirección a la impresión ya la encuentra lista.
+- Las vistas (consulta e impresión) nunca dibujan el código
+  (asegurar_timbre_pdf417): si la imagen del TED ya está en el caché la
+  asignan y, si no, la encolan en segundo plano (tarea de Celery
+  generar_timbres_pdf417 con DTE_ENVIO_MODO = 'celery' o un pool de
+  DTE_TIMBRE_HILOS hilos del proceso).
+- Las vistas de impresión usan respuesta_timbre_pendiente(): mientras la
+  imagen no esté, devuelven una página que recarga el documento hasta
+  DTE_TIMBRE_REINTENTOS veces y, agotados los reintentos, el documento se
+  muestra con el placeholder del timbre (nunca con el PDF417 de otro TED).
+"""
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+from .models import DocumentoTributarioElectronico
+from .pdf417_generator import PDF417Generator
+
+logger = logging.getLogger(__name__)
+
+
+CARPETA = 'dte/timbres/ted'
+ANCHO = 400
+ALTO = 150
+
+_ejecutor = None
+_ejecutor_lock = threading.Lock()
+_en_proceso = set()
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def hash_ted(ted_xml):
+    """SHA-256 de los bytes que van en el PDF417 (el TED en base64 y en XML dan el mismo hash)"""
+    return hashlib.sha256(PDF417Generator.normalizar_ted(ted_xml)).hexdigest()
+
+
+def ruta_timbre(clave):
+    return f'{CARPETA}/{clave[:2]}/{clave}.png'
+
+
+def timbre_vigente(dte):
+    """True si la imagen guardada corresponde al TED actual del DTE"""
+    if not dte.timbre_electronico:
+        return bool(dte.timbre_pdf417)
+    return bool(dte.timbre_pdf417) and dte.pdf417_hash == hash_ted(dte.timbre_electronico)
+
+
+def generar_timbre_dte(dte):
+    """
+    Asigna al DTE la imagen del PDF417 de su TED, dibujándola sólo si no está
+    en el caché. Sin TED se usa el placeholder (compartido por todos los DTE).
+    """
+    columnas, nivel = dte.pdf417_columnas, dte.pdf417_nivel_seguridad
+    if dte.timbre_electronico:
+        clave = hash_ted(dte.timbre_electronico)
+        ruta = ruta_timbre(clave)
+    else:
+        print("[WARN] DTE no tiene TED generado. Se usara placeholder de timbre.")
+        clave = ''
+        ruta = f'{CARPETA}/sin_ted.png'
+
+    if not default_storage.exists(ruta):
+        if clave:
+            imagen, columnas, nivel = PDF417Generator.generar_timbre(
+                dte.timbre_electronico, ANCHO, ALTO, columnas, nivel
+            )
+        else:
+            imagen = PDF417Generator._generar_placeholder(ancho=ANCHO, alto=ALTO)
+        # Otro hilo pudo guardarla mientras se dibujaba: es la misma imagen
+        if not default_storage.exists(ruta):
+            ruta = default_storage.save(ruta, ContentFile(imagen))
+
+    DocumentoTributarioElectronico.objects.filter(pk=dte.pk).update(
+        timbre_pdf417=ruta,
+        pdf417_hash=clave,
+        pdf417_columnas=columnas,
+        pdf417_nivel_seguridad=nivel,
+    )
+    dte.timbre_pdf417.name = ruta
+    dte.pdf417_hash = clave
+    dte.pdf417_columnas = columnas
+    dte.pdf417_nivel_seguridad = nivel
+    return ruta
+
+
+def asegurar_timbre_pdf417(dte):
+    """
+    Para las vistas: deja el DTE apuntando a la imagen de su TED si ya está en
+    el caché y, si no, la encola en segundo plano. Nunca dibuja el código.
+
+    Returns:
+        bool: True si el DTE tiene la imagen de su TED
+    """
+    if not dte.timbre_electronico or timbre_vigente(dte):
+        return bool(dte.timbre_pdf417)
+    clave = hash_ted(dte.timbre_electronico)
+    ruta = ruta_timbre(clave)
+    if default_storage.exists(ruta):
+        DocumentoTributarioElectronico.objects.filter(pk=dte.pk).update(timbre_pdf417=ruta, pdf417_hash=clave)
+        dte.timbre_pdf417.name = ruta
+        dte.pdf417_hash = clave
+        return True
+    encolar_timbre_pdf417(dte)
+    return False
+
+
+def timbre_para_imprimir(dte):
+    """
+    Para las vistas de impresión: como asegurar_timbre_pdf417, pero si la
+    imagen del TED actual no está deja el DTE sin imagen (sólo en memoria) para
+    que la plantilla muestre el placeholder y no un PDF417 de un TED anterior.
+
+    Returns:
+        bool: True si el DTE tiene la imagen de su TED
+    """
+    if dte is None:
+        return False
+    if asegurar_timbre_pdf417(dte):
+        return True
+    dte.timbre_pdf417.name = ''
+    return False
+
+
+def respuesta_timbre_pendiente(request, dte):
+    """
+    Para las vistas de impresión: si el timbre del DTE aún no está, devuelve
+    una página que vuelve a pedir el documento en DTE_TIMBRE_REINTENTO_SEGUNDOS
+    (la imagen se está generando en segundo plano).
+
+    Returns:
+        HttpResponse o None: None si el documento se puede mostrar (con su
+        timbre o, agotados los DTE_TIMBRE_REINTENTOS, con el placeholder)
+    """
+    from django.shortcuts import render
+
+    if dte is None or timbre_para_imprimir(dte):
+        return None
+    try:
+        reintento = int(request.GET.get('timbre_reintento', 0))
+    except (TypeError, ValueError):
+        reintento = 0
+    if reintento >= _config('DTE_TIMBRE_REINTENTOS', 3):
+        logger.warning(f"Timbre del DTE {dte.id} no disponible tras {reintento} reintentos: se imprime con placeholder")
+        return None
+
+    parametros = request.GET.copy()
+    parametros['timbre_reintento'] = reintento + 1
+    return render(request, 'facturacion_electronica/timbre_pendiente.html', {
+        'dte': dte,
+        'url': f'{request.path}?{parametros.urlencode()}',
+        'segundos': _config('DTE_TIMBRE_REINTENTO_SEGUNDOS', 1),
+    })
+
+
+def programar_timbre_pdf417(*dtes):
+    """
+    Genera el PDF417 de los DTE (instancias o IDs) al confirmar la transacción
+    en curso, en este mismo proceso: quien crea el DTE lo deja timbrado antes
+    de redirigir a la impresión.
+    """
+    ids = [getattr(dte, 'pk', dte) for dte in dtes]
+    transaction.on_commit(lambda: generar_timbres(ids), robust=True)
+
+
+def encolar_timbre_pdf417(*dtes):
+    """
+    Genera en segundo plano el PDF417 de los DTE (instancias o IDs) una vez
+    confirmada la transacción en curso.
+    """
+    ids = [getattr(dte, 'pk', dte) for dte in dtes]
+    transaction.on_commit(lambda: _despachar(ids))
+
+
+def _despachar(ids):
+    from .cola_envio import MODO_CELERY, modo_ejecucion
+
+    if modo_ejecucion() == MODO_CELERY:
+        try:
+            from .tasks import generar_timbres_pdf417
+            generar_timbres_pdf417.delay(ids)
+            return
+        except Exception as e:
+            logger.error(f"No se pudo encolar la generación de timbres en Celery: {e}. Se genera localmente.")
+
+    ejecutor = _obtener_ejecutor()
+    for dte_id in ids:
+        with _ejecutor_lock:
+            if dte_id in _en_proceso:
+                continue  # Ya programado (p. ej. varias vistas del mismo documento)
+            _en_proceso.add(dte_id)
+        ejecutor.submit(_generar_en_segundo_plano, dte_id)
+
+
+def _obtener_ejecutor():
+    global _ejecutor
+    if _ejecutor is None:
+        with _ejecutor_lock:
+            if _ejecutor is None:
+                _ejecutor = ThreadPoolExecutor(
+                    max_workers=_config('DTE_TIMBRE_HILOS', 2),
+                    thread_name_prefix='TimbrePDF417',
+                )
+    return _ejecutor
+
+
+def _generar_en_segundo_plano(dte_id):
+    try:
+        generar_timbres([dte_id])
+    finally:
+        with _ejecutor_lock:
+            _en_proceso.discard(dte_id)
+        close_old_connections()
+
+
+def generar_timbres(dte_ids):
+    """
+    Genera el PDF417 de los DTE indicados que no lo tengan al día.
+
+    Returns:
+        int: Cantidad de timbres asignados
+    """
+    dtes = DocumentoTributarioElectronico.objects.filter(pk__in=dte_ids).only(
+        'id', 'tipo_dte', 'folio', 'timbre_electronico', 'timbre_pdf417',
+        'pdf417_hash', 'pdf417_columnas', 'pdf417_nivel_seguridad',
+    )
+    generados = 0
+    for dte in dtes:
+        if timbre_vigente(dte):
+            continue
+        try:
+            generar_timbre_dte(dte)
+            generados += 1
+        except Exception as e:
+            logger.error(f"Error al generar el PDF417 del DTE {dte.id}: {e}")
+    return generados
@@ -0,0 +1,228 @@
+"""
+Tokens de autenticación del SII reutilizados por empresa y ambiente.
+
+Antes cada envío o consulta de estado hacía el ciclo completo semilla →
+firma → GetTokenFromSeed (dos llamadas SOAP más una firma). El token del SII
+sirve para muchas operaciones, así que ahora se guarda:
+
+- En el cache de Django (lectura rápida, compartido si el cache es Redis o
+  Memcached).
+- En la tabla TokenSII como respaldo: otro proceso o nodo, o el mismo tras
+  un reinicio, lo reutiliza aunque el cache sea local o se haya vaciado.
+
+Un token se usa hasta SII_TOKEN_MARGEN segundos antes de su expiración
+(calculada como obtención + SII_TOKEN_VIGENCIA). Cuando le quedan menos de
+SII_TOKEN_REFRESCO segundos se entrega igual y se pide uno nuevo en un hilo
+en segundo plano, así las peticiones no esperan la renovación.
+
+El SII puede rechazar un token antes de su expiración calculada (sesión
+cerrada en el SII, reinicio de sus servidores). con_token_sii() ejecuta la
+operación con el token guardado y, si el SII responde que no está
+autenticado, descarta ese token (invalidar_token_sii) y reintenta una vez con
+uno nuevo.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import TokenSII
+
+logger = logging.getLogger(__name__)
+
+# Respuestas del SII a un token inválido: ESTADO de getEstDte (001 cookie
+# inactiva o token inexistente, 002 token inactivo, 003 token no existe) y
+# STATUS 5 de la recepción de envíos (no está autenticado)
+ESTADOS_TOKEN_RECHAZADO = {'001', '002', '003'}
+STATUS_TOKEN_RECHAZADO = {'5'}
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def _ambiente(empresa, ambiente=None):
+    return ambiente or empresa.ambiente_sii or 'certificacion'
+
+
+def _clave(empresa_id, ambiente):
+    return f'sii_token_{empresa_id}_{ambiente}'
+
+
+# Un lock por (empresa, ambiente): en un proceso, sólo un hilo pide el token
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _lock_token(clave):
+    with _locks_lock:
+        return _locks.setdefault(clave, threading.Lock())
+
+
+def _token_vigente(datos, ahora):
+    """Token de (token, expiracion) si todavía se puede usar, si no None"""
+    if not datos:
+        return None
+    token, expiracion = datos
+    if expiracion - timedelta(seconds=_config('SII_TOKEN_MARGEN', 120)) > ahora:
+        return token
+    return None
+
+
+def _leer(empresa_id, ambiente):
+    """(token, expiracion) desde el cache o, si no está, desde la base de datos"""
+    clave = _clave(empresa_id, ambiente)
+    datos = cache.get(clave)
+    if datos is None:
+        registro = TokenSII.objects.filter(empresa_id=empresa_id, ambiente=ambiente).first()
+        if registro is None:
+            return None
+        datos = (registro.token, registro.fecha_expiracion)
+        _guardar_en_cache(clave, datos)
+    return datos
+
+
+def _guardar_en_cache(clave, datos):
+    segundos = int((datos[1] - timezone.now()).total_seconds())
+    if segundos > 0:
+        cache.set(clave, datos, segundos)
+
+
+def _solicitar_token(empresa, ambiente, cliente=None):
+    """Ciclo completo semilla → firma → token y guardado en cache y base de datos"""
+    from .cliente_sii import ClienteSII
+    from .firma_electronica import obtener_firmador_empresa
+
+    cliente = cliente or ClienteSII(ambiente=ambiente)
+    obtenido = timezone.now()
+    semilla = cliente.obtener_semilla()
+    token = cliente.obtener_token(semilla, obtener_firmador_empresa(empresa))
+    expiracion = obtenido + timedelta(seconds=_config('SII_TOKEN_VIGENCIA', 3600))
+
+    TokenSII.objects.update_or_create(
+        empresa=empresa,
+        ambiente=ambiente,
+        defaults={'token': token, 'fecha_obtencion': obtenido, 'fecha_expiracion': expiracion},
+    )
+    _guardar_en_cache(_clave(empresa.id, ambiente), (token, expiracion))
+    logger.info(f"Token SII renovado para empresa {empresa.id} ({ambiente})")
+    return token
+
+
+def _refrescar_en_segundo_plano(empresa, ambiente):
+    # cache.add es atómico: un solo refresco a la vez (entre procesos si el cache es compartido)
+    if not cache.add(f'{_clave(empresa.id, ambiente)}_refrescando', True, 60):
+        return
+
+    def refrescar():
+        try:
+            with _lock_token(_clave(empresa.id, ambiente)):
+                _solicitar_token(empresa, ambiente)
+        except Exception as e:
+            logger.error(f"No se pudo refrescar el token SII de la empresa {empresa.id}: {e}")
+        finally:
+            cache.delete(f'{_clave(empresa.id, ambiente)}_refrescando')
+            close_old_connections()
+
+    threading.Thread(target=refrescar, name=f"TokenSII-{empresa.id}", daemon=True).start()
+
+
+def obtener_token_sii(empresa, cliente=None, ambiente=None):
+    """
+    Token del SII para la empresa, reutilizando el vigente cuando es posible.
+
+    Args:
+        empresa: Empresa emisora (su certificado firma la semilla)
+        cliente: ClienteSII a usar si hay que pedir un token nuevo
+        ambiente: 'certificacion' o 'produccion' (por defecto el de la empresa)
+
+    Returns:
+        str: Token de autenticación
+    """
+    ambiente = _ambiente(empresa, ambiente)
+    ahora = timezone.now()
+
+    datos = _leer(empresa.id, ambiente)
+    token = _token_vigente(datos, ahora)
+    if token:
+        if datos[1] - timedelta(seconds=_config('SII_TOKEN_REFRESCO', 600)) <= ahora:
+            _refrescar_en_segundo_plano(empresa, ambiente)
+        return token
+
+    clave = _clave(empresa.id, ambiente)
+    with _lock_token(clave):
+        # Otro hilo pudo renovarlo mientras se esperaba el lock
+        token = _token_vigente(_leer(empresa.id, ambiente), timezone.now())
+        if token:
+            return token
+        return _solicitar_token(empresa, ambiente, cliente)
+
+
+def invalidar_token_sii(empresa, ambiente=None, token=None):
+    """
+    Descarta el token guardado (p. ej. si el SII lo rechazó). Con `token` sólo
+    se descarta si sigue siendo ese: si otro proceso ya guardó uno nuevo, se
+    conserva.
+    """
+    ambiente = _ambiente(empresa, ambiente)
+    clave = _clave(empresa.id, ambiente)
+    datos = cache.get(clave)
+    if token is None or (datos and datos[0] == token):
+        cache.delete(clave)
+    registros = TokenSII.objects.filter(empresa=empresa, ambiente=ambiente)
+    if token is not None:
+        registros = registros.filter(token=token)
+    registros.delete()
+
+
+def token_rechazado(respuesta):
+    """True si la respuesta del SII (dict de ClienteSII) indica que el token no es válido"""
+    if not isinstance(respuesta, dict):
+        return False
+    estado = (respuesta.get('estado') or '').strip()
+    status = (respuesta.get('status') or '').strip()
+    return estado in ESTADOS_TOKEN_RECHAZADO or status in STATUS_TOKEN_RECHAZADO
+
+
+def _error_de_autenticacion(error):
+    """Errores HTTP 401/403 del transporte (zeep o requests)"""
+    codigo = getattr(error, 'status_code', None)
+    if codigo is None:
+        codigo = getattr(getattr(error, 'response', None), 'status_code', None)
+    return codigo in (401, 403)
+
+
+def con_token_sii(empresa, operacion, cliente=None, ambiente=None):
+    """
+    Ejecuta operacion(token) con el token vigente de la empresa. Si el SII
+    rechaza el token, lo invalida y reintenta una sola vez con uno nuevo.
+
+    Args:
+        empresa: Empresa emisora
+        operacion: Función que recibe el token y devuelve la respuesta del SII
+        cliente: ClienteSII a usar si hay que pedir un token nuevo
+        ambiente: 'certificacion' o 'produccion' (por defecto el de la empresa)
+
+    Returns:
+        La respuesta de la operación (la del reintento si lo hubo)
+    """
+    ambiente = _ambiente(empresa, ambiente)
+    token = obtener_token_sii(empresa, cliente, ambiente=ambiente)
+    try:
+        respuesta = operacion(token)
+    except Exception as e:
+        if not _error_de_autenticacion(e):
+            raise
+        logger.warning(f"El SII rechazó el token de la empresa {empresa.id} ({ambiente}): {e}")
+    else:
+        if not token_rechazado(respuesta):
+            return respuesta
+        logger.warning(f"El SII rechazó el token de la empresa {empresa.id} ({ambiente}): "
+                       f"{respuesta.get('estado') or respuesta.get('status')}")
+
+    invalidar_token_sii(empresa, ambiente, token=token)
+    return operacion(obtener_token_sii(empresa, cliente, ambiente=ambiente))
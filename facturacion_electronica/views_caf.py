@@ -266,6 +266,18 @@ def ajustar_folio_caf(request, caf_id):
             'error': f'No se puede ajustar a folio {nuevo_folio} porque existen {dtes_posteriores} documentos emitidos con folios superiores'
         })
     
+    # VALIDACIÓN 4: Folios reservados por estaciones del POS (bloques pendientes)
+    bloques_posteriores = caf.bloques.filter(
+        estado__in=['activo', 'liberado'],
+        folio_hasta__gt=nuevo_folio
+    ).count()
+    
+    if bloques_posteriores > 0:
+        return JsonResponse({
+            'success': False,
+            'error': f'No se puede ajustar a folio {nuevo_folio} porque hay {bloques_posteriores} bloques de folios superiores reservados por estaciones del POS'
+        })
+    
     # Calcular nuevos valores
     if nuevo_folio < caf.folio_desde:
         nuevos_folios_utilizados = 0
@@ -251,16 +251,12 @@ def ver_factura_electronica(request, dte_id):
         pk=dte_id, empresa=request.empresa
     )
     
-    # ASEGURAR TIMBRE PDF417 si falta o es placeholder, pero tenemos el TED
-    if dte.timbre_electronico and (not dte.timbre_pdf417 or dte.timbre_pdf417.size < 3000):
-        try:
-            from .pdf417_generator import PDF417Generator
-            # Guardar el timbre (esta funcion llama a dte.timbre_pdf417.save que actualiza la DB)
-            if PDF417Generator.guardar_pdf417_en_dte(dte):
-                # Recargar el objeto para tener la URL del archivo
-                dte.refresh_from_db()
-        except Exception as e_timbre:
-            logger.error(f"[PREVIEW] Error regenerando timbre: {e_timbre}")
+    # TIMBRE PDF417: sólo se lee del caché (se genera al crear el DTE); si aún
+    # no está se reintenta en unos segundos, sin dibujarlo en la petición
+    from .timbre_pdf417 import respuesta_timbre_pendiente
+    pendiente = respuesta_timbre_pendiente(request, dte)
+    if pendiente:
+        return pendiente
 
     # Obtener la venta o la orden de despacho asociada con relaciones cargadas
     venta = None
@@ -468,6 +464,10 @@ def ver_notacredito_electronica(request, notacredito_id):
     
     # Obtener el DTE asociado directamente desde la nota de crédito
     dte = nota.dte
+    from .timbre_pdf417 import respuesta_timbre_pendiente
+    pendiente = respuesta_timbre_pendiente(request, dte)
+    if pendiente:
+        return pendiente
 
     # Obtener detalles de la nota de crédito
     detalles = nota.items.all()
@@ -515,6 +515,10 @@ def ver_notadebito_electronica(request, notadebito_id):
     
     # Obtener el DTE asociado
     dte = nota.dte
+    from .timbre_pdf417 import respuesta_timbre_pendiente
+    pendiente = respuesta_timbre_pendiente(request, dte)
+    if pendiente:
+        return pendiente
 
     # Obtener detalles
     detalles = nota.items.all()
@@ -591,20 +595,17 @@ def probar_dtebox(request, dte_id):
                 dte.timbre_electronico = resultado['ted']
                 
                 # Regenerar PDF417 con el nuevo TED
-                from facturacion_electronica.firma_electronica import FirmadorDTE
-                firmador = FirmadorDTE(
-                    request.empresa.certificado_digital.path,
-                    request.empresa.password_certificado
-                )
+                from facturacion_electronica.firma_electronica import obtener_firmador_empresa
+                firmador = obtener_firmador_empresa(request.empresa)
                 pdf417_data = firmador.generar_datos_pdf417(resultado['ted'])
                 dte.datos_pdf417 = pdf417_data
                 
-                # Regenerar imagen PDF417
-                from facturacion_electronica.pdf417_generator import PDF417Generator
-                PDF417Generator.guardar_pdf417_en_dte(dte)
-                
                 dte.save()
                 
+                # Regenerar imagen PDF417 (en segundo plano)
+                from facturacion_electronica.timbre_pdf417 import programar_timbre_pdf417
+                programar_timbre_pdf417(dte)
+                
                 messages.success(request, '✅ TED obtenido exitosamente desde DTEBox y actualizado en el DTE.')
             else:
                 error = resultado['error']
@@ -892,10 +893,9 @@ def sincronizar_con_gdexpress(request, dte_id):
                     # Guardar cambios
                     dte.save()
                     
-                    # Regenerar la imagen PDF417 localmente usando el TED oficial
-                    from .pdf417_generator import PDF417Generator
-                    if PDF417Generator.guardar_pdf417_en_dte(dte):
-                        print(f"[GDExpress] Imagen PDF417 regenerada exitosamente.")
+                    # Regenerar la imagen PDF417 usando el TED oficial (en segundo plano)
+                    from .timbre_pdf417 import programar_timbre_pdf417
+                    programar_timbre_pdf417(dte)
                     
                     sincronizado_xml = True
                     print(f"[GDExpress] Timbre (TED) sincronizado exitosamente.")
@@ -965,8 +965,8 @@ def regenerar_xml_dte(request, dte_id):
             return redirect_to_dte_list(request)
         try:
             from facturacion_electronica.dte_generator import DTEXMLGenerator
-            from facturacion_electronica.firma_electronica import FirmadorDTE
-            from facturacion_electronica.pdf417_generator import PDF417Generator
+            from facturacion_electronica.firma_electronica import obtener_firmador_empresa
+            from facturacion_electronica.timbre_pdf417 import programar_timbre_pdf417
 
             detalles = transferencia.detalles.all()
             subtotal = sum(detalle.total for detalle in detalles)
@@ -999,10 +999,7 @@ def regenerar_xml_dte(request, dte_id):
             generator = DTEXMLGenerator(request.empresa, venta_wrapper, '52', dte.folio, dte.caf_utilizado)
             xml_sin_firmar = generator.generar_xml()
 
-            firmador = FirmadorDTE(
-                request.empresa.certificado_digital.path,
-                request.empresa.password_certificado
-            )
+            firmador = obtener_firmador_empresa(request.empresa)
             xml_firmado = firmador.firmar_xml(xml_sin_firmar)
 
             ted_xml = None
@@ -1017,13 +1014,6 @@ def regenerar_xml_dte(request, dte_id):
                     pass
             if not ted_xml:
                 dte_service = DTEService(request.empresa)
-                datos_caf = {}
-                try:
-                    datos_parsed = dte_service._parsear_datos_caf(dte.caf_utilizado)
-                    datos_caf = {'modulo': datos_parsed.get('M', ''), 'exponente': datos_parsed.get('E', '')}
-                except Exception:
-                    datos_caf = {'modulo': 'ERROR', 'exponente': 'ERROR'}
-                caf = dte.caf_utilizado
                 dte_data = {
                     'rut_emisor': request.empresa.rut,
                     'tipo_dte': '52',
@@ -1034,17 +1024,7 @@ def regenerar_xml_dte(request, dte_id):
                     'monto_total': int(total),
                     'item_1': 'Guía de Despacho Electrónica',
                 }
-                caf_data = {
-                    'rut_emisor': request.empresa.rut,
-                    'razon_social': request.empresa.razon_social_sii or request.empresa.razon_social,
-                    'tipo_documento': '52',
-                    'folio_desde': caf.folio_desde,
-                    'folio_hasta': caf.folio_hasta,
-                    'fecha_autorizacion': caf.fecha_autorizacion.strftime('%Y-%m-%d'),
-                    'modulo': datos_caf.get('modulo', ''),
-                    'exponente': datos_caf.get('exponente', ''),
-                    'firma': caf.firma_electronica,
-                }
+                caf_data = dte_service._datos_caf_ted(dte.caf_utilizado, '52')
                 ted_xml = firmador.generar_ted(dte_data, caf_data)
 
             pdf417_data = firmador.generar_datos_pdf417(ted_xml)
@@ -1056,7 +1036,7 @@ def regenerar_xml_dte(request, dte_id):
             dte.error_envio = ''
             dte.track_id = ''
             dte.save()
-            PDF417Generator.guardar_pdf417_en_dte(dte)
+            programar_timbre_pdf417(dte)
             messages.success(request, f'XML de la Guía folio {dte.folio} regenerado correctamente. Ya puede enviarla al SII.')
         except Exception as e:
             messages.error(request, f'Error al regenerar XML de la guía: {str(e)}')
@@ -1103,10 +1083,10 @@ def enviar_gdexpress_directo(request, dte_id):
 @requiere_empresa
 def sincronizar_pendientes_sii(request):
     """
-    Envía todos los DTEs pendientes al SII en segundo plano usando BackgroundDTESender.
+    Envía todos los DTEs pendientes al SII en segundo plano (cola persistente de cola_envio).
     Se puede llamar vía GET (redirección) o vía AJAX (JSON).
     """
-    from .background_sender import get_background_sender
+    from .cola_envio import encolar_multiples
     
     # Obtener DTEs pendientes de la empresa
     dtes_pendientes = DocumentoTributarioElectronico.objects.filter(
@@ -1117,9 +1097,8 @@ def sincronizar_pendientes_sii(request):
     count = dtes_pendientes.count()
     
     if count > 0:
-        sender = get_background_sender()
         dtes_ids = list(dtes_pendientes.values_list('id', flat=True))
-        sender.enviar_multiples(dtes_ids, request.empresa.id)
+        encolar_multiples(dtes_ids, request.empresa.id)
         
         msg = f'Se han encolado {count} documentos para envío al SII en segundo plano.'
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
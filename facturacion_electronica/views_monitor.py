@@ -3,10 +3,11 @@ Vista para monitorear DTEs pendientes de envío
 """
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.db.models import Count
 from django.http import JsonResponse
 from empresas.decorators import requiere_empresa
 from .models import DocumentoTributarioElectronico
-from .background_sender import get_background_sender
+from .cola_envio import encolar_dte, encolar_multiples, metricas_envio
 
 
 @login_required
@@ -19,11 +20,10 @@ def monitor_envios(request):
     dtes_pendientes = DocumentoTributarioElectronico.objects.filter(
         empresa=request.empresa,
         estado_sii__in=['pendiente', 'enviando', 'generado']
-    ).select_related('venta').order_by('-fecha_emision')[:50]
+    ).select_related('venta', 'envio_en_cola').order_by('-fecha_emision')[:50]
     
-    # Obtener estadísticas del sender
-    sender = get_background_sender()
-    stats = sender.get_stats()
+    # Estado de la cola y métricas de envío (throughput / latencias)
+    stats = metricas_envio(request.empresa)
     
     context = {
         'dtes_pendientes': dtes_pendientes,
@@ -46,8 +46,7 @@ def reenviar_dte(request, dte_id):
         )
         
         # Agregar a la cola de envío
-        sender = get_background_sender()
-        if sender.enviar_dte(dte.id, request.empresa.id):
+        if encolar_dte(dte.id, request.empresa.id):
             return JsonResponse({
                 'success': True,
                 'message': f'DTE {dte.folio} agregado a la cola de envío'
@@ -86,8 +85,7 @@ def reenviar_multiples(request):
         dte_ids = list(dtes_pendientes.values_list('id', flat=True))
         
         # Agregar a la cola
-        sender = get_background_sender()
-        count = sender.enviar_multiples(dte_ids, request.empresa.id)
+        count = encolar_multiples(dte_ids, request.empresa.id)
         
         return JsonResponse({
             'success': True,
@@ -107,17 +105,17 @@ def stats_envios(request):
     """
     Retorna estadísticas de envíos en formato JSON (para AJAX)
     """
-    sender = get_background_sender()
-    stats = sender.get_stats()
+    stats = metricas_envio(request.empresa)
     
-    # Contar DTEs por estado
-    dtes_por_estado = {}
-    for estado in ['pendiente', 'enviando', 'enviado', 'generado']:
-        count = DocumentoTributarioElectronico.objects.filter(
+    # Contar DTEs por estado (una sola consulta agrupada)
+    estados = ['pendiente', 'enviando', 'enviado', 'generado']
+    dtes_por_estado = dict.fromkeys(estados, 0)
+    dtes_por_estado.update(
+        DocumentoTributarioElectronico.objects.filter(
             empresa=request.empresa,
-            estado_sii=estado
-        ).count()
-        dtes_por_estado[estado] = count
+            estado_sii__in=estados
+        ).order_by().values_list('estado_sii').annotate(total=Count('id'))
+    )
     
     return JsonResponse({
         'success': True,
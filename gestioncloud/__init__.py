@@ -14,3 +14,9 @@ if 'cgi' not in sys.modules:
         sys.modules['cgi'] = cgi
     except ImportError:
         pass
+
+# Aplicación Celery (tareas en segundo plano, ver informes.tasks)
+try:
+    from .celery import app as celery_app
+except ImportError:
+    celery_app = None
@@ -0,0 +1,19 @@
+"""
+Aplicación Celery de GestionCloud.
+
+Sólo se usa cuando EXPORTACIONES_MODO='celery' o DTE_ENVIO_MODO='celery'.
+Iniciar el worker con:
+    celery -A gestioncloud worker -l info
+y, con DTE_ENVIO_MODO='celery', el planificador que drena la cola de envío
+de DTEs (CELERY_BEAT_SCHEDULE):
+    celery -A gestioncloud beat -l info
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gestioncloud.settings')
+
+app = Celery('gestioncloud')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
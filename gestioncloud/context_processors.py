@@ -3,7 +3,7 @@ Context processors globales para GestionCloud
 """
 from django.conf import settings
 
-from empresas.models import Empresa
+from empresas import tenant
 
 def global_context(request):
 	"""
@@ -14,8 +14,8 @@ def global_context(request):
 	# Usar sucursal del middleware (si existe), sino usar la principal
 	sucursal_activa = getattr(request, 'sucursal_activa', None)
 	if sucursal_activa is None and empresa is not None:
-		# Fallback: Sucursal principal o la primera disponible
-		sucursal_activa = empresa.sucursales.filter(es_principal=True).first() or empresa.sucursales.first()
+		# Fallback: Sucursal principal o la primera disponible (cacheadas, ver empresas.tenant)
+		sucursal_activa = tenant.sucursal_por_defecto(empresa)
 
 	return {
 		'APP_NAME': 'GestionCloud',
@@ -303,3 +303,53 @@ if not DEBUG:
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'no-reply@gestioncloud.cl'
 
+# Exportaciones en segundo plano (informes.trabajos)
+# 'local': hilo en el mismo proceso (un solo nodo) | 'celery': worker de Celery | 'eager': dentro de la petición
+EXPORTACIONES_MODO = config('EXPORTACIONES_MODO', default='local')
+# Segundos sin latido tras los cuales una exportación en proceso se da por detenida (informes.trabajos)
+EXPORTACIONES_PLAZO = config('EXPORTACIONES_PLAZO', default=600, cast=int)
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
+CELERY_TASK_IGNORE_RESULT = True
+
+# Cola persistente de envío de DTEs (facturacion_electronica.cola_envio)
+# 'local': hilos en cada proceso web | 'celery': worker de Celery | 'externo': comando procesar_cola_dte
+DTE_ENVIO_MODO = config('DTE_ENVIO_MODO', default='local')
+DTE_ENVIO_WORKERS = config('DTE_ENVIO_WORKERS', default=2, cast=int)
+# Plazo (segundos) de un envío tomado por un worker; se renueva mientras el proveedor responde
+DTE_ENVIO_BLOQUEO = config('DTE_ENVIO_BLOQUEO', default=300, cast=int)
+# Celery beat: drena periódicamente los envíos DTE pendientes (reinicios, reintentos, lotes por tiempo)
+# y revisa las exportaciones detenidas
+CELERY_BEAT_SCHEDULE = {
+	'procesar-cola-envios-dte': {
+		'task': 'facturacion_electronica.procesar_cola_envios_dte',
+		'schedule': config('DTE_ENVIO_BEAT_INTERVALO', default=30, cast=int),
+	},
+	'revisar-exportaciones-detenidas': {
+		'task': 'informes.revisar_exportaciones_detenidas',
+		'schedule': 300,
+	},
+}
+# Empresas sin DTEBox: lotes EnvioDTE/EnvioBOLETA directo al SII (facturacion_electronica.envio_lotes)
+DTE_ENVIO_SII_LOTES = config('DTE_ENVIO_SII_LOTES', default=True, cast=bool)
+SII_LOTE_MAX_DOCUMENTOS = config('SII_LOTE_MAX_DOCUMENTOS', default=500, cast=int)
+SII_LOTE_ESPERA = config('SII_LOTE_ESPERA', default=30, cast=int)
+# Conciliación de estados (facturacion_electronica.conciliacion_estados): hilos y consultas por segundo por proveedor
+DTE_CONCILIACION_HILOS = config('DTE_CONCILIACION_HILOS', default=8, cast=int)
+DTE_CONCILIACION_INTERVALO = config('DTE_CONCILIACION_INTERVALO', default=15, cast=int)  # minutos entre consultas de un DTE
+DTE_CONCILIACION_TASA = {
+    'sii': config('DTE_CONCILIACION_TASA_SII', default=4, cast=float),
+    'dtebox': config('DTE_CONCILIACION_TASA_DTEBOX', default=10, cast=float),
+}
+# Folios reservados por bloque para cada estación del POS (facturacion_electronica.asignador_folios); 1 = sin bloques
+DTE_BLOQUE_FOLIOS = {
+    '39': config('DTE_BLOQUE_FOLIOS_BOLETA', default=10, cast=int),
+    '41': config('DTE_BLOQUE_FOLIOS_BOLETA', default=10, cast=int),
+}
+# Segundos sin uso tras los cuales otra estación puede tomar un bloque de folios activo (estación caída, caja sin cerrar)
+DTE_BLOQUE_FOLIOS_PLAZO = config('DTE_BLOQUE_FOLIOS_PLAZO', default=4 * 60 * 60, cast=int)
+# Hilos que generan las imágenes PDF417 del timbre cuando no se usa Celery (facturacion_electronica.timbre_pdf417)
+DTE_TIMBRE_HILOS = config('DTE_TIMBRE_HILOS', default=2, cast=int)
+# Veces que una vista de impresión se recarga esperando el timbre antes de mostrar el placeholder
+DTE_TIMBRE_REINTENTOS = config('DTE_TIMBRE_REINTENTOS', default=3, cast=int)
+# Segundos entre esos reintentos
+DTE_TIMBRE_REINTENTO_SEGUNDOS = config('DTE_TIMBRE_REINTENTO_SEGUNDOS', default=1, cast=int)
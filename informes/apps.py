@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class InformesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "informes"
+
+    def ready(self):
+        """Importar señales cuando la app esté lista"""
+        import informes.signals
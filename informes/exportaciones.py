@@ -2,21 +2,18 @@
 Funciones de exportación para informes
 """
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
 from django.db.models import Sum, Count, Avg, F, Q
-from django.db.models.functions import Cast
 from datetime import datetime, timedelta
 from decimal import Decimal
 
 from core.decorators import requiere_empresa
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 
 from ventas.models import Venta
 from inventario.models import Stock
 from tesoreria.models import DocumentoCliente, PagoDocumentoCliente
 from caja.models import AperturaCaja
 from documentos.models import DocumentoCompra
+from .exportador_excel import Columna, ExportacionExcel, FORMATO_MONEDA, FORMATO_PORCENTAJE, iterar
 
 
 @login_required
@@ -28,53 +25,36 @@ def exportar_cuentas_cobrar_excel(request):
         estado_pago__in=['pendiente', 'parcial']
     ).select_related('cliente').order_by('fecha_vencimiento')
     
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Cuentas por Cobrar"
-    
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    
-    ws['A1'] = f"Cuentas por Cobrar - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    
-    headers = ['N° Documento', 'Cliente', 'Fecha Emisión', 'Fecha Vencimiento', 'Total', 'Pagado', 'Saldo', 'Estado']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=3, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    row = 4
-    for doc in documentos:
-        ws.cell(row=row, column=1, value=doc.numero_documento).border = border
-        ws.cell(row=row, column=2, value=doc.cliente.nombre if doc.cliente else 'Sin cliente').border = border
-        ws.cell(row=row, column=3, value=doc.fecha_emision.strftime('%d/%m/%Y')).border = border
-        ws.cell(row=row, column=4, value=doc.fecha_vencimiento.strftime('%d/%m/%Y')).border = border
-        ws.cell(row=row, column=5, value=float(doc.total)).border = border
-        ws.cell(row=row, column=5).number_format = '$#,##0'
-        ws.cell(row=row, column=6, value=float(doc.monto_pagado)).border = border
-        ws.cell(row=row, column=6).number_format = '$#,##0'
-        ws.cell(row=row, column=7, value=float(doc.saldo_pendiente)).border = border
-        ws.cell(row=row, column=7).number_format = '$#,##0'
-        ws.cell(row=row, column=8, value=doc.get_estado_pago_display()).border = border
-        row += 1
-    
-    ws.column_dimensions['A'].width = 18
-    ws.column_dimensions['B'].width = 35
-    ws.column_dimensions['C'].width = 15
-    ws.column_dimensions['D'].width = 15
-    ws.column_dimensions['E'].width = 15
-    ws.column_dimensions['F'].width = 15
-    ws.column_dimensions['G'].width = 15
-    ws.column_dimensions['H'].width = 12
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=cuentas_por_cobrar.xlsx'
-    wb.save(response)
-    return response
+    excel = ExportacionExcel(
+        "Cuentas por Cobrar",
+        f"Cuentas por Cobrar - {request.empresa.nombre}",
+        [
+            Columna('N° Documento', 18),
+            Columna('Cliente', 35),
+            Columna('Fecha Emisión', 15),
+            Columna('Fecha Vencimiento', 15),
+            Columna('Total', 15, FORMATO_MONEDA),
+            Columna('Pagado', 15, FORMATO_MONEDA),
+            Columna('Saldo', 15, FORMATO_MONEDA),
+            Columna('Estado', 12),
+        ],
+    )
+    
+    excel.filas(
+        [
+            doc.numero_documento,
+            doc.cliente.nombre if doc.cliente else 'Sin cliente',
+            doc.fecha_emision.strftime('%d/%m/%Y'),
+            doc.fecha_vencimiento.strftime('%d/%m/%Y'),
+            float(doc.total),
+            float(doc.monto_pagado),
+            float(doc.saldo_pendiente),
+            doc.get_estado_pago_display(),
+        ]
+        for doc in iterar(documentos)
+    )
+    
+    return excel.respuesta('cuentas_por_cobrar.xlsx')
 
 
 @login_required
@@ -92,50 +72,35 @@ def exportar_pagos_recibidos_excel(request):
         fecha_hasta = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
     
     pagos = PagoDocumentoCliente.objects.filter(
-        empresa=request.empresa,
+        documento__empresa=request.empresa,
         fecha_pago__range=[fecha_desde, fecha_hasta]
-    ).select_related('documento__cliente', 'forma_pago').order_by('-fecha_pago')
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Pagos Recibidos"
-    
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    
-    ws['A1'] = f"Pagos Recibidos - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A2'] = f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}"
-    
-    headers = ['Fecha', 'N° Documento', 'Cliente', 'Monto', 'Forma de Pago']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=4, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    row = 5
-    for pago in pagos:
-        ws.cell(row=row, column=1, value=pago.fecha_pago.strftime('%d/%m/%Y')).border = border
-        ws.cell(row=row, column=2, value=pago.documento.numero_documento).border = border
-        ws.cell(row=row, column=3, value=pago.documento.cliente.nombre if pago.documento.cliente else 'Sin cliente').border = border
-        ws.cell(row=row, column=4, value=float(pago.monto)).border = border
-        ws.cell(row=row, column=4).number_format = '$#,##0'
-        ws.cell(row=row, column=5, value=pago.forma_pago.nombre if pago.forma_pago else 'Sin especificar').border = border
-        row += 1
-    
-    ws.column_dimensions['A'].width = 12
-    ws.column_dimensions['B'].width = 18
-    ws.column_dimensions['C'].width = 35
-    ws.column_dimensions['D'].width = 15
-    ws.column_dimensions['E'].width = 20
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename=pagos_recibidos_{fecha_desde}_{fecha_hasta}.xlsx'
-    wb.save(response)
-    return response
+    ).select_related('documento__cliente').order_by('-fecha_pago')
+    
+    excel = ExportacionExcel(
+        "Pagos Recibidos",
+        f"Pagos Recibidos - {request.empresa.nombre}",
+        [
+            Columna('Fecha', 12),
+            Columna('N° Documento', 18),
+            Columna('Cliente', 35),
+            Columna('Monto', 15, FORMATO_MONEDA),
+            Columna('Forma de Pago', 20),
+        ],
+        subtitulo=f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}",
+    )
+    
+    excel.filas(
+        [
+            pago.fecha_pago.strftime('%d/%m/%Y'),
+            pago.documento.numero_documento,
+            pago.documento.cliente.nombre if pago.documento.cliente else 'Sin cliente',
+            float(pago.monto),
+            pago.forma_pago or 'Sin especificar',
+        ]
+        for pago in iterar(pagos)
+    )
+    
+    return excel.respuesta(f'pagos_recibidos_{fecha_desde}_{fecha_hasta}.xlsx')
 
 
 @login_required
@@ -147,47 +112,32 @@ def exportar_stock_bajo_excel(request):
         cantidad__lte=F('stock_minimo')
     ).select_related('articulo', 'bodega').order_by('cantidad')
     
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Stock Bajo"
-    
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    
-    ws['A1'] = f"Productos con Stock Bajo - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    
-    headers = ['Código', 'Artículo', 'Bodega', 'Stock Actual', 'Stock Mínimo', 'Diferencia']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=3, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    row = 4
-    for stock in stocks_bajo:
-        diferencia = float(stock.stock_minimo - stock.cantidad)
-        ws.cell(row=row, column=1, value=stock.articulo.codigo).border = border
-        ws.cell(row=row, column=2, value=stock.articulo.nombre).border = border
-        ws.cell(row=row, column=3, value=stock.bodega.nombre).border = border
-        ws.cell(row=row, column=4, value=float(stock.cantidad)).border = border
-        ws.cell(row=row, column=5, value=float(stock.stock_minimo)).border = border
-        ws.cell(row=row, column=6, value=diferencia).border = border
-        row += 1
-    
-    ws.column_dimensions['A'].width = 15
-    ws.column_dimensions['B'].width = 40
-    ws.column_dimensions['C'].width = 25
-    ws.column_dimensions['D'].width = 15
-    ws.column_dimensions['E'].width = 15
-    ws.column_dimensions['F'].width = 15
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=stock_bajo.xlsx'
-    wb.save(response)
-    return response
+    excel = ExportacionExcel(
+        "Stock Bajo",
+        f"Productos con Stock Bajo - {request.empresa.nombre}",
+        [
+            Columna('Código', 15),
+            Columna('Artículo', 40),
+            Columna('Bodega', 25),
+            Columna('Stock Actual', 15),
+            Columna('Stock Mínimo', 15),
+            Columna('Diferencia', 15),
+        ],
+    )
+    
+    excel.filas(
+        [
+            stock.articulo.codigo,
+            stock.articulo.nombre,
+            stock.bodega.nombre,
+            float(stock.cantidad),
+            float(stock.stock_minimo),
+            float(stock.stock_minimo - stock.cantidad),
+        ]
+        for stock in iterar(stocks_bajo)
+    )
+    
+    return excel.respuesta('stock_bajo.xlsx')
 
 
 @login_required
@@ -210,61 +160,73 @@ def exportar_cierres_caja_excel(request):
         estado='cerrada'
     ).select_related('caja', 'usuario_apertura', 'usuario_cierre').order_by('-fecha_apertura')
     
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Cierres de Caja"
-    
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    
-    ws['A1'] = f"Cierres de Caja - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A2'] = f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}"
-    
-    headers = ['Caja', 'Fecha Apertura', 'Fecha Cierre', 'Monto Inicial', 'Total Ventas', 'Monto Final', 'Diferencia']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=4, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    row = 5
-    for cierre in cierres:
-        ws.cell(row=row, column=1, value=cierre.caja.nombre).border = border
-        ws.cell(row=row, column=2, value=cierre.fecha_apertura.strftime('%d/%m/%Y %H:%M')).border = border
-        ws.cell(row=row, column=3, value=cierre.fecha_cierre.strftime('%d/%m/%Y %H:%M') if cierre.fecha_cierre else '').border = border
-        ws.cell(row=row, column=4, value=float(cierre.monto_inicial)).border = border
-        ws.cell(row=row, column=4).number_format = '$#,##0'
-        ws.cell(row=row, column=5, value=float(cierre.total_ventas)).border = border
-        ws.cell(row=row, column=5).number_format = '$#,##0'
-        ws.cell(row=row, column=6, value=float(cierre.monto_cierre)).border = border
-        ws.cell(row=row, column=6).number_format = '$#,##0'
-        ws.cell(row=row, column=7, value=float(cierre.diferencia)).border = border
-        ws.cell(row=row, column=7).number_format = '$#,##0'
-        row += 1
-    
-    ws.column_dimensions['A'].width = 20
-    ws.column_dimensions['B'].width = 18
-    ws.column_dimensions['C'].width = 18
-    ws.column_dimensions['D'].width = 15
-    ws.column_dimensions['E'].width = 15
-    ws.column_dimensions['F'].width = 15
-    ws.column_dimensions['G'].width = 15
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename=cierres_caja_{fecha_desde}_{fecha_hasta}.xlsx'
-    wb.save(response)
-    return response
+    excel = ExportacionExcel(
+        "Cierres de Caja",
+        f"Cierres de Caja - {request.empresa.nombre}",
+        [
+            Columna('Caja', 20),
+            Columna('Fecha Apertura', 18),
+            Columna('Fecha Cierre', 18),
+            Columna('Monto Inicial', 15, FORMATO_MONEDA),
+            Columna('Total Ventas', 15, FORMATO_MONEDA),
+            Columna('Monto Final', 15, FORMATO_MONEDA),
+            Columna('Diferencia', 15, FORMATO_MONEDA),
+        ],
+        subtitulo=f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}",
+    )
+    
+    excel.filas(
+        [
+            cierre.caja.nombre,
+            cierre.fecha_apertura.strftime('%d/%m/%Y %H:%M'),
+            cierre.fecha_cierre.strftime('%d/%m/%Y %H:%M') if cierre.fecha_cierre else '',
+            float(cierre.monto_inicial),
+            float(cierre.total_ventas),
+            float(cierre.monto_cierre),
+            float(cierre.diferencia),
+        ]
+        for cierre in iterar(cierres)
+    )
+    
+    return excel.respuesta(f'cierres_caja_{fecha_desde}_{fecha_hasta}.xlsx')
+
+
+def _exportar_utilidad(excel, ventas_query, columnas_item, col_ventas):
+    """
+    Escribe filas de utilidad (ventas, costo, utilidad, margen) acumulando los
+    totales mientras se recorre el queryset, y agrega la fila de TOTALES.
+    col_ventas es la posición (base 0) de la columna Total Ventas.
+    """
+    totales = {'ventas': 0, 'costos': 0, 'filas': 0}
+    
+    def filas():
+        for item in iterar(ventas_query):
+            ventas = float(item['total_ventas'] or 0)
+            costo = float(item['total_costo'] or 0)
+            utilidad = ventas - costo
+            margen = (utilidad / ventas * 100) if ventas > 0 else 0
+            
+            totales['ventas'] += ventas
+            totales['costos'] += costo
+            totales['filas'] += 1
+            yield columnas_item(item) + [ventas, costo, utilidad, margen]
+    
+    excel.filas(filas())
+    
+    if totales['filas']:
+        total_ventas = totales['ventas']
+        total_costos = totales['costos']
+        margen_total = ((total_ventas - total_costos) / total_ventas * 100) if total_ventas > 0 else 0
+        excel.total(
+            ['TOTALES'] + [None] * (col_ventas - 1)
+            + [total_ventas, total_costos, total_ventas - total_costos, margen_total]
+        )
 
 
 @login_required
 @requiere_empresa
 def exportar_utilidad_familias_excel(request):
     """Exportar utilidad por familias a Excel"""
-    from articulos.models import CategoriaArticulo
-    
     fecha_desde = request.GET.get('fecha_desde')
     fecha_hasta = request.GET.get('fecha_hasta')
     familia_id = request.GET.get('familia')
@@ -278,8 +240,6 @@ def exportar_utilidad_familias_excel(request):
     
     # Query de ventas por familia
     from ventas.models import VentaDetalle
-    from django.db.models import F
-    
     from django.db.models import DecimalField as DField
     
     ventas_query = VentaDetalle.objects.filter(
@@ -291,7 +251,7 @@ def exportar_utilidad_familias_excel(request):
         'articulo__categoria__nombre'
     ).annotate(
         total_ventas=Sum(F('cantidad') * F('precio_unitario'), output_field=DField(max_digits=20, decimal_places=2)),
-        total_costo=Sum(F('cantidad') * Cast(F('articulo__precio_costo'), DField(max_digits=20, decimal_places=2)), output_field=DField(max_digits=20, decimal_places=2)),
+        total_costo=Sum(F('cantidad') * F('articulo__precio_costo'), output_field=DField(max_digits=20, decimal_places=2)),
         cantidad_vendida=Sum('cantidad'),
         num_ventas=Count('venta', distinct=True)
     )
@@ -301,82 +261,29 @@ def exportar_utilidad_familias_excel(request):
     
     ventas_query = ventas_query.order_by('-total_ventas')
     
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Utilidad por Familias"
-    
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    
-    ws['A1'] = f"Utilidad por Familias - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A2'] = f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}"
-    
-    headers = ['Familia', 'Cant. Vendida', 'N° Ventas', 'Total Ventas', 'Total Costos', 'Utilidad', 'Margen %']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=4, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    row = 5
-    total_ventas = 0
-    total_costos = 0
-    
-    for item in ventas_query:
-        ventas = float(item['total_ventas'] or 0)
-        costo = float(item['total_costo'] or 0)
-        utilidad = ventas - costo
-        margen = (utilidad / ventas * 100) if ventas > 0 else 0
-        
-        ws.cell(row=row, column=1, value=item['articulo__categoria__nombre']).border = border
-        ws.cell(row=row, column=2, value=float(item['cantidad_vendida'])).border = border
-        ws.cell(row=row, column=3, value=item['num_ventas']).border = border
-        ws.cell(row=row, column=4, value=ventas).border = border
-        ws.cell(row=row, column=4).number_format = '$#,##0'
-        ws.cell(row=row, column=5, value=costo).border = border
-        ws.cell(row=row, column=5).number_format = '$#,##0'
-        ws.cell(row=row, column=6, value=utilidad).border = border
-        ws.cell(row=row, column=6).number_format = '$#,##0'
-        ws.cell(row=row, column=7, value=margen).border = border
-        ws.cell(row=row, column=7).number_format = '0.0"%"'
-        
-        total_ventas += ventas
-        total_costos += costo
-        row += 1
+    excel = ExportacionExcel(
+        "Utilidad por Familias",
+        f"Utilidad por Familias - {request.empresa.nombre}",
+        [
+            Columna('Familia', 35),
+            Columna('Cant. Vendida', 15),
+            Columna('N° Ventas', 12),
+            Columna('Total Ventas', 18, FORMATO_MONEDA),
+            Columna('Total Costos', 18, FORMATO_MONEDA),
+            Columna('Utilidad', 18, FORMATO_MONEDA),
+            Columna('Margen %', 12, FORMATO_PORCENTAJE),
+        ],
+        subtitulo=f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}",
+    )
     
-    # Totales
-    if row > 5:
-        ws.cell(row=row, column=1, value='TOTALES').border = border
-        ws.cell(row=row, column=1).font = Font(bold=True)
-        ws.cell(row=row, column=4, value=total_ventas).border = border
-        ws.cell(row=row, column=4).number_format = '$#,##0'
-        ws.cell(row=row, column=4).font = Font(bold=True)
-        ws.cell(row=row, column=5, value=total_costos).border = border
-        ws.cell(row=row, column=5).number_format = '$#,##0'
-        ws.cell(row=row, column=5).font = Font(bold=True)
-        ws.cell(row=row, column=6, value=total_ventas - total_costos).border = border
-        ws.cell(row=row, column=6).number_format = '$#,##0'
-        ws.cell(row=row, column=6).font = Font(bold=True)
-        margen_total = ((total_ventas - total_costos) / total_ventas * 100) if total_ventas > 0 else 0
-        ws.cell(row=row, column=7, value=margen_total).border = border
-        ws.cell(row=row, column=7).number_format = '0.0"%"'
-        ws.cell(row=row, column=7).font = Font(bold=True)
-    
-    ws.column_dimensions['A'].width = 35
-    ws.column_dimensions['B'].width = 15
-    ws.column_dimensions['C'].width = 12
-    ws.column_dimensions['D'].width = 18
-    ws.column_dimensions['E'].width = 18
-    ws.column_dimensions['F'].width = 18
-    ws.column_dimensions['G'].width = 12
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename=utilidad_familias_{fecha_desde}_{fecha_hasta}.xlsx'
-    wb.save(response)
-    return response
+    _exportar_utilidad(
+        excel,
+        ventas_query,
+        lambda item: [item['articulo__categoria__nombre'], float(item['cantidad_vendida']), item['num_ventas']],
+        col_ventas=3,
+    )
+    
+    return excel.respuesta(f'utilidad_familias_{fecha_desde}_{fecha_hasta}.xlsx')
 
 
 @login_required
@@ -395,125 +302,89 @@ def exportar_compras_periodo_excel(request):
     
     compras = DocumentoCompra.objects.filter(
         empresa=request.empresa,
-        fecha__range=[fecha_desde, fecha_hasta]
-    ).select_related('proveedor').order_by('-fecha')
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Compras"
-    
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    
-    ws['A1'] = f"Compras por Período - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A2'] = f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}"
-    
-    headers = ['Fecha', 'N° Documento', 'Proveedor', 'Tipo', 'Neto', 'IVA', 'Total']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=4, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    row = 5
-    for compra in compras:
-        ws.cell(row=row, column=1, value=compra.fecha.strftime('%d/%m/%Y')).border = border
-        ws.cell(row=row, column=2, value=compra.numero_documento).border = border
-        ws.cell(row=row, column=3, value=compra.proveedor.nombre if compra.proveedor else 'Sin proveedor').border = border
-        ws.cell(row=row, column=4, value=compra.get_tipo_documento_display()).border = border
-        ws.cell(row=row, column=5, value=float(compra.neto)).border = border
-        ws.cell(row=row, column=5).number_format = '$#,##0'
-        ws.cell(row=row, column=6, value=float(compra.iva)).border = border
-        ws.cell(row=row, column=6).number_format = '$#,##0'
-        ws.cell(row=row, column=7, value=float(compra.total_documento)).border = border
-        ws.cell(row=row, column=7).number_format = '$#,##0'
-        row += 1
-    
-    ws.column_dimensions['A'].width = 12
-    ws.column_dimensions['B'].width = 18
-    ws.column_dimensions['C'].width = 35
-    ws.column_dimensions['D'].width = 15
-    ws.column_dimensions['E'].width = 15
-    ws.column_dimensions['F'].width = 15
-    ws.column_dimensions['G'].width = 15
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename=compras_{fecha_desde}_{fecha_hasta}.xlsx'
-    wb.save(response)
-    return response
+        fecha_emision__range=[fecha_desde, fecha_hasta]
+    ).select_related('proveedor').order_by('-fecha_emision')
+    
+    excel = ExportacionExcel(
+        "Compras",
+        f"Compras por Período - {request.empresa.nombre}",
+        [
+            Columna('Fecha', 12),
+            Columna('N° Documento', 18),
+            Columna('Proveedor', 35),
+            Columna('Tipo', 15),
+            Columna('Neto', 15, FORMATO_MONEDA),
+            Columna('IVA', 15, FORMATO_MONEDA),
+            Columna('Total', 15, FORMATO_MONEDA),
+        ],
+        subtitulo=f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}",
+    )
+    
+    excel.filas(
+        [
+            compra.fecha_emision.strftime('%d/%m/%Y'),
+            compra.numero_documento,
+            compra.proveedor.nombre if compra.proveedor else 'Sin proveedor',
+            compra.get_tipo_documento_display(),
+            float(compra.neto_ajustado),
+            float(compra.iva_ajustado),
+            float(compra.total_documento),
+        ]
+        for compra in iterar(compras)
+    )
+    
+    return excel.respuesta(f'compras_{fecha_desde}_{fecha_hasta}.xlsx')
 
 
 @login_required
 @requiere_empresa
 def exportar_categorias_excel(request):
     """Exportar categorías a Excel"""
-    from articulos.models import Categoria
+    from articulos.models import CategoriaArticulo
     
-    categorias = Categoria.objects.filter(
+    categorias = CategoriaArticulo.objects.filter(
         empresa=request.empresa
     ).annotate(
-        total_articulos=Count('articulos')
+        total_articulos=Count('articulo')
     ).order_by('nombre')
     
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Categorías"
-    
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    
-    ws['A1'] = f"Categorías - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A2'] = f"Fecha: {datetime.now().strftime('%d/%m/%Y %H:%M')}"
-    
-    headers = ['Código', 'Nombre', 'Descripción', 'Total Artículos', 'Estado']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=4, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    row = 5
-    for categoria in categorias:
-        ws.cell(row=row, column=1, value=categoria.codigo).border = border
-        ws.cell(row=row, column=2, value=categoria.nombre).border = border
-        ws.cell(row=row, column=3, value=categoria.descripcion or '').border = border
-        ws.cell(row=row, column=4, value=categoria.total_articulos).border = border
-        ws.cell(row=row, column=4).alignment = Alignment(horizontal='center')
-        ws.cell(row=row, column=5, value='Activa' if categoria.activo else 'Inactiva').border = border
-        ws.cell(row=row, column=5).alignment = Alignment(horizontal='center')
-        row += 1
+    excel = ExportacionExcel(
+        "Categorías",
+        f"Categorías - {request.empresa.nombre}",
+        [
+            Columna('Código', 12),
+            Columna('Nombre', 30),
+            Columna('Descripción', 40),
+            Columna('Total Artículos', 18, centrado=True),
+            Columna('Estado', 12, centrado=True),
+        ],
+        subtitulo=f"Fecha: {datetime.now().strftime('%d/%m/%Y %H:%M')}",
+    )
+    
+    total_categorias = 0
+    for categoria in iterar(categorias):
+        excel.fila([
+            categoria.codigo,
+            categoria.nombre,
+            categoria.descripcion or '',
+            categoria.total_articulos,
+            'Activa' if categoria.activa else 'Inactiva',
+        ])
+        total_categorias += 1
     
     # Totales
-    row += 1
-    ws.cell(row=row, column=1, value='TOTAL CATEGORÍAS:').font = Font(bold=True)
-    ws.cell(row=row, column=2, value=categorias.count()).font = Font(bold=True)
-    
-    ws.column_dimensions['A'].width = 12
-    ws.column_dimensions['B'].width = 30
-    ws.column_dimensions['C'].width = 40
-    ws.column_dimensions['D'].width = 18
-    ws.column_dimensions['E'].width = 12
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename=categorias_{datetime.now().strftime("%Y%m%d")}.xlsx'
-    wb.save(response)
-    return response
+    excel.espacio()
+    excel.total(['TOTAL CATEGORÍAS:', total_categorias], borde=False)
+    
+    return excel.respuesta(f'categorias_{datetime.now().strftime("%Y%m%d")}.xlsx')
 
 
 @login_required
 @requiere_empresa
 def exportar_utilidad_articulos_excel(request):
     """Exportar utilidad por artículos a Excel"""
-    from articulos.models import CategoriaArticulo
     from ventas.models import VentaDetalle
     from django.db.models import DecimalField as DField
-    from django.db.models.functions import Cast
     
     fecha_desde = request.GET.get('fecha_desde')
     fecha_hasta = request.GET.get('fecha_hasta')
@@ -537,7 +408,7 @@ def exportar_utilidad_articulos_excel(request):
         'articulo__categoria__nombre'
     ).annotate(
         total_ventas=Sum(F('cantidad') * F('precio_unitario'), output_field=DField(max_digits=20, decimal_places=2)),
-        total_costo=Sum(F('cantidad') * Cast(F('articulo__precio_costo'), DField(max_digits=20, decimal_places=2)), output_field=DField(max_digits=20, decimal_places=2)),
+        total_costo=Sum(F('cantidad') * F('articulo__precio_costo'), output_field=DField(max_digits=20, decimal_places=2)),
         cantidad_vendida=Sum('cantidad')
     )
     
@@ -546,81 +417,32 @@ def exportar_utilidad_articulos_excel(request):
     
     ventas_query = ventas_query.order_by('-total_ventas')
     
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Utilidad por Artículos"
-    
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    
-    ws['A1'] = f"Utilidad por Artículos - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A2'] = f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}"
-    
-    headers = ['Código', 'Artículo', 'Familia', 'Cant. Vendida', 'Total Ventas', 'Total Costos', 'Utilidad', 'Margen %']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=4, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    row = 5
-    total_ventas = 0
-    total_costos = 0
-    
-    for item in ventas_query:
-        ventas = float(item['total_ventas'] or 0)
-        costo = float(item['total_costo'] or 0)
-        utilidad = ventas - costo
-        margen = (utilidad / ventas * 100) if ventas > 0 else 0
-        
-        ws.cell(row=row, column=1, value=item['articulo__codigo']).border = border
-        ws.cell(row=row, column=2, value=item['articulo__nombre']).border = border
-        ws.cell(row=row, column=3, value=item['articulo__categoria__nombre'] or 'Sin Familia').border = border
-        ws.cell(row=row, column=4, value=float(item['cantidad_vendida'])).border = border
-        ws.cell(row=row, column=5, value=ventas).border = border
-        ws.cell(row=row, column=5).number_format = '$#,##0'
-        ws.cell(row=row, column=6, value=costo).border = border
-        ws.cell(row=row, column=6).number_format = '$#,##0'
-        ws.cell(row=row, column=7, value=utilidad).border = border
-        ws.cell(row=row, column=7).number_format = '$#,##0'
-        ws.cell(row=row, column=8, value=margen).border = border
-        ws.cell(row=row, column=8).number_format = '0.0"%"'
-        
-        total_ventas += ventas
-        total_costos += costo
-        row += 1
+    excel = ExportacionExcel(
+        "Utilidad por Artículos",
+        f"Utilidad por Artículos - {request.empresa.nombre}",
+        [
+            Columna('Código', 15),
+            Columna('Artículo', 40),
+            Columna('Familia', 25),
+            Columna('Cant. Vendida', 12),
+            Columna('Total Ventas', 18, FORMATO_MONEDA),
+            Columna('Total Costos', 18, FORMATO_MONEDA),
+            Columna('Utilidad', 18, FORMATO_MONEDA),
+            Columna('Margen %', 12, FORMATO_PORCENTAJE),
+        ],
+        subtitulo=f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}",
+    )
     
-    # Totales
-    if row > 5:
-        ws.cell(row=row, column=1, value='TOTALES').border = border
-        ws.cell(row=row, column=1).font = Font(bold=True)
-        ws.cell(row=row, column=5, value=total_ventas).border = border
-        ws.cell(row=row, column=5).number_format = '$#,##0'
-        ws.cell(row=row, column=5).font = Font(bold=True)
-        ws.cell(row=row, column=6, value=total_costos).border = border
-        ws.cell(row=row, column=6).number_format = '$#,##0'
-        ws.cell(row=row, column=6).font = Font(bold=True)
-        ws.cell(row=row, column=7, value=total_ventas - total_costos).border = border
-        ws.cell(row=row, column=7).number_format = '$#,##0'
-        ws.cell(row=row, column=7).font = Font(bold=True)
-        margen_total = ((total_ventas - total_costos) / total_ventas * 100) if total_ventas > 0 else 0
-        ws.cell(row=row, column=8, value=margen_total).border = border
-        ws.cell(row=row, column=8).number_format = '0.0"%"'
-        ws.cell(row=row, column=8).font = Font(bold=True)
-    
-    ws.column_dimensions['A'].width = 15
-    ws.column_dimensions['B'].width = 40
-    ws.column_dimensions['C'].width = 25
-    ws.column_dimensions['D'].width = 12
-    ws.column_dimensions['E'].width = 18
-    ws.column_dimensions['F'].width = 18
-    ws.column_dimensions['G'].width = 18
-    ws.column_dimensions['H'].width = 12
-    
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename=utilidad_articulos_{fecha_desde}_{fecha_hasta}.xlsx'
-    wb.save(response)
-    return response
+    _exportar_utilidad(
+        excel,
+        ventas_query,
+        lambda item: [
+            item['articulo__codigo'],
+            item['articulo__nombre'],
+            item['articulo__categoria__nombre'] or 'Sin Familia',
+            float(item['cantidad_vendida']),
+        ],
+        col_ventas=4,
+    )
+    
+    return excel.respuesta(f'utilidad_articulos_{fecha_desde}_{fecha_hasta}.xlsx')
@@ -0,0 +1,155 @@
+"""
+Motor de exportación a Excel en streaming.
+
+Las exportaciones construían el libro completo en memoria (Workbook normal)
+antes de responder, lo que en exportaciones de varios años disparaba el RSS
+del worker. Este motor usa openpyxl en modo write-only: cada fila se escribe
+a un archivo temporal a medida que se consume el iterable (normalmente un
+queryset con .iterator(chunk_size=...)), y el archivo resultante se envía en
+bloques con StreamingHttpResponse. La memoria usada no depende de la cantidad
+de filas.
+"""
+import tempfile
+
+from django.http import StreamingHttpResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Tamaño de los registros leídos desde la BD y de los bloques enviados al cliente
+CHUNK_QUERYSET = 2000
+CHUNK_RESPUESTA = 64 * 1024
+
+FORMATO_MONEDA = '$#,##0'
+FORMATO_PORCENTAJE = '0.0"%"'
+
+HEADER_FILL = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
+HEADER_FONT = Font(bold=True, color="FFFFFF")
+TITULO_FONT = Font(bold=True, size=14)
+TOTAL_FONT = Font(bold=True)
+BORDER = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+CENTRADO = Alignment(horizontal='center')
+
+
+class Columna:
+    """Definición de una columna del informe"""
+
+    __slots__ = ('titulo', 'ancho', 'formato', 'centrado')
+
+    def __init__(self, titulo, ancho=15, formato=None, centrado=False):
+        self.titulo = titulo
+        self.ancho = ancho
+        self.formato = formato
+        self.centrado = centrado
+
+
+def iterar(queryset, chunk_size=CHUNK_QUERYSET):
+    """Recorre un queryset sin cachear los resultados (cursor del lado del servidor en PostgreSQL)"""
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+class ExportacionExcel:
+    """
+    Hoja Excel en modo write-only con el formato estándar de los informes:
+    título (fila 1), subtítulo opcional (fila 2), una fila en blanco,
+    encabezados con fondo café y filas de datos con borde.
+    """
+
+    def __init__(self, hoja, titulo, columnas, subtitulo=None):
+        self.columnas = columnas
+        self.libro = Workbook(write_only=True)
+        self.ws = self.libro.create_sheet(title=hoja)
+
+        # En modo write-only los anchos deben definirse antes de la primera fila
+        for indice, columna in enumerate(columnas, start=1):
+            self.ws.column_dimensions[get_column_letter(indice)].width = columna.ancho
+
+        titulo_cell = WriteOnlyCell(self.ws, value=titulo)
+        titulo_cell.font = TITULO_FONT
+        self.ws.append([titulo_cell])
+        if subtitulo:
+            self.ws.append([subtitulo])
+        self.ws.append([])
+
+        encabezados = []
+        for columna in columnas:
+            cell = WriteOnlyCell(self.ws, value=columna.titulo)
+            cell.fill = HEADER_FILL
+            cell.font = HEADER_FONT
+            cell.border = BORDER
+            cell.alignment = CENTRADO
+            encabezados.append(cell)
+        self.ws.append(encabezados)
+
+    def _celda(self, valor, columna, borde=True, font=None):
+        cell = WriteOnlyCell(self.ws, value=valor)
+        if borde:
+            cell.border = BORDER
+        if columna is not None:
+            if columna.formato:
+                cell.number_format = columna.formato
+            if columna.centrado:
+                cell.alignment = CENTRADO
+        if font is not None:
+            cell.font = font
+        return cell
+
+    def fila(self, valores):
+        """Agrega una fila de datos (lista de valores en el orden de las columnas)"""
+        self.ws.append([
+            self._celda(valor, columna)
+            for valor, columna in zip(valores, self.columnas)
+        ])
+
+    def filas(self, iterable):
+        """Agrega todas las filas de un iterable sin materializarlo"""
+        for valores in iterable:
+            self.fila(valores)
+
+    def total(self, valores, borde=True):
+        """Agrega una fila de totales en negrita (None deja la celda vacía)"""
+        celdas = []
+        for valor, columna in zip(valores, self.columnas):
+            if valor is None:
+                celdas.append(None)
+            else:
+                celdas.append(self._celda(valor, columna, borde=borde, font=TOTAL_FONT))
+        self.ws.append(celdas)
+
+    def espacio(self):
+        self.ws.append([])
+
+    def archivo(self):
+        """
+        Guarda el libro en un archivo temporal y lo devuelve abierto al inicio
+        (p. ej. para un TrabajoExportacion). Se elimina al cerrarlo.
+        """
+        archivo = tempfile.TemporaryFile()
+        self.libro.save(archivo)
+        archivo.seek(0)
+        return archivo
+
+    def respuesta(self, nombre_archivo):
+        """
+        Guarda el libro en un archivo temporal y lo envía por bloques.
+        El archivo se elimina al terminar (o cortarse) la descarga.
+        """
+        archivo = self.archivo()
+        response = StreamingHttpResponse(_leer_por_bloques(archivo), content_type=CONTENT_TYPE_XLSX)
+        response['Content-Disposition'] = f'attachment; filename={nombre_archivo}'
+        return response
+
+
+def _leer_por_bloques(archivo):
+    try:
+        while True:
+            bloque = archivo.read(CHUNK_RESPUESTA)
+            if not bloque:
+                break
+            yield bloque
+    finally:
+        archivo.close()
@@ -0,0 +1,281 @@
+"""
+Mantenimiento de las tablas de hechos de ventas (VentaDiaria y VentaDiariaArticulo).
+
+Mantenimiento incremental: cuando una venta se confirma, se anula, cambia
+estando confirmada o se elimina, al confirmar la transacción se aplica sólo
+la diferencia entre su aporte actual y el que ya estaba aplicado (guardado en
+HechoVentaAplicado). Las diferencias se suman por (empresa, fecha, vendedor)
+y por (empresa, fecha, artículo) con UPDATE ... SET total = total + delta
+(expresiones F), así el costo por venta depende de sus líneas y no de las
+ventas del día. Sólo se bloquean las filas de las ventas tocadas.
+
+Aplicar es idempotente: volver a aplicar una venta sin cambios no escribe
+nada. Los lectores (dashboard BI) siempre suman las filas de hechos, por lo
+que una fila duplicada por una inserción concurrente no altera los totales.
+
+recalcular_hechos() reemplaza los hechos de un rango completo a partir de
+las ventas; lo usa el comando reconstruir_hechos_ventas para la carga
+inicial o para reparar los hechos.
+"""
+import threading
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Subquery, Sum
+
+from ventas.models import Venta, VentaDetalle
+from .models import HechoVentaAplicado, VentaDiaria, VentaDiariaArticulo
+
+
+def _ventas_confirmadas(empresa_id):
+    return Venta.objects.filter(empresa_id=empresa_id, estado='confirmada')
+
+
+def _lineas_ventas(ventas):
+    """Líneas agregadas por artículo de las ventas: {venta_id: [[articulo, categoria, cantidad, total], ...]}"""
+    lineas = defaultdict(list)
+    filas = VentaDetalle.objects.filter(venta__in=ventas).values(
+        'venta_id', 'articulo_id', 'articulo__categoria_id'
+    ).annotate(cantidad=Sum('cantidad'), total=Sum('precio_total')).order_by('venta_id', 'articulo_id')
+    for fila in filas:
+        lineas[fila['venta_id']].append([
+            fila['articulo_id'],
+            fila['articulo__categoria_id'],
+            str(fila['cantidad'] or 0),
+            str(fila['total'] or 0),
+        ])
+    return lineas
+
+
+# ========== MANTENIMIENTO INCREMENTAL ==========
+
+def _sumar_aporte(dias, articulos, aporte, signo):
+    clave_dia = (aporte.empresa_id, aporte.fecha, aporte.vendedor_id)
+    dias[clave_dia][0] += signo
+    dias[clave_dia][1] += signo * Decimal(aporte.total)
+    for articulo_id, categoria_id, cantidad, total in aporte.lineas:
+        fila = articulos[(aporte.empresa_id, aporte.fecha, articulo_id)]
+        fila[0] = categoria_id
+        fila[1] += signo * Decimal(cantidad)
+        fila[2] += signo * Decimal(total)
+
+
+def _mismo_aporte(anterior, actual):
+    return (
+        anterior.empresa_id == actual.empresa_id
+        and anterior.fecha == actual.fecha
+        and anterior.vendedor_id == actual.vendedor_id
+        and Decimal(anterior.total) == Decimal(actual.total)
+        and anterior.lineas == actual.lineas
+    )
+
+
+def _primera_fila(modelo, **clave):
+    """UPDATE sobre una sola fila de la clave (la de menor id, por si hubiera duplicadas)"""
+    return modelo.objects.filter(pk=Subquery(modelo.objects.filter(**clave).order_by('pk').values('pk')[:1]))
+
+
+def _aplicar_deltas(dias, articulos):
+    for (empresa_id, fecha, vendedor_id), (cantidad, total) in dias.items():
+        if not cantidad and not total:
+            continue
+        clave = {'empresa_id': empresa_id, 'fecha': fecha, 'vendedor_id': vendedor_id}
+        actualizadas = _primera_fila(VentaDiaria, **clave).update(
+            cantidad_ventas=F('cantidad_ventas') + cantidad,
+            total=F('total') + total,
+        )
+        # Sin fila no hay nada que restar (p. ej. hechos aún no cargados)
+        if not actualizadas and cantidad > 0:
+            VentaDiaria.objects.create(cantidad_ventas=cantidad, total=total, **clave)
+
+    for (empresa_id, fecha, articulo_id), (categoria_id, cantidad, total) in articulos.items():
+        if not cantidad and not total:
+            continue
+        clave = {'empresa_id': empresa_id, 'fecha': fecha, 'articulo_id': articulo_id}
+        actualizadas = _primera_fila(VentaDiariaArticulo, **clave).update(
+            categoria_id=categoria_id,
+            cantidad=F('cantidad') + cantidad,
+            total=F('total') + total,
+        )
+        if not actualizadas and (cantidad > 0 or total > 0):
+            VentaDiariaArticulo.objects.create(categoria_id=categoria_id, cantidad=cantidad, total=total, **clave)
+
+    # Días y artículos que quedaron sin ventas
+    tocados = defaultdict(set)
+    for empresa_id, fecha, _ in list(dias) + list(articulos):
+        tocados[empresa_id].add(fecha)
+    for empresa_id, fechas in tocados.items():
+        VentaDiaria.objects.filter(empresa_id=empresa_id, fecha__in=fechas, cantidad_ventas=0).delete()
+        VentaDiariaArticulo.objects.filter(empresa_id=empresa_id, fecha__in=fechas, cantidad=0, total=0).delete()
+
+
+def aplicar_ventas(venta_ids):
+    """
+    Lleva a los hechos la diferencia entre el aporte actual de las ventas y
+    el que tenían aplicado. Una venta que ya no está confirmada (o que se
+    eliminó) resta su aporte anterior.
+
+    Returns:
+        int: Cantidad de ventas cuyo aporte cambió
+    """
+    venta_ids = sorted(set(venta_ids))
+    if not venta_ids:
+        return 0
+
+    with transaction.atomic():
+        # Bloquea sólo las ventas tocadas: dos commits de la misma venta no se pisan
+        ventas = {
+            venta['id']: venta
+            for venta in Venta.objects.select_for_update().filter(pk__in=venta_ids).values(
+                'id', 'empresa_id', 'fecha', 'vendedor_id', 'total', 'estado'
+            )
+        }
+        aplicados = {aporte.venta_id: aporte for aporte in HechoVentaAplicado.objects.filter(venta_id__in=venta_ids)}
+        confirmadas = [venta_id for venta_id, venta in ventas.items() if venta['estado'] == 'confirmada']
+        lineas = _lineas_ventas(confirmadas)
+
+        dias = defaultdict(lambda: [0, Decimal('0')])
+        articulos = defaultdict(lambda: [None, Decimal('0'), Decimal('0')])
+        guardar = []
+        quitar = []
+        for venta_id in venta_ids:
+            anterior = aplicados.get(venta_id)
+            venta = ventas.get(venta_id)
+            actual = None
+            if venta and venta['estado'] == 'confirmada':
+                actual = HechoVentaAplicado(
+                    venta_id=venta_id,
+                    empresa_id=venta['empresa_id'],
+                    fecha=venta['fecha'],
+                    vendedor_id=venta['vendedor_id'],
+                    total=venta['total'] or Decimal('0'),
+                    lineas=lineas.get(venta_id, []),
+                )
+            if anterior and actual and _mismo_aporte(anterior, actual):
+                continue
+            if anterior:
+                _sumar_aporte(dias, articulos, anterior, -1)
+            if actual:
+                _sumar_aporte(dias, articulos, actual, 1)
+                guardar.append(actual)
+            elif anterior:
+                quitar.append(venta_id)
+
+        _aplicar_deltas(dias, articulos)
+        if quitar:
+            HechoVentaAplicado.objects.filter(venta_id__in=quitar).delete()
+        if guardar:
+            HechoVentaAplicado.objects.bulk_create(
+                guardar,
+                update_conflicts=True,
+                unique_fields=['venta_id'],
+                update_fields=['empresa', 'fecha', 'vendedor', 'total', 'lineas'],
+            )
+    return len(guardar) + len(quitar)
+
+
+_pendientes = threading.local()
+
+
+def _aplicar_pendientes():
+    ventas = getattr(_pendientes, 'ventas', None)
+    if not ventas:
+        return
+    _pendientes.ventas = set()
+    aplicar_ventas(ventas)
+
+
+def programar_venta(venta_id):
+    """
+    Aplica la venta a los hechos al confirmar la transacción en curso.
+
+    Una venta con muchas líneas se guarda varias veces por transacción
+    (calcular_totales): las ventas se juntan en un conjunto propio del hilo y
+    el primer callback que corre las aplica todas; los siguientes lo
+    encuentran vacío. Si la transacción se revierte, las ventas que quedaron
+    en el conjunto se aplican con el próximo commit, lo que no cambia nada
+    porque aplicar es idempotente.
+    """
+    if not hasattr(_pendientes, 'ventas'):
+        _pendientes.ventas = set()
+    _pendientes.ventas.add(venta_id)
+    transaction.on_commit(_aplicar_pendientes)
+
+
+# ========== RECÁLCULO COMPLETO (carga inicial y reparación) ==========
+
+def _filas_hechos(empresa_id, fecha_desde, fecha_hasta):
+    """Calcula las filas de hechos del rango con dos consultas agregadas"""
+    ventas = _ventas_confirmadas(empresa_id).filter(fecha__gte=fecha_desde, fecha__lte=fecha_hasta)
+    encabezados = [
+        VentaDiaria(
+            empresa_id=empresa_id,
+            fecha=fila['fecha'],
+            vendedor_id=fila['vendedor_id'],
+            cantidad_ventas=fila['cantidad'],
+            total=fila['total'] or 0,
+        )
+        for fila in ventas.values('fecha', 'vendedor_id').annotate(
+            cantidad=Count('id'), total=Sum('total')
+        ).order_by()
+    ]
+    detalles = [
+        VentaDiariaArticulo(
+            empresa_id=empresa_id,
+            fecha=fila['venta__fecha'],
+            articulo_id=fila['articulo_id'],
+            categoria_id=fila['articulo__categoria_id'],
+            cantidad=fila['cantidad'] or 0,
+            total=fila['total'] or 0,
+        )
+        for fila in VentaDetalle.objects.filter(venta__in=ventas).values(
+            'venta__fecha', 'articulo_id', 'articulo__categoria_id'
+        ).annotate(cantidad=Sum('cantidad'), total=Sum('precio_total')).order_by()
+    ]
+    return encabezados, detalles
+
+
+def _aportes_rango(empresa_id, fecha_desde, fecha_hasta):
+    ventas = _ventas_confirmadas(empresa_id).filter(fecha__gte=fecha_desde, fecha__lte=fecha_hasta)
+    lineas = _lineas_ventas(ventas)
+    return [
+        HechoVentaAplicado(
+            venta_id=venta['id'],
+            empresa_id=empresa_id,
+            fecha=venta['fecha'],
+            vendedor_id=venta['vendedor_id'],
+            total=venta['total'] or Decimal('0'),
+            lineas=lineas.get(venta['id'], []),
+        )
+        for venta in ventas.values('id', 'fecha', 'vendedor_id', 'total').order_by()
+    ]
+
+
+def recalcular_hechos(empresa_id, fecha_desde, fecha_hasta=None, batch_size=1000):
+    """
+    Reemplaza los hechos de la empresa en el rango de fechas (inclusive),
+    junto con los aportes aplicados de sus ventas. Para cargas iniciales y
+    reparaciones (comando reconstruir_hechos_ventas), no para cada venta.
+
+    Returns:
+        tuple: (filas VentaDiaria, filas VentaDiariaArticulo) creadas
+    """
+    fecha_hasta = fecha_hasta or fecha_desde
+    with transaction.atomic():
+        encabezados, detalles = _filas_hechos(empresa_id, fecha_desde, fecha_hasta)
+        aportes = _aportes_rango(empresa_id, fecha_desde, fecha_hasta)
+        rango = {'empresa_id': empresa_id, 'fecha__gte': fecha_desde, 'fecha__lte': fecha_hasta}
+        VentaDiaria.objects.filter(**rango).delete()
+        VentaDiariaArticulo.objects.filter(**rango).delete()
+        HechoVentaAplicado.objects.filter(**rango).delete()
+        VentaDiaria.objects.bulk_create(encabezados, batch_size=batch_size)
+        VentaDiariaArticulo.objects.bulk_create(detalles, batch_size=batch_size)
+        HechoVentaAplicado.objects.bulk_create(
+            aportes,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['venta_id'],
+            update_fields=['empresa', 'fecha', 'vendedor', 'total', 'lineas'],
+        )
+    return len(encabezados), len(detalles)
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from informes.models import TrabajoExportacion
+from informes.trabajos import revisar_trabajos_detenidos
+
+
+class Command(BaseCommand):
+    help = (
+        'Elimina los trabajos de exportación antiguos y sus archivos generados, y revisa los '
+        'trabajos detenidos (en proceso sin latido o pendientes sin ejecutor)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=7, help='Antigüedad mínima en días (por defecto 7)')
+
+    def handle(self, *args, **options):
+        despachados, detenidos = revisar_trabajos_detenidos()
+        if despachados or detenidos:
+            self.stdout.write(f'{detenidos} trabajos detenidos marcados con error, {despachados} despachados de nuevo')
+
+        limite = timezone.now() - timedelta(days=options['dias'])
+        trabajos = TrabajoExportacion.objects.filter(fecha_creacion__lt=limite)
+
+        eliminados = 0
+        for trabajo in trabajos.iterator(chunk_size=500):
+            if trabajo.archivo:
+                trabajo.archivo.delete(save=False)
+            trabajo.delete()
+            eliminados += 1
+
+        self.stdout.write(self.style.SUCCESS(f'✓ {eliminados} trabajos de exportación eliminados'))
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from empresas.models import Empresa
+from informes.hechos import recalcular_hechos
+from ventas.models import Venta
+
+
+class Command(BaseCommand):
+    help = (
+        'Carga (o recarga) las tablas de hechos de ventas diarias desde las ventas confirmadas, mes a mes. '
+        'Las ventas nuevas se aplican solas al confirmarse; esto es para la carga inicial o para reparar'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa (por defecto todas)')
+        parser.add_argument('--desde', help='Fecha inicial YYYY-MM-DD (por defecto la primera venta)')
+        parser.add_argument('--hasta', help='Fecha final YYYY-MM-DD (por defecto la última venta)')
+        parser.add_argument('--lote', type=int, default=1000, help='Tamaño de lote para las escrituras')
+
+    def _fecha(self, valor):
+        try:
+            return datetime.strptime(valor, '%Y-%m-%d').date() if valor else None
+        except ValueError:
+            raise CommandError(f'Fecha inválida: {valor} (use YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        empresas = Empresa.objects.all()
+        if options.get('empresa'):
+            empresas = empresas.filter(pk=options['empresa'])
+            if not empresas.exists():
+                raise CommandError(f"Empresa {options['empresa']} no encontrada")
+
+        desde = self._fecha(options.get('desde'))
+        hasta = self._fecha(options.get('hasta'))
+
+        for empresa in empresas:
+            rango = Venta.objects.filter(empresa=empresa, estado='confirmada').aggregate(
+                primera=Min('fecha'), ultima=Max('fecha')
+            )
+            if not rango['primera'] and not (desde and hasta):
+                continue
+            inicio = desde or rango['primera']
+            fin = hasta or rango['ultima']
+
+            self.stdout.write(f'{empresa}: {inicio} a {fin}')
+            total_dias = total_articulos = 0
+            # Un mes por transacción para no mantener transacciones largas
+            actual = inicio
+            while actual <= fin:
+                siguiente = (actual.replace(day=1) + timedelta(days=32)).replace(day=1)
+                fin_tramo = min(fin, siguiente - timedelta(days=1))
+                dias, articulos = recalcular_hechos(empresa.id, actual, fin_tramo, batch_size=options['lote'])
+                total_dias += dias
+                total_articulos += articulos
+                actual = siguiente
+
+            self.stdout.write(self.style.SUCCESS(
+                f'  ✓ {total_dias} filas de ventas diarias, {total_articulos} filas por artículo'
+            ))
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:28
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articulos', '0019_precioarticulo_precio_final'),
+        ('empresas', '0028_plansaas_empresa_auto_suspender_and_more'),
+        ('informes', '0002_delete_permisoinforme'),
+        ('ventas', '0037_estaciontrabajo_copias_notacredito'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('cantidad_ventas', models.PositiveIntegerField(default=0, verbose_name='Cantidad de Ventas')),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Total')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to='empresas.empresa')),
+                ('vendedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='ventas.vendedor', verbose_name='Vendedor')),
+            ],
+            options={
+                'verbose_name': 'Venta Diaria',
+                'verbose_name_plural': 'Ventas Diarias',
+                'ordering': ['empresa', 'fecha'],
+                'indexes': [models.Index(fields=['empresa', 'fecha'], name='venta_diaria_emp_fecha_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaArticulo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('cantidad', models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14, verbose_name='Cantidad')),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Total')),
+                ('articulo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='articulos.articulo', verbose_name='Artículo')),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='articulos.categoriaarticulo', verbose_name='Categoría')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias_articulo', to='empresas.empresa')),
+            ],
+            options={
+                'verbose_name': 'Venta Diaria por Artículo',
+                'verbose_name_plural': 'Ventas Diarias por Artículo',
+                'ordering': ['empresa', 'fecha'],
+                'indexes': [models.Index(fields=['empresa', 'fecha'], name='venta_diaria_art_fecha_idx')],
+            },
+        ),
+    ]
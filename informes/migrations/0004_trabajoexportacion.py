@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0028_plansaas_empresa_auto_suspender_and_more'),
+        ('informes', '0003_ventadiaria_ventadiariaarticulo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoExportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=60, verbose_name='Tipo de Exportación')),
+                ('parametros', models.JSONField(blank=True, default=dict, verbose_name='Parámetros')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20, verbose_name='Estado')),
+                ('progreso', models.PositiveSmallIntegerField(default=0, verbose_name='Progreso (%)')),
+                ('mensaje', models.CharField(blank=True, max_length=255, verbose_name='Mensaje')),
+                ('archivo', models.FileField(blank=True, null=True, upload_to='exportaciones/%Y/%m/', verbose_name='Archivo')),
+                ('nombre_archivo', models.CharField(blank=True, max_length=255, verbose_name='Nombre de Archivo')),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trabajos_exportacion', to='empresas.empresa')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Exportación',
+                'verbose_name_plural': 'Trabajos de Exportación',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['empresa', 'usuario', '-fecha_creacion'], name='trabajo_export_usuario_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:06
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def registrar_aportes(apps, schema_editor):
+    """
+    Los hechos existentes se calcularon desde las ventas confirmadas: se
+    registra el aporte de cada una para poder restarlo si luego se anula
+    """
+    Venta = apps.get_model('ventas', 'Venta')
+    VentaDetalle = apps.get_model('ventas', 'VentaDetalle')
+    HechoVentaAplicado = apps.get_model('informes', 'HechoVentaAplicado')
+
+    ventas = Venta.objects.filter(estado='confirmada').order_by('id').values_list(
+        'id', 'empresa_id', 'fecha', 'vendedor_id', 'total'
+    )
+    total = 0
+    lote = []
+
+    def guardar(lote):
+        lineas = {}
+        for fila in VentaDetalle.objects.filter(venta_id__in=[venta[0] for venta in lote]).values(
+            'venta_id', 'articulo_id', 'articulo__categoria_id'
+        ).annotate(cantidad=Sum('cantidad'), total=Sum('precio_total')).order_by('venta_id', 'articulo_id'):
+            lineas.setdefault(fila['venta_id'], []).append([
+                fila['articulo_id'], fila['articulo__categoria_id'], str(fila['cantidad'] or 0), str(fila['total'] or 0)
+            ])
+        HechoVentaAplicado.objects.bulk_create([
+            HechoVentaAplicado(
+                venta_id=venta_id, empresa_id=empresa_id, fecha=fecha, vendedor_id=vendedor_id,
+                total=venta_total or Decimal('0'), lineas=lineas.get(venta_id, []),
+            )
+            for venta_id, empresa_id, fecha, vendedor_id, venta_total in lote
+        ])
+
+    for venta in ventas.iterator(chunk_size=2000):
+        lote.append(venta)
+        if len(lote) == 2000:
+            guardar(lote)
+            total += len(lote)
+            lote = []
+    if lote:
+        guardar(lote)
+        total += len(lote)
+
+    print(f"\n[MIGRACIÓN] Aporte a los hechos registrado para {total} ventas confirmadas")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0028_plansaas_empresa_auto_suspender_and_more'),
+        ('informes', '0004_trabajoexportacion'),
+        ('ventas', '0038_cambio_indice_pos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HechoVentaAplicado',
+            fields=[
+                ('venta_id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='Venta')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Total')),
+                ('lineas', models.JSONField(blank=True, default=list, verbose_name='Líneas')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='empresas.empresa')),
+                ('vendedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ventas.vendedor')),
+            ],
+            options={
+                'verbose_name': 'Hecho de Venta Aplicado',
+                'verbose_name_plural': 'Hechos de Venta Aplicados',
+                'indexes': [models.Index(fields=['empresa', 'fecha'], name='hecho_aplicado_emp_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(registrar_aportes, migrations.RunPython.noop),
+    ]
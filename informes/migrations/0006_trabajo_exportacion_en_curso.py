@@ -0,0 +1,62 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:19
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def calcular_claves(apps, schema_editor):
+    """Clave de los trabajos existentes; de los duplicados en curso sólo sigue el más reciente"""
+    TrabajoExportacion = apps.get_model('informes', 'TrabajoExportacion')
+    en_curso = set()
+    cerrados = []
+    for trabajo in TrabajoExportacion.objects.order_by('-fecha_creacion', '-id').iterator(chunk_size=500):
+        trabajo.clave = hashlib.sha1(
+            json.dumps(trabajo.parametros or {}, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+        campos = ['clave']
+        if trabajo.estado in ('pendiente', 'procesando'):
+            llave = (trabajo.empresa_id, trabajo.usuario_id, trabajo.tipo, trabajo.clave)
+            if trabajo.usuario_id and llave in en_curso:
+                trabajo.estado = 'error'
+                trabajo.mensaje = 'Exportación duplicada'
+                campos.append('estado')
+                campos.append('mensaje')
+                cerrados.append(trabajo.id)
+            en_curso.add(llave)
+        trabajo.save(update_fields=campos)
+    if cerrados:
+        print(f"\n[MIGRACIÓN] {len(cerrados)} exportaciones duplicadas en curso marcadas con error")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0028_plansaas_empresa_auto_suspender_and_more'),
+        ('informes', '0005_hechoventaaplicado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoexportacion',
+            name='clave',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Clave de Parámetros'),
+        ),
+        migrations.AddField(
+            model_name='trabajoexportacion',
+            name='fecha_latido',
+            field=models.DateTimeField(blank=True, help_text='Última señal del ejecutor (o último despacho si aún está pendiente)', null=True),
+        ),
+        migrations.RunPython(calcular_claves, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='trabajoexportacion',
+            index=models.Index(fields=['estado', 'fecha_latido'], name='trabajo_export_latido_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='trabajoexportacion',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ['pendiente', 'procesando'])), fields=('empresa', 'usuario', 'tipo', 'clave'), name='trabajo_export_en_curso_unico'),
+        ),
+    ]
@@ -1,3 +1,133 @@
 from django.db import models
+from decimal import Decimal
 
-# Create your models here.
+
+class VentaDiaria(models.Model):
+    """
+    Hechos de ventas confirmadas por día y vendedor (nivel encabezado).
+    Se mantiene al confirmar/anular ventas (informes.hechos) y alimenta el dashboard BI.
+    """
+    
+    empresa = models.ForeignKey('empresas.Empresa', on_delete=models.CASCADE, related_name='ventas_diarias')
+    fecha = models.DateField(verbose_name="Fecha")
+    vendedor = models.ForeignKey('ventas.Vendedor', on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Vendedor")
+    cantidad_ventas = models.PositiveIntegerField(default=0, verbose_name="Cantidad de Ventas")
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name="Total")
+    
+    class Meta:
+        verbose_name = "Venta Diaria"
+        verbose_name_plural = "Ventas Diarias"
+        ordering = ['empresa', 'fecha']
+        indexes = [
+            models.Index(fields=['empresa', 'fecha'], name='venta_diaria_emp_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.empresa_id} - {self.fecha}: ${self.total}"
+
+
+class VentaDiariaArticulo(models.Model):
+    """Hechos de ventas confirmadas por día y artículo (nivel detalle)"""
+    
+    empresa = models.ForeignKey('empresas.Empresa', on_delete=models.CASCADE, related_name='ventas_diarias_articulo')
+    fecha = models.DateField(verbose_name="Fecha")
+    articulo = models.ForeignKey('articulos.Articulo', on_delete=models.CASCADE, verbose_name="Artículo")
+    categoria = models.ForeignKey('articulos.CategoriaArticulo', on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Categoría")
+    cantidad = models.DecimalField(max_digits=14, decimal_places=3, default=Decimal('0.000'), verbose_name="Cantidad")
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name="Total")
+    
+    class Meta:
+        verbose_name = "Venta Diaria por Artículo"
+        verbose_name_plural = "Ventas Diarias por Artículo"
+        ordering = ['empresa', 'fecha']
+        indexes = [
+            models.Index(fields=['empresa', 'fecha'], name='venta_diaria_art_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.empresa_id} - {self.fecha} - {self.articulo_id}: {self.cantidad}"
+
+
+class HechoVentaAplicado(models.Model):
+    """
+    Aporte de una venta confirmada a los hechos diarios tal como se aplicó la
+    última vez (informes.hechos). Permite sumar o restar sólo la diferencia
+    cuando la venta se confirma, cambia, se anula o se elimina.
+    """
+    
+    # Sin FK: el aporte debe poder restarse después de eliminar la venta
+    venta_id = models.BigIntegerField(primary_key=True, verbose_name="Venta")
+    empresa = models.ForeignKey('empresas.Empresa', on_delete=models.CASCADE, related_name='+')
+    fecha = models.DateField(verbose_name="Fecha")
+    vendedor = models.ForeignKey('ventas.Vendedor', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name="Total")
+    # [[articulo_id, categoria_id, cantidad, total], ...] con cantidad y total como texto decimal
+    lineas = models.JSONField(default=list, blank=True, verbose_name="Líneas")
+    
+    class Meta:
+        verbose_name = "Hecho de Venta Aplicado"
+        verbose_name_plural = "Hechos de Venta Aplicados"
+        indexes = [
+            models.Index(fields=['empresa', 'fecha'], name='hecho_aplicado_emp_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Venta {self.venta_id} - {self.fecha}: ${self.total}"
+
+
+class TrabajoExportacion(models.Model):
+    """
+    Exportación pesada (Excel/PDF) que se genera fuera de la petición HTTP.
+    El archivo resultante queda en MEDIA_ROOT y se descarga cuando el trabajo termina.
+    Un usuario tiene a lo sumo un trabajo en curso por tipo y parámetros (clave).
+    Ver informes.trabajos.
+    """
+    
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    ]
+    
+    empresa = models.ForeignKey('empresas.Empresa', on_delete=models.CASCADE, related_name='trabajos_exportacion')
+    usuario = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Usuario")
+    tipo = models.CharField(max_length=60, verbose_name="Tipo de Exportación")
+    parametros = models.JSONField(default=dict, blank=True, verbose_name="Parámetros")
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente', verbose_name="Estado")
+    progreso = models.PositiveSmallIntegerField(default=0, verbose_name="Progreso (%)")
+    mensaje = models.CharField(max_length=255, blank=True, verbose_name="Mensaje")
+    archivo = models.FileField(upload_to='exportaciones/%Y/%m/', null=True, blank=True, verbose_name="Archivo")
+    nombre_archivo = models.CharField(max_length=255, blank=True, verbose_name="Nombre de Archivo")
+    content_type = models.CharField(max_length=100, blank=True)
+    clave = models.CharField(max_length=64, blank=True, verbose_name="Clave de Parámetros")
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_latido = models.DateTimeField(
+        null=True, blank=True,
+        help_text="Última señal del ejecutor (o último despacho si aún está pendiente)"
+    )
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Trabajo de Exportación"
+        verbose_name_plural = "Trabajos de Exportación"
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['empresa', 'usuario', '-fecha_creacion'], name='trabajo_export_usuario_idx'),
+            models.Index(fields=['estado', 'fecha_latido'], name='trabajo_export_latido_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empresa', 'usuario', 'tipo', 'clave'],
+                condition=models.Q(estado__in=['pendiente', 'procesando']),
+                name='trabajo_export_en_curso_unico',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.tipo} #{self.id} ({self.estado})"
+    
+    @property
+    def terminado(self):
+        return self.estado in ('completado', 'error')
@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from ventas.models import Venta
+from .hechos import programar_venta
+
+
+@receiver(post_init, sender=Venta)
+def recordar_estado_venta(sender, instance, **kwargs):
+    """Guarda el estado original para detectar cuándo deja de estar confirmada"""
+    instance._hechos_estado_original = instance.estado
+
+
+@receiver(post_save, sender=Venta)
+def actualizar_hechos_venta(sender, instance, created, **kwargs):
+    """
+    Mantiene los hechos de ventas diarias cuando una venta se confirma, se
+    anula o cambia estando confirmada.
+    """
+    estado_original = getattr(instance, '_hechos_estado_original', None)
+    
+    if instance.estado == 'confirmada' or estado_original == 'confirmada':
+        programar_venta(instance.pk)
+    
+    instance._hechos_estado_original = instance.estado
+
+
+@receiver(post_delete, sender=Venta)
+def eliminar_hechos_venta(sender, instance, **kwargs):
+    """Quita del día los montos de una venta confirmada que se elimina"""
+    if instance.estado == 'confirmada' or getattr(instance, '_hechos_estado_original', None) == 'confirmada':
+        programar_venta(instance.pk)
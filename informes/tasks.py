@@ -0,0 +1,15 @@
+from celery import shared_task
+
+from .trabajos import ejecutar_trabajo, revisar_trabajos_detenidos
+
+
+@shared_task(name='informes.ejecutar_trabajo_exportacion')
+def ejecutar_trabajo_exportacion(trabajo_id):
+    """Genera el archivo de un TrabajoExportacion en el worker de Celery"""
+    ejecutar_trabajo(trabajo_id)
+
+
+@shared_task(name='informes.revisar_exportaciones_detenidas')
+def revisar_exportaciones_detenidas():
+    """Da por detenidos los trabajos sin latido y vuelve a despachar los pendientes (Celery beat)"""
+    revisar_trabajos_detenidos()
@@ -1,3 +1,215 @@
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from articulos.models import Articulo, CategoriaArticulo, UnidadMedida
+from empresas.models import Empresa
+from facturacion_electronica.tests import crear_dte
+from informes import hechos, trabajos
+from informes.models import HechoVentaAplicado, TrabajoExportacion, VentaDiaria, VentaDiariaArticulo
+from ventas.models import Venta, VentaDetalle
+from ventas.views import generar_libro_ventas_excel
+
+
+class HechosVentasTest(TestCase):
+    """Los hechos diarios se mantienen con la diferencia de cada venta, igual que el recálculo completo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(nombre='Empresa BI', razon_social='Empresa BI', rut='76.000.004-2')
+        categoria = CategoriaArticulo.objects.create(empresa=cls.empresa, codigo='ALM', nombre='Almacén')
+        unidad = UnidadMedida.objects.create(empresa=cls.empresa, nombre='Unidad', simbolo='UN')
+        cls.articulos = [
+            Articulo.objects.create(
+                empresa=cls.empresa, categoria=categoria, unidad_medida=unidad,
+                codigo=f'BI{i}', nombre=f'Artículo {i}', precio_venta='1000',
+            )
+            for i in range(2)
+        ]
+        cls.fecha = date(2026, 3, 10)
+
+    def _venta(self, numero, lineas, estado='confirmada'):
+        with self.captureOnCommitCallbacks(execute=True):
+            venta = Venta.objects.create(
+                empresa=self.empresa, numero_venta=numero, fecha=self.fecha, estado='borrador', tipo_documento='vale'
+            )
+            for articulo, cantidad in lineas:
+                VentaDetalle.objects.create(
+                    venta=venta, articulo=articulo, cantidad=Decimal(cantidad),
+                    precio_unitario=Decimal('1000'), precio_total=Decimal(cantidad) * 1000,
+                )
+            venta.total = sum(Decimal(cantidad) * 1000 for _, cantidad in lineas)
+            venta.estado = estado
+            venta.save()
+        return venta
+
+    def _hechos(self):
+        dias = sorted(VentaDiaria.objects.filter(empresa=self.empresa).values_list('fecha', 'cantidad_ventas', 'total'))
+        articulos = sorted(VentaDiariaArticulo.objects.filter(empresa=self.empresa).values_list(
+            'fecha', 'articulo_id', 'cantidad', 'total'
+        ))
+        return dias, articulos
+
+    def _recalculados(self):
+        incrementales = self._hechos()
+        hechos.recalcular_hechos(self.empresa.id, self.fecha)
+        return incrementales, self._hechos()
+
+    def test_confirmar_anular_y_eliminar_aplican_solo_la_diferencia(self):
+        uno = self._venta('1', [(self.articulos[0], '2'), (self.articulos[1], '1')])
+        dos = self._venta('2', [(self.articulos[0], '1')])
+        self._venta('3', [(self.articulos[1], '5')], estado='borrador')
+
+        dias, articulos = self._hechos()
+        self.assertEqual(dias, [(self.fecha, 2, Decimal('4000'))])
+        self.assertEqual(
+            [(a, c) for _, a, c, _ in articulos],
+            [(self.articulos[0].id, Decimal('3')), (self.articulos[1].id, Decimal('1'))],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            uno.estado = 'anulada'
+            uno.save()
+        self.assertEqual(self._hechos()[0], [(self.fecha, 1, Decimal('1000'))])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            dos.delete()
+        self.assertEqual(self._hechos(), ([], []))
+        self.assertFalse(HechoVentaAplicado.objects.exists())
+
+    def test_cambio_de_fecha_mueve_el_aporte_y_coincide_con_el_recalculo(self):
+        venta = self._venta('1', [(self.articulos[0], '2')])
+        self._venta('2', [(self.articulos[1], '3')])
+        with self.captureOnCommitCallbacks(execute=True):
+            venta.fecha = date(2026, 3, 11)
+            venta.save()
+
+        dias, _ = self._hechos()
+        self.assertEqual(dias, [(self.fecha, 1, Decimal('3000')), (date(2026, 3, 11), 1, Decimal('2000'))])
+        hechos.recalcular_hechos(self.empresa.id, self.fecha, date(2026, 3, 11))
+        self.assertEqual(self._hechos()[0], dias)
+
+    def test_varios_guardados_en_una_transaccion_se_aplican_una_vez(self):
+        with mock.patch.object(hechos, 'aplicar_ventas', wraps=hechos.aplicar_ventas) as aplicar:
+            venta = self._venta('1', [(self.articulos[0], '1')])
+        aplicar.assert_called_once_with({venta.id})
+
+        # Reaplicar sin cambios no escribe nada
+        with self.assertNumQueries(5):
+            self.assertEqual(hechos.aplicar_ventas([venta.id]), 0)
+
+
+def generador_prueba(empresa, parametros, progreso):
+    """Generador registrado en las pruebas: devuelve un archivo abierto"""
+    archivo = tempfile.TemporaryFile()
+    archivo.write(f"{empresa.nombre};{parametros.get('desde', '')}".encode('utf-8'))
+    archivo.seek(0)
+    return 'prueba.csv', 'text/csv', archivo
+
+
+@mock.patch.dict(trabajos.EXPORTACIONES, {'prueba': 'informes.tests.generador_prueba'})
+class TrabajosExportacionTest(TestCase):
+    """Un trabajo en curso por usuario y parámetros, y recuperación de trabajos detenidos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(nombre='Empresa Export', razon_social='Empresa Export', rut='76.000.007-7')
+        cls.usuario = User.objects.create_user('exportador', password='x')
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = self.settings(MEDIA_ROOT=self.media, EXPORTACIONES_MODO='local', EXPORTACIONES_PLAZO=600)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        despachar = mock.patch.object(trabajos, 'despachar_trabajo')
+        self.despachar = despachar.start()
+        self.addCleanup(despachar.stop)
+
+    def _crear(self, parametros):
+        return trabajos.crear_trabajo(self.empresa, self.usuario, 'prueba', parametros)
+
+    def test_misma_exportacion_en_curso_reutiliza_el_trabajo(self):
+        primero = self._crear({'desde': '2026-01-01', 'hasta': '2026-01-31'})
+        self.assertEqual(self._crear({'hasta': '2026-01-31', 'desde': '2026-01-01'}).id, primero.id)
+        self.assertNotEqual(self._crear({'desde': '2026-02-01'}).id, primero.id)
+
+        trabajos.ejecutar_trabajo(primero.id)
+        primero.refresh_from_db()
+        self.assertEqual(primero.estado, 'completado')
+        self.assertEqual(primero.archivo.read(), b'Empresa Export;2026-01-01')
+        # Terminado el trabajo, pedirlo de nuevo genera uno nuevo
+        self.assertNotEqual(self._crear({'desde': '2026-01-01', 'hasta': '2026-01-31'}).id, primero.id)
+
+    def test_trabajo_sin_latido_se_marca_con_error_y_libera_la_clave(self):
+        trabajo = self._crear({'desde': '2026-01-01'})
+        antiguo = timezone.now() - timedelta(hours=1)
+        TrabajoExportacion.objects.filter(pk=trabajo.pk).update(
+            estado='procesando', fecha_inicio=antiguo, fecha_latido=antiguo
+        )
+
+        self.assertEqual(trabajos.revisar_trabajos_detenidos(), (0, 1))
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, 'error')
+        self.assertIn('interrumpió', trabajo.mensaje)
+        self.assertNotEqual(self._crear({'desde': '2026-01-01'}).id, trabajo.id)
+
+    def test_trabajo_detenido_no_publica_el_archivo(self):
+        trabajo = self._crear({})
+
+        def detener(empresa, parametros, progreso):
+            TrabajoExportacion.objects.filter(pk=trabajo.pk).update(estado='error')
+            return 'prueba.csv', 'text/csv', b'tarde'
+
+        with mock.patch('informes.tests.generador_prueba', side_effect=detener):
+            trabajos.ejecutar_trabajo(trabajo.id)
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, 'error')
+        self.assertFalse(trabajo.archivo)
+
+    def test_pendiente_sin_ejecutor_se_despacha_de_nuevo_una_vez(self):
+        trabajo = self._crear({})
+        TrabajoExportacion.objects.filter(pk=trabajo.pk).update(fecha_creacion=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(trabajos.revisar_trabajos_detenidos(), (1, 0))
+        self.despachar.assert_called_once_with(trabajo.id)
+        # Recién despachado: la siguiente revisión no lo vuelve a despachar
+        self.assertEqual(trabajos.revisar_trabajos_detenidos(), (0, 0))
+
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, 'pendiente')
+
+
+class LibroVentasExcelTest(TestCase):
+    """El libro de ventas mezcla ventas y DTEs ordenados desde la BD en un Excel write-only"""
+
+    def test_documentos_ordenados_por_fecha_y_folio_con_totales(self):
+        empresa = Empresa.objects.create(nombre='Empresa Libro', razon_social='Empresa Libro', rut='76.000.008-5')
+        hoy = timezone.now().date()
+        for numero, fecha in (('9', hoy), ('10', hoy), ('2', hoy - timedelta(days=1))):
+            Venta.objects.create(
+                empresa=empresa, numero_venta=numero, fecha=fecha, estado='confirmada', tipo_documento='boleta',
+                subtotal=Decimal('100'), iva=Decimal('19'), total=Decimal('119'),
+            )
+        crear_dte(empresa, 5, tipo_dte='33')
+
+        progreso = mock.Mock()
+        nombre, content_type, archivo = generar_libro_ventas_excel(
+            empresa, {'fecha_desde': (hoy - timedelta(days=7)).isoformat(), 'fecha_hasta': hoy.isoformat()}, progreso
+        )
+        self.addCleanup(archivo.close)
+        self.assertTrue(nombre.endswith('.xlsx'))
 
-# Create your tests here.
+        hoja = load_workbook(archivo).active
+        filas = list(hoja.iter_rows(min_row=5, values_only=True))
+        self.assertEqual([str(fila[2]) for fila in filas[:4]], ['10', '9', '5', '2'])
+        self.assertEqual(filas[2][7], 1000)
+        self.assertEqual(filas[5][4], 'TOTALES GENERALES:')
+        self.assertEqual(filas[5][7], '=SUM(H5:H8)')
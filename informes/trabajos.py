@@ -0,0 +1,289 @@
+"""
+Exportaciones en segundo plano.
+
+Las exportaciones pesadas (libro de ventas, cuenta corriente de clientes,
+reporte de producción) ya no se generan dentro de la petición: la vista crea
+un TrabajoExportacion y lo despacha a un ejecutor que genera el archivo,
+lo guarda en el storage e informa el avance. La interfaz consulta el estado
+y descarga el archivo al terminar.
+
+Cada tipo de exportación se registra en EXPORTACIONES con la ruta de su
+generador. Un generador recibe (empresa, parametros, progreso) y devuelve
+(nombre_archivo, content_type, contenido), donde contenido son bytes o un
+archivo abierto (p. ej. ExportacionExcel.archivo(), que no carga el libro en
+memoria); progreso(actual, total) es opcional de llamar.
+
+Un usuario tiene a lo sumo un trabajo en curso por (tipo, parámetros): si
+vuelve a pedir la misma exportación mientras se genera (recargar la página,
+doble clic) recibe el mismo trabajo. Lo garantiza una restricción única
+parcial sobre los trabajos pendientes o en proceso.
+
+Trabajos detenidos: mientras se genera el archivo, un hilo actualiza
+fecha_latido cada EXPORTACIONES_PLAZO / 3 segundos. revisar_trabajos_detenidos()
+marca con error los trabajos en proceso sin latido dentro de
+EXPORTACIONES_PLAZO (el proceso murió o se reinició) y vuelve a despachar los
+pendientes que nadie tomó. Se ejecuta al consultar el estado de un trabajo,
+al pedir una exportación, con el comando limpiar_exportaciones y desde
+Celery beat.
+
+Modo de ejecución (settings.EXPORTACIONES_MODO):
+- 'local':  hilo dentro del mismo proceso (instalaciones de un solo nodo)
+- 'celery': tarea de Celery (informes.tasks), requiere un worker corriendo
+- 'eager':  se ejecuta dentro de la petición (desarrollo y pruebas)
+"""
+import hashlib
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import TrabajoExportacion
+
+logger = logging.getLogger(__name__)
+
+
+EXPORTACIONES = {
+    'libro_ventas_excel': 'ventas.views.generar_libro_ventas_excel',
+    'cuenta_corriente_cliente_excel': 'tesoreria.views.generar_cuenta_corriente_cliente_excel',
+    'reporte_produccion_pdf': 'produccion.views.generar_reporte_produccion_pdf',
+}
+
+MODO_LOCAL = 'local'
+MODO_CELERY = 'celery'
+MODO_EAGER = 'eager'
+
+ESTADOS_EN_CURSO = ('pendiente', 'procesando')
+
+
+def modo_ejecucion():
+    return getattr(settings, 'EXPORTACIONES_MODO', MODO_LOCAL)
+
+
+def plazo_trabajo():
+    """Segundos sin latido tras los cuales un trabajo se considera detenido"""
+    return getattr(settings, 'EXPORTACIONES_PLAZO', 600)
+
+
+def clave_parametros(parametros):
+    """Hash estable de los parámetros (no depende del orden de las claves)"""
+    return hashlib.sha1(json.dumps(parametros or {}, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def crear_trabajo(empresa, usuario, tipo, parametros=None):
+    """
+    Crea el trabajo y lo despacha al confirmar la transacción. Si el usuario
+    ya tiene la misma exportación en curso, devuelve ese trabajo.
+    """
+    if tipo not in EXPORTACIONES:
+        raise ValueError(f"Tipo de exportación no registrado: {tipo}")
+
+    usuario = usuario if usuario and usuario.is_authenticated else None
+    parametros = parametros or {}
+    clave = clave_parametros(parametros)
+
+    en_curso = TrabajoExportacion.objects.filter(
+        empresa=empresa, usuario=usuario, tipo=tipo, clave=clave, estado__in=ESTADOS_EN_CURSO
+    )
+    if usuario is not None:
+        revisar_trabajos_detenidos(en_curso)
+        existente = en_curso.first()
+        if existente:
+            return existente
+
+    try:
+        with transaction.atomic():
+            trabajo = TrabajoExportacion.objects.create(
+                empresa=empresa,
+                usuario=usuario,
+                tipo=tipo,
+                parametros=parametros,
+                clave=clave,
+            )
+    except IntegrityError:
+        # Otra petición del mismo usuario lo creó entre la consulta y el INSERT
+        existente = en_curso.first()
+        if existente is None:
+            raise
+        return existente
+
+    if modo_ejecucion() == MODO_EAGER:
+        ejecutar_trabajo(trabajo.id)
+        trabajo.refresh_from_db()
+    else:
+        transaction.on_commit(lambda: despachar_trabajo(trabajo.id))
+    return trabajo
+
+
+def despachar_trabajo(trabajo_id):
+    """Envía el trabajo al ejecutor configurado"""
+    if modo_ejecucion() == MODO_CELERY:
+        try:
+            from .tasks import ejecutar_trabajo_exportacion
+            ejecutar_trabajo_exportacion.delay(trabajo_id)
+            return
+        except Exception as e:
+            # Sin broker disponible: no dejar el trabajo colgado
+            logger.error(f"No se pudo encolar la exportación {trabajo_id} en Celery: {e}. Se ejecuta localmente.")
+
+    threading.Thread(
+        target=_ejecutar_en_hilo,
+        args=(trabajo_id,),
+        name=f"Exportacion-{trabajo_id}",
+        daemon=True,
+    ).start()
+
+
+def revisar_trabajos_detenidos(trabajos=None):
+    """
+    Marca con error los trabajos en proceso sin latido dentro del plazo y
+    vuelve a despachar los pendientes que nadie tomó.
+
+    Args:
+        trabajos: QuerySet a revisar (por defecto todos los trabajos)
+
+    Returns:
+        tuple: (trabajos despachados de nuevo, trabajos marcados con error)
+    """
+    trabajos = TrabajoExportacion.objects.all() if trabajos is None else trabajos
+    ahora = timezone.now()
+    limite = ahora - timedelta(seconds=plazo_trabajo())
+    sin_senal = Q(fecha_latido__lt=limite) | Q(fecha_latido__isnull=True, fecha_creacion__lt=limite)
+
+    marcados = trabajos.filter(sin_senal, estado='procesando').update(
+        estado='error',
+        mensaje='La exportación se interrumpió (el proceso que la generaba se detuvo). Vuelve a solicitarla.',
+        fecha_fin=ahora,
+    )
+    if marcados:
+        logger.warning(f"{marcados} exportaciones detenidas marcadas con error")
+
+    despachados = 0
+    for trabajo_id in list(trabajos.filter(sin_senal, estado='pendiente').values_list('pk', flat=True)):
+        # El UPDATE condicionado evita que dos revisiones despachen el mismo trabajo
+        tomado = TrabajoExportacion.objects.filter(sin_senal, pk=trabajo_id, estado='pendiente').update(
+            fecha_latido=ahora
+        )
+        if tomado:
+            logger.warning(f"Exportación {trabajo_id} sin ejecutor: se despacha de nuevo")
+            despachar_trabajo(trabajo_id)
+            despachados += 1
+    return despachados, marcados
+
+
+@contextmanager
+def _latido(trabajo_id):
+    """Actualiza fecha_latido del trabajo en un hilo mientras se genera el archivo"""
+    detener = threading.Event()
+    intervalo = max(plazo_trabajo() / 3, 1)
+
+    def latir():
+        try:
+            while not detener.wait(intervalo):
+                TrabajoExportacion.objects.filter(pk=trabajo_id, estado='procesando').update(
+                    fecha_latido=timezone.now()
+                )
+        except Exception as e:
+            logger.error(f"No se pudo registrar el latido de la exportación {trabajo_id}: {e}")
+        finally:
+            connection.close()
+
+    hilo = threading.Thread(target=latir, name=f"Exportacion-{trabajo_id}-latido", daemon=True)
+    hilo.start()
+    try:
+        yield
+    finally:
+        detener.set()
+        hilo.join(timeout=5)
+
+
+def _ejecutar_en_hilo(trabajo_id):
+    try:
+        ejecutar_trabajo(trabajo_id)
+    finally:
+        # Cada hilo abre su propia conexión; cerrarla al terminar
+        close_old_connections()
+
+
+class _Progreso:
+    """Reporta el avance sólo cuando cambia el porcentaje (un UPDATE por punto)"""
+
+    def __init__(self, trabajo_id):
+        self.trabajo_id = trabajo_id
+        self.ultimo = -1
+
+    def __call__(self, actual, total, mensaje=None):
+        porcentaje = min(99, int(actual * 100 / total)) if total else 0
+        if porcentaje == self.ultimo and mensaje is None:
+            return
+        self.ultimo = porcentaje
+        campos = {'progreso': porcentaje, 'fecha_latido': timezone.now()}
+        if mensaje is not None:
+            campos['mensaje'] = mensaje[:255]
+        TrabajoExportacion.objects.filter(pk=self.trabajo_id).update(**campos)
+
+
+def ejecutar_trabajo(trabajo_id):
+    """
+    Genera el archivo de un trabajo pendiente. Es seguro llamarlo más de una
+    vez: sólo el primer ejecutor que toma el trabajo lo procesa.
+    """
+    ahora = timezone.now()
+    tomados = TrabajoExportacion.objects.filter(pk=trabajo_id, estado='pendiente').update(
+        estado='procesando',
+        fecha_inicio=ahora,
+        fecha_latido=ahora,
+        mensaje='Generando archivo...',
+    )
+    if not tomados:
+        return
+
+    trabajo = TrabajoExportacion.objects.select_related('empresa').get(pk=trabajo_id)
+    try:
+        generador = import_string(EXPORTACIONES[trabajo.tipo])
+        with _latido(trabajo.id):
+            nombre_archivo, content_type, contenido = generador(
+                trabajo.empresa, trabajo.parametros, _Progreso(trabajo.id)
+            )
+            archivo = File(contenido) if hasattr(contenido, 'read') else ContentFile(contenido)
+            try:
+                trabajo.archivo.save(nombre_archivo, archivo, save=False)
+                tamano = archivo.size
+            finally:
+                archivo.close()
+
+        trabajo.nombre_archivo = nombre_archivo
+        trabajo.content_type = content_type
+        trabajo.estado = 'completado'
+        trabajo.progreso = 100
+        trabajo.mensaje = 'Archivo listo para descargar'
+        trabajo.fecha_fin = timezone.now()
+        actualizados = TrabajoExportacion.objects.filter(pk=trabajo.id, estado='procesando').update(
+            archivo=trabajo.archivo.name,
+            nombre_archivo=nombre_archivo,
+            content_type=content_type,
+            estado='completado',
+            progreso=100,
+            mensaje=trabajo.mensaje,
+            fecha_fin=trabajo.fecha_fin,
+        )
+        if not actualizados:
+            # Se dio por detenido mientras se generaba: el archivo no se publica
+            trabajo.archivo.delete(save=False)
+            logger.warning(f"Exportación {trabajo.tipo} #{trabajo.id} terminó después de darse por detenida")
+            return
+        logger.info(f"[OK] Exportación {trabajo.tipo} #{trabajo.id} generada ({tamano} bytes)")
+    except Exception as e:
+        logger.exception(f"Error generando exportación {trabajo.tipo} #{trabajo.id}")
+        TrabajoExportacion.objects.filter(pk=trabajo.id).update(
+            estado='error',
+            mensaje=f"Error: {e}"[:255],
+            fecha_fin=timezone.now(),
+        )
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, views_trabajos
 
 app_name = 'informes'
 
@@ -49,4 +49,8 @@ urlpatterns = [
     # Informes de Utilidad por Artículos
     path('utilidad/articulos/', views.informe_utilidad_articulos, name='utilidad_articulos'),
     path('exportar/utilidad-articulos/excel/', views.exportar_utilidad_articulos_excel, name='exportar_utilidad_articulos_excel'),
+    
+    # Exportaciones en segundo plano
+    path('exportaciones/<int:trabajo_id>/estado/', views_trabajos.exportacion_estado, name='exportacion_estado'),
+    path('exportaciones/<int:trabajo_id>/descargar/', views_trabajos.exportacion_descargar, name='exportacion_descargar'),
 ]
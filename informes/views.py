@@ -3,7 +3,7 @@ from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse, HttpResponse
 from django.db.models import Sum, Count, Avg, F, Q, DecimalField
-from django.db.models.functions import TruncDate, TruncMonth, Cast
+from django.db.models.functions import TruncDate, TruncMonth
 from datetime import datetime, timedelta
 from decimal import Decimal
 import json
@@ -14,9 +14,8 @@ from inventario.models import Stock
 from tesoreria.models import DocumentoCliente, PagoDocumentoCliente, MovimientoCuentaCorrienteCliente
 from caja.models import AperturaCaja
 from documentos.models import DocumentoCompra
+from .models import VentaDiaria, VentaDiariaArticulo
 from core.decorators import requiere_empresa
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -35,21 +34,26 @@ from .exportaciones import (
     exportar_categorias_excel,
     exportar_utilidad_articulos_excel
 )
+from .exportador_excel import Columna, ExportacionExcel, FORMATO_MONEDA, iterar
 
 
 @login_required
 @requiere_empresa
 def dashboard_informes(request):
-    """Dashboard principal de informes con BI Gerencial"""
+    """
+    Dashboard principal de informes con BI Gerencial.
+    Lee sólo las tablas de hechos diarios (ver informes.hechos), no las ventas.
+    """
     hoy = datetime.now().date()
     inicio_mes = hoy.replace(day=1)
     
+    hechos = VentaDiaria.objects.filter(empresa=request.empresa)
+    hechos_articulo = VentaDiariaArticulo.objects.filter(empresa=request.empresa)
+    
     # Ventas Mes Actual
-    ventas_mes = Venta.objects.filter(
-        empresa=request.empresa,
+    ventas_mes = hechos.filter(
         fecha__gte=inicio_mes,
-        fecha__lte=hoy,
-        estado='confirmada'
+        fecha__lte=hoy
     ).aggregate(total=Sum('total'))['total'] or Decimal('0')
     
     # Ventas Mes Anterior (mismo rango de días para comparación justa)
@@ -63,11 +67,9 @@ def dashboard_informes(request):
         # Si el mes anterior tiene menos días
         fin_mes_anterior_relativo = fin_mes_anterior
         
-    ventas_mes_anterior = Venta.objects.filter(
-        empresa=request.empresa,
+    ventas_mes_anterior = hechos.filter(
         fecha__gte=inicio_mes_anterior,
-        fecha__lte=fin_mes_anterior_relativo,
-        estado='confirmada'
+        fecha__lte=fin_mes_anterior_relativo
     ).aggregate(total=Sum('total'))['total'] or Decimal('0')
     
     # Variación
@@ -77,10 +79,8 @@ def dashboard_informes(request):
         variacion = 100 if ventas_mes > 0 else 0
         
     # Top 5 Productos (Cantidad)
-    top_productos_raw = VentaDetalle.objects.filter(
-        venta__empresa=request.empresa,
-        venta__fecha__gte=inicio_mes,
-        venta__estado='confirmada'
+    top_productos_raw = hechos_articulo.filter(
+        fecha__gte=inicio_mes
     ).values('articulo__nombre').annotate(
         total_qty=Sum('cantidad')
     ).order_by('-total_qty')[:5]
@@ -90,10 +90,8 @@ def dashboard_informes(request):
     
     # Ventas Diarias (Últimos 15 días)
     hace_15_dias = hoy - timedelta(days=14)
-    ventas_diarias_raw = Venta.objects.filter(
-        empresa=request.empresa,
-        fecha__gte=hace_15_dias,
-        estado='confirmada'
+    ventas_diarias_raw = hechos.filter(
+        fecha__gte=hace_15_dias
     ).values('fecha').annotate(
         total=Sum('total')
     ).order_by('fecha')
@@ -109,10 +107,8 @@ def dashboard_informes(request):
         curr += timedelta(days=1)
         
     # Ventas por Vendedor
-    ventas_vendedor_raw = Venta.objects.filter(
-        empresa=request.empresa,
+    ventas_vendedor_raw = hechos.filter(
         fecha__gte=inicio_mes,
-        estado='confirmada',
         vendedor__isnull=False
     ).values('vendedor__nombre').annotate(
         total=Sum('total')
@@ -126,23 +122,19 @@ def dashboard_informes(request):
     # ---------------------------
     
     # 1. Ventas por Categoría (Mes Actual)
-    ventas_categoria_raw = VentaDetalle.objects.filter(
-        venta__empresa=request.empresa,
-        venta__fecha__gte=inicio_mes,
-        venta__estado='confirmada'
-    ).values('articulo__categoria__nombre').annotate(
-        total=Sum('precio_total')
+    ventas_categoria_raw = hechos_articulo.filter(
+        fecha__gte=inicio_mes
+    ).values('categoria__nombre').annotate(
+        total=Sum('total')
     ).order_by('-total')
     
-    cat_labels = [c['articulo__categoria__nombre'] or 'Sin Categoría' for c in ventas_categoria_raw]
+    cat_labels = [c['categoria__nombre'] or 'Sin Categoría' for c in ventas_categoria_raw]
     cat_values = [float(c['total']) for c in ventas_categoria_raw]
 
     # 2. Comparativa Mensual (Últimos 12 meses)
     hace_12_meses = (hoy - timedelta(days=365)).replace(day=1)
-    ventas_mensuales_raw = Venta.objects.filter(
-        empresa=request.empresa,
-        fecha__gte=hace_12_meses,
-        estado='confirmada'
+    ventas_mensuales_raw = hechos.filter(
+        fecha__gte=hace_12_meses
     ).annotate(mes=TruncMonth('fecha')).values('mes').annotate(
         total=Sum('total')
     ).order_by('mes')
@@ -168,16 +160,12 @@ def dashboard_informes(request):
     anio_actual = hoy.year
     anio_anterior = anio_actual - 1
     
-    ventas_anio_actual = Venta.objects.filter(
-        empresa=request.empresa,
-        fecha__year=anio_actual,
-        estado='confirmada'
+    ventas_anio_actual = hechos.filter(
+        fecha__year=anio_actual
     ).aggregate(total=Sum('total'))['total'] or Decimal('0')
     
-    ventas_anio_anterior = Venta.objects.filter(
-        empresa=request.empresa,
-        fecha__year=anio_anterior,
-        estado='confirmada'
+    ventas_anio_anterior = hechos.filter(
+        fecha__year=anio_anterior
     ).aggregate(total=Sum('total'))['total'] or Decimal('0')
 
     # Cumplimiento de meta (Año actual vs Año anterior)
@@ -432,13 +420,9 @@ def informe_stock_actual(request):
 @requiere_empresa
 def informe_stock_bajo(request):
     """Informe de productos con stock bajo"""
-    # Convertir stock_minimo (CharField) a DecimalField para comparar con cantidad
     stocks_bajos = Stock.objects.filter(
-        bodega__empresa=request.empresa
-    ).annotate(
-        stock_minimo_decimal=Cast('articulo__stock_minimo', DecimalField(max_digits=10, decimal_places=2))
-    ).filter(
-        cantidad__lte=F('stock_minimo_decimal')
+        bodega__empresa=request.empresa,
+        cantidad__lte=F('articulo__stock_minimo')
     ).select_related('articulo', 'bodega').order_by('cantidad')
     
     context = {
@@ -616,95 +600,45 @@ def exportar_ventas_excel(request):
         fecha_desde = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
         fecha_hasta = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
     
-    # Obtener datos
-    ventas_query = Venta.objects.filter(
+    # Agrupar por fecha en la BD (una fila por día, no una por venta)
+    ventas = Venta.objects.filter(
         empresa=request.empresa,
         fecha__gte=fecha_desde,
         fecha__lte=fecha_hasta,
         estado='confirmada'
+    ).values('fecha').annotate(
+        total_ventas=Sum('total'),
+        cantidad_ventas=Count('id')
     ).order_by('fecha')
     
-    # Agrupar por fecha
-    ventas_por_fecha = {}
-    for venta in ventas_query:
-        fecha_key = venta.fecha
-        if fecha_key not in ventas_por_fecha:
-            ventas_por_fecha[fecha_key] = {
-                'fecha_solo': fecha_key,
-                'total_ventas': 0,
-                'cantidad_ventas': 0
-            }
-        ventas_por_fecha[fecha_key]['total_ventas'] += float(venta.total)
-        ventas_por_fecha[fecha_key]['cantidad_ventas'] += 1
-    
-    ventas = sorted(ventas_por_fecha.values(), key=lambda x: x['fecha_solo'])
-    
     # Crear Excel
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Ventas por Período"
-    
-    # Estilos
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    excel = ExportacionExcel(
+        "Ventas por Período",
+        f"Informe de Ventas - {request.empresa.nombre}",
+        [
+            Columna('Fecha', 15),
+            Columna('Cantidad Ventas', 18),
+            Columna('Total Ventas', 18, FORMATO_MONEDA),
+            Columna('Ticket Promedio', 18, FORMATO_MONEDA),
+        ],
+        subtitulo=f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}",
     )
     
-    # Título
-    ws['A1'] = f"Informe de Ventas - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A2'] = f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}"
-    
-    # Headers
-    headers = ['Fecha', 'Cantidad Ventas', 'Total Ventas', 'Ticket Promedio']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=4, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
     # Datos
-    row = 5
-    for venta in ventas:
-        ws.cell(row=row, column=1, value=venta['fecha_solo'].strftime('%d/%m/%Y')).border = border
-        ws.cell(row=row, column=2, value=venta['cantidad_ventas']).border = border
-        ws.cell(row=row, column=3, value=venta['total_ventas']).border = border
-        ws.cell(row=row, column=3).number_format = '$#,##0'
-        ticket_prom = venta['total_ventas'] / venta['cantidad_ventas'] if venta['cantidad_ventas'] > 0 else 0
-        ws.cell(row=row, column=4, value=ticket_prom).border = border
-        ws.cell(row=row, column=4).number_format = '$#,##0'
-        row += 1
+    total_general = 0
+    cantidad_total = 0
+    for venta in iterar(ventas):
+        total_dia = float(venta['total_ventas'] or 0)
+        total_general += total_dia
+        cantidad_total += venta['cantidad_ventas']
+        ticket_prom = total_dia / venta['cantidad_ventas'] if venta['cantidad_ventas'] > 0 else 0
+        excel.fila([venta['fecha'].strftime('%d/%m/%Y'), venta['cantidad_ventas'], total_dia, ticket_prom])
     
     # Totales
-    total_general = sum(v['total_ventas'] for v in ventas)
-    cantidad_total = sum(v['cantidad_ventas'] for v in ventas)
     ticket_promedio = total_general / cantidad_total if cantidad_total > 0 else 0
+    excel.total(["TOTAL", cantidad_total, total_general, ticket_promedio], borde=False)
     
-    ws.cell(row=row, column=1, value="TOTAL").font = Font(bold=True)
-    ws.cell(row=row, column=2, value=cantidad_total).font = Font(bold=True)
-    ws.cell(row=row, column=3, value=total_general).font = Font(bold=True)
-    ws.cell(row=row, column=3).number_format = '$#,##0'
-    ws.cell(row=row, column=4, value=ticket_promedio).font = Font(bold=True)
-    ws.cell(row=row, column=4).number_format = '$#,##0'
-    
-    # Ajustar anchos
-    ws.column_dimensions['A'].width = 15
-    ws.column_dimensions['B'].width = 18
-    ws.column_dimensions['C'].width = 18
-    ws.column_dimensions['D'].width = 18
-    
-    # Respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename=ventas_{fecha_desde}_{fecha_hasta}.xlsx'
-    wb.save(response)
-    return response
+    return excel.respuesta(f'ventas_{fecha_desde}_{fecha_hasta}.xlsx')
 
 
 @login_required
@@ -734,59 +668,31 @@ def exportar_productos_excel(request):
     ).order_by('-cantidad_vendida')[:50]
     
     # Crear Excel
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Productos Más Vendidos"
-    
-    # Estilos
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    excel = ExportacionExcel(
+        "Productos Más Vendidos",
+        f"Productos Más Vendidos - {request.empresa.nombre}",
+        [
+            Columna('#', 8),
+            Columna('Código', 15),
+            Columna('Producto', 40),
+            Columna('Cantidad', 15),
+            Columna('Total Vendido', 18, FORMATO_MONEDA),
+        ],
+        subtitulo=f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}",
     )
     
-    # Título
-    ws['A1'] = f"Productos Más Vendidos - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A2'] = f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}"
-    
-    # Headers
-    headers = ['#', 'Código', 'Producto', 'Cantidad', 'Total Vendido']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=4, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Datos
-    row = 5
-    for idx, producto in enumerate(productos, start=1):
-        ws.cell(row=row, column=1, value=idx).border = border
-        ws.cell(row=row, column=2, value=producto['articulo__codigo']).border = border
-        ws.cell(row=row, column=3, value=producto['articulo__nombre']).border = border
-        ws.cell(row=row, column=4, value=float(producto['cantidad_vendida'])).border = border
-        ws.cell(row=row, column=5, value=float(producto['total_vendido'])).border = border
-        ws.cell(row=row, column=5).number_format = '$#,##0'
-        row += 1
-    
-    # Ajustar anchos
-    ws.column_dimensions['A'].width = 8
-    ws.column_dimensions['B'].width = 15
-    ws.column_dimensions['C'].width = 40
-    ws.column_dimensions['D'].width = 15
-    ws.column_dimensions['E'].width = 18
-    
-    # Respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    excel.filas(
+        [
+            idx,
+            producto['articulo__codigo'],
+            producto['articulo__nombre'],
+            float(producto['cantidad_vendida']),
+            float(producto['total_vendido']),
+        ]
+        for idx, producto in enumerate(productos, start=1)
     )
-    response['Content-Disposition'] = f'attachment; filename=productos_vendidos_{fecha_desde}_{fecha_hasta}.xlsx'
-    wb.save(response)
-    return response
+    
+    return excel.respuesta(f'productos_vendidos_{fecha_desde}_{fecha_hasta}.xlsx')
 
 
 @login_required
@@ -816,70 +722,37 @@ def exportar_stock_excel(request):
     stocks = stocks.order_by('bodega__nombre', 'articulo__nombre')
     
     # Crear Excel
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Stock Actual"
-    
-    # Estilos
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    excel = ExportacionExcel(
+        "Stock Actual",
+        f"Stock Actual - {request.empresa.nombre}",
+        [
+            Columna('Bodega', 20),
+            Columna('Código', 15),
+            Columna('Artículo', 40),
+            Columna('Stock', 12),
+            Columna('Precio Promedio', 18, FORMATO_MONEDA),
+            Columna('Valorización', 18, FORMATO_MONEDA),
+        ],
     )
     
-    # Título
-    ws['A1'] = f"Stock Actual - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    
-    # Headers
-    headers = ['Bodega', 'Código', 'Artículo', 'Stock', 'Precio Promedio', 'Valorización']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=3, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
     # Datos
-    row = 4
     total_valorizacion = 0
-    for stock in stocks:
+    for stock in iterar(stocks):
         valorizacion = float(stock.cantidad) * float(stock.precio_promedio)
         total_valorizacion += valorizacion
-        
-        ws.cell(row=row, column=1, value=stock.bodega.nombre).border = border
-        ws.cell(row=row, column=2, value=stock.articulo.codigo).border = border
-        ws.cell(row=row, column=3, value=stock.articulo.nombre).border = border
-        ws.cell(row=row, column=4, value=float(stock.cantidad)).border = border
-        ws.cell(row=row, column=5, value=float(stock.precio_promedio)).border = border
-        ws.cell(row=row, column=5).number_format = '$#,##0'
-        ws.cell(row=row, column=6, value=valorizacion).border = border
-        ws.cell(row=row, column=6).number_format = '$#,##0'
-        row += 1
+        excel.fila([
+            stock.bodega.nombre,
+            stock.articulo.codigo,
+            stock.articulo.nombre,
+            float(stock.cantidad),
+            float(stock.precio_promedio),
+            valorizacion,
+        ])
     
     # Total
-    ws.cell(row=row, column=5, value="TOTAL:").font = Font(bold=True)
-    ws.cell(row=row, column=6, value=total_valorizacion).font = Font(bold=True)
-    ws.cell(row=row, column=6).number_format = '$#,##0'
-    
-    # Ajustar anchos
-    ws.column_dimensions['A'].width = 20
-    ws.column_dimensions['B'].width = 15
-    ws.column_dimensions['C'].width = 40
-    ws.column_dimensions['D'].width = 12
-    ws.column_dimensions['E'].width = 18
-    ws.column_dimensions['F'].width = 18
-    
-    # Respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename=stock_actual.xlsx'
-    wb.save(response)
-    return response
+    excel.total([None, None, None, None, "TOTAL:", total_valorizacion], borde=False)
+    
+    return excel.respuesta('stock_actual.xlsx')
 
 
 @login_required
@@ -893,65 +766,38 @@ def exportar_clientes_excel(request):
     ).order_by('nombre')
     
     # Crear Excel
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Clientes"
-    
-    # Estilos
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    excel = ExportacionExcel(
+        "Clientes",
+        f"Listado de Clientes - {request.empresa.nombre}",
+        [
+            Columna('RUT', 15),
+            Columna('Nombre', 35),
+            Columna('Giro', 30),
+            Columna('Dirección', 35),
+            Columna('Comuna', 20),
+            Columna('Ciudad', 20),
+            Columna('Región', 20),
+            Columna('Teléfono', 15),
+            Columna('Email', 30),
+        ],
     )
     
-    # Título
-    ws['A1'] = f"Listado de Clientes - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    
-    # Headers
-    headers = ['RUT', 'Nombre', 'Giro', 'Dirección', 'Comuna', 'Ciudad', 'Región', 'Teléfono', 'Email']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=3, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Datos
-    row = 4
-    for cliente in clientes:
-        ws.cell(row=row, column=1, value=cliente.rut).border = border
-        ws.cell(row=row, column=2, value=cliente.nombre).border = border
-        ws.cell(row=row, column=3, value=cliente.giro or '').border = border
-        ws.cell(row=row, column=4, value=cliente.direccion or '').border = border
-        ws.cell(row=row, column=5, value=cliente.comuna or '').border = border
-        ws.cell(row=row, column=6, value=cliente.ciudad or '').border = border
-        ws.cell(row=row, column=7, value=cliente.region or '').border = border
-        ws.cell(row=row, column=8, value=cliente.telefono or '').border = border
-        ws.cell(row=row, column=9, value=cliente.email or '').border = border
-        row += 1
-    
-    # Ajustar anchos
-    ws.column_dimensions['A'].width = 15
-    ws.column_dimensions['B'].width = 35
-    ws.column_dimensions['C'].width = 30
-    ws.column_dimensions['D'].width = 35
-    ws.column_dimensions['E'].width = 20
-    ws.column_dimensions['F'].width = 20
-    ws.column_dimensions['G'].width = 20
-    ws.column_dimensions['H'].width = 15
-    ws.column_dimensions['I'].width = 30
-    
-    # Respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    excel.filas(
+        [
+            cliente.rut,
+            cliente.nombre,
+            cliente.giro or '',
+            cliente.direccion or '',
+            cliente.comuna or '',
+            cliente.ciudad or '',
+            cliente.region or '',
+            cliente.telefono or '',
+            cliente.email or '',
+        ]
+        for cliente in iterar(clientes)
     )
-    response['Content-Disposition'] = 'attachment; filename=clientes.xlsx'
-    wb.save(response)
-    return response
+    
+    return excel.respuesta('clientes.xlsx')
 
 
 @login_required
@@ -965,63 +811,36 @@ def exportar_proveedores_excel(request):
     ).order_by('nombre')
     
     # Crear Excel
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Proveedores"
-    
-    # Estilos
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    excel = ExportacionExcel(
+        "Proveedores",
+        f"Listado de Proveedores - {request.empresa.nombre}",
+        [
+            Columna('RUT', 15),
+            Columna('Nombre', 35),
+            Columna('Giro', 30),
+            Columna('Dirección', 35),
+            Columna('Comuna', 20),
+            Columna('Ciudad', 20),
+            Columna('Teléfono', 15),
+            Columna('Email', 30),
+        ],
     )
     
-    # Título
-    ws['A1'] = f"Listado de Proveedores - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    
-    # Headers
-    headers = ['RUT', 'Nombre', 'Giro', 'Dirección', 'Comuna', 'Ciudad', 'Teléfono', 'Email']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=3, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Datos
-    row = 4
-    for proveedor in proveedores:
-        ws.cell(row=row, column=1, value=proveedor.rut).border = border
-        ws.cell(row=row, column=2, value=proveedor.nombre).border = border
-        ws.cell(row=row, column=3, value=proveedor.giro or '').border = border
-        ws.cell(row=row, column=4, value=proveedor.direccion or '').border = border
-        ws.cell(row=row, column=5, value=proveedor.comuna or '').border = border
-        ws.cell(row=row, column=6, value=proveedor.ciudad or '').border = border
-        ws.cell(row=row, column=7, value=proveedor.telefono or '').border = border
-        ws.cell(row=row, column=8, value=proveedor.email or '').border = border
-        row += 1
-    
-    # Ajustar anchos
-    ws.column_dimensions['A'].width = 15
-    ws.column_dimensions['B'].width = 35
-    ws.column_dimensions['C'].width = 30
-    ws.column_dimensions['D'].width = 35
-    ws.column_dimensions['E'].width = 20
-    ws.column_dimensions['F'].width = 20
-    ws.column_dimensions['G'].width = 15
-    ws.column_dimensions['H'].width = 30
-    
-    # Respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    excel.filas(
+        [
+            proveedor.rut,
+            proveedor.nombre,
+            proveedor.giro or '',
+            proveedor.direccion or '',
+            proveedor.comuna or '',
+            proveedor.ciudad or '',
+            proveedor.telefono or '',
+            proveedor.email or '',
+        ]
+        for proveedor in iterar(proveedores)
     )
-    response['Content-Disposition'] = 'attachment; filename=proveedores.xlsx'
-    wb.save(response)
-    return response
+    
+    return excel.respuesta('proveedores.xlsx')
 
 
 @login_required
@@ -1035,71 +854,40 @@ def exportar_articulos_excel(request):
     ).select_related('categoria', 'unidad_medida').order_by('codigo')
     
     # Crear Excel
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Artículos"
-    
-    # Estilos
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    excel = ExportacionExcel(
+        "Artículos",
+        f"Listado de Artículos - {request.empresa.nombre}",
+        [
+            Columna('Código', 15),
+            Columna('Nombre', 35),
+            Columna('Descripción', 40),
+            Columna('Categoría', 20),
+            Columna('Unidad', 12),
+            Columna('Precio Costo', 15, FORMATO_MONEDA),
+            Columna('Precio Venta', 15, FORMATO_MONEDA),
+            Columna('Precio Final', 15, FORMATO_MONEDA),
+            Columna('Margen %', 12, '0.00"%"'),
+            Columna('Código Barras', 18),
+        ],
     )
     
-    # Título
-    ws['A1'] = f"Listado de Artículos - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    
-    # Headers
-    headers = ['Código', 'Nombre', 'Descripción', 'Categoría', 'Unidad', 'Precio Costo', 'Precio Venta', 'Precio Final', 'Margen %', 'Código Barras']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=3, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Datos
-    row = 4
-    for articulo in articulos:
-        ws.cell(row=row, column=1, value=articulo.codigo).border = border
-        ws.cell(row=row, column=2, value=articulo.nombre).border = border
-        ws.cell(row=row, column=3, value=articulo.descripcion or '').border = border
-        ws.cell(row=row, column=4, value=articulo.categoria.nombre if articulo.categoria else '').border = border
-        ws.cell(row=row, column=5, value=articulo.unidad_medida.nombre if articulo.unidad_medida else '').border = border
-        ws.cell(row=row, column=6, value=float(articulo.precio_costo)).border = border
-        ws.cell(row=row, column=6).number_format = '$#,##0'
-        ws.cell(row=row, column=7, value=float(articulo.precio_venta)).border = border
-        ws.cell(row=row, column=7).number_format = '$#,##0'
-        ws.cell(row=row, column=8, value=float(articulo.precio_final)).border = border
-        ws.cell(row=row, column=8).number_format = '$#,##0'
-        ws.cell(row=row, column=9, value=float(articulo.margen_porcentaje)).border = border
-        ws.cell(row=row, column=9).number_format = '0.00"%"'
-        ws.cell(row=row, column=10, value=articulo.codigo_barras or '').border = border
-        row += 1
-    
-    # Ajustar anchos
-    ws.column_dimensions['A'].width = 15
-    ws.column_dimensions['B'].width = 35
-    ws.column_dimensions['C'].width = 40
-    ws.column_dimensions['D'].width = 20
-    ws.column_dimensions['E'].width = 12
-    ws.column_dimensions['F'].width = 15
-    ws.column_dimensions['G'].width = 15
-    ws.column_dimensions['H'].width = 15
-    ws.column_dimensions['I'].width = 12
-    ws.column_dimensions['J'].width = 18
-    
-    # Respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    excel.filas(
+        [
+            articulo.codigo,
+            articulo.nombre,
+            articulo.descripcion or '',
+            articulo.categoria.nombre if articulo.categoria else '',
+            articulo.unidad_medida.nombre if articulo.unidad_medida else '',
+            float(articulo.precio_costo),
+            float(articulo.precio_venta),
+            float(articulo.precio_final),
+            float(articulo.margen_porcentaje),
+            articulo.codigo_barras or '',
+        ]
+        for articulo in iterar(articulos)
     )
-    response['Content-Disposition'] = 'attachment; filename=articulos.xlsx'
-    wb.save(response)
-    return response
+    
+    return excel.respuesta('articulos.xlsx')
 
 
 @login_required
@@ -1130,7 +918,7 @@ def informe_utilidad_familias(request):
         'articulo__categoria__nombre'
     ).annotate(
         total_ventas=Sum(F('cantidad') * F('precio_unitario'), output_field=DecimalField(max_digits=20, decimal_places=2)),
-        total_costo=Sum(F('cantidad') * Cast(F('articulo__precio_costo'), DecimalField(max_digits=20, decimal_places=2)), output_field=DecimalField(max_digits=20, decimal_places=2)),
+        total_costo=Sum(F('cantidad') * F('articulo__precio_costo'), output_field=DecimalField(max_digits=20, decimal_places=2)),
         cantidad_vendida=Sum('cantidad'),
         num_ventas=Count('venta', distinct=True)
     )
@@ -1213,7 +1001,7 @@ def informe_utilidad_familias_detalle(request, familia_id):
         'articulo__nombre'
     ).annotate(
         total_ventas=Sum(F('cantidad') * F('precio_unitario'), output_field=DecimalField(max_digits=20, decimal_places=2)),
-        total_costo=Sum(F('cantidad') * Cast(F('articulo__precio_costo'), DecimalField(max_digits=20, decimal_places=2)), output_field=DecimalField(max_digits=20, decimal_places=2)),
+        total_costo=Sum(F('cantidad') * F('articulo__precio_costo'), output_field=DecimalField(max_digits=20, decimal_places=2)),
         cantidad_vendida=Sum('cantidad')
     ).order_by('-total_ventas')
     
@@ -1270,60 +1058,31 @@ def exportar_ventas_vendedor_excel(request):
     ).order_by('-total_ventas')
     
     # Crear Excel
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Ventas por Vendedor"
-    
-    # Estilos
-    header_fill = PatternFill(start_color="8B7355", end_color="8B7355", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    excel = ExportacionExcel(
+        "Ventas por Vendedor",
+        f"Ventas por Vendedor - {request.empresa.nombre}",
+        [
+            Columna('Código', 12),
+            Columna('Vendedor', 35),
+            Columna('Cant. Ventas', 15),
+            Columna('Total Vendido', 18, FORMATO_MONEDA),
+            Columna('Ticket Promedio', 18, FORMATO_MONEDA),
+        ],
+        subtitulo=f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}",
     )
     
-    # Título
-    ws['A1'] = f"Ventas por Vendedor - {request.empresa.nombre}"
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A2'] = f"Período: {fecha_desde.strftime('%d/%m/%Y')} - {fecha_hasta.strftime('%d/%m/%Y')}"
-    
-    # Headers
-    headers = ['Código', 'Vendedor', 'Cant. Ventas', 'Total Vendido', 'Ticket Promedio']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=4, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Datos
-    row = 5
-    for vendedor in ventas_vendedor:
-        ws.cell(row=row, column=1, value=vendedor['vendedor__codigo']).border = border
-        ws.cell(row=row, column=2, value=vendedor['vendedor__nombre']).border = border
-        ws.cell(row=row, column=3, value=vendedor['cantidad_ventas']).border = border
-        ws.cell(row=row, column=4, value=float(vendedor['total_ventas'])).border = border
-        ws.cell(row=row, column=4).number_format = '$#,##0'
-        ws.cell(row=row, column=5, value=float(vendedor['ticket_promedio'])).border = border
-        ws.cell(row=row, column=5).number_format = '$#,##0'
-        row += 1
-    
-    # Ajustar anchos
-    ws.column_dimensions['A'].width = 12
-    ws.column_dimensions['B'].width = 35
-    ws.column_dimensions['C'].width = 15
-    ws.column_dimensions['D'].width = 18
-    ws.column_dimensions['E'].width = 18
-    
-    # Respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    excel.filas(
+        [
+            vendedor['vendedor__codigo'],
+            vendedor['vendedor__nombre'],
+            vendedor['cantidad_ventas'],
+            float(vendedor['total_ventas']),
+            float(vendedor['ticket_promedio']),
+        ]
+        for vendedor in iterar(ventas_vendedor)
     )
-    response['Content-Disposition'] = f'attachment; filename=ventas_vendedor_{fecha_desde}_{fecha_hasta}.xlsx'
-    wb.save(response)
-    return response
+    
+    return excel.respuesta(f'ventas_vendedor_{fecha_desde}_{fecha_hasta}.xlsx')
 
 
 @login_required
@@ -1355,7 +1114,7 @@ def informe_utilidad_articulos(request):
         'articulo__categoria__nombre'
     ).annotate(
         total_ventas=Sum(F('cantidad') * F('precio_unitario'), output_field=DecimalField(max_digits=20, decimal_places=2)),
-        total_costo=Sum(F('cantidad') * Cast(F('articulo__precio_costo'), DecimalField(max_digits=20, decimal_places=2)), output_field=DecimalField(max_digits=20, decimal_places=2)),
+        total_costo=Sum(F('cantidad') * F('articulo__precio_costo'), output_field=DecimalField(max_digits=20, decimal_places=2)),
         cantidad_vendida=Sum('cantidad')
     )
     
@@ -0,0 +1,82 @@
+"""
+Vistas de exportaciones en segundo plano: inicio, estado (polling) y descarga.
+"""
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+
+from core.decorators import requiere_empresa
+from .models import TrabajoExportacion
+from .trabajos import crear_trabajo, revisar_trabajos_detenidos
+
+
+def iniciar_exportacion(request, tipo, titulo, volver_url=None):
+    """
+    Crea el trabajo de exportación con los parámetros GET de la petición.
+    Si el usuario ya tiene la misma exportación en curso (recarga, doble
+    clic) se reutiliza ese trabajo en vez de crear otro.
+    Responde JSON a las llamadas AJAX; en otro caso muestra la página de
+    progreso, que descarga el archivo al terminar.
+    """
+    parametros = request.GET.dict()
+    parametros.pop('formato', None)
+    trabajo = crear_trabajo(request.empresa, request.user, tipo, parametros)
+    
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.GET.get('formato') == 'json':
+        return JsonResponse(_estado_json(trabajo))
+    
+    if trabajo.estado == 'completado':
+        return redirect('informes:exportacion_descargar', trabajo_id=trabajo.id)
+    
+    return render(request, 'informes/exportacion_progreso.html', {
+        'trabajo': trabajo,
+        'titulo': titulo,
+        'volver_url': volver_url or request.META.get('HTTP_REFERER', ''),
+    })
+
+
+def _trabajo_usuario(request, trabajo_id):
+    trabajo = get_object_or_404(TrabajoExportacion, pk=trabajo_id, empresa=request.empresa)
+    if trabajo.usuario_id and trabajo.usuario_id != request.user.id and not request.user.is_superuser:
+        raise Http404("Exportación no encontrada")
+    return trabajo
+
+
+def _estado_json(trabajo):
+    return {
+        'success': trabajo.estado != 'error',
+        'id': trabajo.id,
+        'estado': trabajo.estado,
+        'progreso': trabajo.progreso,
+        'mensaje': trabajo.mensaje,
+        'terminado': trabajo.terminado,
+        'estado_url': reverse('informes:exportacion_estado', args=[trabajo.id]),
+        'descargar_url': reverse('informes:exportacion_descargar', args=[trabajo.id]) if trabajo.estado == 'completado' else None,
+    }
+
+
+@login_required
+@requiere_empresa
+def exportacion_estado(request, trabajo_id):
+    """Estado y avance de un trabajo (consultado periódicamente por la interfaz)"""
+    trabajo = _trabajo_usuario(request, trabajo_id)
+    if not trabajo.terminado and revisar_trabajos_detenidos(TrabajoExportacion.objects.filter(pk=trabajo.pk)) != (0, 0):
+        trabajo.refresh_from_db()
+    return JsonResponse(_estado_json(trabajo))
+
+
+@login_required
+@requiere_empresa
+def exportacion_descargar(request, trabajo_id):
+    """Descarga el archivo generado"""
+    trabajo = _trabajo_usuario(request, trabajo_id)
+    if trabajo.estado != 'completado' or not trabajo.archivo:
+        raise Http404("El archivo aún no está disponible")
+    
+    return FileResponse(
+        trabajo.archivo.open('rb'),
+        as_attachment=trabajo.content_type != 'application/pdf',
+        filename=trabajo.nombre_archivo,
+        content_type=trabajo.content_type or None,
+    )
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Inventario, Stock, TransferenciaInventario
+from .models import CierreKardex, Inventario, SaldoKardex, Stock, TransferenciaInventario
 
 
 @admin.register(Inventario)
@@ -31,7 +31,7 @@ class InventarioAdmin(admin.ModelAdmin):
     )
     autocomplete_fields = ("articulo", "transferencia")
     raw_id_fields = ("bodega_origen", "bodega_destino")
-    readonly_fields = ("total",)
+    readonly_fields = ("total", "cantidad_firmada")
     date_hierarchy = "fecha_movimiento"
 
 
@@ -49,3 +49,18 @@ class TransferenciaInventarioAdmin(admin.ModelAdmin):
     list_filter = ("estado", "fecha_transferencia", "bodega_origen", "bodega_destino")
     search_fields = ("numero_folio", "bodega_origen__nombre", "bodega_destino__nombre")
     raw_id_fields = ("bodega_origen", "bodega_destino", "creado_por")
+
+
+@admin.register(CierreKardex)
+class CierreKardexAdmin(admin.ModelAdmin):
+    list_display = ("empresa", "periodo", "movimientos", "fecha_cierre")
+    list_filter = ("empresa", "periodo")
+    readonly_fields = ("fecha_cierre",)
+
+
+@admin.register(SaldoKardex)
+class SaldoKardexAdmin(admin.ModelAdmin):
+    list_display = ("cierre", "articulo", "bodega", "saldo")
+    list_filter = ("cierre__periodo", "bodega")
+    search_fields = ("articulo__nombre", "articulo__codigo")
+    raw_id_fields = ("cierre", "articulo", "bodega")
@@ -0,0 +1,210 @@
+"""
+Kardex (cartola) de artículos con saldos de cierre mensual.
+
+El saldo inicial del kardex se calculaba recorriendo en Python todos los
+movimientos confirmados anteriores a la fecha desde, así que un artículo con
+años de ventas en el POS tardaba segundos. Ahora:
+
+- Cada movimiento guarda cantidad_firmada (+ en bodega_destino, - en
+  bodega_origen, como el ledger de Stock) y el índice inv_kardex_idx
+  (empresa, articulo, fecha_movimiento) la incluye: el saldo de un rango de
+  fechas es un solo SUM que se resuelve con el índice.
+- cerrar_kardex() guarda, para cada mes terminado, el saldo de cada
+  (artículo, bodega) al cierre (CierreKardex / SaldoKardex). Cada cierre se
+  calcula desde el cierre anterior más los movimientos del mes.
+- Saldo a una fecha = saldo del último cierre anterior + SUM de los
+  movimientos desde ese cierre: el costo no depende de la antigüedad del
+  artículo.
+- Un movimiento con fecha en un mes ya cerrado (ajustes con fecha pasada,
+  ediciones, eliminaciones) descarta ese cierre y los siguientes, que se
+  vuelven a calcular en el próximo cerrar_kardex.
+
+El comando cerrar_kardex cierra los meses pendientes (para ejecutarlo en un
+cron a comienzos de cada mes).
+"""
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Min, Q, Sum, Value, When
+from django.utils import timezone
+
+from .models import CierreKardex, Inventario, SaldoKardex
+from .services import saldos_desde_ledger
+
+
+CANTIDAD = DecimalField(max_digits=14, decimal_places=2)
+
+
+def inicio_mes(fecha):
+    return date(fecha.year, fecha.month, 1)
+
+
+def mes_siguiente(periodo):
+    if periodo.month == 12:
+        return date(periodo.year + 1, 1, 1)
+    return date(periodo.year, periodo.month + 1, 1)
+
+
+def inicio_dia(fecha):
+    """Inicio del día en la zona horaria local (límite de rango sin __date)"""
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def periodo_abierto():
+    """Primer día del mes en curso: los meses desde aquí no se cierran"""
+    return inicio_mes(timezone.localdate())
+
+
+def movimientos_articulo(empresa, articulo, bodega=None):
+    """Movimientos confirmados del artículo (en una bodega o en todas)"""
+    movimientos = Inventario.objects.filter(empresa=empresa, articulo=articulo, estado='confirmado')
+    if bodega is not None:
+        movimientos = movimientos.filter(Q(bodega_origen=bodega) | Q(bodega_destino=bodega))
+    return movimientos
+
+
+def _cantidad_en_bodega(bodega):
+    """Efecto de cada movimiento en el saldo de la bodega"""
+    return (
+        Case(When(bodega_destino=bodega, then=F('cantidad')), default=Value(Decimal('0')), output_field=CANTIDAD)
+        - Case(When(bodega_origen=bodega, then=F('cantidad')), default=Value(Decimal('0')), output_field=CANTIDAD)
+    )
+
+
+def suma_movimientos(movimientos, bodega=None):
+    """Suma con signo de los movimientos (un solo SUM)"""
+    expresion = _cantidad_en_bodega(bodega) if bodega is not None else F('cantidad_firmada')
+    return movimientos.aggregate(total=Sum(expresion, output_field=CANTIDAD))['total'] or Decimal('0')
+
+
+def ultimo_cierre(empresa, antes_de=None):
+    """Último cierre de la empresa que termina antes de la fecha (date)"""
+    cierres = CierreKardex.objects.filter(empresa=empresa)
+    if antes_de is not None:
+        cierres = cierres.filter(periodo__lt=inicio_mes(antes_de))
+    return cierres.order_by('-periodo').first()
+
+
+def saldo_kardex(empresa, articulo, fecha, bodega=None):
+    """
+    Saldo del artículo al inicio de `fecha` (date): saldo del último cierre
+    anterior más los movimientos posteriores al cierre.
+
+    Returns:
+        Decimal: Saldo en la bodega o en todas las bodegas de la empresa
+    """
+    movimientos = movimientos_articulo(empresa, articulo, bodega).filter(fecha_movimiento__lt=inicio_dia(fecha))
+
+    saldo = Decimal('0')
+    cierre = ultimo_cierre(empresa, antes_de=fecha)
+    if cierre is not None:
+        saldos = SaldoKardex.objects.filter(cierre=cierre, articulo=articulo)
+        if bodega is not None:
+            saldos = saldos.filter(bodega=bodega)
+        saldo = saldos.aggregate(total=Sum('saldo'))['total'] or Decimal('0')
+        movimientos = movimientos.filter(fecha_movimiento__gte=inicio_dia(mes_siguiente(cierre.periodo)))
+
+    return saldo + suma_movimientos(movimientos, bodega)
+
+
+@transaction.atomic
+def cerrar_periodo(empresa, periodo):
+    """
+    Calcula y guarda los saldos de la empresa al término del mes `periodo`
+    desde el cierre anterior (o desde el inicio del ledger si no hay).
+
+    Returns:
+        CierreKardex
+    """
+    periodo = inicio_mes(periodo)
+    if periodo >= periodo_abierto():
+        raise ValueError(f"El periodo {periodo:%m/%Y} todavía no termina")
+
+    fin = inicio_dia(mes_siguiente(periodo))
+    anterior = ultimo_cierre(empresa, antes_de=periodo)
+    saldos = {}
+    desde = None
+    if anterior is not None:
+        for articulo_id, bodega_id, saldo in SaldoKardex.objects.filter(cierre=anterior).values_list(
+            'articulo_id', 'bodega_id', 'saldo'
+        ).iterator(chunk_size=5000):
+            saldos[(articulo_id, bodega_id)] = saldo
+        desde = inicio_dia(mes_siguiente(anterior.periodo))
+
+    for (_empresa_id, bodega_id, articulo_id), delta in saldos_desde_ledger(empresa, desde=desde, hasta=fin).items():
+        clave = (articulo_id, bodega_id)
+        saldos[clave] = saldos.get(clave, Decimal('0')) + delta
+
+    CierreKardex.objects.filter(empresa=empresa, periodo=periodo).delete()
+    cierre = CierreKardex.objects.create(
+        empresa=empresa,
+        periodo=periodo,
+        movimientos=Inventario.objects.filter(
+            empresa=empresa,
+            estado='confirmado',
+            fecha_movimiento__gte=inicio_dia(periodo),
+            fecha_movimiento__lt=fin,
+        ).count(),
+    )
+    SaldoKardex.objects.bulk_create(
+        [
+            SaldoKardex(cierre=cierre, articulo_id=articulo_id, bodega_id=bodega_id, saldo=saldo)
+            for (articulo_id, bodega_id), saldo in saldos.items()
+            if saldo != 0
+        ],
+        batch_size=1000,
+    )
+    return cierre
+
+
+def cerrar_kardex(empresa, hasta=None, recalcular=False):
+    """
+    Cierra los meses terminados que la empresa no tenga cerrados, en orden.
+
+    Args:
+        empresa: Empresa a cerrar
+        hasta: Último mes a cerrar (date; por defecto el mes anterior al actual)
+        recalcular: Descarta los cierres existentes y los calcula de nuevo
+
+    Returns:
+        list: CierreKardex creados
+    """
+    ultimo = mes_siguiente(inicio_mes(hasta)) if hasta else periodo_abierto()
+    ultimo = min(ultimo, periodo_abierto())
+
+    if recalcular:
+        CierreKardex.objects.filter(empresa=empresa).delete()
+
+    anterior = ultimo_cierre(empresa)
+    if anterior is not None:
+        periodo = mes_siguiente(anterior.periodo)
+    else:
+        primero = Inventario.objects.filter(empresa=empresa, estado='confirmado').aggregate(
+            primero=Min('fecha_movimiento')
+        )['primero']
+        if primero is None:
+            return []
+        periodo = inicio_mes(timezone.localtime(primero))
+
+    cierres = []
+    while periodo < ultimo:
+        cierres.append(cerrar_periodo(empresa, periodo))
+        periodo = mes_siguiente(periodo)
+    return cierres
+
+
+def invalidar_cierres(empresa_id, fecha_movimiento):
+    """
+    Descarta los cierres afectados por un movimiento con fecha en un mes ya
+    cerrado. No consulta la base de datos para movimientos del mes en curso.
+    """
+    if not empresa_id or fecha_movimiento is None:
+        return 0
+    if timezone.is_aware(fecha_movimiento):
+        fecha_movimiento = timezone.localtime(fecha_movimiento)
+    periodo = inicio_mes(fecha_movimiento)
+    if periodo >= periodo_abierto():
+        return 0
+    eliminados, _ = CierreKardex.objects.filter(empresa_id=empresa_id, periodo__gte=periodo).delete()
+    return eliminados
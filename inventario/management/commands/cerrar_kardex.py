@@ -0,0 +1,53 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from empresas.models import Empresa
+from inventario.kardex import cerrar_kardex
+
+
+class Command(BaseCommand):
+    help = (
+        'Cierra los meses terminados del kardex: guarda el saldo de cada artículo y bodega al cierre '
+        'para que el saldo inicial del kardex no recorra todo el historial (ejecutar a comienzos de mes)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa (por defecto todas)')
+        parser.add_argument('--hasta', help='Último mes a cerrar, AAAA-MM (por defecto el mes anterior)')
+        parser.add_argument(
+            '--recalcular',
+            action='store_true',
+            help='Descarta los cierres existentes y los calcula de nuevo desde el primer movimiento',
+        )
+
+    def handle(self, *args, **options):
+        hasta = None
+        if options.get('hasta'):
+            try:
+                hasta = datetime.strptime(options['hasta'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--hasta debe tener el formato AAAA-MM')
+
+        empresas = Empresa.objects.all().order_by('id')
+        if options.get('empresa'):
+            empresas = empresas.filter(pk=options['empresa'])
+            if not empresas.exists():
+                raise CommandError(f"Empresa {options['empresa']} no encontrada")
+
+        total = 0
+        for empresa in empresas:
+            inicio = time.perf_counter()
+            cierres = cerrar_kardex(empresa, hasta=hasta, recalcular=options['recalcular'])
+            if not cierres:
+                continue
+            total += len(cierres)
+            saldos = sum(cierre.saldos.count() for cierre in cierres)
+            self.stdout.write(
+                f'  {empresa.nombre}: {len(cierres)} meses cerrados '
+                f'({cierres[0].periodo:%m/%Y} a {cierres[-1].periodo:%m/%Y}, {saldos} saldos) '
+                f'en {time.perf_counter() - inicio:.1f} s'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} cierres de kardex generados'))
@@ -0,0 +1,101 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from empresas.models import Empresa
+from inventario.models import Stock
+from inventario.services import saldos_desde_ledger, stock_actualizado
+
+
+class Command(BaseCommand):
+    help = 'Verifica (y opcionalmente reconstruye) los saldos de Stock a partir del ledger de movimientos de Inventario'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa (por defecto todas)')
+        parser.add_argument(
+            '--aplicar',
+            action='store_true',
+            help='Corrige los saldos de Stock con los calculados desde el ledger (por defecto solo verifica)',
+        )
+        parser.add_argument('--lote', type=int, default=1000, help='Tamaño de lote para las escrituras')
+        parser.add_argument('--detalle', type=int, default=50, help='Cantidad máxima de diferencias a listar')
+
+    def handle(self, *args, **options):
+        empresa = None
+        if options.get('empresa'):
+            try:
+                empresa = Empresa.objects.get(pk=options['empresa'])
+            except Empresa.DoesNotExist:
+                raise CommandError(f"Empresa {options['empresa']} no encontrada")
+
+        self.stdout.write('Calculando saldos desde el ledger...')
+        saldos = saldos_desde_ledger(empresa)
+
+        stocks = Stock.objects.all()
+        if empresa is not None:
+            stocks = stocks.filter(empresa=empresa)
+        existentes = {
+            (stock.empresa_id, stock.bodega_id, stock.articulo_id): stock
+            for stock in stocks.only('id', 'empresa_id', 'bodega_id', 'articulo_id', 'cantidad').iterator(chunk_size=5000)
+        }
+
+        a_actualizar = []
+        a_crear = []
+        for clave, stock in existentes.items():
+            esperado = saldos.get(clave, Decimal('0'))
+            if stock.cantidad != esperado:
+                a_actualizar.append((stock, stock.cantidad, esperado))
+        for clave, esperado in saldos.items():
+            if clave not in existentes and esperado != 0:
+                a_crear.append((clave, esperado))
+
+        self.stdout.write(
+            f'Saldos en Stock: {len(existentes)} | Saldos en ledger: {len(saldos)} | '
+            f'Diferencias: {len(a_actualizar)} | Faltantes: {len(a_crear)}'
+        )
+
+        for stock, actual, esperado in a_actualizar[:options['detalle']]:
+            self.stdout.write(
+                f'  ≠ empresa={stock.empresa_id} bodega={stock.bodega_id} articulo={stock.articulo_id}: '
+                f'stock={actual} ledger={esperado}'
+            )
+        for (empresa_id, bodega_id, articulo_id), esperado in a_crear[:options['detalle']]:
+            self.stdout.write(
+                f'  + empresa={empresa_id} bodega={bodega_id} articulo={articulo_id}: ledger={esperado}'
+            )
+
+        if not a_actualizar and not a_crear:
+            self.stdout.write(self.style.SUCCESS('✓ Los saldos de Stock coinciden con el ledger'))
+            return
+
+        if not options['aplicar']:
+            self.stdout.write(self.style.WARNING('Use --aplicar para corregir los saldos'))
+            return
+
+        lote = options['lote']
+        with transaction.atomic():
+            for stock, _actual, esperado in a_actualizar:
+                stock.cantidad = esperado
+            Stock.objects.bulk_update([item[0] for item in a_actualizar], ['cantidad'], batch_size=lote)
+            Stock.objects.bulk_create(
+                [
+                    Stock(empresa_id=empresa_id, bodega_id=bodega_id, articulo_id=articulo_id, cantidad=esperado)
+                    for (empresa_id, bodega_id, articulo_id), esperado in a_crear
+                ],
+                batch_size=lote,
+                ignore_conflicts=True,
+            )
+
+        # Avisar a los consumidores del saldo (ej: índice de búsqueda del POS)
+        afectados = {}
+        for stock, _actual, _esperado in a_actualizar:
+            afectados.setdefault((stock.empresa_id, stock.bodega_id), []).append(stock.articulo_id)
+        for (empresa_id, bodega_id, articulo_id), _esperado in a_crear:
+            afectados.setdefault((empresa_id, bodega_id), []).append(articulo_id)
+        for (empresa_id, bodega_id), articulo_ids in afectados.items():
+            stock_actualizado.send(sender=Stock, empresa_id=empresa_id, bodega_id=bodega_id, articulo_ids=articulo_ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Saldos reconstruidos: {len(a_actualizar)} actualizados, {len(a_crear)} creados'
+        ))
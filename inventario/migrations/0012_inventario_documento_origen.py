@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articulos', '0019_precioarticulo_precio_final'),
+        ('bodegas', '0004_alter_bodega_sucursal'),
+        ('empresas', '0028_plansaas_empresa_auto_suspender_and_more'),
+        ('inventario', '0011_ajustestock_detalleajuste'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventario',
+            name='documento_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='ID de Documento Origen'),
+        ),
+        migrations.AddField(
+            model_name='inventario',
+            name='documento_tipo',
+            field=models.CharField(blank=True, max_length=30, null=True, verbose_name='Tipo de Documento Origen'),
+        ),
+        migrations.AddIndex(
+            model_name='inventario',
+            index=models.Index(fields=['documento_tipo', 'documento_id', 'tipo_movimiento'], name='inv_documento_idx'),
+        ),
+    ]
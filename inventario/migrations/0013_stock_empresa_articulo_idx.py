@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articulos', '0019_precioarticulo_precio_final'),
+        ('bodegas', '0004_alter_bodega_sucursal'),
+        ('empresas', '0028_plansaas_empresa_auto_suspender_and_more'),
+        ('inventario', '0012_inventario_documento_origen'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['empresa', 'articulo'], name='stock_empresa_articulo_idx'),
+        ),
+    ]
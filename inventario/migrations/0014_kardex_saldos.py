@@ -0,0 +1,103 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:55
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, F, Max, Min, Value, When
+
+
+def calcular_cantidad_firmada(apps, schema_editor):
+    """Llena cantidad_firmada de los movimientos existentes por tramos de ID"""
+    Inventario = apps.get_model('inventario', 'Inventario')
+    firmada = Case(
+        When(bodega_destino__isnull=False, bodega_origen__isnull=True, then=F('cantidad')),
+        When(bodega_destino__isnull=True, bodega_origen__isnull=False, then=-F('cantidad')),
+        default=Value(Decimal('0')),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+    )
+    rango = Inventario.objects.aggregate(desde=Min('id'), hasta=Max('id'))
+    if rango['desde'] is None:
+        return
+    actualizados = 0
+    for desde in range(rango['desde'], rango['hasta'] + 1, 50000):
+        actualizados += Inventario.objects.filter(id__gte=desde, id__lt=desde + 50000).update(cantidad_firmada=firmada)
+    print(f"[MIGRACIÓN] Cantidad con signo calculada para {actualizados} movimientos de inventario")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('articulos', '0019_precioarticulo_precio_final'),
+        ('bodegas', '0004_alter_bodega_sucursal'),
+        ('empresas', '0028_plansaas_empresa_auto_suspender_and_more'),
+        ('inventario', '0013_stock_empresa_articulo_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierreKardex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.DateField(help_text='Primer día del mes cerrado', verbose_name='Periodo')),
+                ('movimientos', models.PositiveIntegerField(default=0, verbose_name='Movimientos del Periodo')),
+                ('fecha_cierre', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Cierre')),
+            ],
+            options={
+                'verbose_name': 'Cierre de Kardex',
+                'verbose_name_plural': 'Cierres de Kardex',
+                'ordering': ['-periodo'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SaldoKardex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('saldo', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Saldo al Cierre')),
+            ],
+            options={
+                'verbose_name': 'Saldo de Kardex',
+                'verbose_name_plural': 'Saldos de Kardex',
+            },
+        ),
+        migrations.AddField(
+            model_name='inventario',
+            name='cantidad_firmada',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Cantidad con Signo'),
+        ),
+        migrations.RunPython(calcular_cantidad_firmada, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='inventario',
+            index=models.Index(fields=['empresa', 'articulo', 'fecha_movimiento'], include=('estado', 'bodega_origen', 'bodega_destino', 'cantidad', 'cantidad_firmada'), name='inv_kardex_idx'),
+        ),
+        migrations.AddField(
+            model_name='cierrekardex',
+            name='empresa',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cierres_kardex', to='empresas.empresa'),
+        ),
+        migrations.AddField(
+            model_name='saldokardex',
+            name='articulo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_kardex', to='articulos.articulo'),
+        ),
+        migrations.AddField(
+            model_name='saldokardex',
+            name='bodega',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_kardex', to='bodegas.bodega'),
+        ),
+        migrations.AddField(
+            model_name='saldokardex',
+            name='cierre',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos', to='inventario.cierrekardex'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cierrekardex',
+            unique_together={('empresa', 'periodo')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='saldokardex',
+            unique_together={('cierre', 'articulo', 'bodega')},
+        ),
+    ]
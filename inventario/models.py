@@ -127,6 +127,30 @@ class Inventario(models.Model):
         verbose_name="Proveedor"
     )
     
+    # Documento origen (clave de idempotencia del posteo de stock)
+    documento_tipo = models.CharField(
+        max_length=30,
+        blank=True,
+        null=True,
+        verbose_name="Tipo de Documento Origen"
+    )
+    documento_id = models.PositiveBigIntegerField(
+        blank=True,
+        null=True,
+        verbose_name="ID de Documento Origen"
+    )
+    
+    # Efecto del movimiento en el stock total de la empresa: +cantidad si entra a
+    # una bodega (bodega_destino), -cantidad si sale (bodega_origen), 0 en las
+    # transferencias. Permite obtener saldos con un solo SUM.
+    cantidad_firmada = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name="Cantidad con Signo"
+    )
+    
     # Estado y auditoría
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
     fecha_movimiento = models.DateTimeField(verbose_name="Fecha del Movimiento", default=timezone.now)
@@ -138,6 +162,15 @@ class Inventario(models.Model):
         verbose_name = "Movimiento de Inventario"
         verbose_name_plural = "Movimientos de Inventario"
         ordering = ['-fecha_movimiento', '-fecha_creacion']
+        indexes = [
+            models.Index(fields=['documento_tipo', 'documento_id', 'tipo_movimiento'], name='inv_documento_idx'),
+            # Kardex: saldos y movimientos de un artículo por rango de fechas sin leer la tabla
+            models.Index(
+                fields=['empresa', 'articulo', 'fecha_movimiento'],
+                include=['estado', 'bodega_origen', 'bodega_destino', 'cantidad', 'cantidad_firmada'],
+                name='inv_kardex_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.get_tipo_movimiento_display()} - {self.articulo.nombre} - {self.cantidad}"
@@ -148,9 +181,28 @@ class Inventario(models.Model):
         return self.numero_folio or f"MOV-{self.pk:06d}"
     
     def save(self, *args, **kwargs):
-        """Calcula el total automáticamente"""
+        """Calcula el total y la cantidad con signo automáticamente"""
         self.total = self.cantidad * self.precio_unitario
+        self.cantidad_firmada = self.calcular_cantidad_firmada()
         super().save(*args, **kwargs)
+        # Un movimiento en un mes ya cerrado deja desactualizados los cierres del kardex
+        from .kardex import invalidar_cierres
+        invalidar_cierres(self.empresa_id, self.fecha_movimiento)
+    
+    def delete(self, *args, **kwargs):
+        from .kardex import invalidar_cierres
+        resultado = super().delete(*args, **kwargs)
+        invalidar_cierres(self.empresa_id, self.fecha_movimiento)
+        return resultado
+    
+    def calcular_cantidad_firmada(self):
+        """Suma en bodega_destino y resta en bodega_origen (igual que el ledger de Stock)"""
+        firmada = 0
+        if self.bodega_destino_id:
+            firmada += self.cantidad
+        if self.bodega_origen_id:
+            firmada -= self.cantidad
+        return firmada
     
     def get_tipo_badge_class(self):
         """Retorna la clase CSS para el badge del tipo de movimiento"""
@@ -174,7 +226,13 @@ class Inventario(models.Model):
 
 
 class Stock(models.Model):
-    """Modelo para controlar el stock actual de cada artículo por bodega"""
+    """
+    Stock actual de cada artículo por bodega.
+    
+    Es el saldo materializado del ledger Inventario: se actualiza de forma
+    incremental con cada posteo (inventario.services) y se puede reconstruir y
+    verificar con el comando reconstruir_stock.
+    """
     
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='stocks')
     bodega = models.ForeignKey(Bodega, on_delete=models.CASCADE, related_name='stocks')
@@ -221,6 +279,9 @@ class Stock(models.Model):
         verbose_name_plural = "Stocks"
         unique_together = ['empresa', 'bodega', 'articulo']
         ordering = ['articulo__nombre']
+        indexes = [
+            models.Index(fields=['empresa', 'articulo'], name='stock_empresa_articulo_idx'),
+        ]
     
     def __str__(self):
         return f"{self.articulo.nombre} - {self.bodega.nombre} - Stock: {self.cantidad}"
@@ -257,5 +318,45 @@ class Stock(models.Model):
         return textos.get(self.get_estado_stock(), 'Desconocido')
 
 
+
+class CierreKardex(models.Model):
+    """
+    Cierre mensual del kardex de una empresa. Sus SaldoKardex guardan el saldo
+    de cada (artículo, bodega) al término del mes, de modo que el saldo a una
+    fecha es el del último cierre más los movimientos posteriores.
+    """
+    
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='cierres_kardex')
+    periodo = models.DateField(verbose_name="Periodo", help_text="Primer día del mes cerrado")
+    movimientos = models.PositiveIntegerField(default=0, verbose_name="Movimientos del Periodo")
+    fecha_cierre = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Cierre")
+    
+    class Meta:
+        verbose_name = "Cierre de Kardex"
+        verbose_name_plural = "Cierres de Kardex"
+        unique_together = ['empresa', 'periodo']
+        ordering = ['-periodo']
+    
+    def __str__(self):
+        return f"{self.empresa} - {self.periodo:%m/%Y}"
+
+
+class SaldoKardex(models.Model):
+    """Saldo de un artículo en una bodega al cierre de un periodo"""
+    
+    cierre = models.ForeignKey(CierreKardex, on_delete=models.CASCADE, related_name='saldos')
+    articulo = models.ForeignKey(Articulo, on_delete=models.CASCADE, related_name='saldos_kardex')
+    bodega = models.ForeignKey(Bodega, on_delete=models.CASCADE, related_name='saldos_kardex')
+    saldo = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Saldo al Cierre")
+    
+    class Meta:
+        verbose_name = "Saldo de Kardex"
+        verbose_name_plural = "Saldos de Kardex"
+        unique_together = ['cierre', 'articulo', 'bodega']
+    
+    def __str__(self):
+        return f"{self.articulo} - {self.bodega}: {self.saldo}"
+
+
 # Importación de modelos de ajustes para que sean detectados por Django
 from .models_ajustes import AjusteStock, DetalleAjuste
@@ -0,0 +1,335 @@
+"""
+Servicio de posteo de stock por documento.
+
+Aplica todos los movimientos de un documento (venta, anulación, etc.) en
+operaciones de conjunto en lugar de procesar línea por línea:
+
+- Una consulta de idempotencia por documento (documento_tipo + documento_id)
+- Un bulk_create para los registros de Stock que falten
+- Un UPDATE con expresiones F() por bodega para todas las cantidades
+- Un bulk_create para los movimientos de Inventario
+
+Así un ticket de 200+ líneas cuesta un número fijo de consultas y la
+transacción se mantiene abierta el menor tiempo posible.
+"""
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+
+from .models import Inventario, Stock
+
+
+# Se emite después de actualizar stock con UPDATE masivos (que no disparan post_save).
+# Argumentos: empresa_id, bodega_id, articulo_ids
+stock_actualizado = Signal()
+
+
+class LineaStock:
+    """Línea de un documento a postear en stock"""
+
+    __slots__ = ('articulo', 'cantidad', 'precio_unitario')
+
+    def __init__(self, articulo, cantidad, precio_unitario=Decimal('0')):
+        self.articulo = articulo
+        self.cantidad = Decimal(str(cantidad))
+        self.precio_unitario = Decimal(str(precio_unitario or 0))
+
+
+def _to_decimal(valor):
+    try:
+        return Decimal(str(valor)) if valor else Decimal('0')
+    except Exception:
+        return Decimal('0')
+
+
+def movimientos_documento(empresa, documento_tipo, documento_id, tipo_movimiento, numero_documento=None):
+    """
+    Movimientos confirmados ya registrados para un documento. Incluye los
+    movimientos antiguos que sólo tenían numero_documento (antes de existir
+    documento_id) para no volver a postearlos.
+    """
+    filtro = Q(documento_tipo=documento_tipo, documento_id=documento_id)
+    if numero_documento:
+        filtro |= Q(documento_id__isnull=True, numero_documento=numero_documento)
+    return Inventario.objects.filter(
+        filtro,
+        empresa=empresa,
+        tipo_movimiento=tipo_movimiento,
+        estado='confirmado',
+    )
+
+
+def postear_documento(empresa, bodega, lineas, tipo_movimiento, documento_tipo, documento_id,
+                      numero_documento=None, descripcion='', motivo=None, usuario=None,
+                      permitir_negativo=False):
+    """
+    Postea en stock todas las líneas de un documento.
+
+    Args:
+        empresa: Empresa del documento
+        bodega: Bodega afectada
+        lineas: Iterable de LineaStock
+        tipo_movimiento: 'salida' (descuenta) o 'entrada' (repone)
+        documento_tipo: Tipo de documento origen (ej: 'venta')
+        documento_id: ID del documento origen (clave de idempotencia)
+        numero_documento: Número visible del documento
+        descripcion: Descripción de los movimientos de inventario
+        motivo: Motivo de los movimientos (opcional)
+        usuario: Usuario que registra los movimientos
+        permitir_negativo: Si es False, las salidas descuentan como máximo el saldo
+            disponible y sus movimientos registran la cantidad descontada
+
+    Returns:
+        int: Cantidad de movimientos creados (0 si el documento ya estaba posteado)
+    """
+    if tipo_movimiento not in ('salida', 'entrada'):
+        raise ValueError(f"Tipo de movimiento no soportado: {tipo_movimiento}")
+
+    # Sólo artículos con control de stock
+    lineas = [linea for linea in lineas if linea.articulo.control_stock and linea.cantidad > 0]
+    if not lineas:
+        return 0
+
+    # Cantidad total por artículo (un artículo puede venir en varias líneas)
+    cantidades = OrderedDict()
+    articulos = {}
+    for linea in lineas:
+        cantidades[linea.articulo.id] = cantidades.get(linea.articulo.id, Decimal('0')) + linea.cantidad
+        articulos[linea.articulo.id] = linea.articulo
+    articulo_ids = list(cantidades)
+
+    with transaction.atomic():
+        if movimientos_documento(empresa, documento_tipo, documento_id, tipo_movimiento, numero_documento).exists():
+            print(f"[INFO] {documento_tipo} {numero_documento or documento_id} ya tiene movimientos de {tipo_movimiento}. Se omite.")
+            return 0
+
+        # 1. Crear los registros de stock que falten (sin pisar los existentes)
+        Stock.objects.bulk_create(
+            [
+                Stock(
+                    empresa=empresa,
+                    bodega=bodega,
+                    articulo_id=articulo_id,
+                    cantidad=Decimal('0'),
+                    stock_minimo=_to_decimal(articulos[articulo_id].stock_minimo),
+                    stock_maximo=_to_decimal(articulos[articulo_id].stock_maximo),
+                    precio_promedio=_to_decimal(articulos[articulo_id].precio_costo),
+                )
+                for articulo_id in articulo_ids
+            ],
+            ignore_conflicts=True,
+        )
+
+        # 2. Sin stock negativo, la salida se limita al saldo disponible: se
+        #    bloquean los saldos y el movimiento registra lo descontado, así la
+        #    suma del ledger sigue igual al Stock
+        if tipo_movimiento == 'salida' and not permitir_negativo:
+            disponibles = dict(
+                Stock.objects.select_for_update().filter(
+                    empresa=empresa,
+                    bodega=bodega,
+                    articulo_id__in=articulo_ids,
+                ).values_list('articulo_id', 'cantidad')
+            )
+            for articulo_id, cantidad in cantidades.items():
+                cantidades[articulo_id] = min(cantidad, max(disponibles.get(articulo_id) or Decimal('0'), Decimal('0')))
+
+        # 3. Un solo UPDATE para todas las cantidades de la bodega
+        delta = Case(
+            *[When(articulo_id=articulo_id, then=Value(cantidad)) for articulo_id, cantidad in cantidades.items()],
+            default=Value(Decimal('0')),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        )
+        if tipo_movimiento == 'salida':
+            nueva_cantidad = F('cantidad') - delta
+        else:
+            nueva_cantidad = F('cantidad') + delta
+
+        Stock.objects.filter(
+            empresa=empresa,
+            bodega=bodega,
+            articulo_id__in=articulo_ids,
+        ).update(cantidad=nueva_cantidad, actualizado_por=usuario)
+
+        # 4. Movimientos de inventario (uno por línea del documento, con la
+        #    cantidad efectivamente aplicada; las líneas sin saldo quedan en 0)
+        pendientes = dict(cantidades)
+        aplicadas = []
+        for linea in lineas:
+            cantidad = min(linea.cantidad, pendientes[linea.articulo.id])
+            pendientes[linea.articulo.id] -= cantidad
+            aplicadas.append((linea, cantidad))
+
+        bodega_campo = 'bodega_origen' if tipo_movimiento == 'salida' else 'bodega_destino'
+        movimientos = [
+            Inventario(
+                empresa=empresa,
+                articulo_id=linea.articulo.id,
+                tipo_movimiento=tipo_movimiento,
+                cantidad=cantidad,
+                precio_unitario=linea.precio_unitario,
+                total=cantidad * linea.precio_unitario,
+                cantidad_firmada=-cantidad if tipo_movimiento == 'salida' else cantidad,
+                descripcion=descripcion,
+                motivo=motivo,
+                numero_documento=numero_documento,
+                documento_tipo=documento_tipo,
+                documento_id=documento_id,
+                estado='confirmado',
+                creado_por=usuario,
+                **{bodega_campo: bodega},
+            )
+            for linea, cantidad in aplicadas
+        ]
+        Inventario.objects.bulk_create(movimientos)
+
+        transaction.on_commit(lambda: stock_actualizado.send(
+            sender=Stock,
+            empresa_id=empresa.id,
+            bodega_id=bodega.id,
+            articulo_ids=articulo_ids,
+        ))
+
+    return len(movimientos)
+
+
+def _lineas_venta(venta):
+    return [
+        LineaStock(detalle.articulo, detalle.cantidad, detalle.precio_unitario)
+        for detalle in venta.ventadetalle_set.select_related('articulo')
+    ]
+
+
+def _bloquear_venta(venta):
+    """Serializa posteos concurrentes de la misma venta (dentro de una transacción)"""
+    list(type(venta).objects.select_for_update().filter(pk=venta.pk).values_list('pk', flat=True))
+
+
+@transaction.atomic
+def descontar_stock_venta(venta, bodega):
+    """Descuenta el stock de una venta confirmada (idempotente por venta)"""
+    _bloquear_venta(venta)
+    return postear_documento(
+        empresa=venta.empresa,
+        bodega=bodega,
+        lineas=_lineas_venta(venta),
+        tipo_movimiento='salida',
+        documento_tipo='venta',
+        documento_id=venta.id,
+        numero_documento=venta.numero_venta,
+        descripcion=f'Venta {venta.numero_venta} - {venta.get_tipo_documento_display()}',
+        usuario=venta.usuario_creacion,
+    )
+
+
+@transaction.atomic
+def reponer_stock_venta(venta, bodega=None):
+    """
+    Repone el stock de una venta anulada (idempotente por venta).
+    Sólo repone lo que la venta efectivamente descontó (sus movimientos de
+    salida, que pudieron quedar limitados por el saldo) y por defecto en la
+    misma bodega de la que se descontó.
+    """
+    _bloquear_venta(venta)
+    salidas = list(movimientos_documento(
+        venta.empresa, 'venta', venta.id, 'salida', venta.numero_venta
+    ).select_related('articulo', 'bodega_origen').order_by('id'))
+    if not salidas:
+        return 0
+    return postear_documento(
+        empresa=venta.empresa,
+        bodega=bodega or salidas[0].bodega_origen,
+        lineas=[LineaStock(salida.articulo, salida.cantidad, salida.precio_unitario) for salida in salidas],
+        tipo_movimiento='entrada',
+        documento_tipo='venta',
+        documento_id=venta.id,
+        numero_documento=venta.numero_venta,
+        descripcion=f'Anulación de Venta {venta.numero_venta} - {venta.get_tipo_documento_display()}',
+        motivo='Anulación de venta',
+        usuario=venta.usuario_creacion,
+    )
+
+
+# ========== SALDOS (LEDGER -> BALANCE) ==========
+# Inventario es el libro de movimientos (append-only) y Stock es el saldo
+# materializado por (empresa, bodega, artículo). Cada movimiento suma su
+# cantidad en bodega_destino y la resta en bodega_origen, cualquiera sea su tipo
+# (entrada, salida, ajuste o transferencia).
+
+def saldos_desde_ledger(empresa=None, desde=None, hasta=None):
+    """
+    Calcula los saldos por (empresa_id, bodega_id, articulo_id) sumando los
+    movimientos confirmados del ledger en dos consultas agregadas. Con desde y
+    hasta (datetime) sólo suma los movimientos de ese rango [desde, hasta).
+    """
+    movimientos = Inventario.objects.filter(estado='confirmado')
+    if empresa is not None:
+        movimientos = movimientos.filter(empresa=empresa)
+    if desde is not None:
+        movimientos = movimientos.filter(fecha_movimiento__gte=desde)
+    if hasta is not None:
+        movimientos = movimientos.filter(fecha_movimiento__lt=hasta)
+
+    saldos = {}
+    entradas = movimientos.filter(bodega_destino__isnull=False).values(
+        'empresa_id', 'bodega_destino_id', 'articulo_id'
+    ).annotate(total=Sum('cantidad')).order_by()
+    for fila in entradas.iterator(chunk_size=5000):
+        clave = (fila['empresa_id'], fila['bodega_destino_id'], fila['articulo_id'])
+        saldos[clave] = saldos.get(clave, Decimal('0')) + fila['total']
+
+    salidas = movimientos.filter(bodega_origen__isnull=False).values(
+        'empresa_id', 'bodega_origen_id', 'articulo_id'
+    ).annotate(total=Sum('cantidad')).order_by()
+    for fila in salidas.iterator(chunk_size=5000):
+        clave = (fila['empresa_id'], fila['bodega_origen_id'], fila['articulo_id'])
+        saldos[clave] = saldos.get(clave, Decimal('0')) - fila['total']
+
+    return saldos
+
+
+def saldo_stock(empresa, articulo, bodega=None):
+    """Saldo de un artículo (en una bodega o en todas) con una sola consulta indexada"""
+    stocks = Stock.objects.filter(empresa=empresa, articulo=articulo)
+    if bodega is not None:
+        stocks = stocks.filter(bodega=bodega)
+    return stocks.aggregate(total=Sum('cantidad'))['total'] or Decimal('0')
+
+
+def saldos_stock(empresa, articulo_ids, bodegas=None):
+    """
+    Saldos de varios artículos en una sola consulta.
+
+    Returns:
+        dict: {articulo_id: Decimal}
+    """
+    stocks = Stock.objects.filter(empresa=empresa, articulo_id__in=list(articulo_ids))
+    if bodegas is not None:
+        stocks = stocks.filter(bodega__in=bodegas)
+    return dict(
+        stocks.values('articulo_id').annotate(total=Sum('cantidad')).order_by().values_list('articulo_id', 'total')
+    )
+
+
+def anotar_stock_total(articulos, empresa, bodegas=None, nombre='stock_total'):
+    """
+    Anota en un queryset de Articulo el saldo total del Stock materializado
+    (suma de las bodegas) con una subconsulta correlacionada: una página de
+    artículos cuesta una sola consulta. Los artículos sin control de stock
+    quedan con None.
+    """
+    stocks = Stock.objects.filter(empresa=empresa, articulo=OuterRef('pk'))
+    if bodegas is not None:
+        stocks = stocks.filter(bodega__in=bodegas)
+    total = stocks.order_by().values('articulo').annotate(total=Sum('cantidad')).values('total')
+    return articulos.annotate(**{
+        nombre: Case(
+            When(control_stock=False, then=Value(None)),
+            default=Coalesce(Subquery(total), Value(Decimal('0'))),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )
+    })
@@ -1,22 +1,23 @@
 from django import template
-from django.db import models
-from inventario.models import Stock
 
 register = template.Library()
 
-@register.simple_tag
-def get_stock_total(articulo):
-    """Obtiene el stock total de un artículo sumando todas las bodegas"""
+@register.simple_tag(takes_context=True)
+def get_stock_total(context, articulo):
+    """
+    Obtiene el stock total de un artículo sumando todas las bodegas, sin
+    consultar la base de datos: usa la anotación stock_total del queryset
+    (inventario.services.anotar_stock_total) o el mapa {articulo_id: saldo}
+    que la vista deja en el contexto como 'stock_articulos'
+    (inventario.services.saldos_stock).
+    """
     if not articulo or not articulo.control_stock:
         return 0
     
-    try:
-        total = Stock.objects.filter(articulo=articulo).aggregate(
-            total=models.Sum('cantidad')
-        )['total']
-        return total or 0
-    except:
-        return 0
+    total = getattr(articulo, 'stock_total', None)
+    if total is None:
+        total = (context.get('stock_articulos') or {}).get(articulo.id)
+    return total or 0
 
 
 @register.filter(name='format_miles')
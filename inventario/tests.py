@@ -0,0 +1,87 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from articulos.models import Articulo, CategoriaArticulo, UnidadMedida
+from bodegas.models import Bodega
+from empresas.models import Empresa
+from inventario.models import Inventario, Stock
+from inventario.services import LineaStock, postear_documento, saldos_desde_ledger
+
+
+class PostearDocumentoTest(TestCase):
+    """El ledger (Inventario) y el saldo (Stock) se mueven juntos: SUM(ledger) == Stock"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(nombre='Empresa Stock', razon_social='Empresa Stock', rut='76.000.011-5')
+        cls.bodega = Bodega.objects.create(empresa=cls.empresa, codigo='B1', nombre='Bodega 1')
+        categoria = CategoriaArticulo.objects.create(empresa=cls.empresa, codigo='GEN', nombre='General')
+        unidad = UnidadMedida.objects.create(empresa=cls.empresa, nombre='Unidad', simbolo='UN')
+        cls.articulos = [
+            Articulo.objects.create(
+                empresa=cls.empresa, categoria=categoria, unidad_medida=unidad,
+                codigo=f'A{n}', nombre=f'Artículo {n}', precio_costo='100', precio_venta='200',
+            )
+            for n in range(2)
+        ]
+
+    def _postear(self, lineas, tipo, documento_id, **kwargs):
+        return postear_documento(
+            self.empresa, self.bodega, [LineaStock(articulo, cantidad, 100) for articulo, cantidad in lineas],
+            tipo, 'prueba', documento_id, **kwargs
+        )
+
+    def _stock(self, articulo):
+        return Stock.objects.get(empresa=self.empresa, bodega=self.bodega, articulo=articulo).cantidad
+
+    def _assert_ledger_igual_stock(self):
+        saldos = saldos_desde_ledger(self.empresa)
+        for stock in Stock.objects.filter(empresa=self.empresa):
+            self.assertEqual(saldos.get((self.empresa.id, stock.bodega_id, stock.articulo_id), 0), stock.cantidad)
+
+    def test_idempotente_por_documento(self):
+        a, b = self.articulos
+        self.assertEqual(self._postear([(a, 5), (b, 3), (a, 2)], 'entrada', 1), 3)
+        self.assertEqual(self._postear([(a, 5), (b, 3), (a, 2)], 'entrada', 1), 0)
+        self.assertEqual(self._stock(a), Decimal('7'))
+        self.assertEqual(self._stock(b), Decimal('3'))
+        self.assertEqual(Inventario.objects.filter(documento_tipo='prueba', documento_id=1).count(), 3)
+        self._assert_ledger_igual_stock()
+
+    def test_salida_limitada_registra_lo_descontado(self):
+        a, b = self.articulos
+        self._postear([(a, 4), (b, 10)], 'entrada', 1)
+        # a aparece en dos líneas: 3 + 3 con saldo 4 -> la segunda línea sólo descuenta 1
+        self._postear([(a, 3), (a, 3), (b, 2)], 'salida', 2)
+
+        self.assertEqual(self._stock(a), Decimal('0'))
+        self.assertEqual(self._stock(b), Decimal('8'))
+        salidas = Inventario.objects.filter(documento_id=2).order_by('id')
+        self.assertEqual([m.cantidad for m in salidas], [Decimal('3'), Decimal('1'), Decimal('2')])
+        self.assertEqual([m.cantidad_firmada for m in salidas], [Decimal('-3'), Decimal('-1'), Decimal('-2')])
+        self._assert_ledger_igual_stock()
+
+        # Sin saldo la línea queda en 0, pero el documento sigue marcado como posteado
+        self._postear([(a, 5)], 'salida', 3)
+        self.assertEqual(Inventario.objects.get(documento_id=3).cantidad, Decimal('0'))
+        self.assertEqual(self._postear([(a, 5)], 'salida', 3), 0)
+        self._assert_ledger_igual_stock()
+
+    def test_salida_con_negativo_permitido(self):
+        a, _ = self.articulos
+        self._postear([(a, 2)], 'salida', 1, permitir_negativo=True)
+        self.assertEqual(self._stock(a), Decimal('-2'))
+        self._assert_ledger_igual_stock()
+
+    def test_crear_stock_inicial_por_ledger(self):
+        a, b = self.articulos
+        self._postear([(a, 1)], 'entrada', 1)
+        call_command('crear_stock_inicial', stdout=StringIO())
+        call_command('crear_stock_inicial', stdout=StringIO())
+
+        self.assertEqual(self._stock(a), Decimal('1'))
+        self.assertEqual(self._stock(b), Decimal('100'))
+        self._assert_ledger_igual_stock()
@@ -3,15 +3,12 @@ Vistas para el Kardex (Cartola) de Artículos
 """
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required, permission_required
-from django.db.models import Q, Sum, F
 from django.utils import timezone
 from datetime import datetime, timedelta
 from core.decorators import requiere_empresa
 from articulos.models import Articulo
 from bodegas.models import Bodega
-from .models import Inventario, Stock
-from ventas.models import Venta, VentaDetalle
-from inventario.models import TransferenciaInventario
+from .kardex import inicio_dia, movimientos_articulo, saldo_kardex
 
 
 @login_required
@@ -74,128 +71,28 @@ def kardex_articulo(request):
             fecha_desde_obj = (timezone.now() - timedelta(days=30)).date()
             fecha_hasta_obj = timezone.now().date()
         
-        # Calcular saldo inicial (antes de la fecha desde)
-        saldo_inicial = 0
-        inventarios_iniciales = Inventario.objects.filter(
-            empresa=request.empresa,
-            articulo=articulo,
-            fecha_movimiento__date__lt=fecha_desde_obj,
-            estado='confirmado'
-        )
+        # Saldo inicial: último cierre mensual + movimientos posteriores (un SUM indexado)
+        saldo_inicial = saldo_kardex(request.empresa, articulo, fecha_desde_obj, bodega)
         
-        if bodega:
-            inventarios_iniciales = inventarios_iniciales.filter(
-                Q(bodega_origen=bodega) | Q(bodega_destino=bodega)
-            )
+        # Movimientos del período (rango de fechas sin __date para usar el índice del kardex)
+        inventarios = movimientos_articulo(request.empresa, articulo, bodega).filter(
+            fecha_movimiento__gte=inicio_dia(fecha_desde_obj),
+            fecha_movimiento__lt=inicio_dia(fecha_hasta_obj + timedelta(days=1)),
+        ).select_related('bodega_origen', 'bodega_destino', 'creado_por').order_by('fecha_movimiento', 'id')
         
-        for inv in inventarios_iniciales:
-            tipo_mov = inv.tipo_movimiento.lower()
-            if tipo_mov == 'entrada':
-                if not bodega or inv.bodega_destino == bodega:
-                    saldo_inicial += inv.cantidad
-            elif tipo_mov == 'salida':
-                if not bodega or inv.bodega_origen == bodega:
-                    saldo_inicial -= inv.cantidad
-            elif tipo_mov == 'ajuste':
-                if not bodega or inv.bodega_destino == bodega:
-                    saldo_inicial += inv.cantidad
-            elif tipo_mov == 'transferencia':
-                # En saldo inicial también considerar transferencias
-                if bodega:
-                    if inv.bodega_origen == bodega:
-                        saldo_inicial -= inv.cantidad
-                    elif inv.bodega_destino == bodega:
-                        saldo_inicial += inv.cantidad
-                # Sin bodega: las transferencias no afectan el saldo global
-        
-        # Obtener movimientos del período
-        inventarios = Inventario.objects.filter(
-            empresa=request.empresa,
-            articulo=articulo,
-            fecha_movimiento__date__gte=fecha_desde_obj,
-            fecha_movimiento__date__lte=fecha_hasta_obj,
-            estado='confirmado'
-        ).select_related('bodega_origen', 'bodega_destino', 'creado_por')
-        
-        if bodega:
-            inventarios = inventarios.filter(
-                Q(bodega_origen=bodega) | Q(bodega_destino=bodega)
-            )
-        
-        inventarios = inventarios.order_by('fecha_movimiento', 'id')
-        
-        # Eliminar duplicados: agrupar por campos clave y tomar solo el primero de cada grupo
-        # Los duplicados típicamente tienen: mismo numero_documento, tipo_movimiento, fecha, cantidad, bodega
-        movimientos_unicos = {}
-        inventarios_limpios = []
-        
-        for inv in inventarios:
-            # Crear clave única basada en campos que identifican un movimiento único
-            # Para ventas, el numero_documento es único por venta, así que si hay múltiples movimientos
-            # con el mismo numero_documento, tipo, fecha y cantidad, son duplicados
-            clave = (
-                inv.numero_documento or inv.numero_folio or '',
-                inv.tipo_movimiento,
-                inv.bodega_origen_id if inv.bodega_origen else None,
-                inv.bodega_destino_id if inv.bodega_destino else None,
-                str(inv.fecha_movimiento.date()),  # Solo la fecha, no la hora
-                str(inv.cantidad),  # Usar string para evitar problemas de precisión
-            )
-            
-            # Si ya existe un movimiento con esta clave, saltarlo (es duplicado)
-            # Mantener el primero que aparece (el más antiguo por ID)
-            if clave not in movimientos_unicos:
-                movimientos_unicos[clave] = inv
-                inventarios_limpios.append(inv)
-            else:
-                # Si encontramos un duplicado, mantener el que tiene el ID más bajo (más antiguo)
-                existente = movimientos_unicos[clave]
-                if inv.id < existente.id:
-                    # Reemplazar con el más antiguo
-                    index = inventarios_limpios.index(existente)
-                    inventarios_limpios[index] = inv
-                    movimientos_unicos[clave] = inv
-        
-        inventarios = inventarios_limpios
-        
-        # Procesar movimientos
+        # Procesar movimientos: suman en bodega_destino y restan en bodega_origen (como Stock)
         saldo = saldo_inicial
         for inv in inventarios:
-            entrada = 0
-            salida = 0
-            
-            tipo_mov = inv.tipo_movimiento.lower()
-            
-            if tipo_mov == 'entrada':
-                if not bodega or inv.bodega_destino == bodega:
-                    entrada = inv.cantidad
-                    saldo += entrada
-            elif tipo_mov == 'salida':
-                if not bodega or inv.bodega_origen == bodega:
-                    salida = inv.cantidad
-                    saldo -= salida
-            elif tipo_mov == 'ajuste':
-                if not bodega or inv.bodega_destino == bodega:
-                    if inv.cantidad >= 0:
-                        entrada = inv.cantidad
-                        saldo += entrada
-                    else:
-                        salida = abs(inv.cantidad)
-                        saldo -= salida
-            elif tipo_mov == 'transferencia':
-                # Transferencia: salida de origen, entrada en destino
-                if bodega:
-                    if inv.bodega_origen == bodega:
-                        salida = inv.cantidad
-                        saldo -= salida
-                    elif inv.bodega_destino == bodega:
-                        entrada = inv.cantidad
-                        saldo += entrada
-                else:
-                    # Sin bodega específica: mostrar transferencia sin afectar saldo global
-                    # (es movimiento interno, no cambia stock total de la empresa)
-                    entrada = inv.cantidad  # Mostrar la cantidad transferida
-                    salida = inv.cantidad   # En ambas columnas para indicar movimiento
+            if bodega:
+                entrada = inv.cantidad if inv.bodega_destino_id == bodega.id else 0
+                salida = inv.cantidad if inv.bodega_origen_id == bodega.id else 0
+                saldo += entrada - salida
+            else:
+                # Sin bodega específica las transferencias se muestran en ambas columnas
+                # sin afectar el saldo global (es movimiento interno)
+                entrada = inv.cantidad if inv.bodega_destino_id else 0
+                salida = inv.cantidad if inv.bodega_origen_id else 0
+                saldo += inv.cantidad_firmada
             
             if entrada > 0 or salida > 0:
                 movimientos.append({
@@ -220,74 +117,11 @@ def kardex_articulo(request):
         activo=True
     ).order_by('nombre')
     
-    # Stock en sistema basado en movimientos de Inventario (coherente con la cartola)
-    # Debe usar la misma lógica que el saldo actual, eliminando duplicados
+    # Stock en sistema al término de fecha_hasta, calculado aparte desde los cierres
+    # del kardex (debe coincidir con el saldo de la cartola)
     stock_sistema = None
     if articulo:
-        stock_sistema_calc = 0
-        inv_qs = Inventario.objects.filter(
-            empresa=request.empresa,
-            articulo=articulo,
-            estado='confirmado'
-        ).select_related('bodega_origen', 'bodega_destino')
-        # Considerar movimientos hasta la fecha_hasta seleccionada
-        try:
-            fecha_hasta_obj  # ya calculada arriba
-        except NameError:
-            from datetime import datetime as _dt
-            from django.utils import timezone as _tz
-            fecha_hasta_obj = _tz.now().date()
-        inv_qs = inv_qs.filter(fecha_movimiento__date__lte=fecha_hasta_obj)
-        if bodega:
-            inv_qs = inv_qs.filter(Q(bodega_origen=bodega) | Q(bodega_destino=bodega))
-        
-        # Eliminar duplicados usando la misma lógica que el saldo actual
-        movimientos_unicos_stock = {}
-        inv_qs_limpios = []
-        
-        for inv in inv_qs:
-            clave = (
-                inv.numero_documento or inv.numero_folio or '',
-                inv.tipo_movimiento,
-                inv.bodega_origen_id if inv.bodega_origen else None,
-                inv.bodega_destino_id if inv.bodega_destino else None,
-                str(inv.fecha_movimiento.date()),
-                str(inv.cantidad),
-            )
-            
-            if clave not in movimientos_unicos_stock:
-                movimientos_unicos_stock[clave] = inv
-                inv_qs_limpios.append(inv)
-            else:
-                existente = movimientos_unicos_stock[clave]
-                if inv.id < existente.id:
-                    index = inv_qs_limpios.index(existente)
-                    inv_qs_limpios[index] = inv
-                    movimientos_unicos_stock[clave] = inv
-        
-        # Calcular stock usando movimientos sin duplicados
-        for inv in inv_qs_limpios:
-            t = (inv.tipo_movimiento or '').lower()
-            if t == 'entrada':
-                if not bodega or inv.bodega_destino == bodega:
-                    stock_sistema_calc += inv.cantidad
-            elif t == 'salida':
-                if not bodega or inv.bodega_origen == bodega:
-                    stock_sistema_calc -= inv.cantidad
-            elif t == 'ajuste':
-                # En ajustes, la cantidad puede ser negativa; usar bodega_destino como referencia
-                if not bodega or inv.bodega_destino == bodega:
-                    stock_sistema_calc += inv.cantidad
-            elif t == 'transferencia':
-                if bodega:
-                    if inv.bodega_origen == bodega:
-                        stock_sistema_calc -= inv.cantidad
-                    elif inv.bodega_destino == bodega:
-                        stock_sistema_calc += inv.cantidad
-                else:
-                    # Sin bodega, transferencias netean en 0 a nivel global
-                    pass
-        stock_sistema = stock_sistema_calc
+        stock_sistema = saldo_kardex(request.empresa, articulo, fecha_hasta_obj + timedelta(days=1), bodega)
     
     context = {
         'articulo': articulo,
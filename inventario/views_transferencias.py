@@ -540,17 +540,12 @@ def transferencia_imprimir_guia(request, pk):
     
     dte = transferencia.guia_despacho
     
-    # ASEGURAR TIMBRE PDF417 si falta o es placeholder, pero tenemos el TED
-    # El placeholder tiene un tamaño pequeño (~2KB) comparado con un PDF417 real (>10KB)
-    if dte.timbre_electronico and (not dte.timbre_pdf417 or dte.timbre_pdf417.size < 3000):
-        try:
-            from facturacion_electronica.pdf417_generator import PDF417Generator
-            print(f"[PREVIEW] Regenerando timbre para Guía {dte.folio}")
-            if PDF417Generator.guardar_pdf417_en_dte(dte):
-                dte.refresh_from_db()
-                print(f"[PREVIEW] Timbre regenerado: {dte.timbre_pdf417.url}")
-        except Exception as e_timbre:
-            print(f"[PREVIEW] Error regenerando timbre: {e_timbre}")
+    # TIMBRE PDF417: sólo se lee del caché (se genera al crear la guía); si aún
+    # no está se reintenta en unos segundos, sin dibujarlo en la petición
+    from facturacion_electronica.timbre_pdf417 import respuesta_timbre_pendiente
+    pendiente = respuesta_timbre_pendiente(request, dte)
+    if pendiente:
+        return pendiente
     
     # Obtener detalles de la transferencia
     detalles = transferencia.detalles.all().select_related('articulo', 'articulo__unidad_medida')
@@ -640,8 +635,8 @@ def transferencia_generar_guia(request, pk):
             try:
                 from facturacion_electronica.dte_service import DTEService as DTEServiceReal
                 from facturacion_electronica.dte_generator import DTEXMLGenerator
-                from facturacion_electronica.firma_electronica import FirmadorDTE
-                from facturacion_electronica.pdf417_generator import PDF417Generator
+                from facturacion_electronica.firma_electronica import obtener_firmador_empresa
+                from facturacion_electronica.timbre_pdf417 import programar_timbre_pdf417
                 
                 # Preparar datos para el generador de XML
                 # Crear objeto temporal tipo venta para el generador
@@ -677,10 +672,7 @@ def transferencia_generar_guia(request, pk):
                 xml_sin_firmar = generator.generar_xml()
                 
                 # 2. Firmar el XML
-                firmador = FirmadorDTE(
-                    request.empresa.certificado_digital.path,
-                    request.empresa.password_certificado
-                )
+                firmador = obtener_firmador_empresa(request.empresa)
                 xml_firmado = firmador.firmar_xml(xml_sin_firmar)
                 
                 # 3. Generar TED (Timbre Electrónico)
@@ -782,8 +774,8 @@ def transferencia_generar_guia(request, pk):
                     estado_sii='generado'
                 )
                 
-                # 5. Generar imagen PDF417
-                PDF417Generator.guardar_pdf417_en_dte(dte)
+                # 5. Imagen PDF417 en segundo plano (después del commit)
+                programar_timbre_pdf417(dte)
                 
                 print(f"✅ Guía de Despacho generada con timbre: Folio {folio}")
                 
@@ -815,8 +807,8 @@ def transferencia_generar_guia(request, pk):
                 try:
                     dte.timbre_electronico = 'DOCUMENTO SIN TIMBRE - PLACEHOLDER'
                     dte.save(update_fields=['timbre_electronico'])
-                    from facturacion_electronica.pdf417_generator import PDF417Generator
-                    PDF417Generator.guardar_pdf417_en_dte(dte)
+                    from facturacion_electronica.timbre_pdf417 import programar_timbre_pdf417
+                    programar_timbre_pdf417(dte)
                 except Exception as e2:
                     print(f"⚠️ No se pudo generar timbre placeholder: {e2}")
             
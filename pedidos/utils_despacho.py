@@ -4,8 +4,8 @@ Funciones de utilidad para la gestión de despachos.
 from django.db import transaction, models
 from facturacion_electronica.models import DocumentoTributarioElectronico, ArchivoCAF
 from facturacion_electronica.dte_generator import DTEXMLGenerator
-from facturacion_electronica.firma_electronica import FirmadorDTE
-from facturacion_electronica.pdf417_generator import PDF417Generator
+from facturacion_electronica.firma_electronica import obtener_firmador_empresa
+from facturacion_electronica.timbre_pdf417 import programar_timbre_pdf417
 
 def actualizar_estado_pedido_despachado(orden_despacho):
     """
@@ -131,7 +131,7 @@ def generar_guia_desde_orden_despacho(orden_despacho, usuario):
         xml_sin_firmar = generator.generar_xml()
 
         # 2. Firmar XML
-        firmador = FirmadorDTE(empresa.certificado_digital.path, empresa.password_certificado)
+        firmador = obtener_firmador_empresa(empresa)
         xml_firmado = firmador.firmar_xml(xml_sin_firmar)
 
         # 3. Generar TED (Timbre Electrónico)
@@ -204,8 +204,8 @@ def generar_guia_desde_orden_despacho(orden_despacho, usuario):
         dte.estado_sii = 'generado'
         dte.save()
 
-        # 6. Generar imagen del timbre
-        PDF417Generator.guardar_pdf417_en_dte(dte)
+        # 6. Imagen del timbre en segundo plano (después del commit)
+        programar_timbre_pdf417(dte)
 
         return dte
 
@@ -309,7 +309,7 @@ def generar_factura_desde_orden_despacho(orden_despacho, usuario):
         xml_sin_firmar = generator.generar_xml()
 
         # 2. Firmar XML
-        firmador = FirmadorDTE(empresa.certificado_digital.path, empresa.password_certificado)
+        firmador = obtener_firmador_empresa(empresa)
         xml_firmado = firmador.firmar_xml(xml_sin_firmar)
 
         # 3. Generar TED
@@ -328,7 +328,7 @@ def generar_factura_desde_orden_despacho(orden_despacho, usuario):
         dte.estado_sii = 'generado'
         dte.save()
 
-        # 6. Generar imagen del timbre
-        PDF417Generator.guardar_pdf417_en_dte(dte)
+        # 6. Imagen del timbre en segundo plano (después del commit)
+        programar_timbre_pdf417(dte)
 
         return dte
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ProduccionConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "produccion"
+
+    def ready(self):
+        """Importar señales cuando la app esté lista"""
+        import produccion.signals
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from empresas.models import Empresa
+from produccion.services import recalcular_costos_recetas
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula el costo guardado de las recetas de producción (incluidas las sub-recetas). '
+        'Necesario después de actualizar precio_costo con UPDATE masivos, que no disparan la señal'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa (por defecto todas)')
+
+    def handle(self, *args, **options):
+        empresas = Empresa.objects.all().order_by('id')
+        if options.get('empresa'):
+            empresas = empresas.filter(pk=options['empresa'])
+            if not empresas.exists():
+                raise CommandError(f"Empresa {options['empresa']} no encontrada")
+
+        total = 0
+        for empresa in empresas:
+            inicio = time.perf_counter()
+            actualizadas = recalcular_costos_recetas(empresa)
+            if not actualizadas:
+                continue
+            total += actualizadas
+            self.stdout.write(
+                f'  {empresa.nombre}: {actualizadas} recetas con costo actualizado '
+                f'en {time.perf_counter() - inicio:.1f} s'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} recetas con costo actualizado'))
@@ -0,0 +1,358 @@
+"""
+Costos de recetas y cierre de órdenes de producción.
+
+RecetaProduccion.costo_total_insumos recorría los insumos de la receta (y
+cargaba cada artículo) en cada acceso, y los reportes sumaban
+orden.costo_total orden por orden: N órdenes × M insumos consultas. Ahora:
+
+- Cada receta guarda su costo (costo_insumos) y cada insumo su costo unitario
+  (costo_unitario_calculado). Un insumo que es el producto final de otra
+  receta activa (sub-receta) se costea con el costo unitario de esa receta.
+- recalcular_costos_recetas() calcula en memoria con tres consultas y sólo
+  escribe las recetas e insumos cuyo costo cambió (bulk_update).
+- Al guardar un artículo (señal en produccion.signals) se recalculan las
+  recetas que lo usan, directamente o a través de sub-recetas. Los UPDATE
+  masivos de precio_costo no disparan la señal: el comando
+  recalcular_costos_recetas recalcula todas las recetas.
+- costo_ordenes() suma el costo de las órdenes con un solo aggregate.
+- finalizar_ordenes() cierra una o varias órdenes en una transacción: una
+  consulta para los insumos de todas las recetas, una consulta de saldos con
+  la demanda acumulada de todas las órdenes y un posteo de stock por orden.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import NullIf
+from django.utils import timezone
+
+from articulos.models import InsumoReceta, OrdenProduccion, RecetaProduccion
+from inventario.services import LineaStock, postear_documento, saldos_stock
+
+
+DECIMALES_COSTO = Decimal('0.0001')
+
+# Costo de una orden: costo de la receta × veces que se ejecuta la receta
+COSTO_ORDEN = ExpressionWrapper(
+    F('receta__costo_insumos') * F('cantidad_planificada') / NullIf(F('receta__cantidad_producir'), Value(Decimal('0'))),
+    output_field=DecimalField(max_digits=20, decimal_places=4),
+)
+
+
+class CierreOrden:
+    """Datos de cierre de una orden de producción"""
+
+    __slots__ = ('orden', 'cantidad_producida', 'merma_real', 'observaciones', 'meses_garantia')
+
+    def __init__(self, orden, cantidad_producida, merma_real=Decimal('0'), observaciones='', meses_garantia=None):
+        self.orden = orden
+        self.cantidad_producida = Decimal(str(cantidad_producida))
+        self.merma_real = Decimal(str(merma_real or 0))
+        self.observaciones = observaciones
+        self.meses_garantia = meses_garantia
+
+
+# ==================== COSTOS DE RECETAS ====================
+
+def costear_recetas(lineas, sub_recetas, costos_articulo):
+    """
+    Calcula el costo de las recetas en memoria (sin consultas).
+
+    Args:
+        lineas: {receta_id: [(insumo_id, articulo_id, cantidad), ...]} de las recetas a calcular
+        sub_recetas: {articulo_id: (receta_id, cantidad_producir, costo_guardado)} de las recetas
+            activas que producen cada artículo; las que no están en `lineas` usan su costo guardado
+        costos_articulo: {articulo_id: precio_costo}
+
+    Returns:
+        tuple: ({receta_id: costo}, {insumo_id: costo unitario}, [receta_id de ciclos])
+    """
+    costos = {}
+    unitarios = {}
+    en_curso = set()
+    ciclos = []
+
+    def costo_unitario(articulo_id):
+        sub_receta = sub_recetas.get(articulo_id)
+        if sub_receta is not None:
+            receta_id, cantidad_producir, costo = sub_receta
+            if receta_id in en_curso:
+                ciclos.append(receta_id)  # Ciclo entre sub-recetas: se costea con precio_costo
+                costo = None
+            elif receta_id in lineas:
+                costo = costear(receta_id)
+            if costo is not None and cantidad_producir:
+                return (costo / cantidad_producir).quantize(DECIMALES_COSTO)
+        return costos_articulo.get(articulo_id) or Decimal('0')
+
+    def costear(receta_id):
+        if receta_id in costos:
+            return costos[receta_id]
+        en_curso.add(receta_id)
+        total = Decimal('0')
+        for insumo_id, articulo_id, cantidad in lineas[receta_id]:
+            unitario = costo_unitario(articulo_id)
+            unitarios[insumo_id] = unitario
+            total += unitario * cantidad
+        en_curso.discard(receta_id)
+        costos[receta_id] = total.quantize(DECIMALES_COSTO)
+        return costos[receta_id]
+
+    for receta_id in lineas:
+        costear(receta_id)
+    return costos, unitarios, ciclos
+
+
+def _sub_recetas(empresa, articulo_ids):
+    """Receta activa que produce cada artículo (la primera por código si hay varias)"""
+    sub_recetas = {}
+    recetas = RecetaProduccion.objects.filter(
+        empresa=empresa, activo=True, producto_final_id__in=list(articulo_ids)
+    ).order_by('codigo', 'id').values_list('producto_final_id', 'id', 'cantidad_producir', 'costo_insumos')
+    for producto_id, receta_id, cantidad_producir, costo in recetas:
+        sub_recetas.setdefault(producto_id, (receta_id, cantidad_producir, costo))
+    return sub_recetas
+
+
+def _calcular(empresa, receta_ids):
+    """
+    Costos de las recetas indicadas y los valores guardados actuales (tres
+    consultas). Las sub-recetas que aún no tienen costo se calculan también.
+    """
+    lineas = {}
+    costos_articulo = {}
+    guardados = {}
+    sub_recetas = {}
+    pendientes = set(receta_ids)
+    while pendientes:
+        lineas.update({receta_id: [] for receta_id in pendientes})
+        insumos = InsumoReceta.objects.filter(receta_id__in=list(pendientes)).order_by('receta_id', 'orden', 'id').values_list(
+            'id', 'receta_id', 'articulo_id', 'cantidad', 'articulo__precio_costo', 'costo_unitario_calculado'
+        )
+        for insumo_id, receta_id, articulo_id, cantidad, precio_costo, costo_guardado in insumos:
+            lineas[receta_id].append((insumo_id, articulo_id, cantidad))
+            costos_articulo[articulo_id] = precio_costo
+            guardados[insumo_id] = costo_guardado
+
+        sub_recetas = _sub_recetas(empresa, costos_articulo)
+        pendientes = {
+            receta_id for receta_id, _cantidad, costo in sub_recetas.values()
+            if costo is None and receta_id not in lineas
+        }
+
+    costos, unitarios, ciclos = costear_recetas(lineas, sub_recetas, costos_articulo)
+    for receta_id in set(ciclos):
+        print(f"⚠️ ADVERTENCIA: La receta {receta_id} forma un ciclo con sus sub-recetas; se costea con el precio de costo")
+    return costos, unitarios, guardados
+
+
+def recetas_afectadas(empresa, articulo_ids=(), receta_ids=()):
+    """
+    Recetas cuyo costo depende de los artículos o recetas indicados: las que
+    los usan como insumo y, nivel por nivel, las que usan sus productos.
+
+    Returns:
+        set: IDs de RecetaProduccion (incluye receta_ids)
+    """
+    afectadas = set(receta_ids)
+    if articulo_ids:
+        afectadas |= set(InsumoReceta.objects.filter(
+            receta__empresa=empresa, articulo_id__in=list(articulo_ids)
+        ).values_list('receta_id', flat=True))
+    nuevas = set(afectadas)
+    while nuevas:
+        productos = RecetaProduccion.objects.filter(pk__in=nuevas).values('producto_final_id')
+        nuevas = set(InsumoReceta.objects.filter(
+            receta__empresa=empresa, articulo_id__in=productos
+        ).values_list('receta_id', flat=True)) - afectadas
+        afectadas |= nuevas
+    return afectadas
+
+
+def recalcular_costos_recetas(empresa, receta_ids=None):
+    """
+    Recalcula y guarda el costo de las recetas de la empresa (todas o las
+    indicadas). Sólo escribe las recetas e insumos cuyo costo cambió.
+
+    Returns:
+        int: Cantidad de recetas con costo actualizado
+    """
+    if receta_ids is None:
+        receta_ids = RecetaProduccion.objects.filter(empresa=empresa).values_list('id', flat=True)
+    receta_ids = set(receta_ids)
+    if not receta_ids:
+        return 0
+
+    costos, unitarios, guardados = _calcular(empresa, receta_ids)
+    actuales = dict(RecetaProduccion.objects.filter(pk__in=list(costos)).values_list('id', 'costo_insumos'))
+    ahora = timezone.now()
+
+    recetas = [
+        RecetaProduccion(id=receta_id, costo_insumos=costo, costo_actualizado=ahora)
+        for receta_id, costo in costos.items()
+        if actuales.get(receta_id) != costo
+    ]
+    insumos = [
+        InsumoReceta(id=insumo_id, costo_unitario_calculado=costo)
+        for insumo_id, costo in unitarios.items()
+        if guardados.get(insumo_id) != costo
+    ]
+    with transaction.atomic():
+        RecetaProduccion.objects.bulk_update(recetas, ['costo_insumos', 'costo_actualizado'], batch_size=500)
+        InsumoReceta.objects.bulk_update(insumos, ['costo_unitario_calculado'], batch_size=500)
+    return len(recetas)
+
+
+def actualizar_costos_articulos(empresa, articulo_ids):
+    """Recalcula las recetas que dependen del costo de los artículos"""
+    return recalcular_costos_recetas(empresa, recetas_afectadas(empresa, articulo_ids=articulo_ids))
+
+
+def actualizar_costos_receta(receta, articulo_ids=()):
+    """
+    Recalcula la receta y las recetas que usan su producto (al crearla o
+    editarla). articulo_ids: productos finales anteriores, si cambiaron.
+    """
+    articulo_ids = set(articulo_ids) | {receta.producto_final_id}
+    return recalcular_costos_recetas(
+        receta.empresa_id, recetas_afectadas(receta.empresa_id, articulo_ids=articulo_ids, receta_ids=[receta.id])
+    )
+
+
+def costo_receta(receta):
+    """Costo de una receta sin guardarlo (para recetas que aún no tienen costo)"""
+    costos, _unitarios, _guardados = _calcular(receta.empresa_id, [receta.id])
+    return costos[receta.id]
+
+
+def completar_costos_pendientes(empresa):
+    """Calcula el costo de las recetas que aún no lo tienen (una consulta si no hay)"""
+    pendientes = list(RecetaProduccion.objects.filter(
+        empresa=empresa, costo_insumos__isnull=True
+    ).values_list('id', flat=True))
+    if pendientes:
+        recalcular_costos_recetas(empresa, pendientes)
+    return len(pendientes)
+
+
+def costo_ordenes(ordenes):
+    """Costo total de las órdenes en un solo aggregate"""
+    return ordenes.aggregate(total=Sum(COSTO_ORDEN))['total'] or Decimal('0')
+
+
+# ==================== CIERRE DE ÓRDENES ====================
+
+def finalizar_ordenes(empresa, cierres, bodega_insumos, bodega_productos, usuario=None):
+    """
+    Finaliza órdenes de producción en proceso: consume los insumos de la
+    bodega de insumos y agrega los productos a la bodega de productos.
+
+    Args:
+        empresa: Empresa de las órdenes
+        cierres: Lista de CierreOrden
+        bodega_insumos: Bodega de la que se consumen los insumos
+        bodega_productos: Bodega a la que ingresan los productos
+        usuario: Usuario que registra los movimientos
+
+    Returns:
+        list: Insumos con stock insuficiente (considerando todas las órdenes);
+        no bloquean el cierre, el stock queda negativo
+
+    Raises:
+        ValueError: Si alguna orden ya no está en proceso
+    """
+    if not cierres:
+        return []
+
+    with transaction.atomic():
+        # Bloquear las órdenes para que no se finalicen dos veces
+        ordenes = OrdenProduccion.objects.select_for_update().select_related(
+            'receta', 'receta__producto_final'
+        ).in_bulk([cierre.orden.pk for cierre in cierres])
+        for cierre in cierres:
+            orden = ordenes.get(cierre.orden.pk)
+            if orden is None or orden.empresa_id != empresa.id or orden.estado != 'en_proceso':
+                raise ValueError(f"La orden {cierre.orden.numero_orden} no está en proceso")
+            cierre.orden = orden
+
+        # Insumos de todas las recetas en una consulta
+        insumos_por_receta = {}
+        for insumo in InsumoReceta.objects.filter(
+            receta_id__in={cierre.orden.receta_id for cierre in cierres}
+        ).select_related('articulo'):
+            insumos_por_receta.setdefault(insumo.receta_id, []).append(insumo)
+
+        # Demanda acumulada por insumo y una sola consulta de saldos
+        consumos = []
+        necesidades = {}
+        articulos = {}
+        for cierre in cierres:
+            factor_produccion = cierre.orden.cantidad_planificada / cierre.orden.receta.cantidad_producir
+            lineas = [
+                LineaStock(insumo.articulo, insumo.cantidad * factor_produccion, insumo.costo_unitario)
+                for insumo in insumos_por_receta.get(cierre.orden.receta_id, [])
+            ]
+            consumos.append(lineas)
+            for linea in lineas:
+                necesidades[linea.articulo.id] = necesidades.get(linea.articulo.id, Decimal('0')) + linea.cantidad
+                articulos[linea.articulo.id] = linea.articulo
+
+        saldos = saldos_stock(empresa, necesidades, bodegas=[bodega_insumos])
+        insumos_sin_stock = []
+        for articulo_id, cantidad_necesaria in necesidades.items():
+            stock_disponible = saldos.get(articulo_id, Decimal('0'))
+            if stock_disponible < cantidad_necesaria:
+                insumos_sin_stock.append({
+                    'nombre': articulos[articulo_id].nombre,
+                    'necesario': float(cantidad_necesaria),
+                    'disponible': float(stock_disponible),
+                    'faltante': float(cantidad_necesaria - stock_disponible)
+                })
+
+        # Un solo UPDATE para todas las órdenes
+        ahora = timezone.now()
+        for cierre in cierres:
+            cierre.orden.estado = 'terminada'
+            cierre.orden.fecha_fin = ahora
+            cierre.orden.fecha_actualizacion = ahora
+            cierre.orden.cantidad_producida = cierre.cantidad_producida
+            cierre.orden.merma_real = cierre.merma_real
+            cierre.orden.observaciones = cierre.observaciones
+            cierre.orden.meses_garantia = cierre.meses_garantia
+        OrdenProduccion.objects.bulk_update(
+            [cierre.orden for cierre in cierres],
+            ['estado', 'fecha_fin', 'fecha_actualizacion', 'cantidad_producida', 'merma_real',
+             'observaciones', 'meses_garantia'],
+        )
+
+        # Posteo de stock por orden (la orden es la clave de idempotencia del documento)
+        for cierre, lineas in zip(cierres, consumos):
+            orden = cierre.orden
+            producto = orden.receta.producto_final
+            postear_documento(
+                empresa=empresa,
+                bodega=bodega_insumos,
+                lineas=lineas,
+                tipo_movimiento='salida',
+                documento_tipo='orden_produccion',
+                documento_id=orden.id,
+                numero_documento=str(orden.numero_orden),
+                descripcion=f'Insumo consumido en producción de {producto.nombre}',
+                motivo=f'Consumo por Producción - Orden {orden.numero_orden}',
+                usuario=usuario,
+                permitir_negativo=True,
+            )
+            postear_documento(
+                empresa=empresa,
+                bodega=bodega_productos,
+                lineas=[LineaStock(producto, cierre.cantidad_producida, orden.receta.costo_unitario)],
+                tipo_movimiento='entrada',
+                documento_tipo='orden_produccion',
+                documento_id=orden.id,
+                numero_documento=str(orden.numero_orden),
+                descripcion=f'Producto fabricado. Merma: {cierre.merma_real}. {cierre.observaciones[:100] if cierre.observaciones else ""}',
+                motivo=f'Producción - Orden {orden.numero_orden}',
+                usuario=usuario,
+            )
+
+    return insumos_sin_stock
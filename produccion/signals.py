@@ -0,0 +1,15 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from articulos.models import Articulo
+from .services import actualizar_costos_articulos
+
+
+@receiver(post_save, sender=Articulo)
+def actualizar_costos_recetas_articulo(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Recalcula el costo de las recetas que usan el artículo (directamente o en sub-recetas)"""
+    if created or raw:
+        return
+    if update_fields is not None and 'precio_costo' not in update_fields:
+        return
+    actualizar_costos_articulos(instance.empresa_id, [instance.id])
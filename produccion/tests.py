@@ -1,3 +1,56 @@
+from datetime import date, time
+from decimal import Decimal
+from unittest import mock
+
 from django.test import TestCase
 
-# Create your tests here.
+from articulos.models import Articulo, CategoriaArticulo, OrdenProduccion, RecetaProduccion, UnidadMedida
+from empresas.models import Empresa, Sucursal
+from produccion.views import _ordenes_reporte_produccion, _totales_reporte_produccion, generar_reporte_produccion_pdf
+
+
+class ReporteProduccionTest(TestCase):
+    """El reporte de producción calcula costos y totales en la consulta (COSTO_ORDEN), no por orden"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(nombre='Empresa Prod', razon_social='Empresa Prod', rut='76.000.009-3')
+        sucursal = Sucursal.objects.create(
+            empresa=cls.empresa, nombre='Planta', codigo='P1', direccion='Calle 1', comuna='Santiago',
+            ciudad='Santiago', region='Metropolitana', telefono='123',
+            horario_apertura=time(9), horario_cierre=time(18),
+        )
+        categoria = CategoriaArticulo.objects.create(empresa=cls.empresa, codigo='PRD', nombre='Producción')
+        unidad = UnidadMedida.objects.create(empresa=cls.empresa, nombre='Unidad', simbolo='UN')
+        producto = Articulo.objects.create(
+            empresa=cls.empresa, categoria=categoria, unidad_medida=unidad,
+            codigo='PAN', nombre='Pan', precio_venta='1000', tipo_articulo='produccion',
+        )
+        receta = RecetaProduccion.objects.create(
+            empresa=cls.empresa, codigo='R1', nombre='Pan amasado', producto_final=producto,
+            cantidad_producir=Decimal('10'), tiempo_estimado=60, costo_insumos=Decimal('1000'),
+        )
+        for numero, planificada, producida, estado in (('1', '20', '18', 'terminada'), ('2', '5', '0', 'pendiente')):
+            OrdenProduccion.objects.create(
+                empresa=cls.empresa, sucursal=sucursal, numero_orden=numero, receta=receta,
+                cantidad_planificada=Decimal(planificada), cantidad_producida=Decimal(producida),
+                fecha_planificada=date(2026, 5, int(numero)), estado=estado,
+            )
+
+    def test_totales_y_costo_en_un_solo_aggregate(self):
+        with self.assertNumQueries(1):
+            totales = _totales_reporte_produccion(_ordenes_reporte_produccion(self.empresa, {}))
+        self.assertEqual(totales['total_ordenes'], 2)
+        self.assertEqual(totales['ordenes_terminadas'], 1)
+        self.assertEqual(totales['costo_total'], Decimal('2500'))
+        self.assertEqual(totales['eficiencia_promedio'], Decimal('72'))
+
+        filtradas = _ordenes_reporte_produccion(self.empresa, {'estado': 'terminada'})
+        self.assertEqual(_totales_reporte_produccion(filtradas)['costo_total'], Decimal('2000'))
+
+    def test_pdf_sin_consultas_por_orden(self):
+        # Recetas con costo pendiente, aggregate de totales y una consulta de filas
+        with self.assertNumQueries(3):
+            nombre, content_type, contenido = generar_reporte_produccion_pdf(self.empresa, {}, mock.Mock())
+        self.assertEqual(content_type, 'application/pdf')
+        self.assertTrue(contenido.startswith(b'%PDF'))
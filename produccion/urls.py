@@ -20,6 +20,7 @@ urlpatterns = [
     path('ordenes/<int:pk>/eliminar/', views.orden_delete, name='orden_delete'),
     path('ordenes/<int:pk>/iniciar/', views.orden_iniciar, name='orden_iniciar'),
     path('ordenes/<int:pk>/finalizar/', views.orden_finalizar, name='orden_finalizar'),
+    path('ordenes/finalizar/', views.orden_finalizar_masivo, name='orden_finalizar_masivo'),
     path('ordenes/<int:pk>/cancelar/', views.orden_cancelar, name='orden_cancelar'),
     
     # Reportes
@@ -17,8 +17,13 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT
 from io import BytesIO
 
-from articulos.models import RecetaProduccion, InsumoReceta, OrdenProduccion, Articulo, StockArticulo
+from articulos.models import RecetaProduccion, InsumoReceta, OrdenProduccion, Articulo
+from inventario.services import saldos_stock
 from core.decorators import requiere_empresa
+from .services import (
+    COSTO_ORDEN, CierreOrden, actualizar_costos_articulos, actualizar_costos_receta,
+    completar_costos_pendientes, costo_ordenes, finalizar_ordenes,
+)
 
 
 # ==================== RECETAS DE PRODUCCIÓN ====================
@@ -27,6 +32,7 @@ from core.decorators import requiere_empresa
 @login_required
 def receta_list(request):
     """Lista de recetas de producción"""
+    completar_costos_pendientes(request.empresa)
     recetas = RecetaProduccion.objects.filter(empresa=request.empresa).select_related('producto_final')
     
     # Filtros
@@ -130,6 +136,9 @@ def receta_create(request):
                         notas=insumo_notas[i] if i < len(insumo_notas) else ''
                     )
             
+            # Costo de la receta (y de las recetas que usan su producto como insumo)
+            actualizar_costos_receta(receta)
+            
             # Redirigir sin mensaje (se mostrará en la siguiente página)
             messages.success(request, 'Receta creada exitosamente.')
             
@@ -286,6 +295,7 @@ def receta_update(request, pk):
                 return render(request, 'produccion/receta_form.html', context)
             
             # TODO VALIDADO - Ahora sí actualizar
+            producto_anterior_id = receta.producto_final_id
             receta.codigo = codigo
             receta.nombre = nombre
             receta.descripcion = request.POST.get('descripcion', '').strip()
@@ -307,6 +317,9 @@ def receta_update(request, pk):
                         notas=insumo_notas[i] if i < len(insumo_notas) else ''
                     )
             
+            # Costo de la receta y de las recetas que usan su producto (el actual y el anterior)
+            actualizar_costos_receta(receta, articulo_ids=[producto_anterior_id])
+            
             messages.success(request, 'Receta actualizada exitosamente.')
             
             # Si es AJAX, devolver JSON de éxito
@@ -391,7 +404,10 @@ def receta_delete(request, pk):
     receta = get_object_or_404(RecetaProduccion, pk=pk, empresa=request.empresa)
     
     if request.method == 'POST':
+        producto_final_id = receta.producto_final_id
         receta.delete()
+        # Las recetas que usaban su producto como sub-receta vuelven al precio de costo
+        actualizar_costos_articulos(request.empresa, [producto_final_id])
         messages.success(request, 'Receta eliminada exitosamente.')
         return redirect('produccion:receta_list')
     
@@ -829,123 +845,28 @@ def orden_finalizar(request, pk):
                 messages.error(request, msg)
                 return redirect('produccion:orden_detail', pk=pk)
             
-            # Calcular factor de producción (cuántas veces se ejecutó la receta)
-            factor_produccion = orden.cantidad_planificada / orden.receta.cantidad_producir
-
-            
-            # VALIDAR STOCK DE INSUMOS ANTES DE FINALIZAR
-            insumos_sin_stock = []
-            for insumo in orden.receta.insumos.all():
-                cantidad_necesaria = insumo.cantidad * factor_produccion
-                
-                # Buscar stock del insumo
-                stock = StockArticulo.objects.filter(
-                    articulo=insumo.articulo,
-                    sucursal=orden.sucursal
-                ).first()
-            
-            if stock:
-                if isinstance(stock.cantidad_disponible, str):
-                    stock_disponible = Decimal(stock.cantidad_disponible.replace(',', '.'))
-                else:
-                    stock_disponible = Decimal(str(stock.cantidad_disponible))
-            else:
-                stock_disponible = Decimal('0')
-            
-            if stock_disponible < cantidad_necesaria:
-                insumos_sin_stock.append({
-                    'nombre': insumo.articulo.nombre,
-                    'necesario': float(cantidad_necesaria),
-                    'disponible': float(stock_disponible),
-                    'faltante': float(cantidad_necesaria - stock_disponible)
-                })
+            # Validar stock de insumos, cerrar la orden y postear insumos y producto
+            # en una sola transacción (una consulta de saldos para todos los insumos)
+            insumos_sin_stock = finalizar_ordenes(
+                request.empresa,
+                [CierreOrden(
+                    orden,
+                    cantidad_producida,
+                    merma_real,
+                    observaciones=comentarios,
+                    meses_garantia=int(meses_garantia) if meses_garantia else None,
+                )],
+                bodega_insumos,
+                bodega_productos,
+                usuario=request.user,
+            )
             
             # Si hay insumos sin stock, solo registrar advertencia (no bloquear)
             if insumos_sin_stock:
                 print("⚠️ ADVERTENCIA: Insumos con stock insuficiente:")
                 for insumo in insumos_sin_stock:
                     print(f"  • {insumo['nombre']}: Necesario {insumo['necesario']}, Disponible {insumo['disponible']}, Falta {insumo['faltante']}")
-            
-            # Actualizar orden
-            orden.estado = 'terminada'
-            orden.fecha_fin = timezone.now()
-            orden.cantidad_producida = cantidad_producida
-            orden.merma_real = merma_real
-            orden.observaciones = comentarios
-            orden.meses_garantia = int(meses_garantia) if meses_garantia else None
-            orden.save()
-            
-            # Consumir stock de insumos
-            for insumo in orden.receta.insumos.all():
-                cantidad_consumir = insumo.cantidad * factor_produccion
-                
-                # Buscar stock del insumo en la sucursal
-                stock, created = StockArticulo.objects.get_or_create(
-                    articulo=insumo.articulo,
-                    sucursal=orden.sucursal,
-                    defaults={'cantidad_disponible': '0', 'cantidad_reservada': '0'}
-                )
-                
-                # Reducir stock disponible
-                if isinstance(stock.cantidad_disponible, str):
-                    stock_actual = Decimal(stock.cantidad_disponible.replace(',', '.'))
-                else:
-                    stock_actual = Decimal(str(stock.cantidad_disponible))
-                nuevo_stock = stock_actual - cantidad_consumir
-                stock.cantidad_disponible = str(nuevo_stock)
-                stock.save()
-                
-                # Registrar movimiento en kardex (SALIDA de insumo desde bodega de insumos)
-                mov_salida = Inventario.objects.create(
-                    empresa=orden.empresa,
-                    bodega_origen=bodega_insumos,
-                    articulo=insumo.articulo,
-                    tipo_movimiento='salida',
-                    cantidad=cantidad_consumir,
-                    precio_unitario=Decimal(insumo.articulo.precio_costo.replace(',', '.')) if insumo.articulo.precio_costo else Decimal('0'),
-                    total=cantidad_consumir * (Decimal(insumo.articulo.precio_costo.replace(',', '.')) if insumo.articulo.precio_costo else Decimal('0')),
-                    motivo=f'Consumo por Producción - Orden {orden.numero_orden}',
-                    descripcion=f'Insumo consumido en producción de {orden.receta.producto_final.nombre}',
-                    numero_documento=str(orden.numero_orden),
-                    estado='confirmado',
-                    fecha_movimiento=timezone.now(),
-                    creado_por=request.user
-                )
-                print(f"✅ Movimiento SALIDA creado: ID={mov_salida.id}, Artículo={insumo.articulo.nombre}, Bodega={bodega_insumos.nombre}, Cantidad={cantidad_consumir}")
-            
-            # Agregar stock del producto final
-            stock_producto, created = StockArticulo.objects.get_or_create(
-                articulo=orden.receta.producto_final,
-                sucursal=orden.sucursal,
-                defaults={'cantidad_disponible': '0', 'cantidad_reservada': '0'}
-            )
-            
-            # Aumentar stock disponible
-            if isinstance(stock_producto.cantidad_disponible, str):
-                stock_actual = Decimal(stock_producto.cantidad_disponible.replace(',', '.'))
-            else:
-                stock_actual = Decimal(str(stock_producto.cantidad_disponible))
-            nuevo_stock = stock_actual + cantidad_producida
-            stock_producto.cantidad_disponible = str(nuevo_stock)
-            stock_producto.save()
-            
-            # Registrar movimiento en kardex (ENTRADA de producto final a bodega de productos)
-            mov_entrada = Inventario.objects.create(
-                empresa=orden.empresa,
-                bodega_destino=bodega_productos,
-                articulo=orden.receta.producto_final,
-                tipo_movimiento='entrada',
-                cantidad=cantidad_producida,
-                precio_unitario=orden.receta.costo_unitario,
-                total=cantidad_producida * orden.receta.costo_unitario,
-                motivo=f'Producción - Orden {orden.numero_orden}',
-                descripcion=f'Producto fabricado. Merma: {merma_real}. {comentarios[:100] if comentarios else ""}',
-                numero_documento=str(orden.numero_orden),
-                estado='confirmado',
-                fecha_movimiento=timezone.now(),
-                creado_por=request.user
-            )
-            print(f"✅ Movimiento ENTRADA creado: ID={mov_entrada.id}, Artículo={orden.receta.producto_final.nombre}, Bodega={bodega_productos.nombre}, Cantidad={cantidad_producida}")
+            print(f"✅ Orden {orden.numero_orden} finalizada: insumos desde {bodega_insumos.nombre}, {cantidad_producida} a {bodega_productos.nombre}")
             
             # Si es AJAX, devolver JSON
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -977,6 +898,49 @@ def orden_finalizar(request, pk):
     return render(request, 'produccion/orden_finalizar.html', context)
 
 
+@requiere_empresa
+@login_required
+def orden_finalizar_masivo(request):
+    """Finalizar varias órdenes en proceso con la cantidad planificada (sin merma)"""
+    if request.method != 'POST':
+        return redirect('produccion:orden_list')
+    
+    from bodegas.models import Bodega
+    
+    ids = [int(orden_id) for orden_id in request.POST.getlist('ordenes') if orden_id.isdigit()]
+    ordenes = list(OrdenProduccion.objects.filter(empresa=request.empresa, pk__in=ids, estado='en_proceso'))
+    if not ordenes:
+        messages.error(request, 'Seleccione al menos una orden en proceso.')
+        return redirect('produccion:orden_list')
+    
+    try:
+        bodega_insumos = Bodega.objects.get(id=int(request.POST.get('bodega_insumos', '')), empresa=request.empresa)
+        bodega_productos = Bodega.objects.get(id=int(request.POST.get('bodega_productos', '')), empresa=request.empresa)
+    except (ValueError, Bodega.DoesNotExist):
+        messages.error(request, 'Debe seleccionar las bodegas de insumos y productos.')
+        return redirect('produccion:orden_list')
+    
+    try:
+        insumos_sin_stock = finalizar_ordenes(
+            request.empresa,
+            [CierreOrden(orden, orden.cantidad_planificada) for orden in ordenes],
+            bodega_insumos,
+            bodega_productos,
+            usuario=request.user,
+        )
+    except Exception as e:
+        import traceback
+        print(f"Error al finalizar órdenes: {traceback.format_exc()}")
+        messages.error(request, f'Error al finalizar órdenes: {str(e)}')
+        return redirect('produccion:orden_list')
+    
+    if insumos_sin_stock:
+        faltantes = ', '.join(f"{insumo['nombre']} (falta {insumo['faltante']:g})" for insumo in insumos_sin_stock[:5])
+        messages.warning(request, f'Insumos con stock insuficiente en {bodega_insumos.nombre}: {faltantes}')
+    messages.success(request, f'{len(ordenes)} órdenes finalizadas exitosamente.')
+    return redirect('produccion:orden_list')
+
+
 @requiere_empresa
 @login_required
 def orden_cancelar(request, pk):
@@ -1043,14 +1007,13 @@ def reportes(request):
         activo=True
     ).count()
     
-    # Costo total del mes (calculado desde las propiedades)
-    ordenes_terminadas_mes = OrdenProduccion.objects.filter(
+    # Costo total del mes (costo guardado de las recetas, en un solo aggregate)
+    completar_costos_pendientes(empresa)
+    costo_total_mes = costo_ordenes(OrdenProduccion.objects.filter(
         empresa=empresa,
         estado='terminada',
         fecha_fin__gte=inicio_mes
-    ).select_related('receta')
-    
-    costo_total_mes = sum(orden.costo_total for orden in ordenes_terminadas_mes)
+    ))
     
     context = {
         'ordenes_activas': ordenes_activas,
@@ -1062,6 +1025,43 @@ def reportes(request):
     return render(request, 'produccion/reportes.html', context)
 
 
+def _ordenes_reporte_produccion(empresa, parametros):
+    """Órdenes del reporte de producción según los filtros (GET o parámetros del trabajo)"""
+    ordenes = OrdenProduccion.objects.filter(empresa=empresa)
+    
+    if parametros.get('fecha_desde'):
+        ordenes = ordenes.filter(fecha_planificada__gte=parametros['fecha_desde'])
+    
+    if parametros.get('fecha_hasta'):
+        ordenes = ordenes.filter(fecha_planificada__lte=parametros['fecha_hasta'])
+    
+    if parametros.get('estado'):
+        ordenes = ordenes.filter(estado=parametros['estado'])
+    
+    return ordenes
+
+
+def _totales_reporte_produccion(ordenes):
+    """Estadísticas y totales del reporte en una sola consulta (costo con el costo guardado de las recetas)"""
+    totales = ordenes.aggregate(
+        total_ordenes=Count('id'),
+        ordenes_terminadas=Count('id', filter=Q(estado='terminada')),
+        total_planificado=Sum('cantidad_planificada'),
+        total_producido=Sum('cantidad_producida'),
+        total_merma=Sum('merma_real'),
+        costo_total=Sum(COSTO_ORDEN),
+    )
+    for campo in ('total_planificado', 'total_producido', 'total_merma', 'costo_total'):
+        totales[campo] = totales[campo] or Decimal('0')
+    
+    # Eficiencia promedio
+    if totales['total_planificado'] > 0:
+        totales['eficiencia_promedio'] = (totales['total_producido'] / totales['total_planificado']) * 100
+    else:
+        totales['eficiencia_promedio'] = 0
+    return totales
+
+
 @requiere_empresa
 @login_required
 def reporte_produccion(request):
@@ -1072,47 +1072,19 @@ def reporte_produccion(request):
     estado = request.GET.get('estado', '')
     
     # Filtrar órdenes
-    ordenes = OrdenProduccion.objects.filter(empresa=request.empresa).select_related('receta', 'sucursal')
-    
-    if fecha_desde:
-        ordenes = ordenes.filter(fecha_planificada__gte=fecha_desde)
-    
-    if fecha_hasta:
-        ordenes = ordenes.filter(fecha_planificada__lte=fecha_hasta)
-    
-    if estado:
-        ordenes = ordenes.filter(estado=estado)
-    
-    # Calcular estadísticas
-    total_ordenes = ordenes.count()
-    ordenes_terminadas = ordenes.filter(estado='terminada').count()
-    
-    # Totales
-    total_planificado = sum(orden.cantidad_planificada for orden in ordenes)
-    total_producido = sum(orden.cantidad_producida for orden in ordenes)
-    total_merma = sum(orden.merma_real for orden in ordenes)
-    
-    # Eficiencia promedio
-    if total_planificado > 0:
-        eficiencia_promedio = (total_producido / total_planificado) * 100
-    else:
-        eficiencia_promedio = 0
+    ordenes = _ordenes_reporte_produccion(request.empresa, request.GET)
     
-    # Costo total
-    costo_total = sum(orden.costo_total for orden in ordenes)
+    # Estadísticas y totales en una sola consulta
+    completar_costos_pendientes(request.empresa)
+    totales = _totales_reporte_produccion(ordenes)
     
     context = {
-        'ordenes': ordenes.order_by('-fecha_planificada'),
+        # Costo de cada orden calculado en la misma consulta (sin orden.costo_total por fila)
+        'ordenes': ordenes.select_related('receta', 'sucursal').annotate(costo=COSTO_ORDEN).order_by('-fecha_planificada'),
         'fecha_desde': fecha_desde,
         'fecha_hasta': fecha_hasta,
         'estado': estado,
-        'total_ordenes': total_ordenes,
-        'ordenes_terminadas': ordenes_terminadas,
-        'total_planificado': total_planificado,
-        'total_producido': total_producido,
-        'total_merma': total_merma,
-        'eficiencia_promedio': eficiencia_promedio,
-        'costo_total': costo_total,
+        **totales,
     }
     
     return render(request, 'produccion/reporte_produccion.html', context)
@@ -1142,33 +1114,38 @@ def reporte_costos(request):
     if receta_id:
         ordenes = ordenes.filter(receta_id=receta_id)
     
-    # Calcular costos totales
-    costo_total_produccion = sum(orden.costo_total for orden in ordenes)
-    costo_total_insumos = sum(orden.receta.costo_total_insumos * (orden.cantidad_planificada / orden.receta.cantidad_producir) for orden in ordenes)
+    # Calcular costos totales (costo guardado de las recetas, en un solo aggregate)
+    completar_costos_pendientes(request.empresa)
+    totales = ordenes.aggregate(costo=Sum(COSTO_ORDEN), unidades=Sum('cantidad_producida'))
+    costo_total_produccion = totales['costo'] or Decimal('0')
+    costo_total_insumos = costo_total_produccion
     
     # Costo promedio unitario
-    total_unidades = sum(orden.cantidad_producida for orden in ordenes)
+    total_unidades = totales['unidades'] or Decimal('0')
     if total_unidades > 0:
         costo_promedio_unitario = costo_total_produccion / total_unidades
     else:
         costo_promedio_unitario = 0
     
     # Agrupar por receta
-    from collections import defaultdict
-    costos_por_receta_dict = defaultdict(lambda: {
-        'receta': None,
-        'total_ordenes': 0,
-        'costo_total_producido': Decimal('0')
-    })
-    
-    for orden in ordenes:
-        key = orden.receta.id
-        if costos_por_receta_dict[key]['receta'] is None:
-            costos_por_receta_dict[key]['receta'] = orden.receta
-        costos_por_receta_dict[key]['total_ordenes'] += 1
-        costos_por_receta_dict[key]['costo_total_producido'] += orden.costo_total
-    
-    costos_por_receta = list(costos_por_receta_dict.values())
+    por_receta = ordenes.order_by().values('receta_id').annotate(
+        total_ordenes=Count('id'),
+        costo_total_producido=Sum(COSTO_ORDEN),
+    )
+    recetas_por_id = RecetaProduccion.objects.select_related('producto_final').in_bulk(
+        [fila['receta_id'] for fila in por_receta]
+    )
+    costos_por_receta = sorted(
+        [
+            {
+                'receta': recetas_por_id[fila['receta_id']],
+                'total_ordenes': fila['total_ordenes'],
+                'costo_total_producido': fila['costo_total_producido'] or Decimal('0'),
+            }
+            for fila in por_receta
+        ],
+        key=lambda item: item['receta'].nombre,
+    )
     
     # Obtener todas las recetas para el filtro
     recetas = RecetaProduccion.objects.filter(empresa=request.empresa, activo=True).order_by('nombre')
@@ -1211,6 +1188,7 @@ def exportar_reporte_produccion_excel(request):
         ordenes = ordenes.filter(estado=estado)
     
     ordenes = ordenes.order_by('-fecha_planificada')
+    completar_costos_pendientes(request.empresa)
     
     # Crear libro de Excel
     wb = openpyxl.Workbook()
@@ -1375,25 +1353,18 @@ def exportar_orden_excel(request, pk):
     # Calcular factor de producción
     factor_produccion = orden.cantidad_planificada / orden.receta.cantidad_producir
     
-    # Datos de insumos
-    for insumo in orden.receta.insumos.all():
+    # Datos de insumos (stock de las bodegas de la sucursal en una sola consulta)
+    from bodegas.models import Bodega
+    insumos = list(orden.receta.insumos.select_related('articulo'))
+    saldos = saldos_stock(
+        orden.empresa,
+        [insumo.articulo_id for insumo in insumos],
+        bodegas=Bodega.objects.filter(empresa=orden.empresa, sucursal=orden.sucursal)
+    )
+    for insumo in insumos:
         row += 1
         cantidad_total = insumo.cantidad * factor_produccion
-        
-        # Obtener stock disponible
-        stock = StockArticulo.objects.filter(
-            articulo=insumo.articulo,
-            sucursal=orden.sucursal
-        ).first()
-        
-        if stock:
-            # Convertir a Decimal si es string, sino usar directamente
-            if isinstance(stock.cantidad_disponible, str):
-                stock_disponible = Decimal(stock.cantidad_disponible.replace(',', '.'))
-            else:
-                stock_disponible = Decimal(str(stock.cantidad_disponible))
-        else:
-            stock_disponible = Decimal('0')
+        stock_disponible = saldos.get(insumo.articulo_id, Decimal('0'))
         
         ws.cell(row=row, column=1, value=insumo.articulo.nombre).border = border
         ws.cell(row=row, column=2, value=float(insumo.cantidad)).border = border
@@ -1436,25 +1407,29 @@ def exportar_orden_excel(request, pk):
 @requiere_empresa
 @login_required
 def exportar_reporte_produccion_pdf(request):
-    """Exportar reporte de producción a PDF"""
+    """
+    Exportar reporte de producción a PDF.
+    Se genera en segundo plano (ver generar_reporte_produccion_pdf).
+    """
+    from informes.views_trabajos import iniciar_exportacion
+    return iniciar_exportacion(request, 'reporte_produccion_pdf', 'Reporte de Producción')
+
+
+def generar_reporte_produccion_pdf(empresa, parametros, progreso):
+    """
+    Genera el PDF del reporte de producción para un TrabajoExportacion.
+    Las filas se leen como valores con el costo calculado en la consulta
+    (COSTO_ORDEN) y los totales salen de un solo aggregate.
+    """
     # Obtener filtros
-    fecha_desde = request.GET.get('fecha_desde', '')
-    fecha_hasta = request.GET.get('fecha_hasta', '')
-    estado = request.GET.get('estado', '')
+    fecha_desde = parametros.get('fecha_desde', '')
+    fecha_hasta = parametros.get('fecha_hasta', '')
     
     # Filtrar órdenes
-    ordenes = OrdenProduccion.objects.filter(empresa=request.empresa).select_related('receta', 'sucursal')
-    
-    if fecha_desde:
-        ordenes = ordenes.filter(fecha_planificada__gte=fecha_desde)
-    
-    if fecha_hasta:
-        ordenes = ordenes.filter(fecha_planificada__lte=fecha_hasta)
-    
-    if estado:
-        ordenes = ordenes.filter(estado=estado)
-    
-    ordenes = ordenes.order_by('-fecha_planificada')
+    ordenes = _ordenes_reporte_produccion(empresa, parametros)
+    completar_costos_pendientes(empresa)
+    totales = _totales_reporte_produccion(ordenes)
+    estados = dict(OrdenProduccion._meta.get_field('estado').choices)
     
     # Crear PDF
     buffer = BytesIO()
@@ -1475,7 +1450,7 @@ def exportar_reporte_produccion_pdf(request):
     )
     
     # Título
-    title = Paragraph(f'REPORTE DE PRODUCCIÓN<br/>{request.empresa.nombre}', title_style)
+    title = Paragraph(f'REPORTE DE PRODUCCIÓN<br/>{empresa.nombre}', title_style)
     elements.append(title)
     elements.append(Spacer(1, 12))
     
@@ -1487,42 +1462,46 @@ def exportar_reporte_produccion_pdf(request):
         elements.append(Spacer(1, 12))
     
     # Datos de la tabla
-    data = [['Orden', 'Receta', 'Fecha', 'Plan.', 'Prod.', 'Merma', 'Efic.%', 'Estado']]
+    data = [['Orden', 'Receta', 'Fecha', 'Plan.', 'Prod.', 'Merma', 'Efic.%', 'Estado', 'Costo']]
     
-    total_planificado = 0
-    total_producido = 0
-    total_merma = 0
-    
-    for orden in ordenes:
+    total_ordenes = totales['total_ordenes']
+    filas = ordenes.annotate(costo=COSTO_ORDEN).order_by('-fecha_planificada').values_list(
+        'numero_orden', 'receta__nombre', 'fecha_planificada', 'cantidad_planificada',
+        'cantidad_producida', 'merma_real', 'estado', 'costo',
+    )
+    for indice, (numero, receta, fecha, planificada, producida, merma, estado, costo) in enumerate(
+        filas.iterator(chunk_size=500), 1
+    ):
+        if indice % 200 == 0:
+            progreso(indice, total_ordenes, 'Procesando órdenes...')
+        eficiencia = (producida / planificada) * 100 if planificada > 0 else 0
         data.append([
-            f"OP-{orden.numero_orden}",
-            orden.receta.nombre[:20],
-            orden.fecha_planificada.strftime('%d/%m/%Y'),
-            f"{float(orden.cantidad_planificada):.0f}",
-            f"{float(orden.cantidad_producida):.0f}",
-            f"{float(orden.merma_real):.0f}",
-            f"{float(orden.porcentaje_completado):.0f}%",
-            orden.get_estado_display()[:10]
+            f"OP-{numero}",
+            receta[:20],
+            fecha.strftime('%d/%m/%Y'),
+            f"{float(planificada):.0f}",
+            f"{float(producida):.0f}",
+            f"{float(merma):.0f}",
+            f"{float(eficiencia):.0f}%",
+            str(estados.get(estado, estado))[:10],
+            f"${float(costo or 0):,.0f}".replace(',', '.'),
         ])
-        
-        total_planificado += orden.cantidad_planificada
-        total_producido += orden.cantidad_producida
-        total_merma += orden.merma_real
     
     # Fila de totales
     data.append([
         'TOTALES',
         '',
         '',
-        f"{float(total_planificado):.0f}",
-        f"{float(total_producido):.0f}",
-        f"{float(total_merma):.0f}",
+        f"{float(totales['total_planificado']):.0f}",
+        f"{float(totales['total_producido']):.0f}",
+        f"{float(totales['total_merma']):.0f}",
+        f"{float(totales['eficiencia_promedio']):.0f}%",
         '',
-        ''
+        f"${float(totales['costo_total']):,.0f}".replace(',', '.'),
     ])
     
     # Crear tabla
-    table = Table(data, colWidths=[60, 120, 60, 40, 40, 40, 45, 60])
+    table = Table(data, colWidths=[55, 110, 55, 38, 38, 38, 40, 55, 65])
     
     # Estilo de la tabla
     table.setStyle(TableStyle([
@@ -1543,10 +1522,11 @@ def exportar_reporte_produccion_pdf(request):
     ]))
     
     elements.append(table)
+    progreso(total_ordenes, total_ordenes, 'Generando PDF...')
     doc.build(elements)
     
-    buffer.seek(0)
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="reporte_produccion_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-    
-    return response
+    return (
+        f'reporte_produccion_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf',
+        'application/pdf',
+        buffer.getvalue(),
+    )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from tesoreria.models import MovimientoCuentaCorrienteCliente
+from tesoreria.saldos import actualizar_saldos_documentos
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el saldo persistido de cada factura de cuenta corriente de clientes desde sus pagos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa (por defecto todas)')
+
+    def handle(self, *args, **options):
+        movimientos = MovimientoCuentaCorrienteCliente.objects.all()
+        if options['empresa']:
+            movimientos = movimientos.filter(cuenta_corriente__empresa_id=options['empresa'])
+
+        actualizados = actualizar_saldos_documentos(movimientos)
+        self.stdout.write(self.style.SUCCESS(f'✓ Saldos recalculados: {actualizados} facturas'))
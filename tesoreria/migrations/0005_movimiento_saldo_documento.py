@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:54
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+
+def calcular_saldos_documentos(apps, schema_editor):
+    """Saldo inicial de cada factura (DEBE) = monto - pagos HABER de la misma venta"""
+    Movimiento = apps.get_model('tesoreria', 'MovimientoCuentaCorrienteCliente')
+    monto = models.DecimalField(max_digits=12, decimal_places=2)
+
+    def suma_pagos(**filtro_venta):
+        pagos = Movimiento.objects.filter(
+            cuenta_corriente=OuterRef('cuenta_corriente'),
+            tipo_movimiento='haber',
+            **filtro_venta
+        ).order_by().values('cuenta_corriente').annotate(total=Sum('monto')).values('total')
+        return Coalesce(Subquery(pagos, output_field=monto), Value(Decimal('0')), output_field=monto)
+
+    actualizados = Movimiento.objects.filter(tipo_movimiento='debe').update(
+        saldo_documento=F('monto') - Case(
+            When(venta__isnull=True, then=suma_pagos(venta__isnull=True)),
+            default=suma_pagos(venta=OuterRef('venta')),
+            output_field=monto,
+        )
+    )
+    print(f"[MIGRACIÓN] Saldo calculado para {actualizados} facturas de cuenta corriente")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tesoreria', '0004_pagodocumentocliente'),
+        ('ventas', '0037_estaciontrabajo_copias_notacredito'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientocuentacorrientecliente',
+            name='saldo_documento',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='Saldo del Documento'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientocuentacorrientecliente',
+            index=models.Index(fields=['cuenta_corriente', 'venta', 'tipo_movimiento'], name='mov_cc_cli_venta_tipo_idx'),
+        ),
+        migrations.RunPython(calcular_saldos_documentos, migrations.RunPython.noop),
+    ]
@@ -165,6 +165,10 @@ class MovimientoCuentaCorrienteCliente(models.Model):
     estado = models.CharField(max_length=20, choices=ESTADO_MOVIMIENTO_CHOICES, default='confirmado', verbose_name="Estado")
     observaciones = models.TextField(blank=True, verbose_name="Observaciones")
 
+    # Sólo movimientos DEBE: lo que queda por pagar de la factura (monto - pagos HABER).
+    # Lo mantienen los registros de pago; ver tesoreria.saldos
+    saldo_documento = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True, verbose_name="Saldo del Documento")
+
     # Auditoría
     fecha_movimiento = models.DateTimeField(default=timezone.now, verbose_name="Fecha del Movimiento")
     registrado_por = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Registrado por")
@@ -173,10 +177,20 @@ class MovimientoCuentaCorrienteCliente(models.Model):
         verbose_name = "Movimiento de Cuenta Corriente de Cliente"
         verbose_name_plural = "Movimientos de Cuenta Corriente de Clientes"
         ordering = ['-fecha_movimiento']
+        indexes = [
+            # Pagos de una factura (cuenta + venta + HABER)
+            models.Index(fields=['cuenta_corriente', 'venta', 'tipo_movimiento'], name='mov_cc_cli_venta_tipo_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_tipo_movimiento_display()} - {self.monto} - {self.fecha_movimiento.strftime('%d/%m/%Y')}"
 
+    def save(self, *args, **kwargs):
+        # Una factura nueva parte con todo su monto pendiente
+        if self._state.adding and self.tipo_movimiento == 'debe' and self.saldo_documento is None:
+            self.saldo_documento = self.monto
+        super().save(*args, **kwargs)
+
 
 class DocumentoCliente(models.Model):
     """Modelo para gestionar documentos de clientes en cuenta corriente"""
@@ -0,0 +1,132 @@
+"""
+Saldos por documento de la cuenta corriente de clientes.
+
+Cada movimiento DEBE (factura a crédito) guarda en saldo_documento lo que
+queda por pagar. Los registros de pago lo recalculan con un UPDATE contra la
+suma de los movimientos HABER de la misma venta, y el listado filtra, busca y
+pagina sobre ese campo en la base de datos (sin una consulta por factura).
+
+Para movimientos antiguos sin saldo persistido, las consultas calculan el
+saldo con una subconsulta sobre los pagos (Coalesce), así el listado es
+correcto aun antes de correr recalcular_saldos_cuenta_corriente.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Case, CharField, Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Cast, Coalesce
+
+from .models import DocumentoCliente, MovimientoCuentaCorrienteCliente
+
+
+MONTO = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _suma_pagos(**filtro_venta):
+    pagos = MovimientoCuentaCorrienteCliente.objects.filter(
+        cuenta_corriente=OuterRef('cuenta_corriente'),
+        tipo_movimiento='haber',
+        **filtro_venta
+    ).order_by().values('cuenta_corriente').annotate(total=Sum('monto')).values('total')
+    return Coalesce(Subquery(pagos, output_field=MONTO), Value(Decimal('0')), output_field=MONTO)
+
+
+def total_pagado_subquery():
+    """
+    Suma de los pagos (HABER) de la misma cuenta y venta que el movimiento
+    externo. Un movimiento sin venta toma los pagos sin venta de su cuenta.
+    """
+    return Case(
+        When(venta__isnull=True, then=_suma_pagos(venta__isnull=True)),
+        default=_suma_pagos(venta=OuterRef('venta')),
+        output_field=MONTO,
+    )
+
+
+def movimientos_con_saldo(empresa):
+    """
+    Facturas a crédito (movimientos DEBE) de la empresa anotadas con
+    saldo_actual, estado_pago ('pagado', 'parcial', 'pendiente') y los montos
+    enteros que muestran el listado y la exportación.
+    """
+    return MovimientoCuentaCorrienteCliente.objects.filter(
+        cuenta_corriente__empresa=empresa,
+        tipo_movimiento='debe',
+    ).annotate(
+        saldo_actual=Coalesce(
+            F('saldo_documento'),
+            F('monto') - total_pagado_subquery(),
+            output_field=MONTO,
+        ),
+    ).annotate(
+        estado_pago=Case(
+            When(saldo_actual__lte=0, then=Value('pagado')),
+            When(saldo_actual__lt=F('monto'), then=Value('parcial')),
+            default=Value('pendiente'),
+            output_field=CharField(),
+        ),
+        monto_display=Cast('monto', IntegerField()),
+        total_pagado=Cast(F('monto') - F('saldo_actual'), IntegerField()),
+        saldo_pendiente_factura=Cast('saldo_actual', IntegerField()),
+    )
+
+
+def filtrar_movimientos(movimientos, search='', estado_pago=''):
+    """Búsqueda por cliente / RUT / N° de factura y filtro por estado de pago"""
+    if search:
+        movimientos = movimientos.filter(
+            Q(cuenta_corriente__cliente__nombre__icontains=search) |
+            Q(cuenta_corriente__cliente__rut__icontains=search) |
+            Q(venta__numero_venta__icontains=search)
+        )
+    if estado_pago:
+        movimientos = movimientos.filter(estado_pago=estado_pago)
+    return movimientos
+
+
+def estadisticas_movimientos(movimientos):
+    """Totales del listado en una sola consulta agregada"""
+    stats = movimientos.order_by().aggregate(
+        total_documentos=Count('id'),
+        total_pendiente=Sum('saldo_actual', filter=Q(estado_pago='pendiente')),
+        total_pagado=Sum(F('monto') - F('saldo_actual'), filter=Q(estado_pago='pagado')),
+        total_parcial=Sum('saldo_actual', filter=Q(estado_pago='parcial')),
+    )
+    return {clave: int(valor or 0) for clave, valor in stats.items()}
+
+
+def actualizar_saldos_documentos(movimientos):
+    """
+    Recalcula saldo_documento de los movimientos DEBE indicados a partir de
+    sus pagos HABER (un solo UPDATE).
+
+    Returns:
+        int: Cantidad de movimientos actualizados
+    """
+    return movimientos.filter(tipo_movimiento='debe').update(
+        saldo_documento=F('monto') - total_pagado_subquery()
+    )
+
+
+@transaction.atomic
+def aplicar_pago_documento(documento_id, monto):
+    """
+    Descuenta un pago del saldo de un DocumentoCliente bloqueando la fila,
+    para que dos pagos simultáneos no se pisen.
+
+    Returns:
+        DocumentoCliente: El documento actualizado
+    """
+    documento = DocumentoCliente.objects.select_for_update().get(pk=documento_id)
+    documento.monto_pagado += monto
+    documento.saldo_pendiente -= monto
+
+    if documento.saldo_pendiente <= 0:
+        documento.estado_pago = 'pagado'
+    elif documento.monto_pagado > 0:
+        documento.estado_pago = 'parcial'
+
+    documento.save(update_fields=['monto_pagado', 'saldo_pendiente', 'estado_pago', 'fecha_modificacion'])
+    return documento
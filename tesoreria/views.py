@@ -427,104 +427,27 @@ def cuenta_corriente_cliente_list(request):
     # La empresa ya está configurada por el decorador @requiere_empresa
     empresa = request.empresa
     
-    # Obtener MOVIMIENTOS individuales de cuenta corriente (cada factura)
-    from .models import DocumentoCliente, CuentaCorrienteCliente, MovimientoCuentaCorrienteCliente
-    from clientes.models import Cliente
-    from ventas.models import Venta
+    from .saldos import estadisticas_movimientos, filtrar_movimientos, movimientos_con_saldo
     
     # Filtros
     search = request.GET.get('search', '')
     estado_pago = request.GET.get('estado_pago', '')
     
-    # Mostrar movimientos DEBE (facturas a crédito) individuales
-    from django.db.models import Sum, Q, Case, When, Value, CharField
+    # Movimientos DEBE (facturas a crédito) con su saldo y estado de pago calculados en la BD
+    movimientos = movimientos_con_saldo(empresa)
     
-    # Obtener todos los movimientos de tipo 'debe' de la empresa
-    movimientos_query = MovimientoCuentaCorrienteCliente.objects.filter(
-        cuenta_corriente__empresa=empresa,
-        tipo_movimiento='debe'
-    ).select_related('cuenta_corriente', 'cuenta_corriente__cliente', 'venta').order_by('-fecha_movimiento')
+    # Estadísticas (de todas las facturas, sin filtros)
+    stats = estadisticas_movimientos(movimientos)
     
-    # Anotar cada movimiento con el total pagado
-    from decimal import Decimal
-    
-    movimientos_list = []
-    for mov in movimientos_query:
-        # Calcular total pagado para esta factura
-        total_pagado_result = MovimientoCuentaCorrienteCliente.objects.filter(
-            cuenta_corriente=mov.cuenta_corriente,
-            venta=mov.venta,
-            tipo_movimiento='haber'
-        ).aggregate(total=Sum('monto'))['total']
-        
-        # Convertir a Decimal para evitar problemas de tipo
-        total_pagado = Decimal(str(total_pagado_result)) if total_pagado_result else Decimal('0')
-        monto_factura = Decimal(str(mov.monto))
-        
-        # Determinar estado
-        if total_pagado >= monto_factura:
-            mov.estado_pago = 'pagado'
-        elif total_pagado > 0:
-            mov.estado_pago = 'parcial'
-        else:
-            mov.estado_pago = 'pendiente'
-        
-        # Convertir a enteros para evitar problemas de formato
-        mov.monto_display = int(monto_factura)
-        mov.total_pagado = int(total_pagado)
-        mov.saldo_pendiente_factura = int(monto_factura - total_pagado)
-        movimientos_list.append(mov)
-    
-    # Convertir de vuelta a queryset-like para paginación
-    class MovimientosList(list):
-        def __init__(self, *args, **kwargs):
-            super().__init__(*args, **kwargs)
-        
-        def filter(self, **kwargs):
-            result = list(self)
-            if 'estado' in kwargs:
-                estado = kwargs['estado']
-                result = [m for m in result if m.estado_pago == estado]
-            return MovimientosList(result)
-        
-        def aggregate(self, **kwargs):
-            if 'monto__sum' in kwargs:
-                return {'monto__sum': sum(m.monto for m in self)}
-            return {}
-        
-        def count(self):
-            return len(self)
-    
-    movimientos_query = MovimientosList(movimientos_list)
-    
-    # Aplicar filtro de búsqueda
-    if search:
-        filtered_list = []
-        for mov in movimientos_query:
-            if (search.lower() in mov.cuenta_corriente.cliente.nombre.lower() or
-                search.lower() in mov.cuenta_corriente.cliente.rut.lower() or
-                (mov.venta and search in mov.venta.numero_venta)):
-                filtered_list.append(mov)
-        movimientos_query = MovimientosList(filtered_list)
-    
-    # Filtrar por estado de pago
-    if estado_pago:
-        movimientos_query = MovimientosList([m for m in movimientos_query if m.estado_pago == estado_pago])
+    movimientos = filtrar_movimientos(movimientos, search, estado_pago).select_related(
+        'cuenta_corriente', 'cuenta_corriente__cliente', 'venta'
+    ).order_by('-fecha_movimiento', '-id')
     
     # Paginación
-    from django.core.paginator import Paginator
-    paginator = Paginator(list(movimientos_query), 20)
+    paginator = Paginator(movimientos, 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
-    # Estadísticas
-    stats = {
-        'total_documentos': len(movimientos_list),
-        'total_pendiente': sum(m.saldo_pendiente_factura for m in movimientos_list if m.estado_pago == 'pendiente'),
-        'total_pagado': sum(m.total_pagado for m in movimientos_list if m.estado_pago == 'pagado'),
-        'total_parcial': sum(m.saldo_pendiente_factura for m in movimientos_list if m.estado_pago == 'parcial'),
-    }
-    
     context = {
         'empresa': empresa,
         'page_obj': page_obj,
@@ -540,56 +463,33 @@ def cuenta_corriente_cliente_list(request):
 @login_required
 @requiere_empresa
 def exportar_cuenta_corriente_cliente_excel(request):
-    """Exportar cuentas corrientes de clientes a Excel con formato profesional"""
-    empresa = request.empresa
+    """
+    Exportar cuentas corrientes de clientes a Excel con formato profesional.
+    Se genera en segundo plano (ver generar_cuenta_corriente_cliente_excel).
+    """
+    from informes.views_trabajos import iniciar_exportacion
+    return iniciar_exportacion(request, 'cuenta_corriente_cliente_excel', 'Cuenta Corriente Clientes')
+
+
+def generar_cuenta_corriente_cliente_excel(empresa, parametros, progreso):
+    """Genera el Excel de cuentas corrientes de clientes para un TrabajoExportacion"""
+    from io import BytesIO
     
     # Obtener los mismos datos que la vista de lista
-    from .models import MovimientoCuentaCorrienteCliente
+    from .saldos import filtrar_movimientos, movimientos_con_saldo
     
-    search = request.GET.get('search', '')
-    estado_pago = request.GET.get('estado_pago', '')
+    search = parametros.get('search', '')
+    estado_pago = parametros.get('estado_pago', '')
     
-    # Obtener todos los movimientos de tipo 'debe' de la empresa
-    movimientos_query = MovimientoCuentaCorrienteCliente.objects.filter(
-        cuenta_corriente__empresa=empresa,
-        tipo_movimiento='debe'
-    ).select_related('cuenta_corriente', 'cuenta_corriente__cliente', 'venta').order_by('-fecha_movimiento')
+    movimientos_query = filtrar_movimientos(movimientos_con_saldo(empresa), search, estado_pago).select_related(
+        'cuenta_corriente', 'cuenta_corriente__cliente', 'venta'
+    ).order_by('-fecha_movimiento', '-id')
     
-    # Aplicar filtros
-    if search:
-        movimientos_query = movimientos_query.filter(
-            Q(cuenta_corriente__cliente__nombre__icontains=search) |
-            Q(cuenta_corriente__cliente__rut__icontains=search) |
-            Q(venta__numero_venta__icontains=search)
-        )
-    
-    # Procesar movimientos igual que en la vista de lista
     movimientos_list = []
-    for mov in movimientos_query:
-        total_pagado_result = MovimientoCuentaCorrienteCliente.objects.filter(
-            cuenta_corriente=mov.cuenta_corriente,
-            venta=mov.venta,
-            tipo_movimiento='haber'
-        ).aggregate(total=Sum('monto'))['total']
-        
-        total_pagado = Decimal(str(total_pagado_result)) if total_pagado_result else Decimal('0')
-        monto_factura = Decimal(str(mov.monto))
-        
-        if total_pagado >= monto_factura:
-            estado_pago_mov = 'pagado'
-        elif total_pagado > 0:
-            estado_pago_mov = 'parcial'
-        else:
-            estado_pago_mov = 'pendiente'
-        
-        # Aplicar filtro de estado si existe
-        if estado_pago and estado_pago_mov != estado_pago:
-            continue
-        
-        mov.estado_pago = estado_pago_mov
-        mov.monto_display = int(monto_factura)
-        mov.total_pagado = int(total_pagado)
-        mov.saldo_pendiente_factura = int(monto_factura - total_pagado)
+    total_movimientos = movimientos_query.count()
+    for indice, mov in enumerate(movimientos_query.iterator(chunk_size=2000), 1):
+        if indice % 200 == 0:
+            progreso(indice, total_movimientos)
         movimientos_list.append(mov)
     
     # Crear workbook
@@ -788,14 +688,15 @@ def exportar_cuenta_corriente_cliente_excel(request):
     ws.column_dimensions['H'].width = 18
     ws.column_dimensions['I'].width = 15
     
-    # Preparar respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    # Preparar archivo
+    buffer = BytesIO()
+    wb.save(buffer)
     fecha_export = datetime.now().strftime('%Y%m%d_%H%M%S')
-    response['Content-Disposition'] = f'attachment; filename=cuenta_corriente_clientes_{fecha_export}.xlsx'
-    wb.save(response)
-    return response
+    return (
+        f'cuenta_corriente_clientes_{fecha_export}.xlsx',
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        buffer.getvalue(),
+    )
 
 
 @csrf_exempt
@@ -1440,32 +1341,28 @@ def registrar_pago_cliente(request):
         if monto_total <= 0:
             return JsonResponse({'success': False, 'message': 'El monto debe ser mayor a 0'})
         
-        if monto_total > documento.saldo_pendiente:
-            return JsonResponse({'success': False, 'message': 'El monto excede el saldo pendiente'})
-        
-        # Registrar cada forma de pago
+        from django.db import transaction
         from .models import PagoDocumentoCliente
+        from .saldos import aplicar_pago_documento
         
-        for forma in formas_pago:
-            PagoDocumentoCliente.objects.create(
-                documento=documento,
-                monto=Decimal(str(forma['monto'])),
-                forma_pago=forma['forma_pago'],
-                observaciones=observaciones,
-                registrado_por=request.user
-            )
-        
-        # Actualizar documento
-        documento.monto_pagado += monto_total
-        documento.saldo_pendiente -= monto_total
-        
-        # Actualizar estado
-        if documento.saldo_pendiente <= 0:
-            documento.estado_pago = 'pagado'
-        elif documento.monto_pagado > 0:
-            documento.estado_pago = 'parcial'
-        
-        documento.save()
+        with transaction.atomic():
+            # Validar contra el saldo bloqueado (dos pagos simultáneos no pueden exceder el saldo)
+            documento = DocumentoCliente.objects.select_for_update().get(pk=documento.pk)
+            if monto_total > documento.saldo_pendiente:
+                return JsonResponse({'success': False, 'message': 'El monto excede el saldo pendiente'})
+            
+            # Registrar cada forma de pago
+            for forma in formas_pago:
+                PagoDocumentoCliente.objects.create(
+                    documento=documento,
+                    monto=Decimal(str(forma['monto'])),
+                    forma_pago=forma['forma_pago'],
+                    observaciones=observaciones,
+                    registrado_por=request.user
+                )
+            
+            # Actualizar saldo y estado del documento
+            aplicar_pago_documento(documento.pk, monto_total)
         
         return JsonResponse({
             'success': True,
@@ -1623,25 +1520,30 @@ def registrar_pago_movimiento(request):
         if not formas_pago:
             return JsonResponse({'success': False, 'message': 'Debe especificar al menos una forma de pago'}, status=400)
         
-        # Obtener el movimiento
-        movimiento = get_object_or_404(
-            MovimientoCuentaCorrienteCliente,
-            pk=movimiento_id,
-            cuenta_corriente__empresa=request.empresa
-        )
+        from .saldos import actualizar_saldos_documentos, aplicar_pago_documento
         
         # Calcular monto total del pago
         monto_total_pago = sum(Decimal(str(fp['monto'])) for fp in formas_pago)
         
-        # Validar que el monto no exceda el monto del movimiento
-        if monto_total_pago > movimiento.monto:
-            return JsonResponse({
-                'success': False,
-                'message': f'El monto total ({monto_total_pago}) excede el monto de la factura ({movimiento.monto})'
-            }, status=400)
-        
         # Registrar el pago como un movimiento HABER (abono)
         with transaction.atomic():
+            # Bloquear la factura: los pagos simultáneos se validan contra el saldo vigente
+            movimiento = get_object_or_404(
+                MovimientoCuentaCorrienteCliente.objects.select_for_update(of=('self',)),
+                pk=movimiento_id,
+                cuenta_corriente__empresa=request.empresa
+            )
+            if movimiento.saldo_documento is None:
+                actualizar_saldos_documentos(MovimientoCuentaCorrienteCliente.objects.filter(pk=movimiento.pk))
+                movimiento.refresh_from_db(fields=['saldo_documento'])
+            
+            # Validar que el monto no exceda el saldo de la factura
+            if monto_total_pago > movimiento.saldo_documento:
+                return JsonResponse({
+                    'success': False,
+                    'message': f'El monto total ({monto_total_pago}) excede el saldo de la factura ({movimiento.saldo_documento})'
+                }, status=400)
+            
             cuenta = movimiento.cuenta_corriente
             saldo_anterior = cuenta.saldo_pendiente
             
@@ -1695,15 +1597,7 @@ def registrar_pago_movimiento(request):
                         print(f"✓ Pago creado: ID={pago_creado.id}, Monto=${pago_creado.monto}, Forma={pago_creado.forma_pago}")
                     
                     # Actualizar documento
-                    documento.monto_pagado += monto_total_pago
-                    documento.saldo_pendiente -= monto_total_pago
-                    
-                    if documento.saldo_pendiente <= 0:
-                        documento.estado_pago = 'pagado'
-                    elif documento.monto_pagado > 0:
-                        documento.estado_pago = 'parcial'
-                    
-                    documento.save()
+                    documento = aplicar_pago_documento(documento.pk, monto_total_pago)
                     print(f"✓ Documento actualizado: Pagado=${documento.monto_pagado}, Saldo=${documento.saldo_pendiente}")
                     
                 except DocumentoCliente.DoesNotExist:
@@ -1717,15 +1611,13 @@ def registrar_pago_movimiento(request):
             cuenta.saldo_pendiente -= monto_total_pago
             cuenta.save()
             
-            # Si el movimiento original está completamente pagado, marcarlo como anulado
-            # (porque ya fue pagado)
-            total_pagado = MovimientoCuentaCorrienteCliente.objects.filter(
-                cuenta_corriente=cuenta,
-                venta=movimiento.venta,
-                tipo_movimiento='haber'
-            ).aggregate(total=models.Sum('monto'))['total'] or Decimal('0')
+            # Saldo persistido de la factura (monto - pagos HABER)
+            actualizar_saldos_documentos(MovimientoCuentaCorrienteCliente.objects.filter(pk=movimiento.pk))
+            movimiento.refresh_from_db(fields=['saldo_documento'])
             
-            if total_pagado >= movimiento.monto:
+            # Si el movimiento original está completamente pagado, dejarlo anotado
+            if movimiento.saldo_documento <= 0:
+                total_pagado = movimiento.monto - movimiento.saldo_documento
                 # Marcar como completamente pagado agregando observación
                 movimiento.observaciones += f"\n[PAGADO] Total pagado: ${total_pagado}"
                 movimiento.save()
@@ -6,6 +6,8 @@ from django.urls import reverse
 from django.contrib import messages
 from django.conf import settings
 
+from empresas import tenant
+
 
 class EmpresaMiddleware:
 	"""
@@ -37,17 +39,17 @@ class EmpresaMiddleware:
 						except (ValueError, TypeError):
 							empresa_id = None
 				
-				# 3. Intentar obtener la empresa
+				# 3. Intentar obtener la empresa (cacheada, ver empresas.tenant)
 				if empresa_id:
-					try:
-						request.empresa = Empresa.objects.get(id=empresa_id)
+					request.empresa = tenant.obtener_empresa(empresa_id)
+					if request.empresa:
 						# SOLO actualizar sesión si cambió (evitar sobrescribir POS)
 						if request.session.get('empresa_activa_id') != request.empresa.id:
 							request.session['empresa_activa_id'] = request.empresa.id
 							request.session.modified = True
 							# CRÍTICO: Forzar guardado inmediato
 							request.session.save()
-					except Empresa.DoesNotExist:
+					else:
 						empresa_id = None
 				
 				# 4. Si no se encontró, asignar la primera disponible
@@ -69,8 +71,10 @@ class EmpresaMiddleware:
 			else:
 				# Usuario normal debe tener un perfil con empresa
 				try:
-					if hasattr(request.user, 'perfil') and request.user.perfil:
-						request.empresa = request.user.perfil.empresa
+					# Perfil con empresa y sucursal desde el cache (queda en request.user.perfil)
+					perfil = tenant.obtener_perfil(request.user)
+					if perfil:
+						request.empresa = perfil.empresa
 					else:
 						# Crear perfil si no existe
 						from usuarios.models import PerfilUsuario
@@ -0,0 +1,554 @@
+"""
+Índice en memoria para la búsqueda de artículos del POS.
+
+Cada proceso mantiene un índice por empresa con:
+- Mapa exacto de código y código de barras -> artículo
+- Índice de trigramas sobre código, código de barras, nombre y descripción
+- Precio neto, factores de impuesto y stock de cada artículo
+- Precios finales por lista de precios (PrecioArticulo.precio_final)
+
+El índice se construye en segundo plano tras la primera búsqueda (mientras
+tanto se usa la consulta directa) y se mantiene al día con las señales de
+Articulo, PrecioArticulo, Stock, CategoriaArticulo, ImpuestoEspecifico y Bodega
+(ver ventas/signals.py). Las señales registran los artículos modificados en la
+tabla CambioIndicePOS, compartida por todos los procesos: cada proceso lee los
+cambios nuevos cada INTERVALO_SINCRONIZACION segundos y refresca solo esos
+artículos. Las reconstrucciones completas (categorías, impuestos, bodegas,
+vencimiento) corren en un hilo aparte mientras se sigue usando el índice anterior.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, Max, Sum, OuterRef, Subquery, Value, DecimalField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from articulos.models import Articulo, PrecioArticulo
+from inventario.models import Stock
+from .models import CambioIndicePOS
+
+
+logger = logging.getLogger(__name__)
+
+
+# Tiempo máximo de vida de un índice antes de reconstruirlo completo (segundos)
+INDICE_TTL = 15 * 60
+
+# Segundos entre lecturas del registro de cambios en cada proceso
+INTERVALO_SINCRONIZACION = getattr(settings, 'POS_INDICE_SINCRONIZACION', 1)
+
+# Segundos en que un cambio recién insertado puede no estar confirmado aún
+MARGEN_CONFIRMACION = 10
+
+# Sobre esta cantidad de artículos modificados se reconstruye el índice completo
+MAX_CAMBIOS_INCREMENTALES = 500
+
+# Tiempo que se conservan los cambios registrados (segundos)
+RETENCION_CAMBIOS = 24 * 60 * 60
+
+# Máximo de resultados retornados por búsqueda (igual que la consulta ORM)
+MAX_RESULTADOS = 100
+
+
+def calcular_precio_pos(precio_neto, exenta_iva, porcentaje_impuesto_especifico):
+    """
+    Calcula el precio final (con IVA e impuesto específico) que muestra el POS.
+
+    Args:
+        precio_neto: Precio neto del artículo (float)
+        exenta_iva: True si la categoría está exenta de IVA
+        porcentaje_impuesto_especifico: Impuesto específico como fracción (ej: 0.18)
+
+    Returns:
+        int: Precio final redondeado
+    """
+    iva = 0.0 if exenta_iva else precio_neto * 0.19
+    impuesto_especifico = precio_neto * porcentaje_impuesto_especifico
+    return round(precio_neto + iva + impuesto_especifico)
+
+
+def buscar_articulos_orm(empresa, query, lista_precio_id=None, limite=MAX_RESULTADOS):
+    """
+    Búsqueda directa en la base de datos (sin índice), en una sola consulta:
+    el stock de bodegas activas y el precio final de la lista vienen anotados.
+    Se usa como respaldo si el índice falla y como referencia en el benchmark.
+    """
+    stock_activo = Stock.objects.filter(
+        articulo=OuterRef('pk'),
+        bodega__activa=True
+    ).values('articulo').annotate(total=Sum('cantidad')).values('total')
+
+    articulos = Articulo.objects.filter(
+        empresa=empresa,
+        activo=True
+    ).filter(
+        Q(codigo_barras__icontains=query) |
+        Q(codigo__icontains=query) |
+        Q(nombre__icontains=query) |
+        Q(descripcion__icontains=query)
+    ).select_related('categoria', 'categoria__impuesto_especifico').annotate(
+        stock_total=Coalesce(Subquery(stock_activo), Value(Decimal('0')), output_field=DecimalField())
+    )
+
+    # Precio final ya calculado para la lista, si está seleccionada
+    if lista_precio_id:
+        articulos = articulos.annotate(
+            precio_final_lista=Subquery(
+                PrecioArticulo.objects.filter(
+                    lista_precio_id=lista_precio_id,
+                    articulo=OuterRef('pk')
+                ).values('precio_final')[:1]
+            )
+        )
+
+    articulos = articulos.order_by('nombre')[:limite]
+
+    results = []
+    for articulo in articulos:
+        try:
+            exenta_iva = bool(articulo.categoria and articulo.categoria.exenta_iva)
+
+            # Impuesto específico si aplica
+            impuesto_esp_decimal = 0.0
+            impuesto_esp_pct = 0
+            if articulo.categoria and articulo.categoria.impuesto_especifico:
+                try:
+                    impuesto_esp_decimal = float(articulo.categoria.impuesto_especifico.get_porcentaje_decimal())
+                    impuesto_esp_pct = float(articulo.categoria.impuesto_especifico.porcentaje)
+                except (TypeError, ValueError, ArithmeticError):
+                    pass
+
+            precio_final_lista = getattr(articulo, 'precio_final_lista', None)
+            if precio_final_lista is not None:
+                precio_final = int(precio_final_lista)
+            else:
+                precio_final = calcular_precio_pos(float(articulo.precio_venta), exenta_iva, impuesto_esp_decimal)
+
+            results.append({
+                'id': articulo.id,
+                'codigo': articulo.codigo or '',
+                'codigo_barras': articulo.codigo_barras or '',
+                'nombre': articulo.nombre or '',
+                'descripcion': articulo.descripcion or articulo.nombre or '',
+                'precio': precio_final,
+                'stock': float(articulo.stock_total),
+                'categoria_exenta_iva': exenta_iva,
+                'impuesto_especifico_porcentaje': impuesto_esp_pct,
+            })
+        except Exception as e:
+            logger.exception("Error procesando artículo %s en la búsqueda POS: %s", articulo.id, e)
+            continue
+
+    return results
+
+
+def _normalizar(texto):
+    return (texto or '').casefold()
+
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceArticulosPOS:
+    """Índice de búsqueda de artículos activos de una empresa"""
+
+    def __init__(self, empresa_id):
+        self.empresa_id = empresa_id
+        self.construido_en = time.monotonic()
+        self.sincronizado_en = self.construido_en
+        self.lock = threading.RLock()
+        self.sincronizando = threading.Lock()
+
+        self.ultimo_cambio = 0       # id del último CambioIndicePOS aplicado
+        self.recientes = {}          # id de cambio -> instante en que se aplicó (margen de confirmación)
+
+        self.registros = {}          # articulo_id -> dict con datos del artículo
+        self.textos = {}             # articulo_id -> texto normalizado buscable
+        self.por_codigo = {}         # código normalizado -> articulo_id
+        self.por_codigo_barras = {}  # código de barras normalizado -> articulo_id
+        self.trigramas = {}          # trigrama -> set(articulo_id)
+        self.stock = {}              # articulo_id -> {bodega_id: cantidad}
+        self.precios_lista = {}      # lista_precio_id -> {articulo_id: precio final}
+
+        self._construir()
+
+    # ----- Construcción -----
+
+    def _construir(self):
+        # Los cambios registrados durante la construcción se vuelven a aplicar
+        # en la primera sincronización (refrescar un artículo es idempotente)
+        cambios = CambioIndicePOS.objects.filter(empresa_id=self.empresa_id)
+        self.ultimo_cambio = cambios.aggregate(ultimo=Max('id'))['ultimo'] or 0
+        desde = timezone.now() - timedelta(seconds=MARGEN_CONFIRMACION)
+        self.recientes = dict.fromkeys(
+            cambios.filter(fecha__gte=desde, id__lte=self.ultimo_cambio).values_list('id', flat=True),
+            self.construido_en
+        )
+
+        articulos = Articulo.objects.filter(
+            empresa_id=self.empresa_id,
+            activo=True
+        ).select_related('categoria', 'categoria__impuesto_especifico')
+
+        for articulo in articulos.iterator(chunk_size=2000):
+            self._agregar_articulo(articulo)
+
+        precios = PrecioArticulo.objects.filter(
+            articulo__empresa_id=self.empresa_id,
+            articulo__activo=True
+        ).values_list('lista_precio_id', 'articulo_id', 'precio_final')
+        for lista_precio_id, articulo_id, precio_final in precios.iterator(chunk_size=5000):
+            self.precios_lista.setdefault(lista_precio_id, {})[articulo_id] = int(precio_final)
+
+        stocks = Stock.objects.filter(
+            empresa_id=self.empresa_id,
+            bodega__activa=True
+        ).values_list('articulo_id', 'bodega_id', 'cantidad')
+        for articulo_id, bodega_id, cantidad in stocks.iterator(chunk_size=5000):
+            self.stock.setdefault(articulo_id, {})[bodega_id] = float(cantidad)
+
+    def _agregar_articulo(self, articulo):
+        categoria = articulo.categoria
+        exenta_iva = bool(categoria and categoria.exenta_iva)
+        impuesto_esp_decimal = 0.0
+        impuesto_esp_pct = 0
+        if categoria and categoria.impuesto_especifico:
+            try:
+                impuesto_esp_decimal = float(categoria.impuesto_especifico.get_porcentaje_decimal())
+                impuesto_esp_pct = float(categoria.impuesto_especifico.porcentaje)
+            except (TypeError, ValueError, ArithmeticError):
+                impuesto_esp_decimal = 0.0
+                impuesto_esp_pct = 0
+
+        precio_venta = float(articulo.precio_venta or 0)
+
+        self.registros[articulo.id] = {
+            'id': articulo.id,
+            'codigo': articulo.codigo or '',
+            'codigo_barras': articulo.codigo_barras or '',
+            'nombre': articulo.nombre or '',
+            'descripcion': articulo.descripcion or articulo.nombre or '',
+            'precio_venta': precio_venta,
+            'categoria_exenta_iva': exenta_iva,
+            'impuesto_especifico_decimal': impuesto_esp_decimal,
+            'impuesto_especifico_porcentaje': impuesto_esp_pct,
+        }
+
+        texto = '\x00'.join(_normalizar(valor) for valor in (
+            articulo.codigo_barras, articulo.codigo, articulo.nombre, articulo.descripcion
+        ))
+        self.textos[articulo.id] = texto
+        for trigrama in _trigramas(texto):
+            self.trigramas.setdefault(trigrama, set()).add(articulo.id)
+
+        if articulo.codigo:
+            self.por_codigo[_normalizar(articulo.codigo).strip()] = articulo.id
+        if articulo.codigo_barras:
+            self.por_codigo_barras[_normalizar(articulo.codigo_barras).strip()] = articulo.id
+
+    def _quitar_articulo(self, articulo_id):
+        registro = self.registros.pop(articulo_id, None)
+        texto = self.textos.pop(articulo_id, None)
+        if texto is not None:
+            for trigrama in _trigramas(texto):
+                ids = self.trigramas.get(trigrama)
+                if ids is not None:
+                    ids.discard(articulo_id)
+                    if not ids:
+                        del self.trigramas[trigrama]
+        if registro:
+            codigo = _normalizar(registro['codigo']).strip()
+            if self.por_codigo.get(codigo) == articulo_id:
+                del self.por_codigo[codigo]
+            codigo_barras = _normalizar(registro['codigo_barras']).strip()
+            if self.por_codigo_barras.get(codigo_barras) == articulo_id:
+                del self.por_codigo_barras[codigo_barras]
+
+    # ----- Actualización incremental -----
+
+    def refrescar_articulos(self, articulo_ids):
+        """Vuelve a leer datos, precios y stock de los artículos indicados"""
+        articulo_ids = list(articulo_ids)
+        articulos = list(
+            Articulo.objects.filter(
+                empresa_id=self.empresa_id,
+                id__in=articulo_ids,
+                activo=True
+            ).select_related('categoria', 'categoria__impuesto_especifico')
+        )
+        activos = [articulo.id for articulo in articulos]
+        precios = list(
+            PrecioArticulo.objects.filter(articulo_id__in=activos).values_list(
+                'lista_precio_id', 'articulo_id', 'precio_final'
+            )
+        )
+        stocks = list(
+            Stock.objects.filter(
+                empresa_id=self.empresa_id,
+                bodega__activa=True,
+                articulo_id__in=activos
+            ).values_list('articulo_id', 'bodega_id', 'cantidad')
+        )
+
+        with self.lock:
+            for articulo_id in articulo_ids:
+                self._quitar_articulo(articulo_id)
+                self.stock.pop(articulo_id, None)
+                for precios_lista in self.precios_lista.values():
+                    precios_lista.pop(articulo_id, None)
+            for articulo in articulos:
+                self._agregar_articulo(articulo)
+            for lista_precio_id, articulo_id, precio_final in precios:
+                self.precios_lista.setdefault(lista_precio_id, {})[articulo_id] = int(precio_final)
+            for articulo_id, bodega_id, cantidad in stocks:
+                self.stock.setdefault(articulo_id, {})[bodega_id] = float(cantidad)
+
+    def sincronizar(self):
+        """
+        Aplica los cambios registrados por cualquier proceso desde la última
+        sincronización. Retorna True si hace falta reconstruir el índice completo.
+
+        Los ids se asignan al insertar y no al confirmar, por lo que un cambio
+        puede aparecer con un id menor al último aplicado: se releen también los
+        cambios de los últimos MARGEN_CONFIRMACION segundos.
+        """
+        ahora = time.monotonic()
+        desde = timezone.now() - timedelta(seconds=MARGEN_CONFIRMACION)
+        cambios = list(
+            CambioIndicePOS.objects.filter(empresa_id=self.empresa_id).filter(
+                Q(id__gt=self.ultimo_cambio) | Q(fecha__gte=desde)
+            ).order_by('id').values_list('id', 'articulo_id')[:MAX_CAMBIOS_INCREMENTALES + 1]
+        )
+        self.sincronizado_en = ahora
+        self.recientes = {
+            cambio_id: aplicado for cambio_id, aplicado in self.recientes.items()
+            if ahora - aplicado <= MARGEN_CONFIRMACION * 2
+        }
+        cambios = [(cambio_id, articulo_id) for cambio_id, articulo_id in cambios if cambio_id not in self.recientes]
+        if not cambios:
+            return False
+        if len(cambios) > MAX_CAMBIOS_INCREMENTALES or any(articulo_id is None for _, articulo_id in cambios):
+            return True
+
+        self.refrescar_articulos({articulo_id for _, articulo_id in cambios})
+        for cambio_id, _ in cambios:
+            self.recientes[cambio_id] = ahora
+        self.ultimo_cambio = max(self.ultimo_cambio, cambios[-1][0])
+        return False
+
+    # ----- Búsqueda -----
+
+    def _candidatos(self, query_normalizada):
+        if len(query_normalizada) < 3:
+            return [
+                articulo_id for articulo_id, texto in self.textos.items()
+                if query_normalizada in texto
+            ]
+
+        conjuntos = []
+        for trigrama in _trigramas(query_normalizada):
+            ids = self.trigramas.get(trigrama)
+            if not ids:
+                return []
+            conjuntos.append(ids)
+        conjuntos.sort(key=len)
+        candidatos = set(conjuntos[0])
+        for ids in conjuntos[1:]:
+            candidatos &= ids
+            if not candidatos:
+                return []
+        # Verificación final: los trigramas no garantizan la subcadena completa
+        return [
+            articulo_id for articulo_id in candidatos
+            if query_normalizada in self.textos[articulo_id]
+        ]
+
+    def buscar(self, query, lista_precio_id=None, limite=MAX_RESULTADOS):
+        """
+        Busca artículos cuyo código de barras, código, nombre o descripción
+        contengan el texto (equivalente a icontains). Los calces exactos por
+        código de barras o código se retornan primero.
+
+        Returns:
+            list: Resultados con el mismo formato que retorna pos_buscar_articulo
+        """
+        query_normalizada = _normalizar(query).strip()
+        if not query_normalizada:
+            return []
+
+        with self.lock:
+            exactos = []
+            for mapa in (self.por_codigo_barras, self.por_codigo):
+                articulo_id = mapa.get(query_normalizada)
+                if articulo_id is not None and articulo_id not in exactos:
+                    exactos.append(articulo_id)
+
+            resto = [
+                articulo_id for articulo_id in self._candidatos(query_normalizada)
+                if articulo_id not in exactos
+            ]
+            resto.sort(key=lambda articulo_id: self.registros[articulo_id]['nombre'].casefold())
+            ids = (exactos + resto)[:limite]
+
+            precios = self.precios_lista.get(int(lista_precio_id), {}) if lista_precio_id else {}
+            return [self._resultado(articulo_id, precios) for articulo_id in ids]
+
+    def _resultado(self, articulo_id, precios):
+        registro = self.registros[articulo_id]
+        precio_final = precios.get(articulo_id)
+        if precio_final is None:
+            precio_final = calcular_precio_pos(
+                registro['precio_venta'],
+                registro['categoria_exenta_iva'],
+                registro['impuesto_especifico_decimal'],
+            )
+        return {
+            'id': articulo_id,
+            'codigo': registro['codigo'],
+            'codigo_barras': registro['codigo_barras'],
+            'nombre': registro['nombre'],
+            'descripcion': registro['descripcion'],
+            'precio': precio_final,
+            'stock': sum(self.stock.get(articulo_id, {}).values()),
+            'categoria_exenta_iva': registro['categoria_exenta_iva'],
+            'impuesto_especifico_porcentaje': registro['impuesto_especifico_porcentaje'],
+        }
+
+
+# ----- Registro de índices por empresa (por proceso) -----
+# Los índices se construyen en un hilo aparte: mientras tanto se sigue usando
+# el índice anterior o, si aún no hay ninguno, la consulta directa.
+
+_indices = {}
+_en_construccion = set()
+_registro_lock = threading.Lock()
+
+
+def construir_indice(empresa_id):
+    """Construye el índice de la empresa y lo publica para las búsquedas de este proceso"""
+    indice = IndiceArticulosPOS(empresa_id)
+    _indices[empresa_id] = indice
+    CambioIndicePOS.objects.filter(
+        fecha__lt=timezone.now() - timedelta(seconds=RETENCION_CAMBIOS)
+    ).delete()
+    return indice
+
+
+def _construir_en_segundo_plano(empresa_id):
+    try:
+        construir_indice(empresa_id)
+    except Exception as e:
+        logger.exception("Error construyendo índice de búsqueda POS de la empresa %s: %s", empresa_id, e)
+    finally:
+        with _registro_lock:
+            _en_construccion.discard(empresa_id)
+        connection.close()
+
+
+def programar_construccion(empresa_id):
+    """Lanza la construcción del índice en segundo plano (una a la vez por empresa)"""
+    with _registro_lock:
+        if empresa_id in _en_construccion:
+            return
+        _en_construccion.add(empresa_id)
+    threading.Thread(
+        target=_construir_en_segundo_plano,
+        args=(empresa_id,),
+        name=f'indice-pos-{empresa_id}',
+        daemon=True,
+    ).start()
+
+
+def obtener_indice(empresa_id):
+    """
+    Retorna el índice de la empresa al día con el registro de cambios, o None
+    si todavía no hay uno listo. Nunca construye dentro de la petición: si falta
+    o venció, programa la construcción y sigue entregando el que haya.
+    """
+    indice = _indices.get(empresa_id)
+    if indice is not None and time.monotonic() - indice.sincronizado_en > RETENCION_CAMBIOS:
+        # Pudieron purgarse cambios que este índice no alcanzó a aplicar
+        _indices.pop(empresa_id, None)
+        indice = None
+    if indice is None:
+        programar_construccion(empresa_id)
+        return None
+
+    reconstruir = time.monotonic() - indice.construido_en > INDICE_TTL
+    if time.monotonic() - indice.sincronizado_en >= INTERVALO_SINCRONIZACION:
+        # Solo un hilo consulta el registro; los demás usan el índice tal como está
+        if indice.sincronizando.acquire(blocking=False):
+            try:
+                reconstruir = indice.sincronizar() or reconstruir
+            finally:
+                indice.sincronizando.release()
+    if reconstruir:
+        programar_construccion(empresa_id)
+    return indice
+
+
+def buscar_articulos(empresa_id, query, lista_precio_id=None, limite=MAX_RESULTADOS):
+    """
+    Busca artículos del POS usando el índice en memoria de la empresa, o con
+    la consulta directa mientras el índice se construye
+    """
+    indice = obtener_indice(empresa_id)
+    if indice is None:
+        return buscar_articulos_orm(empresa_id, query, lista_precio_id=lista_precio_id, limite=limite)
+    return indice.buscar(query, lista_precio_id=lista_precio_id, limite=limite)
+
+
+# ----- Avisos de cambios (desde ventas/signals.py) -----
+
+def registrar_cambios(empresa_id, articulo_ids):
+    """
+    Registra los artículos modificados para que todos los procesos los
+    refresquen en su próxima sincronización. Demasiados artículos de una vez
+    se registran como una reconstrucción completa.
+    """
+    articulo_ids = set(articulo_ids)
+    if not articulo_ids:
+        return
+    if len(articulo_ids) > MAX_CAMBIOS_INCREMENTALES:
+        invalidar_indice(empresa_id)
+        return
+    CambioIndicePOS.objects.bulk_create([
+        CambioIndicePOS(empresa_id=empresa_id, articulo_id=articulo_id) for articulo_id in articulo_ids
+    ])
+
+
+def notificar_articulo_guardado(articulo):
+    registrar_cambios(articulo.empresa_id, [articulo.id])
+
+
+def notificar_articulo_eliminado(articulo):
+    registrar_cambios(articulo.empresa_id, [articulo.id])
+
+
+def notificar_precio(empresa_id, articulo_id):
+    registrar_cambios(empresa_id, [articulo_id])
+
+
+def notificar_precios_masivo(empresa_id, articulo_ids):
+    """Registra precios cambiados con upserts o DELETE masivos (sin post_save)"""
+    registrar_cambios(empresa_id, articulo_ids)
+
+
+def notificar_stock(stock):
+    registrar_cambios(stock.empresa_id, [stock.articulo_id])
+
+
+def notificar_stock_masivo(empresa_id, bodega_id, articulo_ids):
+    """Registra el stock de varios artículos tras un UPDATE masivo (sin post_save)"""
+    registrar_cambios(empresa_id, articulo_ids)
+
+
+def invalidar_indice(empresa_id):
+    """Pide reconstruir el índice completo de la empresa en todos los procesos"""
+    CambioIndicePOS.objects.create(empresa_id=empresa_id, articulo_id=None)
@@ -0,0 +1,172 @@
+"""
+Construcción de documentos de venta (cabecera + detalles) en bloque.
+
+VentaDetalle.save() recalcula los totales de la venta después de cada línea
+(lee todos los detalles y guarda la cabecera), así que armar una venta de N
+líneas con VentaDetalle.objects.create cuesta O(N²) lecturas y N escrituras
+de cabecera. Aquí las líneas se reciben todas juntas:
+
+- Se calculan precio_total e impuesto específico de cada línea y los totales
+  de la venta (subtotal, neto, IVA, impuesto específico, total) en una sola
+  pasada en memoria
+- Los detalles se insertan con un bulk_create
+- La cabecera se guarda una sola vez
+
+Los montos se redondean a 2 decimales igual que al guardarlos en la base de
+datos, así los totales calculados en memoria coinciden con los que daría
+Venta.calcular_totales() releyendo los detalles.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import VentaDetalle
+
+
+CENTAVOS = Decimal('0.01')
+FACTOR_IVA = Decimal('1.19')
+
+CAMPOS_TOTALES = ['subtotal', 'neto', 'iva', 'impuesto_especifico', 'total']
+
+
+class LineaVenta:
+    """Línea de un documento de venta por crear"""
+
+    __slots__ = ('articulo', 'cantidad', 'precio_unitario')
+
+    def __init__(self, articulo, cantidad, precio_unitario):
+        self.articulo = articulo
+        self.cantidad = Decimal(str(cantidad))
+        self.precio_unitario = Decimal(str(precio_unitario))
+
+
+def _a_centavos(valor):
+    return valor.quantize(CENTAVOS)
+
+
+def porcentaje_impuesto_especifico(articulo):
+    """Porcentaje de impuesto específico del artículo (0 si no tiene)"""
+    if not articulo.impuesto_especifico:
+        return Decimal('0')
+    try:
+        return Decimal(str(articulo.impuesto_especifico))
+    except Exception:
+        return Decimal('0')
+
+
+def montos_linea(articulo, cantidad, precio_unitario):
+    """
+    (precio_total, impuesto_especifico) de una línea, con el mismo cálculo que
+    VentaDetalle.save().
+    """
+    precio_total = Decimal(str(cantidad)) * Decimal(str(precio_unitario))
+    impuesto = precio_total * (porcentaje_impuesto_especifico(articulo) / 100)
+    return _a_centavos(precio_total), _a_centavos(impuesto)
+
+
+def calcular_totales(subtotal, impuesto_especifico, descuento):
+    """
+    Totales de la cabecera a partir de la suma de líneas.
+    Los precios de las líneas YA INCLUYEN IVA: el IVA se extrae, no se agrega.
+    """
+    descuento = Decimal(str(descuento or 0))
+    base = subtotal - descuento
+    neto = _a_centavos(base / FACTOR_IVA)
+    return {
+        'subtotal': subtotal,
+        'neto': neto,
+        'iva': base - neto,
+        'impuesto_especifico': impuesto_especifico,
+        'total': subtotal + impuesto_especifico - descuento,
+    }
+
+
+def _guardar_totales(venta, totales):
+    for campo, valor in totales.items():
+        setattr(venta, campo, valor)
+    # Venta.save() recalcula monto_pagado / saldo_pendiente de las ventas confirmadas
+    venta.save(update_fields=CAMPOS_TOTALES + ['monto_pagado', 'saldo_pendiente', 'fecha_modificacion'])
+
+
+@transaction.atomic
+def crear_detalles(venta, lineas):
+    """
+    Crea los detalles de una venta recién creada y guarda sus totales.
+
+    La venta no debe tener otros detalles: los totales se calculan sólo con
+    las líneas recibidas (para agregar a una venta existente usar
+    recalcular_totales después de guardar la línea).
+
+    Args:
+        venta: Venta ya guardada (cabecera)
+        lineas: Iterable de LineaVenta
+
+    Returns:
+        list: Los VentaDetalle creados
+    """
+    detalles = []
+    subtotal = Decimal('0')
+    impuesto_especifico = Decimal('0')
+
+    for linea in lineas:
+        precio_total, impuesto = montos_linea(linea.articulo, linea.cantidad, linea.precio_unitario)
+        subtotal += precio_total
+        impuesto_especifico += impuesto
+        detalles.append(VentaDetalle(
+            venta=venta,
+            articulo=linea.articulo,
+            cantidad=linea.cantidad,
+            precio_unitario=linea.precio_unitario,
+            precio_total=precio_total,
+            impuesto_especifico=impuesto,
+        ))
+
+    VentaDetalle.objects.bulk_create(detalles)
+    _guardar_totales(venta, calcular_totales(subtotal, impuesto_especifico, venta.descuento))
+    return detalles
+
+
+@transaction.atomic
+def copiar_detalles(origen, destino):
+    """
+    Copia los detalles de una venta a otra recién creada (ej: el ticket que se
+    cobra en caja a su documento final) y guarda los totales una sola vez.
+    Las líneas de origen ya tienen sus montos calculados: se copian tal cual.
+
+    Returns:
+        list: Los VentaDetalle creados
+    """
+    detalles = [
+        VentaDetalle(
+            venta=destino,
+            articulo_id=detalle.articulo_id,
+            cantidad=detalle.cantidad,
+            precio_unitario=detalle.precio_unitario,
+            precio_total=detalle.precio_total,
+            impuesto_especifico=detalle.impuesto_especifico,
+        )
+        for detalle in VentaDetalle.objects.filter(venta=origen).order_by('id')
+    ]
+    VentaDetalle.objects.bulk_create(detalles)
+    recalcular_totales(destino)
+    return detalles
+
+
+def totales_detalles(venta):
+    """Totales de la venta a partir de sus detalles guardados (una consulta agregada)"""
+    cero = Value(Decimal('0'))
+    sumas = VentaDetalle.objects.filter(venta=venta).aggregate(
+        subtotal=Coalesce(Sum('precio_total'), cero),
+        impuesto_especifico=Coalesce(Sum('impuesto_especifico'), cero),
+    )
+    return calcular_totales(sumas['subtotal'], sumas['impuesto_especifico'], venta.descuento)
+
+
+def recalcular_totales(venta):
+    """
+    Recalcula y guarda los totales de la venta a partir de sus detalles
+    guardados (una consulta agregada + un UPDATE de la cabecera).
+    """
+    _guardar_totales(venta, totales_detalles(venta))
@@ -0,0 +1,349 @@
+"""
+Libro de Ventas servido desde la base de datos.
+
+Las ventas del POS sin DTE y los DTEs se combinan con un único UNION ALL que
+expone las mismas columnas de ordenamiento en ambas ramas. El orden, la
+paginación (por desplazamiento o por cursor/keyset) y los totales se resuelven
+en SQL; Python sólo carga los 50 documentos de la página visible.
+"""
+import base64
+import json
+from datetime import date
+from decimal import Decimal
+
+from django.core.paginator import Paginator
+from django.db.models import (
+    BigIntegerField, Case, CharField, Count, DecimalField, F, Func, IntegerField, Q, Sum, Value, When
+)
+from django.db.models.functions import Coalesce, Lower
+
+from facturacion_electronica.models import DocumentoTributarioElectronico
+from .models import Venta
+
+
+POR_PAGINA = 50
+
+# Tipos de venta del POS mapeados a su código SII (para ordenar junto a los DTEs)
+TIPO_SII_VENTA = {'factura': '33', 'boleta': '39', 'guia': '52', 'nota_credito': '61', 'nota_debito': '56'}
+
+TIPOS_DTE = ['33', '34', '39', '41', '52', '56', '61']
+
+# Columnas de ordenamiento de cada criterio (se agrega el desempate origen + id)
+ORDENAMIENTOS = {
+    'tipo_folio': ('orden_tipo', 'orden_folio'),
+    'fecha': ('orden_fecha',),
+    'folio': ('orden_folio',),
+    'cliente': ('orden_cliente',),
+    'total': ('orden_total',),
+}
+DESEMPATE = ('es_dte', 'doc_id')
+
+MONTO = DecimalField(max_digits=14, decimal_places=2)
+
+
+class SoloDigitos(Func):
+    """Parte numérica de un texto como entero ('B-000123' -> 123, sin dígitos -> 0)"""
+
+    output_field = BigIntegerField()
+    template = 'CAST(%(expressions)s AS INTEGER)'
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template="COALESCE(NULLIF(LEFT(REGEXP_REPLACE(%(expressions)s, '\\D', '', 'g'), 18), '')::bigint, 0)",
+            **extra_context
+        )
+
+
+def _monto_con_signo(campo):
+    """Las Notas de Crédito (61) restan en el libro"""
+    return Case(
+        When(tipo_dte='61', then=-F(campo)),
+        default=F(campo),
+        output_field=MONTO,
+    )
+
+
+def filtrar_documentos(empresa, filtros):
+    """
+    Aplica los filtros del libro a ventas y DTEs.
+
+    Returns:
+        tuple: (queryset de Venta, queryset de DocumentoTributarioElectronico)
+    """
+    # Ventas confirmadas SIN DTE asociado (las guías tienen su propio libro)
+    ventas = Venta.objects.filter(
+        empresa=empresa,
+        estado='confirmada',
+        dte__isnull=True
+    ).exclude(
+        Q(numero_venta__icontains='test') |
+        Q(tipo_documento__in=['cotizacion', 'guia'])
+    )
+
+    # DTEs, excluyendo Guías de Despacho (52)
+    dtes = DocumentoTributarioElectronico.objects.filter(
+        empresa=empresa
+    ).exclude(
+        Q(folio__icontains='test') |
+        Q(tipo_dte='52')
+    )
+
+    fecha_desde = filtros.get('fecha_desde')
+    fecha_hasta = filtros.get('fecha_hasta')
+    if fecha_desde and fecha_hasta:
+        ventas = ventas.filter(fecha__gte=fecha_desde, fecha__lte=fecha_hasta)
+        dtes = dtes.filter(fecha_emision__gte=fecha_desde, fecha_emision__lte=fecha_hasta)
+
+    tipo_documento = filtros.get('tipo_documento')
+    if tipo_documento:
+        if tipo_documento in TIPOS_DTE:
+            dtes = dtes.filter(tipo_dte=tipo_documento)
+            ventas = ventas.none()
+        else:
+            ventas = ventas.filter(tipo_documento=tipo_documento)
+            dtes = dtes.none()
+
+    cliente_id = filtros.get('cliente_id')
+    vendedor_id = filtros.get('vendedor_id')
+    forma_pago_id = filtros.get('forma_pago_id')
+    if cliente_id:
+        ventas = ventas.filter(cliente_id=cliente_id)
+        dtes = dtes.filter(Q(venta__cliente_id=cliente_id) | Q(rut_receptor__icontains=cliente_id))
+    if vendedor_id:
+        ventas = ventas.filter(vendedor_id=vendedor_id)
+        dtes = dtes.filter(venta__vendedor_id=vendedor_id)
+    if forma_pago_id:
+        ventas = ventas.filter(forma_pago_id=forma_pago_id)
+        dtes = dtes.filter(venta__forma_pago_id=forma_pago_id)
+    if filtros.get('estado'):
+        ventas = ventas.filter(estado=filtros['estado'])
+
+    search = filtros.get('search')
+    if search:
+        ventas = ventas.filter(
+            Q(numero_venta__icontains=search) |
+            Q(cliente__nombre__icontains=search) |
+            Q(cliente__rut__icontains=search) |
+            Q(observaciones__icontains=search)
+        )
+        dtes = dtes.filter(
+            Q(folio__icontains=search) |
+            Q(razon_social_receptor__icontains=search) |
+            Q(rut_receptor__icontains=search) |
+            Q(glosa_sii__icontains=search)
+        )
+
+    return ventas, dtes
+
+
+def _columnas_venta(ventas):
+    return ventas.annotate(
+        es_dte=Value(0, output_field=IntegerField()),
+        doc_id=F('id'),
+        orden_tipo=Case(
+            *[When(tipo_documento=tipo, then=Value(codigo)) for tipo, codigo in TIPO_SII_VENTA.items()],
+            default=Value('99'),
+            output_field=CharField(),
+        ),
+        orden_folio=SoloDigitos('numero_venta'),
+        orden_fecha=F('fecha'),
+        orden_cliente=Lower(Coalesce(F('cliente__nombre'), Value(''), output_field=CharField())),
+        orden_total=Coalesce(F('total'), Value(Decimal('0')), output_field=MONTO),
+    )
+
+
+def _columnas_dte(dtes):
+    return dtes.annotate(
+        es_dte=Value(1, output_field=IntegerField()),
+        doc_id=F('id'),
+        orden_tipo=F('tipo_dte'),
+        orden_folio=Coalesce(F('folio'), Value(0), output_field=BigIntegerField()),
+        orden_fecha=F('fecha_emision'),
+        orden_cliente=Lower(Coalesce(F('razon_social_receptor'), Value(''), output_field=CharField())),
+        orden_total=Coalesce(_monto_con_signo('monto_total'), Value(Decimal('0')), output_field=MONTO),
+    )
+
+
+COLUMNAS = ('es_dte', 'doc_id', 'orden_tipo', 'orden_folio', 'orden_fecha', 'orden_cliente', 'orden_total')
+
+
+# ========== CURSOR (KEYSET) ==========
+
+def _codificar_cursor(fila, claves):
+    valores = []
+    for clave in claves:
+        valor = fila[clave]
+        if isinstance(valor, date):
+            valor = valor.isoformat()
+        elif isinstance(valor, Decimal):
+            valor = str(valor)
+        valores.append(valor)
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip('=')
+
+
+def _decodificar_cursor(cursor, claves):
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if len(valores) != len(claves):
+            return None
+        resultado = {}
+        for clave, valor in zip(claves, valores):
+            if clave == 'orden_fecha':
+                valor = date.fromisoformat(valor)
+            elif clave == 'orden_total':
+                valor = Decimal(valor)
+            resultado[clave] = valor
+        return resultado
+    except (ValueError, TypeError):
+        return None
+
+
+def _filtro_keyset(claves, valores, descendente):
+    """(k1, k2, ...) > (v1, v2, ...) (o <) expresado como Q"""
+    comparador = 'lt' if descendente else 'gt'
+    filtro = Q()
+    iguales = Q()
+    for clave in claves:
+        filtro |= iguales & Q(**{f'{clave}__{comparador}': valores[clave]})
+        iguales &= Q(**{clave: valores[clave]})
+    return filtro
+
+
+# ========== CONSULTAS DEL LIBRO ==========
+
+def documentos_ordenados(ventas, dtes, sort, direction, despues=None, antes=None):
+    """
+    UNION ALL de ventas y DTEs con las columnas de ordenamiento, ordenado en SQL.
+    despues/antes son valores de cursor ya decodificados (paginación keyset).
+    """
+    claves = ORDENAMIENTOS.get(sort, ORDENAMIENTOS['fecha']) + DESEMPATE
+    descendente = direction == 'desc'
+
+    ventas = _columnas_venta(ventas)
+    dtes = _columnas_dte(dtes)
+
+    if despues is not None:
+        filtro = _filtro_keyset(claves, despues, descendente)
+        ventas, dtes = ventas.filter(filtro), dtes.filter(filtro)
+    elif antes is not None:
+        # Página anterior: recorrer en sentido inverso y dar vuelta el resultado
+        descendente = not descendente
+        filtro = _filtro_keyset(claves, antes, descendente)
+        ventas, dtes = ventas.filter(filtro), dtes.filter(filtro)
+
+    orden = [f'-{clave}' if descendente else clave for clave in claves]
+    return (
+        ventas.values(*COLUMNAS).order_by()
+        .union(dtes.values(*COLUMNAS).order_by(), all=True)
+        .order_by(*orden)
+    ), claves
+
+
+def cargar_documentos(filas):
+    """Carga los objetos de una página (dos consultas) respetando el orden de las filas"""
+    ids_venta = [fila['doc_id'] for fila in filas if not fila['es_dte']]
+    ids_dte = [fila['doc_id'] for fila in filas if fila['es_dte']]
+
+    ventas = Venta.objects.select_related(
+        'cliente', 'vendedor', 'forma_pago', 'estacion_trabajo'
+    ).in_bulk(ids_venta) if ids_venta else {}
+    dtes = DocumentoTributarioElectronico.objects.select_related(
+        'caf_utilizado', 'usuario_creacion', 'venta', 'venta__vendedor', 'venta__forma_pago'
+    ).prefetch_related('notas_credito').in_bulk(ids_dte) if ids_dte else {}
+
+    documentos = []
+    for fila in filas:
+        if fila['es_dte']:
+            dte = dtes.get(fila['doc_id'])
+            if dte is None:
+                continue
+            dte.es_dte = True
+            dte.fecha_documento = dte.fecha_emision
+            # Notas de Crédito (61) como montos negativos
+            dte.es_nota_credito = dte.tipo_dte == '61'
+            if dte.es_nota_credito:
+                dte.monto_neto = -(dte.monto_neto or 0)
+                dte.monto_iva = -(dte.monto_iva or 0)
+                dte.monto_total = -(dte.monto_total or 0)
+                notas = list(dte.notas_credito.all())
+                dte.notacredito_id = notas[0].id if notas else None
+            documentos.append(dte)
+        else:
+            venta = ventas.get(fila['doc_id'])
+            if venta is None:
+                continue
+            venta.es_dte = False
+            venta.fecha_documento = venta.fecha
+            documentos.append(venta)
+    return documentos
+
+
+def pagina_libro(ventas, dtes, sort, direction, numero_pagina=None, despues=None, antes=None):
+    """
+    Página del libro. Sin cursor usa LIMIT/OFFSET (permite saltar a cualquier
+    página); con cursor usa keyset, cuyo costo no depende de la página.
+
+    Returns:
+        tuple: (page_obj, cursor_anterior, cursor_siguiente)
+    """
+    consulta, claves = documentos_ordenados(ventas, dtes, sort, direction)
+    paginator = Paginator(consulta, POR_PAGINA)
+    page_obj = paginator.get_page(numero_pagina)
+
+    valores_despues = _decodificar_cursor(despues, claves) if despues else None
+    valores_antes = _decodificar_cursor(antes, claves) if antes and not valores_despues else None
+
+    if valores_despues or valores_antes:
+        consulta_keyset, _ = documentos_ordenados(
+            ventas, dtes, sort, direction, despues=valores_despues, antes=valores_antes
+        )
+        filas = list(consulta_keyset[:POR_PAGINA])
+        if valores_antes:
+            filas.reverse()
+    else:
+        filas = list(page_obj.object_list)
+
+    page_obj.object_list = cargar_documentos(filas)
+
+    cursor_anterior = _codificar_cursor(filas[0], claves) if filas and page_obj.has_previous() else ''
+    cursor_siguiente = _codificar_cursor(filas[-1], claves) if filas and page_obj.has_next() else ''
+    return page_obj, cursor_anterior, cursor_siguiente
+
+
+def totales_libro(ventas, dtes):
+    """
+    Totales generales y por tipo de documento con consultas agregadas
+    (Notas de Crédito restan).
+    """
+    stats_ventas = ventas.aggregate(
+        cantidad=Count('id'),
+        total_neto=Sum('neto'),
+        total_iva=Sum('iva'),
+        total_general=Sum('total'),
+    )
+    stats_dtes = dtes.aggregate(
+        cantidad=Count('id'),
+        total_neto=Sum(_monto_con_signo('monto_neto')),
+        total_iva=Sum(_monto_con_signo('monto_iva')),
+        total_general=Sum(_monto_con_signo('monto_total')),
+    )
+
+    estadisticas = {
+        'total_documentos': stats_ventas['cantidad'] + stats_dtes['cantidad'],
+        'total_neto': (stats_ventas['total_neto'] or 0) + (stats_dtes['total_neto'] or 0),
+        'total_iva': (stats_ventas['total_iva'] or 0) + (stats_dtes['total_iva'] or 0),
+        'total_general': (stats_ventas['total_general'] or 0) + (stats_dtes['total_general'] or 0),
+    }
+
+    stats_por_tipo = list(
+        ventas.values('tipo_documento').annotate(cantidad=Count('id'), total=Sum('total')).order_by()
+    ) + [
+        {'tipo_documento': fila['tipo_dte'], 'cantidad': fila['cantidad'], 'total': fila['total']}
+        for fila in dtes.values('tipo_dte').annotate(
+            cantidad=Count('id'), total=Sum(_monto_con_signo('monto_total'))
+        ).order_by()
+    ]
+
+    return estadisticas, stats_por_tipo
@@ -0,0 +1,103 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from articulos.models import Articulo
+from empresas.models import Empresa
+from ventas import busqueda_pos
+
+
+class Command(BaseCommand):
+    help = 'Compara la latencia (p50/p99) de la búsqueda de artículos del POS: consulta ORM vs índice en memoria'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa (por defecto la primera con artículos)')
+        parser.add_argument('--lista-precio', type=int, help='ID de la lista de precios a aplicar')
+        parser.add_argument('--consultas', type=int, default=200, help='Cantidad de búsquedas a ejecutar')
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla para elegir las búsquedas')
+
+    def handle(self, *args, **options):
+        if options.get('empresa'):
+            try:
+                empresa = Empresa.objects.get(pk=options['empresa'])
+            except Empresa.DoesNotExist:
+                raise CommandError(f"Empresa {options['empresa']} no encontrada")
+        else:
+            empresa = Empresa.objects.filter(articulo__activo=True).distinct().first()
+            if not empresa:
+                raise CommandError('No hay empresas con artículos activos')
+
+        consultas = self._generar_consultas(empresa, options['consultas'], options['semilla'])
+        if not consultas:
+            raise CommandError('La empresa no tiene artículos activos para generar búsquedas')
+
+        lista_precio_id = options.get('lista_precio')
+        self.stdout.write(f'Empresa: {empresa} | {len(consultas)} búsquedas')
+
+        # Construcción del índice (costo único por proceso)
+        inicio = time.perf_counter()
+        indice = busqueda_pos.construir_indice(empresa.id)
+        construccion_ms = (time.perf_counter() - inicio) * 1000
+        self.stdout.write(
+            f'Índice construido en {construccion_ms:.1f} ms '
+            f'({len(indice.registros)} artículos, {len(indice.trigramas)} trigramas)'
+        )
+
+        tiempos_orm = self._medir(
+            lambda q: busqueda_pos.buscar_articulos_orm(empresa, q, lista_precio_id=lista_precio_id),
+            consultas
+        )
+        tiempos_indice = self._medir(
+            lambda q: busqueda_pos.buscar_articulos(empresa.id, q, lista_precio_id=lista_precio_id),
+            consultas
+        )
+
+        self.stdout.write('')
+        self.stdout.write(f"{'Método':<10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'máx (ms)':>10}")
+        for nombre, tiempos in (('ORM', tiempos_orm), ('Índice', tiempos_indice)):
+            self.stdout.write(
+                f'{nombre:<10} {self._percentil(tiempos, 50):>10.2f} '
+                f'{self._percentil(tiempos, 99):>10.2f} {max(tiempos):>10.2f}'
+            )
+
+        mejora = statistics.median(tiempos_orm) / max(statistics.median(tiempos_indice), 1e-6)
+        self.stdout.write(self.style.SUCCESS(f'✓ Mejora en p50: {mejora:.1f}x'))
+
+    def _generar_consultas(self, empresa, cantidad, semilla):
+        """Mezcla de búsquedas reales del POS: código de barras, código y fragmentos de nombre"""
+        muestras = list(
+            Articulo.objects.filter(empresa=empresa, activo=True)
+            .values_list('codigo', 'codigo_barras', 'nombre')[:5000]
+        )
+        if not muestras:
+            return []
+
+        rnd = random.Random(semilla)
+        consultas = []
+        for _ in range(cantidad):
+            codigo, codigo_barras, nombre = rnd.choice(muestras)
+            tipo = rnd.random()
+            if tipo < 0.4 and codigo_barras:
+                consultas.append(codigo_barras)
+            elif tipo < 0.6 and codigo:
+                consultas.append(codigo)
+            else:
+                palabras = (nombre or codigo).split()
+                palabra = rnd.choice(palabras) if palabras else codigo
+                consultas.append(palabra[:rnd.randint(3, max(3, len(palabra)))])
+        return consultas
+
+    def _medir(self, funcion, consultas):
+        tiempos = []
+        for consulta in consultas:
+            inicio = time.perf_counter()
+            funcion(consulta)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return tiempos
+
+    def _percentil(self, valores, percentil):
+        ordenados = sorted(valores)
+        k = max(0, min(len(ordenados) - 1, int(round(percentil / 100 * len(ordenados))) - 1))
+        return ordenados[k]
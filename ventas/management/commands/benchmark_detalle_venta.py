@@ -0,0 +1,109 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from articulos.models import Articulo
+from empresas.models import Empresa
+from ventas.documentos import LineaVenta, crear_detalles
+from ventas.models import Venta, VentaDetalle
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compara el armado de ventas de 10/100/1000 líneas: VentaDetalle.create por línea vs crear_detalles en bloque'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--empresa', type=int, help='ID de la empresa (por defecto la primera con artículos)')
+        parser.add_argument('--lineas', default='10,100,1000', help='Tamaños de documento separados por coma')
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla para elegir artículos y cantidades')
+
+    def handle(self, *args, **options):
+        if options.get('empresa'):
+            try:
+                empresa = Empresa.objects.get(pk=options['empresa'])
+            except Empresa.DoesNotExist:
+                raise CommandError(f"Empresa {options['empresa']} no encontrada")
+        else:
+            empresa = Empresa.objects.filter(articulo__activo=True).distinct().first()
+            if not empresa:
+                raise CommandError('No hay empresas con artículos activos')
+
+        articulos = list(Articulo.objects.filter(empresa=empresa, activo=True)[:1000])
+        if not articulos:
+            raise CommandError('La empresa no tiene artículos activos')
+
+        try:
+            tamanos = [int(valor) for valor in options['lineas'].split(',') if valor.strip()]
+        except ValueError:
+            raise CommandError('--lineas debe ser una lista de enteros separados por coma')
+
+        self.stdout.write(f'Empresa: {empresa} | {len(articulos)} artículos')
+        self.stdout.write('Las ventas se crean dentro de una transacción que se revierte al terminar')
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'Líneas':>7} {'Método':<10} {'Tiempo (ms)':>12} {'Consultas':>10} {'Total':>14}"
+        )
+
+        mejoras = []
+        for cantidad in tamanos:
+            rnd = random.Random(options['semilla'])
+            lineas = [
+                LineaVenta(rnd.choice(articulos), rnd.randint(1, 5), rnd.randint(100, 50000))
+                for _ in range(cantidad)
+            ]
+            tiempo_linea, consultas_linea, total_linea = self._medir(empresa, lineas, self._por_linea)
+            tiempo_bloque, consultas_bloque, total_bloque = self._medir(empresa, lineas, self._en_bloque)
+
+            self.stdout.write(
+                f'{cantidad:>7} {"Por línea":<10} {tiempo_linea:>12.1f} {consultas_linea:>10} {total_linea:>14}'
+            )
+            self.stdout.write(
+                f'{cantidad:>7} {"En bloque":<10} {tiempo_bloque:>12.1f} {consultas_bloque:>10} {total_bloque:>14}'
+            )
+            if total_linea != total_bloque:
+                self.stdout.write(self.style.WARNING(f'  Totales distintos: {total_linea} vs {total_bloque}'))
+            mejoras.append((cantidad, tiempo_linea / max(tiempo_bloque, 1e-6)))
+
+        self.stdout.write('')
+        resumen = ', '.join(f'{cantidad} líneas {mejora:.1f}x' for cantidad, mejora in mejoras)
+        self.stdout.write(self.style.SUCCESS(f'✓ Mejora: {resumen}'))
+
+    def _por_linea(self, venta, lineas):
+        for linea in lineas:
+            VentaDetalle.objects.create(
+                venta=venta,
+                articulo=linea.articulo,
+                cantidad=linea.cantidad,
+                precio_unitario=linea.precio_unitario,
+            )
+
+    def _en_bloque(self, venta, lineas):
+        crear_detalles(venta, lineas)
+
+    def _medir(self, empresa, lineas, funcion):
+        """(ms, consultas, total) de armar una venta con las líneas dadas; la venta se revierte"""
+        resultado = {}
+        try:
+            with transaction.atomic():
+                venta = Venta.objects.create(
+                    empresa=empresa,
+                    numero_venta=f'BENCH{len(lineas)}',
+                    tipo_documento='cotizacion',
+                    tipo_documento_planeado='cotizacion',
+                )
+                with CaptureQueriesContext(connection) as consultas:
+                    inicio = time.perf_counter()
+                    funcion(venta, lineas)
+                    resultado['ms'] = (time.perf_counter() - inicio) * 1000
+                resultado['consultas'] = len(consultas)
+                resultado['total'] = Venta.objects.get(pk=venta.pk).total
+                raise _Rollback()
+        except _Rollback:
+            pass
+        return resultado['ms'], resultado['consultas'], resultado['total']
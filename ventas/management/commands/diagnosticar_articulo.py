@@ -53,12 +53,7 @@ class Command(BaseCommand):
             self.stdout.write('-' * 80)
             self.stdout.write('Desglose Correcto:')
             
-            # Convertir precio_final de string a float
-            try:
-                precio_final = float(articulo.precio_final.replace(',', '.'))
-            except (ValueError, AttributeError):
-                self.stdout.write(self.style.ERROR('✗ Error al leer precio_final'))
-                continue
+            precio_final = float(articulo.precio_final)
             
             if articulo.categoria:
                 tiene_iva = not articulo.categoria.exenta_iva
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 02:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresas', '0028_plansaas_empresa_auto_suspender_and_more'),
+        ('ventas', '0037_estaciontrabajo_copias_notacredito'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioIndicePOS',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('articulo_id', models.BigIntegerField(blank=True, null=True, verbose_name='Artículo')),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Fecha')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='empresas.empresa', verbose_name='Empresa')),
+            ],
+            options={
+                'verbose_name': 'Cambio del Índice POS',
+                'verbose_name_plural': 'Cambios del Índice POS',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['empresa', 'id'], name='ventas_camb_empresa_b96b07_idx')],
+            },
+        ),
+    ]
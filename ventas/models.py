@@ -262,29 +262,14 @@ class Venta(models.Model):
         IMPORTANTE: Los precios en precio_total YA INCLUYEN IVA e impuestos.
         Este método extrae el IVA del subtotal, no lo agrega.
         """
-        detalles = self.ventadetalle_set.all()
-        
-        # Subtotal: suma de todos los precios totales (YA incluye IVA)
-        subtotal = sum(detalle.precio_total for detalle in detalles)
-        
-        # Impuesto específico: suma de impuestos específicos de cada detalle
-        impuesto_especifico = sum(detalle.impuesto_especifico for detalle in detalles)
-        
-        # El total es el subtotal (que ya incluye IVA) más impuestos específicos
-        total = subtotal + impuesto_especifico - self.descuento
-        
-        # Extraer el IVA del subtotal (subtotal incluye IVA)
-        # subtotal = neto + iva
-        # subtotal = neto * 1.19
-        # neto = subtotal / 1.19
-        neto = (subtotal - self.descuento) / Decimal('1.19')
-        iva = (subtotal - self.descuento) - neto
-        
-        self.subtotal = subtotal
-        self.neto = neto
-        self.iva = iva
-        self.impuesto_especifico = impuesto_especifico
-        self.total = total
+        from .documentos import totales_detalles
+
+        # Suma de las líneas en una sola consulta agregada:
+        # total = subtotal (ya incluye IVA) + impuestos específicos - descuento
+        # neto = (subtotal - descuento) / 1.19 ; iva = (subtotal - descuento) - neto
+        totales = totales_detalles(self)
+        for campo, valor in totales.items():
+            setattr(self, campo, valor)
         self.save()
     
     def es_cotizacion_vencida(self):
@@ -327,19 +312,20 @@ class VentaDetalle(models.Model):
         return f"{self.articulo.codigo} - {self.cantidad} x {self.precio_unitario}"
     
     def save(self, *args, **kwargs):
-        # Calcular precio total
-        self.precio_total = self.cantidad * self.precio_unitario
-        
-        # Calcular impuesto específico si el artículo lo tiene
+        from .documentos import montos_linea
+
+        # Calcular precio total e impuesto específico (si el artículo lo tiene)
+        # Para crear muchas líneas de una vez usar ventas.documentos.crear_detalles
+        precio_total, impuesto = montos_linea(self.articulo, self.cantidad, self.precio_unitario)
+        self.precio_total = precio_total
         if self.articulo.impuesto_especifico:
-            # Convertir a Decimal para evitar errores de tipo
-            impuesto_porcentaje = Decimal(str(self.articulo.impuesto_especifico))
-            self.impuesto_especifico = self.precio_total * (impuesto_porcentaje / 100)
+            self.impuesto_especifico = impuesto
         
+        recalcular_venta = kwargs.pop('recalcular_venta', True)
         super().save(*args, **kwargs)
         
         # Recalcular totales de la venta
-        if self.venta:
+        if self.venta and recalcular_venta:
             self.venta.calcular_totales()
 
 
@@ -1106,3 +1092,27 @@ class NotaDebitoDetalle(models.Model):
         descuento_monto = subtotal_item * (self.descuento / Decimal('100'))
         self.total = subtotal_item - descuento_monto
         super().save(*args, **kwargs)
+
+
+class CambioIndicePOS(models.Model):
+    """
+    Registro de cambios del índice de búsqueda del POS (ventas.busqueda_pos).
+    Cada proceso lee los cambios posteriores al último que aplicó y refresca
+    solo esos artículos. Un cambio sin artículo pide reconstruir el índice completo.
+    """
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='+', verbose_name="Empresa")
+    # Sin FK: el cambio debe sobrevivir a la eliminación del artículo
+    articulo_id = models.BigIntegerField(null=True, blank=True, verbose_name="Artículo")
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Fecha")
+
+    class Meta:
+        verbose_name = "Cambio del Índice POS"
+        verbose_name_plural = "Cambios del Índice POS"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['empresa', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.empresa_id} - {self.articulo_id or 'todo'} ({self.fecha})"
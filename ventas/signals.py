@@ -1,9 +1,17 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
-from decimal import Decimal
 from .models import Venta, VentaDetalle
-from inventario.models import Stock, Inventario
+from inventario.models import Stock
+from inventario import services as servicio_stock
+from articulos.models import Articulo, PrecioArticulo, CategoriaArticulo, ImpuestoEspecifico
+from bodegas.models import Bodega
+from . import busqueda_pos
+
+
+# Tickets y vales del POS son preventas: su stock lo descuenta, con la bodega
+# de la caja, el proceso de caja o el cierre directo que los cobra
+DOCUMENTOS_SIN_DESCUENTO_AUTOMATICO = ['cotizacion', 'ticket', 'vale']
 
 
 @receiver(post_save, sender=Venta)
@@ -11,166 +19,103 @@ def actualizar_stock_venta(sender, instance, created, **kwargs):
     """
     Actualiza el stock cuando se confirma o anula una venta.
     Solo aplica para ventas confirmadas, no para cotizaciones ni borradores.
+
+    El posteo se hace al confirmar la transacción, con la venta ya completa:
+    la cabecera se guarda con cada línea que se agrega, y postear en ese
+    momento descontaría sólo las líneas que existieran hasta ahí.
     """
-    # Solo procesar ventas confirmadas (no cotizaciones ni borradores)
-    if instance.tipo_documento in ['cotizacion']:
+    if instance.estado not in ('confirmada', 'anulada'):
         return
-    
-    # Verificar si ya hay movimientos de inventario para esta venta
-    # Esto evita procesar múltiples veces cuando el signal se ejecuta varias veces
-    from inventario.models import Inventario
-    movimientos_existentes = Inventario.objects.filter(
-        empresa=instance.empresa,
-        numero_documento=instance.numero_venta,
-        tipo_movimiento='salida',
-        estado='confirmado'
-    ).exists()
-    
-    # Si la venta está confirmada, descontar stock (solo si no se ha procesado antes)
-    if instance.estado == 'confirmada' and not movimientos_existentes:
-        descontar_stock_venta(instance)
-    
+    venta_id = instance.pk
+    transaction.on_commit(lambda: postear_stock_venta(venta_id))
+
+
+def postear_stock_venta(venta_id):
+    """Descuenta o repone el stock de la venta según su estado al confirmar la transacción"""
+    venta = Venta.objects.select_related('empresa', 'usuario_creacion').filter(pk=venta_id).first()
+    if venta is None:
+        return
+
+    if venta.estado == 'confirmada':
+        descontar_stock_venta(venta)
+
     # Si la venta fue anulada, reponer stock
-    elif instance.estado == 'anulada':
-        reponer_stock_venta(instance)
+    elif venta.estado == 'anulada':
+        reponer_stock_venta(venta)
 
 
 def descontar_stock_venta(venta):
     """
-    Descuenta el stock de los artículos de una venta confirmada.
+    Descuenta el stock de los artículos de una venta confirmada desde la
+    bodega principal de la empresa (la primera activa).
     Crea movimientos de inventario tipo 'salida'.
+
+    No descuenta las preventas del POS ni las ventas procesadas en caja: esas
+    las descuenta (o no, en las guías) quien las procesa, con la bodega de la
+    caja. El posteo es idempotente por venta, así que tampoco duplica lo que
+    ya se descontó en la misma transacción.
     """
-    # Verificar que la venta tenga detalles
-    detalles = venta.ventadetalle_set.all()
-    
-    if not detalles:
+    from caja.models import VentaProcesada
+
+    if venta.tipo_documento in DOCUMENTOS_SIN_DESCUENTO_AUTOMATICO:
         return
-    
-    # Obtener la bodega principal de la empresa (la primera activa)
-    from bodegas.models import Bodega
+    if VentaProcesada.objects.filter(venta_final=venta).exists():
+        return
+
     bodega = Bodega.objects.filter(empresa=venta.empresa, activa=True).first()
     
     if not bodega:
         print(f"WARNING: No se encontró bodega activa para la empresa {venta.empresa}")
         return
     
-    with transaction.atomic():
-        for detalle in detalles:
-            articulo = detalle.articulo
-            
-            # Solo descontar si el artículo tiene control de stock
-            if not articulo.control_stock:
-                continue
-            
-            # Verificar si ya existe un movimiento de inventario para esta venta y artículo
-            # Esto evita duplicados cuando el signal se ejecuta múltiples veces
-            movimiento_existente = Inventario.objects.filter(
-                empresa=venta.empresa,
-                bodega_origen=bodega,
-                articulo=articulo,
-                tipo_movimiento='salida',
-                numero_documento=venta.numero_venta,
-                estado='confirmado'
-            ).first()
-            
-            if movimiento_existente:
-                # Si ya existe un movimiento, solo actualizar el stock si es necesario
-                # pero no crear otro movimiento
-                print(f"[INFO] Movimiento de inventario ya existe para venta {venta.numero_venta}, artículo {articulo.nombre}. Saltando creación duplicada.")
-                continue
-            
-            # Obtener o crear el registro de stock
-            stock, created = Stock.objects.get_or_create(
-                empresa=venta.empresa,
-                bodega=bodega,
-                articulo=articulo,
-                defaults={
-                    'cantidad': Decimal('0'),
-                    'stock_minimo': Decimal(str(articulo.stock_minimo)) if articulo.stock_minimo else Decimal('0'),
-                    'stock_maximo': Decimal(str(articulo.stock_maximo)) if articulo.stock_maximo else Decimal('0'),
-                    'precio_promedio': Decimal(str(articulo.precio_costo)) if articulo.precio_costo else Decimal('0'),
-                }
-            )
-            
-            # Descontar la cantidad
-            stock.cantidad -= detalle.cantidad
-            
-            # No permitir stock negativo
-            if stock.cantidad < 0:
-                stock.cantidad = Decimal('0')
-            
-            stock.save()
-            
-            # Crear movimiento de inventario
-            Inventario.objects.create(
-                empresa=venta.empresa,
-                bodega_origen=bodega,
-                articulo=articulo,
-                tipo_movimiento='salida',
-                cantidad=detalle.cantidad,
-                precio_unitario=detalle.precio_unitario,
-                descripcion=f'Venta {venta.numero_venta} - {venta.get_tipo_documento_display()}',
-                numero_documento=venta.numero_venta,
-                estado='confirmado',
-                creado_por=venta.usuario_creacion
-            )
+    servicio_stock.descontar_stock_venta(venta, bodega)
 
 
 def reponer_stock_venta(venta):
     """
-    Repone el stock de los artículos de una venta anulada.
-    Crea movimientos de inventario tipo 'entrada' con motivo de anulación.
+    Repone el stock de los artículos de una venta anulada en la bodega de la
+    que se descontó. Crea movimientos de inventario tipo 'entrada' con motivo de anulación.
     """
-    # Verificar que la venta tenga detalles
-    detalles = venta.ventadetalle_set.all()
-    
-    if not detalles:
-        return
-    
-    # Obtener la bodega principal de la empresa
-    from bodegas.models import Bodega
-    bodega = Bodega.objects.filter(empresa=venta.empresa, activa=True).first()
-    
-    if not bodega:
-        print(f"WARNING: No se encontró bodega activa para la empresa {venta.empresa}")
-        return
-    
-    with transaction.atomic():
-        for detalle in detalles:
-            articulo = detalle.articulo
-            
-            # Solo reponer si el artículo tiene control de stock
-            if not articulo.control_stock:
-                continue
-            
-            # Obtener o crear el registro de stock
-            stock, created = Stock.objects.get_or_create(
-                empresa=venta.empresa,
-                bodega=bodega,
-                articulo=articulo,
-                defaults={
-                    'cantidad': Decimal('0'),
-                    'stock_minimo': Decimal(str(articulo.stock_minimo)) if articulo.stock_minimo else Decimal('0'),
-                    'stock_maximo': Decimal(str(articulo.stock_maximo)) if articulo.stock_maximo else Decimal('0'),
-                    'precio_promedio': Decimal(str(articulo.precio_costo)) if articulo.precio_costo else Decimal('0'),
-                }
-            )
-            
-            # Reponer la cantidad
-            stock.cantidad += detalle.cantidad
-            stock.save()
-            
-            # Crear movimiento de inventario
-            Inventario.objects.create(
-                empresa=venta.empresa,
-                bodega_destino=bodega,
-                articulo=articulo,
-                tipo_movimiento='entrada',
-                cantidad=detalle.cantidad,
-                precio_unitario=detalle.precio_unitario,
-                descripcion=f'Anulación de Venta {venta.numero_venta} - {venta.get_tipo_documento_display()}',
-                motivo='Anulación de venta',
-                numero_documento=venta.numero_venta,
-                estado='confirmado',
-                creado_por=venta.usuario_creacion
-            )
+    servicio_stock.reponer_stock_venta(venta)
+
+
+# ========== ÍNDICE DE BÚSQUEDA DEL POS ==========
+# Registra en CambioIndicePOS los artículos que cambian, para que el índice en
+# memoria de ventas.busqueda_pos se refresque en todos los procesos.
+# Se registra al confirmar la transacción para no indexar datos que luego se revierten.
+
+@receiver(post_save, sender=Articulo)
+def indexar_articulo_pos(sender, instance, **kwargs):
+    transaction.on_commit(lambda: busqueda_pos.notificar_articulo_guardado(instance))
+
+
+@receiver(post_delete, sender=Articulo)
+def desindexar_articulo_pos(sender, instance, **kwargs):
+    transaction.on_commit(lambda: busqueda_pos.notificar_articulo_eliminado(instance))
+
+
+@receiver(post_save, sender=PrecioArticulo)
+@receiver(post_delete, sender=PrecioArticulo)
+def indexar_precio_pos(sender, instance, **kwargs):
+    transaction.on_commit(lambda: busqueda_pos.notificar_precio(
+        instance.lista_precio.empresa_id, instance.articulo_id
+    ))
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def indexar_stock_pos(sender, instance, **kwargs):
+    transaction.on_commit(lambda: busqueda_pos.notificar_stock(instance))
+
+
+@receiver(post_save, sender=CategoriaArticulo)
+@receiver(post_save, sender=ImpuestoEspecifico)
+@receiver(post_save, sender=Bodega)
+def invalidar_indice_pos(sender, instance, **kwargs):
+    # Cambian impuestos o bodegas activas de muchos artículos: reconstruir completo
+    transaction.on_commit(lambda: busqueda_pos.invalidar_indice(instance.empresa_id))
+
+
+@receiver(servicio_stock.stock_actualizado)
+def indexar_stock_masivo_pos(sender, empresa_id, bodega_id, articulo_ids, **kwargs):
+    busqueda_pos.notificar_stock_masivo(empresa_id, bodega_id, articulo_ids)
@@ -1,3 +1,484 @@
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.db import transaction
 from django.test import TestCase
 
-# Create your tests here.
+from articulos.models import (
+    Articulo, CategoriaArticulo, ImpuestoEspecifico, ListaPrecio, PrecioArticulo, UnidadMedida
+)
+from bodegas.models import Bodega
+from empresas.models import Empresa
+from facturacion_electronica.models import DocumentoTributarioElectronico
+from facturacion_electronica.tests import crear_caf, crear_sucursal
+from inventario.models import Inventario, Stock
+from inventario.services import LineaStock, descontar_stock_venta, postear_documento, saldos_desde_ledger
+from ventas import busqueda_pos
+from ventas.busqueda_pos import buscar_articulos_orm
+from ventas.documentos import LineaVenta, copiar_detalles, crear_detalles
+from ventas.libro_ventas import (
+    ORDENAMIENTOS, _codificar_cursor, _decodificar_cursor, documentos_ordenados, filtrar_documentos, pagina_libro,
+)
+from ventas.models import CambioIndicePOS, Venta, VentaDetalle
+
+
+class BusquedaPOSConsultasTest(TestCase):
+    """La búsqueda del POS debe costar un número fijo de consultas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(nombre='Empresa Test', razon_social='Empresa Test', rut='76.000.000-0')
+        impuesto = ImpuestoEspecifico.objects.create(empresa=cls.empresa, nombre='ILA', porcentaje='18')
+        cls.categoria = CategoriaArticulo.objects.create(
+            empresa=cls.empresa, codigo='BEB', nombre='Bebidas', impuesto_especifico=impuesto
+        )
+        cls.unidad = UnidadMedida.objects.create(empresa=cls.empresa, nombre='Unidad', simbolo='UN')
+        cls.bodegas = [
+            Bodega.objects.create(empresa=cls.empresa, codigo='B1', nombre='Bodega 1'),
+            Bodega.objects.create(empresa=cls.empresa, codigo='B2', nombre='Bodega 2'),
+        ]
+        cls.lista = ListaPrecio.objects.create(empresa=cls.empresa, nombre='Mayorista')
+
+    def _crear_articulos(self, prefijo, cantidad):
+        for i in range(cantidad):
+            articulo = Articulo.objects.create(
+                empresa=self.empresa,
+                categoria=self.categoria,
+                unidad_medida=self.unidad,
+                codigo=f'{prefijo}{i:04d}',
+                codigo_barras=f'780{prefijo}{i:06d}',
+                nombre=f'Bebida {prefijo} {i}',
+                precio_venta='1000',
+            )
+            for bodega in self.bodegas:
+                Stock.objects.create(empresa=self.empresa, bodega=bodega, articulo=articulo, cantidad=Decimal('5'))
+            PrecioArticulo.objects.create(articulo=articulo, lista_precio=self.lista, precio=Decimal('800'))
+
+    def test_cantidad_de_consultas_no_depende_de_los_resultados(self):
+        self._crear_articulos('AA', 3)
+        self._crear_articulos('BB', 40)
+
+        with self.assertNumQueries(1):
+            pocos = buscar_articulos_orm(self.empresa, 'AA', lista_precio_id=self.lista.id)
+        with self.assertNumQueries(1):
+            muchos = buscar_articulos_orm(self.empresa, 'BB', lista_precio_id=self.lista.id)
+        with self.assertNumQueries(1):
+            buscar_articulos_orm(self.empresa, 'BB')
+
+        self.assertEqual(len(pocos), 3)
+        self.assertEqual(len(muchos), 40)
+
+    def test_precio_final_por_lista_y_stock_agregado(self):
+        self._crear_articulos('CC', 1)
+
+        con_lista = buscar_articulos_orm(self.empresa, 'CC', lista_precio_id=self.lista.id)[0]
+        sin_lista = buscar_articulos_orm(self.empresa, 'CC')[0]
+
+        # 800 + 19% IVA + 18% ILA
+        self.assertEqual(con_lista['precio'], 1096)
+        self.assertEqual(sin_lista['precio'], 1370)
+        # Suma de las dos bodegas activas
+        self.assertEqual(con_lista['stock'], 10.0)
+
+
+class IndiceBusquedaPOSTest(TestCase):
+    """El índice del POS se refresca por artículo desde el registro de cambios compartido"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(nombre='Empresa Índice', razon_social='Empresa Índice', rut='76.000.001-8')
+        cls.categoria = CategoriaArticulo.objects.create(empresa=cls.empresa, codigo='ALM', nombre='Almacén')
+        unidad = UnidadMedida.objects.create(empresa=cls.empresa, nombre='Unidad', simbolo='UN')
+        cls.bodega = Bodega.objects.create(empresa=cls.empresa, codigo='B1', nombre='Bodega 1')
+        cls.lista = ListaPrecio.objects.create(empresa=cls.empresa, nombre='Mayorista')
+        cls.articulos = []
+        for i in range(3):
+            articulo = Articulo.objects.create(
+                empresa=cls.empresa, categoria=cls.categoria, unidad_medida=unidad,
+                codigo=f'IX{i}', nombre=f'Arroz {i}', precio_venta='1000',
+            )
+            Stock.objects.create(empresa=cls.empresa, bodega=cls.bodega, articulo=articulo, cantidad=Decimal('5'))
+            cls.articulos.append(articulo)
+
+    def setUp(self):
+        self.indice = busqueda_pos.construir_indice(self.empresa.id)
+
+    def tearDown(self):
+        busqueda_pos._indices.pop(self.empresa.id, None)
+
+    def _resultado(self, articulo, lista_precio_id=None):
+        resultados = self.indice.buscar(articulo.codigo, lista_precio_id=lista_precio_id)
+        return next(r for r in resultados if r['id'] == articulo.id)
+
+    def test_venta_y_precio_se_aplican_solo_a_los_articulos_modificados(self):
+        articulo = self.articulos[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            stock = Stock.objects.get(articulo=articulo, bodega=self.bodega)
+            stock.cantidad = Decimal('2')
+            stock.save()
+            PrecioArticulo.objects.create(articulo=articulo, lista_precio=self.lista, precio=Decimal('500'))
+
+        self.assertFalse(CambioIndicePOS.objects.filter(empresa=self.empresa, articulo_id__isnull=True).exists())
+        # Otro proceso ya tenía su índice: lo pone al día sin reconstruirlo
+        with mock.patch.object(self.indice, 'refrescar_articulos', wraps=self.indice.refrescar_articulos) as refrescar:
+            self.assertFalse(self.indice.sincronizar())
+        refrescar.assert_called_once_with({articulo.id})
+
+        resultado = self._resultado(articulo, lista_precio_id=self.lista.id)
+        self.assertEqual(resultado['stock'], 2.0)
+        self.assertEqual(resultado['precio'], 595)
+        self.assertEqual(self._resultado(self.articulos[1])['stock'], 5.0)
+
+        # Los cambios ya aplicados no se vuelven a leer
+        with mock.patch.object(self.indice, 'refrescar_articulos') as refrescar:
+            self.assertFalse(self.indice.sincronizar())
+        refrescar.assert_not_called()
+
+    def test_stock_masivo_y_articulo_desactivado(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Stock.objects.filter(articulo__in=self.articulos[:2]).update(cantidad=Decimal('9'))
+            busqueda_pos.notificar_stock_masivo(self.empresa.id, self.bodega.id, [a.id for a in self.articulos[:2]])
+            self.articulos[2].activo = False
+            self.articulos[2].save()
+
+        self.assertFalse(self.indice.sincronizar())
+        self.assertEqual(self._resultado(self.articulos[0])['stock'], 9.0)
+        self.assertEqual(self.indice.buscar(self.articulos[2].codigo), [])
+
+    def test_regla_de_precios_masiva_refresca_el_indice(self):
+        from articulos.reglas_precios import ReglaPrecio, aplicar_cambios, calcular_cambios, guardar_precios
+
+        articulos = Articulo.objects.filter(pk__in=[a.pk for a in self.articulos])
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicar_cambios(self.lista, calcular_cambios(self.lista, articulos, ReglaPrecio('porcentaje', Decimal('-10'), 'neto')))
+        self.assertFalse(self.indice.sincronizar())
+        self.assertEqual(self._resultado(self.articulos[0], lista_precio_id=self.lista.id)['precio'], 1071)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            guardar_precios(self.lista, {self.articulos[0].id: None, self.articulos[1].id: Decimal('2000')})
+        self.assertFalse(self.indice.sincronizar())
+        self.assertEqual(self._resultado(self.articulos[0], lista_precio_id=self.lista.id)['precio'], 1190)
+        self.assertEqual(self._resultado(self.articulos[1], lista_precio_id=self.lista.id)['precio'], 2380)
+
+    def test_cambio_de_categoria_pide_reconstruccion(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categoria.exenta_iva = True
+            self.categoria.save()
+        self.assertTrue(self.indice.sincronizar())
+
+    def test_sin_indice_usa_consulta_directa_y_construye_aparte(self):
+        busqueda_pos._indices.pop(self.empresa.id, None)
+        with mock.patch.object(busqueda_pos, 'programar_construccion') as programar:
+            resultados = busqueda_pos.buscar_articulos(self.empresa.id, 'Arroz')
+        programar.assert_called_once_with(self.empresa.id)
+        self.assertEqual(resultados, buscar_articulos_orm(self.empresa, 'Arroz'))
+
+
+class IndiceIgualConsultaPOSTest(TestCase):
+    """
+    El índice en memoria encuentra lo mismo que la consulta directa (icontains)
+    con los mismos datos. pos_buscar_articulo ya entrega la búsqueda sin
+    espacios en los extremos.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(nombre='Empresa Equivalencia', razon_social='Empresa Equivalencia', rut='76.000.012-3')
+        otra = Empresa.objects.create(nombre='Otra Empresa', razon_social='Otra Empresa', rut='76.000.013-1')
+        impuesto = ImpuestoEspecifico.objects.create(empresa=cls.empresa, nombre='ILA', porcentaje='10')
+        categorias = [
+            CategoriaArticulo.objects.create(empresa=cls.empresa, codigo='ALM', nombre='Almacén'),
+            CategoriaArticulo.objects.create(empresa=cls.empresa, codigo='EXE', nombre='Exentos', exenta_iva=True),
+            CategoriaArticulo.objects.create(empresa=cls.empresa, codigo='LIC', nombre='Licores', impuesto_especifico=impuesto),
+        ]
+        unidad = UnidadMedida.objects.create(empresa=cls.empresa, nombre='Unidad', simbolo='UN')
+        activa = Bodega.objects.create(empresa=cls.empresa, codigo='B1', nombre='Bodega 1')
+        inactiva = Bodega.objects.create(empresa=cls.empresa, codigo='B2', nombre='Bodega 2', activa=False)
+        cls.lista = ListaPrecio.objects.create(empresa=cls.empresa, nombre='Mayorista')
+
+        datos = [
+            ('AZ1', '7801000000011', 'Arroz grado 1', 'Arroz largo fino', True),
+            ('AZ10', '7801000000103', 'ARROZ integral', '', True),
+            ('FID', '7802000000010', 'Fideos spaghetti', 'Pasta de trigo', True),
+            ('PIS', '', 'Pisco 35', 'Destilado de uva', True),
+            ('ACE', '7803000000019', 'Aceite maravilla', '', True),
+            ('ARX', '7801999999999', 'Arroz descontinuado', '', False),
+        ]
+        cls.articulos = []
+        for n, (codigo, codigo_barras, nombre, descripcion, es_activo) in enumerate(datos):
+            articulo = Articulo.objects.create(
+                empresa=cls.empresa, categoria=categorias[n % 3], unidad_medida=unidad,
+                codigo=codigo, codigo_barras=codigo_barras, nombre=nombre, descripcion=descripcion,
+                precio_venta=str(1000 + n * 250), activo=es_activo,
+            )
+            Stock.objects.create(empresa=cls.empresa, bodega=activa, articulo=articulo, cantidad=Decimal(n + 1))
+            Stock.objects.create(empresa=cls.empresa, bodega=inactiva, articulo=articulo, cantidad=Decimal('50'))
+            if n % 2:
+                PrecioArticulo.objects.create(articulo=articulo, lista_precio=cls.lista, precio=Decimal('700'))
+            cls.articulos.append(articulo)
+        Articulo.objects.create(
+            empresa=otra, categoria=CategoriaArticulo.objects.create(empresa=otra, codigo='ALM', nombre='Almacén'),
+            unidad_medida=UnidadMedida.objects.create(empresa=otra, nombre='Unidad', simbolo='UN'),
+            codigo='AZ1', nombre='Arroz de otra empresa', precio_venta='500',
+        )
+
+    def setUp(self):
+        self.indice = busqueda_pos.construir_indice(self.empresa.id)
+
+    def tearDown(self):
+        busqueda_pos._indices.pop(self.empresa.id, None)
+
+    def test_mismos_resultados_que_la_consulta_directa(self):
+        consultas = ['arroz', 'ARROZ', 'az1', 'Az', 'a', '7801', '0000000', 'trigo', 'uva', 'piSco 3', 'zzz', 'z g']
+        for consulta in consultas:
+            for lista_precio_id in (None, self.lista.id):
+                with self.subTest(consulta=consulta, lista_precio_id=lista_precio_id):
+                    por_id = lambda resultados: sorted(resultados, key=lambda r: r['id'])
+                    self.assertEqual(
+                        por_id(self.indice.buscar(consulta, lista_precio_id=lista_precio_id)),
+                        por_id(buscar_articulos_orm(self.empresa, consulta, lista_precio_id=lista_precio_id)),
+                    )
+
+    def test_calce_exacto_de_codigo_primero(self):
+        resultados = self.indice.buscar('az1')
+        self.assertEqual([r['codigo'] for r in resultados], ['AZ1', 'AZ10'])
+        resultados = self.indice.buscar('7801000000103')
+        self.assertEqual([r['codigo'] for r in resultados], ['AZ10'])
+
+    def test_limite_de_resultados(self):
+        self.assertEqual(len(self.indice.buscar('a', limite=2)), 2)
+        self.assertEqual(self.indice.buscar('   '), [])
+
+
+class DetallesVentaEnBloqueTest(TestCase):
+    """crear_detalles deja la venta igual que crear las líneas una a una, con consultas fijas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(nombre='Empresa Detalles', razon_social='Empresa Detalles', rut='76.000.014-K')
+        categoria = CategoriaArticulo.objects.create(empresa=cls.empresa, codigo='GEN', nombre='General')
+        unidad = UnidadMedida.objects.create(empresa=cls.empresa, nombre='Unidad', simbolo='UN')
+        cls.articulos = [
+            Articulo.objects.create(
+                empresa=cls.empresa, categoria=categoria, unidad_medida=unidad, codigo=f'D{n}',
+                nombre=f'Artículo {n}', precio_venta='1000', impuesto_especifico=impuesto,
+            )
+            for n, impuesto in enumerate(('0', '18', '31.5'))
+        ]
+
+    def _lineas(self, cantidad):
+        return [
+            LineaVenta(self.articulos[n % 3], Decimal('1.333') if n % 4 == 0 else n % 5 + 1, Decimal('990.99') + n)
+            for n in range(cantidad)
+        ]
+
+    def _venta(self, numero, descuento='0'):
+        return Venta.objects.create(empresa=self.empresa, numero_venta=numero, descuento=Decimal(descuento))
+
+    def _montos(self, venta):
+        venta.refresh_from_db()
+        detalles = list(
+            VentaDetalle.objects.filter(venta=venta).order_by('id').values_list('precio_total', 'impuesto_especifico')
+        )
+        return [getattr(venta, campo) for campo in ('subtotal', 'neto', 'iva', 'impuesto_especifico', 'total')], detalles
+
+    def test_mismos_totales_que_por_linea(self):
+        for descuento in ('0', '1500.50'):
+            with self.subTest(descuento=descuento):
+                lineas = self._lineas(25)
+                por_linea = self._venta(f'L{descuento}', descuento)
+                for linea in lineas:
+                    VentaDetalle.objects.create(
+                        venta=por_linea, articulo=linea.articulo,
+                        cantidad=linea.cantidad, precio_unitario=linea.precio_unitario,
+                    )
+                en_bloque = self._venta(f'B{descuento}', descuento)
+                crear_detalles(en_bloque, lineas)
+
+                self.assertEqual(self._montos(en_bloque), self._montos(por_linea))
+                # Y lo mismo que releer los detalles guardados
+                totales = self._montos(en_bloque)[0]
+                en_bloque.calcular_totales()
+                self.assertEqual(self._montos(en_bloque)[0], totales)
+
+    def test_consultas_no_dependen_de_las_lineas(self):
+        # INSERT de los detalles y UPDATE de la cabecera (más el savepoint)
+        for cantidad in (10, 100):
+            venta = self._venta(f'C{cantidad}')
+            lineas = self._lineas(cantidad)
+            with self.assertNumQueries(4):
+                crear_detalles(venta, lineas)
+
+
+class StockVentaAlConfirmarTest(TestCase):
+    """Cada venta descuenta todas sus líneas una sola vez, de la bodega de quien la procesa"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(nombre='Empresa Stock Venta', razon_social='Empresa Stock Venta', rut='76.000.016-7')
+        categoria = CategoriaArticulo.objects.create(empresa=cls.empresa, codigo='GEN', nombre='General')
+        unidad = UnidadMedida.objects.create(empresa=cls.empresa, nombre='Unidad', simbolo='UN')
+        # La primera bodega activa (por nombre) es la que usa el signal; la segunda es la de la caja
+        cls.principal = Bodega.objects.create(empresa=cls.empresa, codigo='B1', nombre='Bodega 1 Principal')
+        cls.bodega_caja = Bodega.objects.create(empresa=cls.empresa, codigo='B2', nombre='Bodega 2 Caja')
+        cls.articulos = [
+            Articulo.objects.create(
+                empresa=cls.empresa, categoria=categoria, unidad_medida=unidad, codigo=f'S{n}',
+                nombre=f'Artículo {n}', precio_venta='1000',
+            )
+            for n in range(3)
+        ]
+        for bodega in (cls.principal, cls.bodega_caja):
+            postear_documento(
+                cls.empresa, bodega, [LineaStock(articulo, 10, 500) for articulo in cls.articulos],
+                'entrada', 'prueba', bodega.id,
+            )
+
+    def _venta_por_lineas(self, numero, tipo_documento):
+        # Como el POS: cabecera confirmada y una línea a la vez
+        venta = Venta.objects.create(
+            empresa=self.empresa, numero_venta=numero, tipo_documento=tipo_documento, estado='confirmada'
+        )
+        for n, articulo in enumerate(self.articulos, start=1):
+            VentaDetalle.objects.create(venta=venta, articulo=articulo, cantidad=n, precio_unitario='1000')
+        return venta
+
+    def _saldos(self, bodega):
+        return [
+            Stock.objects.get(empresa=self.empresa, bodega=bodega, articulo=articulo).cantidad
+            for articulo in self.articulos
+        ]
+
+    def _assert_ledger_igual_stock(self):
+        saldos = saldos_desde_ledger(self.empresa)
+        for stock in Stock.objects.filter(empresa=self.empresa):
+            self.assertEqual(saldos.get((self.empresa.id, stock.bodega_id, stock.articulo_id), 0), stock.cantidad)
+
+    def test_venta_procesada_descuenta_de_la_bodega_de_la_caja(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket = self._venta_por_lineas('T-1', 'ticket')
+            with transaction.atomic():
+                venta_final = Venta.objects.create(
+                    empresa=self.empresa, numero_venta='F-1', tipo_documento='boleta', estado='confirmada'
+                )
+                copiar_detalles(ticket, venta_final)
+                descontar_stock_venta(venta_final, self.bodega_caja)
+
+        self.assertEqual(self._saldos(self.bodega_caja), [Decimal('9'), Decimal('8'), Decimal('7')])
+        self.assertEqual(self._saldos(self.principal), [Decimal('10')] * 3)
+        self.assertFalse(Inventario.objects.filter(documento_tipo='venta', documento_id=ticket.id).exists())
+        self.assertEqual(Inventario.objects.filter(documento_tipo='venta', documento_id=venta_final.id).count(), 3)
+        venta_final.refresh_from_db()
+        self.assertEqual(venta_final.subtotal, Decimal('6000'))
+        self._assert_ledger_igual_stock()
+
+    def test_venta_sin_caja_descuenta_todas_sus_lineas(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                venta = self._venta_por_lineas('B-1', 'boleta')
+
+        self.assertEqual(self._saldos(self.principal), [Decimal('9'), Decimal('8'), Decimal('7')])
+        self.assertEqual(self._saldos(self.bodega_caja), [Decimal('10')] * 3)
+        self.assertEqual(Inventario.objects.filter(documento_tipo='venta', documento_id=venta.id).count(), 3)
+
+        # La anulación repone lo descontado una sola vez
+        with self.captureOnCommitCallbacks(execute=True):
+            venta.estado = 'anulada'
+            venta.save()
+            venta.save()
+        self.assertEqual(self._saldos(self.principal), [Decimal('10')] * 3)
+        self._assert_ledger_igual_stock()
+
+
+class LibroVentasKeysetTest(TestCase):
+    """La paginación por cursor recorre el libro en el mismo orden que LIMIT/OFFSET, sin saltos ni repetidos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresa = Empresa.objects.create(nombre='Empresa Libro', razon_social='Empresa Libro', rut='76.000.015-8')
+        cafs = {
+            '39': crear_caf(cls.empresa, crear_sucursal(cls.empresa), 1, 100),
+            '61': crear_caf(cls.empresa, crear_sucursal(cls.empresa, 'S2'), 101, 200, '61'),
+        }
+        # Fechas y totales repetidos para forzar empates entre ventas y DTEs
+        for n in range(8):
+            Venta.objects.create(
+                empresa=cls.empresa, numero_venta=f'V-{n:04d}', fecha=date(2026, 3, 1 + n % 2),
+                tipo_documento='boleta' if n % 2 else 'factura', estado='confirmada', total=Decimal(1000 * (n % 3)),
+            )
+        for n in range(7):
+            tipo_dte = '61' if n == 3 else '39'
+            DocumentoTributarioElectronico.objects.create(
+                empresa=cls.empresa, caf_utilizado=cafs[tipo_dte], tipo_dte=tipo_dte, folio=cafs[tipo_dte].folio_desde + n,
+                fecha_emision=date(2026, 3, 1 + n % 2), rut_receptor='66666666-6',
+                razon_social_receptor=('Ana', 'beto', '')[n % 3], monto_neto=840, monto_iva=160,
+                monto_total=1000 * (n % 3),
+            )
+
+    def _libro(self):
+        return filtrar_documentos(self.empresa, {})
+
+    def _claves(self, filas):
+        return [(fila['es_dte'], fila['doc_id']) for fila in filas]
+
+    def test_cursor_sigue_el_orden_de_offset(self):
+        ventas, dtes = self._libro()
+        for sort in ORDENAMIENTOS:
+            for direction in ('asc', 'desc'):
+                with self.subTest(sort=sort, direction=direction):
+                    consulta, claves = documentos_ordenados(ventas, dtes, sort, direction)
+                    todas = list(consulta)
+                    esperado = self._claves(todas)
+                    self.assertEqual(len(esperado), 15)
+
+                    # Hacia adelante, de a 4, con el cursor codificado como en la URL
+                    recorrido, despues = [], None
+                    while True:
+                        consulta, _ = documentos_ordenados(
+                            ventas, dtes, sort, direction,
+                            despues=_decodificar_cursor(despues, claves) if despues else None,
+                        )
+                        filas = list(consulta[:4])
+                        if not filas:
+                            break
+                        recorrido += self._claves(filas)
+                        despues = _codificar_cursor(filas[-1], claves)
+                    self.assertEqual(recorrido, esperado)
+
+                    # Hacia atrás desde el final
+                    recorrido, antes = [esperado[-1]], _codificar_cursor(todas[-1], claves)
+                    while True:
+                        consulta, _ = documentos_ordenados(
+                            ventas, dtes, sort, direction, antes=_decodificar_cursor(antes, claves)
+                        )
+                        filas = list(consulta[:4])[::-1]
+                        if not filas:
+                            break
+                        recorrido = self._claves(filas) + recorrido
+                        antes = _codificar_cursor(filas[0], claves)
+                    self.assertEqual(recorrido, esperado)
+
+    def test_pagina_libro_con_cursores(self):
+        ventas, dtes = self._libro()
+        with mock.patch('ventas.libro_ventas.POR_PAGINA', 6):
+            primera, anterior, siguiente = pagina_libro(ventas, dtes, 'fecha', 'desc', 1)
+            self.assertEqual(anterior, '')
+            segunda, anterior, _ = pagina_libro(ventas, dtes, 'fecha', 'desc', 2, despues=siguiente)
+            por_offset, _, _ = pagina_libro(ventas, dtes, 'fecha', 'desc', 2)
+            self.assertEqual(
+                [(d.es_dte, d.pk) for d in segunda.object_list],
+                [(d.es_dte, d.pk) for d in por_offset.object_list],
+            )
+            de_vuelta, _, _ = pagina_libro(ventas, dtes, 'fecha', 'desc', 1, antes=anterior)
+            self.assertEqual(
+                [(d.es_dte, d.pk) for d in de_vuelta.object_list],
+                [(d.es_dte, d.pk) for d in primera.object_list],
+            )
+
+    def test_cursor_invalido_usa_offset(self):
+        ventas, dtes = self._libro()
+        self.assertIsNone(_decodificar_cursor('no-es-un-cursor', ORDENAMIENTOS['fecha'] + ('es_dte', 'doc_id')))
+        with mock.patch('ventas.libro_ventas.POR_PAGINA', 6):
+            pagina, _, _ = pagina_libro(ventas, dtes, 'fecha', 'desc', 1, despues='xxx')
+        self.assertEqual(len(pagina.object_list), 6)
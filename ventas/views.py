@@ -10,6 +10,7 @@ from django.urls import reverse
 from django.template.loader import get_template
 from decimal import Decimal
 from datetime import datetime, timedelta
+import logging
 from core.decorators import requiere_empresa
 from .models import Vendedor, FormaPago, Venta, VentaDetalle, EstacionTrabajo, TIPO_DOCUMENTO_CHOICES
 from .forms import VendedorForm, FormaPagoForm, EstacionTrabajoForm
@@ -25,6 +26,8 @@ from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
 
+logger = logging.getLogger(__name__)
+
 
 # ========== VENDEDORES ==========
 
@@ -458,83 +461,13 @@ def pos_buscar_articulo(request):
         
         print(f"=== No se encontró código comodín coincidente ===")
         
-        # Buscar por código de barras, código, nombre o descripción
-        articulos = Articulo.objects.filter(
-            empresa=request.empresa,
-            activo=True
-        ).filter(
-            Q(codigo_barras__icontains=query) |
-            Q(codigo__icontains=query) |
-            Q(nombre__icontains=query) |
-            Q(descripcion__icontains=query)
-        ).select_related('categoria', 'categoria__impuesto_especifico').order_by('nombre')[:100]
-        
-        print(f"Artículos encontrados: {articulos.count()}")
-        
-        # Obtener precios de la lista si está seleccionada
-        precios_lista = {}
-        if lista_precio_id:
-            from articulos.models import PrecioArticulo
-            precios = PrecioArticulo.objects.filter(
-                lista_precio_id=lista_precio_id,
-                articulo__in=articulos
-            ).select_related('articulo')
-            
-            for precio in precios:
-                precios_lista[precio.articulo_id] = float(precio.precio)
-        
-        results = []
-        for articulo in articulos:
-            try:
-                # Usar precio de la lista si existe, sino usar precio_venta del artículo
-                if articulo.id in precios_lista:
-                    precio_neto = precios_lista[articulo.id]
-                else:
-                    precio_neto = float(articulo.precio_venta)
-                
-                # Calcular IVA solo si la categoría NO está exenta
-                if articulo.categoria and articulo.categoria.exenta_iva:
-                    iva = 0.0
-                else:
-                    iva = precio_neto * 0.19
-                
-                # Calcular impuesto específico si aplica
-                impuesto_especifico = 0.0
-                impuesto_esp_pct = 0
-                if articulo.categoria and articulo.categoria.impuesto_especifico:
-                    try:
-                        porcentaje_decimal = float(articulo.categoria.impuesto_especifico.get_porcentaje_decimal())
-                        impuesto_especifico = precio_neto * porcentaje_decimal
-                        impuesto_esp_pct = float(articulo.categoria.impuesto_especifico.porcentaje)
-                    except:
-                        pass
-                
-                precio_final = round(precio_neto + iva + impuesto_especifico)
-                
-                # Obtener stock desde la bodega activa
-                from inventario.models import Stock
-                stock_disponible = 0
-                try:
-                    stock_obj = Stock.objects.filter(articulo=articulo, bodega__activa=True).first()
-                    if stock_obj:
-                        stock_disponible = float(stock_obj.cantidad)
-                except:
-                    pass
-                
-                results.append({
-                    'id': articulo.id,
-                    'codigo': articulo.codigo or '',
-                    'codigo_barras': articulo.codigo_barras or '',
-                    'nombre': articulo.nombre or '',
-                    'descripcion': articulo.descripcion or articulo.nombre or '',
-                    'precio': precio_final,
-                    'stock': stock_disponible,
-                    'categoria_exenta_iva': articulo.categoria.exenta_iva if articulo.categoria else False,
-                    'impuesto_especifico_porcentaje': impuesto_esp_pct,
-                })
-            except Exception as e:
-                print(f"Error procesando artículo {articulo.id}: {e}")
-                continue
+        # Buscar en el índice en memoria (código de barras, código, nombre o descripción)
+        from .busqueda_pos import buscar_articulos, buscar_articulos_orm
+        try:
+            results = buscar_articulos(request.empresa.id, query, lista_precio_id=lista_precio_id or None)
+        except Exception as e:
+            logger.exception("Error en índice de búsqueda POS, usando consulta directa: %s", e)
+            results = buscar_articulos_orm(request.empresa, query, lista_precio_id=lista_precio_id or None)
         
         print(f"Retornando {len(results)} artículos para búsqueda '{query}'")
         return JsonResponse({'articulos': results})
@@ -564,12 +497,14 @@ def pos_agregar_articulo(request):
         if cantidad <= 0:
             return JsonResponse({'success': False, 'error': 'La cantidad debe ser mayor a 0'})
         
+        # Verificar si el artículo ya está en la venta
+        detalle_existente = VentaDetalle.objects.filter(venta=venta, articulo=articulo).first()
+        
         # Verificar stock disponible si el artículo tiene control de stock
         if articulo.control_stock:
             stock_disponible = articulo.stock_disponible
             
-            # Verificar si el artículo ya está en la venta para calcular el total
-            detalle_existente = VentaDetalle.objects.filter(venta=venta, articulo=articulo).first()
+            # Sumar lo que ya está en la venta para calcular el total
             cantidad_en_venta = detalle_existente.cantidad if detalle_existente else Decimal('0')
             cantidad_total = cantidad_en_venta + cantidad
             
@@ -587,21 +522,24 @@ def pos_agregar_articulo(request):
             empresa=request.empresa
         )
         
-        # Verificar si el artículo ya está en la venta
-        detalle_existente = VentaDetalle.objects.filter(venta=venta, articulo=articulo).first()
+        from .documentos import recalcular_totales
         
-        if detalle_existente:
-            # Actualizar cantidad
-            detalle_existente.cantidad += cantidad
-            detalle_existente.save()
-        else:
-            # Crear nuevo detalle con precio especial si aplica
-            VentaDetalle.objects.create(
-                venta=venta,
-                articulo=articulo,
-                cantidad=cantidad,
-                precio_unitario=precio_unitario
-            )
+        with transaction.atomic():
+            if detalle_existente:
+                # Actualizar cantidad
+                detalle_existente.cantidad += cantidad
+                detalle_existente.save(recalcular_venta=False)
+            else:
+                # Crear nuevo detalle con precio especial si aplica
+                VentaDetalle(
+                    venta=venta,
+                    articulo=articulo,
+                    cantidad=cantidad,
+                    precio_unitario=precio_unitario
+                ).save(recalcular_venta=False)
+            
+            # Un solo recálculo de la cabecera (consulta agregada + UPDATE)
+            recalcular_totales(venta)
         
         return JsonResponse({'success': True})
         
@@ -865,8 +803,8 @@ def pos_view(request):
     
     # Generar próximo número de venta basado en el correlativo de la estación actual
     # CRÍTICO: Debe mostrar el siguiente número que se asignará al próximo vale de esta estación
-    print(f"[DEBUG POS] Estación ID en sesión: {estacion_id}")
-    print(f"[DEBUG POS] Estación activa encontrada: {estacion_activa}")
+    logger.debug("Estación ID en sesión: %s", estacion_id)
+    logger.debug("Estación activa encontrada: %s", estacion_activa)
     
     if estacion_activa:
         # Usar el correlativo actual de la estación (sin incrementar, solo para mostrar)
@@ -874,24 +812,24 @@ def pos_view(request):
         estacion_activa.refresh_from_db()
         correlativo_actual = estacion_activa.correlativo_ticket
         proximo_numero = f"{correlativo_actual:06d}"
-        print(f"[DEBUG POS] Estación: {estacion_activa.nombre}, Correlativo actual: {correlativo_actual}, Próximo número mostrado: {proximo_numero}")
+        logger.debug("Estación: %s, Correlativo actual: %s, Próximo número mostrado: %s", estacion_activa.nombre, correlativo_actual, proximo_numero)
     else:
         # Fallback si no hay estación activa - usar último vale de la empresa
-        print(f"[DEBUG POS] No hay estación activa, usando fallback")
+        logger.debug("No hay estación activa, usando fallback")
         ultima_venta = Venta.objects.filter(empresa=request.empresa, tipo_documento='vale').order_by('-numero_venta').first()
         if ultima_venta:
             try:
                 numero_actual = int(ultima_venta.numero_venta)
                 proximo_numero = f"{numero_actual + 1:06d}"
-                print(f"[DEBUG POS] Fallback: Último vale encontrado: {ultima_venta.numero_venta}, Próximo: {proximo_numero}")
+                logger.debug("Fallback: Último vale encontrado: %s, Próximo: %s", ultima_venta.numero_venta, proximo_numero)
             except ValueError:
                 proximo_numero = "000001"
-                print(f"[DEBUG POS] Fallback: Error al convertir número, usando 000001")
+                logger.debug("Fallback: Error al convertir número, usando 000001")
         else:
             proximo_numero = "000001"
-            print(f"[DEBUG POS] Fallback: No hay vales, usando 000001")
+            logger.debug("Fallback: No hay vales, usando 000001")
     
-    print(f"[DEBUG POS] NÚMERO FINAL QUE SE MOSTRARÁ EN EL POS: {proximo_numero}")
+    logger.debug("NÚMERO FINAL QUE SE MOSTRARÁ EN EL POS: %s", proximo_numero)
     
     # Cargar kits de ofertas disponibles
     kits = KitOferta.objects.filter(
@@ -2024,16 +1962,9 @@ def pos_procesar_preventa(request):
                                 usuario_creacion=request.user
                             )
                             
-                            # Copiar detalles
-                            for detalle in preventa.ventadetalle_set.all():
-                                VentaDetalle.objects.create(
-                                    venta=venta_final,
-                                    articulo=detalle.articulo,
-                                    cantidad=detalle.cantidad,
-                                    precio_unitario=detalle.precio_unitario,
-                                    precio_total=detalle.precio_total,
-                                    impuesto_especifico=detalle.impuesto_especifico
-                                )
+                            # Copiar detalles (en bloque: la cabecera se guarda una vez)
+                            from .documentos import copiar_detalles
+                            copiar_detalles(preventa, venta_final)
                             
                             # Crear movimiento de caja (solo si NO es guía)
                             if tipo_doc_planeado != 'guia' and forma_pago:
@@ -2060,18 +1991,12 @@ def pos_procesar_preventa(request):
                                 dte_generado=dte
                             )
                             
-                            # Descontar stock
-                            from inventario.models import Stock
+                            # Descontar stock de la venta final desde la bodega de la caja
+                            # (con movimientos de inventario, idempotente por venta)
+                            from inventario.services import descontar_stock_venta
                             bodega_caja = apertura_activa.caja.bodega
-                            for detalle in preventa.ventadetalle_set.all():
-                                stock = Stock.objects.filter(
-                                    empresa=request.empresa,
-                                    bodega=bodega_caja,
-                                    articulo=detalle.articulo
-                                ).first()
-                                if stock:
-                                    stock.cantidad -= detalle.cantidad
-                                    stock.save()
+                            if bodega_caja:
+                                descontar_stock_venta(venta_final, bodega_caja)
                             
                             # Marcar ticket como facturado
                             preventa.facturado = True
@@ -2087,9 +2012,8 @@ def pos_procesar_preventa(request):
                             # Enviar al SII si corresponde
                             if estacion.enviar_sii_directo and request.empresa.facturacion_electronica:
                                 try:
-                                    from facturacion_electronica.background_sender import get_background_sender
-                                    sender = get_background_sender()
-                                    if sender.enviar_dte(dte.id, request.empresa.id):
+                                    from facturacion_electronica.cola_envio import encolar_dte
+                                    if encolar_dte(dte.id, request.empresa.id):
                                         print("[OK] CIERRE DIRECTO TICKET: DTE agregado a cola de envío")
                                 except Exception as e_envio:
                                     print(f"[WARN] Error al enviar DTE: {e_envio}")
@@ -2170,18 +2094,12 @@ def pos_procesar_preventa(request):
                             )
                             apertura_activa.calcular_totales()
                             
-                            # Descontar stock
-                            from inventario.models import Stock
+                            # Descontar stock del vale desde la bodega de la caja
+                            # (con movimientos de inventario, idempotente por venta)
+                            from inventario.services import descontar_stock_venta
                             bodega_caja = apertura_activa.caja.bodega
-                            for detalle in preventa.ventadetalle_set.all():
-                                stock = Stock.objects.filter(
-                                    empresa=request.empresa,
-                                    bodega=bodega_caja,
-                                    articulo=detalle.articulo
-                                ).first()
-                                if stock:
-                                    stock.cantidad -= detalle.cantidad
-                                    stock.save()
+                            if bodega_caja:
+                                descontar_stock_venta(preventa, bodega_caja)
                     else:
                         print("[WARN] VALE INTERNO: No se encontró forma de pago por defecto")
                 else:
@@ -2604,16 +2522,9 @@ def pos_procesar_preventa(request):
                                     usuario_creacion=request.user
                                 )
                                 
-                                # Copiar detalles del ticket a la venta final
-                                for detalle in preventa.ventadetalle_set.all():
-                                    VentaDetalle.objects.create(
-                                        venta=venta_final,
-                                        articulo=detalle.articulo,
-                                        cantidad=detalle.cantidad,
-                                        precio_unitario=detalle.precio_unitario,
-                                        precio_total=detalle.precio_total,
-                                        impuesto_especifico=detalle.impuesto_especifico
-                                    )
+                                # Copiar detalles del ticket a la venta final (en bloque)
+                                from .documentos import copiar_detalles
+                                copiar_detalles(preventa, venta_final)
                                 print(f"[OK] CIERRE DIRECTO: Venta final creada - ID {venta_final.id}")
                             else:
                                 print(f"[INFO] CIERRE DIRECTO: Venta final ya existe - ID {venta_final.id}, reutilizando")
@@ -2669,22 +2580,13 @@ def pos_procesar_preventa(request):
                                 dte_generado=dte
                             )
                             
-                            # Descontar stock
-                            from inventario.models import Stock
+                            # Descontar stock de la venta final desde la bodega de la caja
+                            # (con movimientos de inventario, idempotente por venta)
+                            from inventario.services import descontar_stock_venta
                             bodega_caja = apertura_activa.caja.bodega
-                            
-                            for detalle in ticket_vale.ventadetalle_set.all():
-                                # Buscar stock en la bodega de la caja
-                                stock = Stock.objects.filter(
-                                    empresa=request.empresa,
-                                    bodega=bodega_caja,
-                                    articulo=detalle.articulo
-                                ).first()
-                                
-                                if stock:
-                                    stock.cantidad -= detalle.cantidad
-                                    stock.save()
-                                    print(f"[CIERRE DIRECTO] Stock descontado: {detalle.articulo.nombre} - {detalle.cantidad}")
+                            if bodega_caja:
+                                movimientos = descontar_stock_venta(venta_final, bodega_caja)
+                                print(f"[CIERRE DIRECTO] Stock descontado: {movimientos} movimientos en bodega {bodega_caja.nombre}")
                             
                             # Generar URL del documento y enviar al SII si corresponde
                             doc_url = None
@@ -2699,10 +2601,9 @@ def pos_procesar_preventa(request):
                                 # Enviar al SII si está configurado (en segundo plano)
                                 if estacion.enviar_sii_directo and request.empresa.facturacion_electronica:
                                     try:
-                                        from facturacion_electronica.background_sender import get_background_sender
+                                        from facturacion_electronica.cola_envio import encolar_dte
                                         
-                                        sender = get_background_sender()
-                                        if sender.enviar_dte(dte.id, request.empresa.id):
+                                        if encolar_dte(dte.id, request.empresa.id):
                                             print("[OK] CIERRE DIRECTO: DTE agregado a cola de envío (background)")
                                         else:
                                             print("[WARN] CIERRE DIRECTO: No se pudo agregar DTE a cola")
@@ -3673,6 +3574,14 @@ def venta_html(request, pk):
             print(f"[WARN] Error al buscar DTE: {str(e)}")
             pass
     
+    # El timbre se genera al crear el DTE y aquí sólo se lee del caché; si aún
+    # no está, se reintenta en unos segundos en vez de imprimir sin él
+    if dte:
+        from facturacion_electronica.timbre_pdf417 import respuesta_timbre_pendiente
+        pendiente = respuesta_timbre_pendiente(request, dte)
+        if pendiente:
+            return pendiente
+    
     # Determinar el template según el tipo de documento Y tipo de impresora configurado
     empresa = venta.empresa
     
@@ -3992,16 +3901,12 @@ def cotizacion_convertir_venta(request, pk):
                 usuario_creacion=request.user
             )
             
-            # Copiar detalles
-            for detalle in cotizacion.ventadetalle_set.all():
-                VentaDetalle.objects.create(
-                    venta=nueva_venta,
-                    articulo=detalle.articulo,
-                    cantidad=detalle.cantidad,
-                    precio_unitario=detalle.precio_unitario,
-                    precio_total=detalle.precio_total,
-                    impuesto_especifico=detalle.impuesto_especifico
-                )
+            # Copiar detalles (un bulk_create y un solo cálculo de totales)
+            from .documentos import LineaVenta, crear_detalles
+            crear_detalles(nueva_venta, [
+                LineaVenta(detalle.articulo, detalle.cantidad, detalle.precio_unitario)
+                for detalle in cotizacion.ventadetalle_set.select_related('articulo')
+            ])
             
             # Actualizar estado de la cotización
             cotizacion.estado_cotizacion = 'convertida'
@@ -4323,9 +4228,7 @@ def libro_ventas(request):
     Libro de Ventas - Listado completo de documentos emitidos (Ventas + DTEs)
     con filtros avanzados por tipo, fecha, cliente, vendedor y forma de pago
     """
-    from facturacion_electronica.models import DocumentoTributarioElectronico
-    from itertools import chain
-    from operator import attrgetter
+    from .libro_ventas import filtrar_documentos, pagina_libro, totales_libro
     
     # Fecha por defecto: primer día del año hasta hoy
     hoy = timezone.now().date()
@@ -4341,213 +4244,37 @@ def libro_ventas(request):
     estado = request.GET.get('estado', '')
     search = request.GET.get('search', '')
     
-    # Consulta base: ventas confirmadas SIN DTE asociado
-    # (Excluimos todas las ventas del POS que no han sido convertidas a DTE para que el Libro de Ventas sea oficial)
-    # EXCLUIMOS Guías de Despacho ya que ahora tienen su propio libro
-    ventas = Venta.objects.filter(
-        empresa=request.empresa,
-        estado='confirmada',
-        dte__isnull=True
-    ).exclude(
-        Q(numero_venta__icontains='test') | 
-        Q(tipo_documento__in=['cotizacion', 'guia'])
-    ).select_related('cliente', 'vendedor', 'forma_pago', 'estacion_trabajo')
-    
-    # Consulta DTEs (Documentos Tributarios Electrónicos)
-    # EXCLUIMOS Guías de Despacho (Tipo 52)
-    dtes = DocumentoTributarioElectronico.objects.filter(
-        empresa=request.empresa
-    ).exclude(
-        Q(folio__icontains='test') |
-        Q(tipo_dte='52')
-    ).select_related('caf_utilizado', 'usuario_creacion', 'venta').prefetch_related('usuario_creacion', 'notas_credito')
-    
-    # Aplicar filtros de fecha
+    filtros = {
+        'tipo_documento': tipo_documento,
+        'cliente_id': cliente_id,
+        'vendedor_id': vendedor_id,
+        'forma_pago_id': forma_pago_id,
+        'estado': estado,
+        'search': search,
+    }
     try:
-        fecha_desde_obj = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
-        fecha_hasta_obj = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
-        ventas = ventas.filter(fecha__gte=fecha_desde_obj, fecha__lte=fecha_hasta_obj)
-        dtes = dtes.filter(fecha_emision__gte=fecha_desde_obj, fecha_emision__lte=fecha_hasta_obj)
+        filtros['fecha_desde'] = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
+        filtros['fecha_hasta'] = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
     except ValueError:
         pass
     
-    # Filtrar por tipo de documento
-    if tipo_documento:
-        if tipo_documento in ['33', '34', '39', '41', '52', '56', '61']:
-            # Es un DTE
-            dtes = dtes.filter(tipo_dte=tipo_documento)
-            ventas = ventas.none()
-        else:
-            # Es una venta del POS
-            ventas = ventas.filter(tipo_documento=tipo_documento)
-            dtes = dtes.none()
-    
-    # Filtros adicionales para ventas y DTEs
-    if ventas.exists():
-        if cliente_id:
-            ventas = ventas.filter(cliente_id=cliente_id)
-        
-        if vendedor_id:
-            ventas = ventas.filter(vendedor_id=vendedor_id)
-        
-        if forma_pago_id:
-            ventas = ventas.filter(forma_pago_id=forma_pago_id)
-        
-        if estado:
-            ventas = ventas.filter(estado=estado)
-    
-    # Filtros para DTEs (usar venta asociada si existe)
-    if dtes.exists():
-        if cliente_id:
-            dtes = dtes.filter(
-                Q(venta__cliente_id=cliente_id) |
-                Q(rut_receptor__icontains=cliente_id)
-            )
-        
-        if vendedor_id:
-            dtes = dtes.filter(venta__vendedor_id=vendedor_id)
-        
-        if forma_pago_id:
-            dtes = dtes.filter(venta__forma_pago_id=forma_pago_id)
-    
-    # Búsqueda en ambos tipos
-    if search:
-        if ventas.exists():
-            ventas = ventas.filter(
-                Q(numero_venta__icontains=search) |
-                Q(cliente__nombre__icontains=search) |
-                Q(cliente__rut__icontains=search) |
-                Q(observaciones__icontains=search)
-            )
-        if dtes.exists():
-            dtes = dtes.filter(
-                Q(folio__icontains=search) |
-                Q(razon_social_receptor__icontains=search) |
-                Q(rut_receptor__icontains=search) |
-                Q(glosa_sii__icontains=search)
-            )
-    
-    # Combinar ventas y DTEs
-    ventas_list = list(ventas)
-    dtes_list = list(dtes)
+    # Ventas del POS sin DTE + DTEs (sin Guías de Despacho, que tienen su propio libro)
+    ventas, dtes = filtrar_documentos(request.empresa, filtros)
     
     # Parámetros de ordenamiento
     sort = request.GET.get('sort', 'tipo_folio')
     direction = request.GET.get('direction', 'desc')
     
-    for venta in ventas_list:
-        venta.fecha_documento = venta.fecha
-        venta.es_dte = False
-        # Mapeo de tipos para ordenamiento consistente
-        tipo_map = {'factura': '33', 'boleta': '39', 'guia': '52', 'nota_credito': '61', 'nota_debito': '56'}
-        venta.sort_tipo = tipo_map.get(venta.tipo_documento, '99')
-        try:
-            import re
-            venta.sort_folio = int(re.sub(r'\D', '', str(venta.numero_venta))) if venta.numero_venta else 0
-        except:
-            venta.sort_folio = 0
-    
-    for dte in dtes_list:
-        dte.fecha_documento = dte.fecha_emision
-        dte.es_dte = True
-        dte.sort_tipo = getattr(dte, 'tipo_dte', '99')
-        try:
-            dte.sort_folio = int(dte.folio) if dte.folio else 0
-        except:
-            dte.sort_folio = 0
-        # Marcar y ajustar montos para Notas de Crédito (tipo 61) como negativos
-        dte.es_nota_credito = (getattr(dte, 'tipo_dte', '') == '61')
-        if dte.es_nota_credito:
-            dte.monto_neto = -(dte.monto_neto or 0)
-            dte.monto_iva = -(dte.monto_iva or 0)
-            dte.monto_total = -(dte.monto_total or 0)
-            # Exponer ID de Nota de Crédito asociada (si existe) para el template
-            try:
-                nc = dte.notas_credito.all()[0] if hasattr(dte, 'notas_credito') and dte.notas_credito.all() else None
-                dte.notacredito_id = nc.id if nc else None
-            except Exception:
-                dte.notacredito_id = None
-    
-    # Definir la función de clave para ordenamiento
-    def get_sort_key(doc):
-        if sort == 'tipo_folio':
-            return (doc.sort_tipo, doc.sort_folio)
-        elif sort == 'fecha':
-            return doc.fecha_documento
-        elif sort == 'folio':
-            return doc.sort_folio
-        elif sort == 'cliente':
-            if hasattr(doc, 'razon_social_receptor'):
-                return (doc.razon_social_receptor or '').lower()
-            return (doc.cliente.nombre if doc.cliente else '').lower()
-        elif sort == 'total':
-            return getattr(doc, 'monto_total', getattr(doc, 'total', 0))
-        return doc.fecha_documento
-
-    reverse_sort = direction == 'desc'
-    # Si es tipo_folio y asc, normalmente queremos tipo asc y folio asc.
-    
-    documentos = sorted(
-        chain(ventas_list, dtes_list),
-        key=get_sort_key,
-        reverse=reverse_sort
+    # UNION ALL ordenado y paginado en la BD: sólo se cargan los documentos de la página
+    page_obj, cursor_anterior, cursor_siguiente = pagina_libro(
+        ventas, dtes, sort, direction,
+        numero_pagina=request.GET.get('page'),
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
     )
     
-    # Estadísticas del período (solo si hay datos)
-    if ventas.exists():
-        stats_ventas = ventas.aggregate(
-            total_neto=Sum('neto'),
-            total_iva=Sum('iva'),
-            total_general=Sum('total')
-        )
-    else:
-        stats_ventas = {'total_neto': 0, 'total_iva': 0, 'total_general': 0}
-    
-    # Calcular stats DTE desde la lista ajustada (NC negativas)
-    if dtes_list:
-        from decimal import Decimal as _Dec
-        stats_dtes = {
-            'total_neto': sum((d.monto_neto or 0) for d in dtes_list) or _Dec('0'),
-            'total_iva': sum((d.monto_iva or 0) for d in dtes_list) or _Dec('0'),
-            'total_general': sum((d.monto_total or 0) for d in dtes_list) or _Dec('0'),
-        }
-    else:
-        stats_dtes = {'total_neto': 0, 'total_iva': 0, 'total_general': 0}
-    
-    estadisticas = {
-        'total_documentos': len(documentos),
-        'total_neto': (stats_ventas['total_neto'] or 0) + (stats_dtes['total_neto'] or 0),
-        'total_iva': (stats_ventas['total_iva'] or 0) + (stats_dtes['total_iva'] or 0),
-        'total_general': (stats_ventas['total_general'] or 0) + (stats_dtes['total_general'] or 0),
-    }
-    
-    # Estadísticas por tipo
-    stats_ventas_tipo = ventas.values('tipo_documento').annotate(
-        cantidad=Count('id'),
-        total=Sum('total')
-    )
-    
-    # Construir stats por tipo DTE desde la lista (NC como negativas)
-    from collections import defaultdict
-    from decimal import Decimal as _Dec
-    dte_stats_map = defaultdict(lambda: {'cantidad': 0, 'total': _Dec('0')})
-    for d in dtes_list:
-        t = getattr(d, 'tipo_dte', None)
-        if not t:
-            continue
-        dte_stats_map[t]['cantidad'] += 1
-        dte_stats_map[t]['total'] += (d.monto_total or _Dec('0'))
-    stats_dtes_tipo = [
-        {'tipo_documento': k, 'cantidad': v['cantidad'], 'total': v['total']}
-        for k, v in dte_stats_map.items()
-    ]
-
-    stats_por_tipo = list(stats_ventas_tipo) + stats_dtes_tipo
-    
-    # Paginación
-    paginator = Paginator(documentos, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Estadísticas del período con consultas agregadas (NC como negativas)
+    estadisticas, stats_por_tipo = totales_libro(ventas, dtes)
     
     # Opciones para filtros
     clientes = request.empresa.cliente_set.filter(estado='activo').order_by('nombre')
@@ -4580,6 +4307,8 @@ def libro_ventas(request):
         'search': search,
         'sort': sort,
         'direction': direction,
+        'cursor_anterior': cursor_anterior,
+        'cursor_siguiente': cursor_siguiente,
         'clientes': clientes,
         'vendedores': vendedores,
         'formas_pago': formas_pago,
@@ -4672,6 +4401,7 @@ def precio_cliente_list(request):
 @permission_required('ventas.add_precioclientearticulo', raise_exception=True)
 def precio_cliente_create(request):
     """Crear precio especial"""
+    from django.db.models.functions import Round
     from .models import PrecioClienteArticulo
     from .forms import PrecioClienteArticuloForm
     from clientes.models import Cliente
@@ -4695,7 +4425,10 @@ def precio_cliente_create(request):
     
     # Preparar artículos con sus precios FINALES (con IVA e impuestos) para JavaScript
     articulos = Articulo.objects.filter(empresa=request.empresa, activo=True).order_by('nombre')
-    articulos_precios = {str(a.id): int(round(float(a.precio_final))) for a in articulos}
+    articulos_precios = {
+        str(articulo_id): int(precio)
+        for articulo_id, precio in articulos.annotate(precio_redondeado=Round('precio_final')).values_list('id', 'precio_redondeado')
+    }
     
     form.fields['articulo'].queryset = articulos
     
@@ -4710,6 +4443,7 @@ def precio_cliente_create(request):
 @permission_required('ventas.change_precioclientearticulo', raise_exception=True)
 def precio_cliente_edit(request, pk):
     """Editar precio especial"""
+    from django.db.models.functions import Round
     from .models import PrecioClienteArticulo
     from .forms import PrecioClienteArticuloForm
     from clientes.models import Cliente
@@ -4733,7 +4467,10 @@ def precio_cliente_edit(request, pk):
         
         # Preparar artículos con sus precios FINALES (con IVA e impuestos) para JavaScript
         articulos = Articulo.objects.filter(empresa=request.empresa, activo=True).order_by('nombre')
-        articulos_precios = {str(a.id): int(round(float(a.precio_final))) for a in articulos}
+        articulos_precios = {
+            str(articulo_id): int(precio)
+            for articulo_id, precio in articulos.annotate(precio_redondeado=Round('precio_final')).values_list('id', 'precio_redondeado')
+        }
         
         form.fields['articulo'].queryset = articulos
         
@@ -4987,42 +4724,23 @@ def mobile_api_sync(request):
         } for cat in categorias]
         
         # Artículos (Solo los activos y que sean productos de venta)
-        articulos = Articulo.objects.filter(empresa=request.empresa, activo=True).select_related('categoria')
-        articulos_data = []
-        for art in articulos:
-            try:
-                # Limpiar strings de precios de manera robusta
-                def clean_price(val):
-                    if not val: return Decimal('0')
-                    s_val = str(val).strip()
-                    # Si tiene coma, es formato chileno (1.234,56)
-                    if ',' in s_val:
-                        s_val = s_val.replace('.', '').replace(',', '.')
-                    # Si no tiene coma, el punto ya es el decimal o no hay.
-                    try:
-                        return Decimal(s_val)
-                    except:
-                        return Decimal('0')
-
-                p_final = clean_price(art.precio_final)
-                p_venta = clean_price(art.precio_venta)
-                
-                # Si el precio final es 0, usamos el de venta directamente
-                if p_final == 0:
-                    p_final = p_venta
-                
-                articulos_data.append({
-                    'id': art.id,
-                    'codigo': art.codigo,
-                    'codigo_barras': art.codigo_barras,
-                    'nombre': art.nombre,
-                    'precio': int(p_final.quantize(Decimal('1'), rounding='ROUND_HALF_UP')),
-                    'categoria_id': art.categoria_id,
-                    'stock': art.stock_actual,
-                })
-            except Exception as e_art:
-                print(f"[ERROR] Sync Articulo {art.id}: {e_art}")
-                continue
+        # Precio redondeado en la base de datos; si el precio final es 0 se usa el de venta
+        from django.db.models import Case, F, When
+        from django.db.models.functions import Round
+        from inventario.services import saldos_stock
+        articulos = list(Articulo.objects.filter(empresa=request.empresa, activo=True).annotate(
+            precio_sync=Round(Case(When(precio_final=0, then=F('precio_venta')), default=F('precio_final')))
+        ).values('id', 'codigo', 'codigo_barras', 'nombre', 'precio_sync', 'categoria_id'))
+        stocks = saldos_stock(request.empresa, [art['id'] for art in articulos])
+        articulos_data = [{
+            'id': art['id'],
+            'codigo': art['codigo'],
+            'codigo_barras': art['codigo_barras'],
+            'nombre': art['nombre'],
+            'precio': int(art['precio_sync'] or 0),
+            'categoria_id': art['categoria_id'],
+            'stock': int(stocks.get(art['id']) or 0),
+        } for art in articulos]
 
         # Clientes (Centralizados por vendedor si se especifica)
         vendedor_id_sync = request.GET.get('vendedor_id')
@@ -5346,19 +5064,18 @@ def mobile_api_save_sale(request):
             observaciones=data.get('observaciones', f"[MOVIL] Doc Solicitado: {tipo_documento_solicitado}")
         )
         
-        # 4. Crear Detalles
+        # 4. Crear Detalles y recalcular totales para asegurar consistencia
+        from .documentos import LineaVenta, crear_detalles
+        articulos = Articulo.objects.filter(empresa=request.empresa).in_bulk(
+            [int(item['id']) for item in items]
+        )
+        lineas = []
         for item in items:
-            articulo = Articulo.objects.get(id=item['id'], empresa=request.empresa)
-            VentaDetalle.objects.create(
-                venta=venta,
-                articulo=articulo,
-                cantidad=Decimal(str(item['cantidad'])),
-                precio_unitario=Decimal(str(item['precio'])),
-                precio_total=Decimal(str(item['total']))
-            )
-            
-        # Recalcular totales para asegurar consistencia
-        venta.calcular_totales()
+            articulo = articulos.get(int(item['id']))
+            if articulo is None:
+                raise Articulo.DoesNotExist(f"Artículo {item['id']} no encontrado")
+            lineas.append(LineaVenta(articulo, item['cantidad'], item['precio']))
+        crear_detalles(venta, lineas)
         
         return JsonResponse({
             'success': True,
@@ -5546,38 +5263,50 @@ def mobile_api_cliente_historial(request):
 def libro_ventas_excel(request):
     """
     Exporta el Libro de Ventas a Excel con formato elegante, sucursal y vendedor.
+    Se genera en segundo plano (ver generar_libro_ventas_excel).
+    """
+    from informes.views_trabajos import iniciar_exportacion
+    return iniciar_exportacion(request, 'libro_ventas_excel', 'Libro de Ventas')
+
+
+def generar_libro_ventas_excel(empresa, parametros, progreso):
+    """
+    Genera el Excel del Libro de Ventas para un TrabajoExportacion.
+    parametros son los mismos filtros GET de libro_ventas. Usa el motor
+    write-only de informes.exportador_excel: la memoria no depende de la
+    cantidad de documentos.
     """
     from facturacion_electronica.models import DocumentoTributarioElectronico
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-    from django.http import HttpResponse
+    from informes.exportador_excel import CONTENT_TYPE_XLSX, Columna, ExportacionExcel, iterar
     from django.db.models import Q
+    from django.db.models.functions import Length
     from datetime import datetime
+    import heapq
     import re
     
     # --- LOGICA DE FILTRADO (Consistente con libro_ventas) ---
     hoy = timezone.now().date()
     primer_dia_ano = hoy.replace(month=1, day=1)
     
-    fecha_desde = request.GET.get('fecha_desde', primer_dia_ano.strftime('%Y-%m-%d'))
-    fecha_hasta = request.GET.get('fecha_hasta', hoy.strftime('%Y-%m-%d'))
-    tipo_documento = request.GET.get('tipo_documento', '')
-    cliente_id = request.GET.get('cliente', '')
-    vendedor_id = request.GET.get('vendedor', '')
-    forma_pago_id = request.GET.get('forma_pago', '')
-    search = request.GET.get('search', '')
+    fecha_desde = parametros.get('fecha_desde', primer_dia_ano.strftime('%Y-%m-%d'))
+    fecha_hasta = parametros.get('fecha_hasta', hoy.strftime('%Y-%m-%d'))
+    tipo_documento = parametros.get('tipo_documento', '')
+    cliente_id = parametros.get('cliente', '')
+    vendedor_id = parametros.get('vendedor', '')
+    forma_pago_id = parametros.get('forma_pago', '')
+    search = parametros.get('search', '')
 
     # Consultas base
     # Solo Boletas y Facturas confirmadas (oficiales)
     ventas = Venta.objects.filter(
-        empresa=request.empresa, 
+        empresa=empresa, 
         estado='confirmada', 
         tipo_documento__in=['boleta', 'factura'],
         dte__isnull=True
     ).select_related('cliente', 'vendedor', 'forma_pago', 'sucursal')
     
     dtes = DocumentoTributarioElectronico.objects.filter(
-        empresa=request.empresa
+        empresa=empresa
     ).exclude(
         tipo_dte='52'
     ).select_related('venta', 'venta__cliente', 'venta__vendedor', 'venta__sucursal')
@@ -5622,134 +5351,109 @@ def libro_ventas_excel(request):
             Q(rut_receptor__icontains=search)
         )
 
-    # Procesar documentos para el reporte
-    documentos = []
-    for v in ventas:
-        documentos.append({
-            'fecha': v.fecha,
-            'tipo': v.get_tipo_documento_display(),
-            'folio': v.numero_venta,
-            'rut': v.cliente.rut if v.cliente else '-',
-            'nombre': v.cliente.nombre if v.cliente else 'Cliente General',
-            'neto': v.subtotal or 0,
-            'iva': v.iva or 0,
-            'total': v.total or 0,
-            'estado': v.estado.upper(),
-            'vendedor': v.vendedor.nombre if v.vendedor else 'Sin asignar',
-            'vendedor_cod': v.vendedor.codigo if v.vendedor else '-',
-            'sucursal': v.sucursal.nombre if v.sucursal else 'Casa Matriz'
-        })
-    
-    for d in dtes:
-        monto_factor = -1 if d.tipo_dte == '61' else 1
-        documentos.append({
-            'fecha': d.fecha_emision,
-            'tipo': d.get_tipo_dte_display(),
-            'folio': d.folio or '-',
-            'rut': d.rut_receptor or '-',
-            'nombre': d.razon_social_receptor or 'Cliente General',
-            'neto': (d.monto_neto or 0) * monto_factor,
-            'iva': (d.monto_iva or 0) * monto_factor,
-            'total': (d.monto_total or 0) * monto_factor,
-            'estado': d.estado_sii.upper() if d.estado_sii else 'GENERADO',
-            'vendedor': (d.venta.vendedor.nombre if d.venta and d.venta.vendedor else 'Sin asignar'),
-            'vendedor_cod': (d.venta.vendedor.codigo if d.venta and d.venta.vendedor else '-'),
-            'sucursal': (d.venta.sucursal.nombre if d.venta and d.venta.sucursal else 'Casa Matriz')
-        })
-    
-    # Ordenar por fecha y folio (numérico si es posible)
+    # Cada consulta llega ordenada desde la BD (fecha y folio descendentes) y
+    # se mezclan a medida que se escriben: ni los documentos ni el libro se
+    # cargan completos en memoria
     def sort_folio(val):
         try: return int(re.sub(r'\D', '', str(val)))
         except: return 0
-    
-    documentos.sort(key=lambda x: (x['fecha'], sort_folio(x['folio'])), reverse=True)
 
-    # --- GENERACION EXCEL ---
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Libro de Ventas"
+    def filas_ventas():
+        # Largo y luego texto: orden numérico de numero_venta sin convertirlo en la BD
+        for v in iterar(ventas.order_by('-fecha', Length('numero_venta').desc(), '-numero_venta')):
+            yield {
+                'fecha': v.fecha,
+                'tipo': v.get_tipo_documento_display(),
+                'folio': v.numero_venta,
+                'rut': v.cliente.rut if v.cliente else '-',
+                'nombre': v.cliente.nombre if v.cliente else 'Cliente General',
+                'neto': v.subtotal or 0,
+                'iva': v.iva or 0,
+                'total': v.total or 0,
+                'estado': v.estado.upper(),
+                'vendedor': v.vendedor.nombre if v.vendedor else 'Sin asignar',
+                'vendedor_cod': v.vendedor.codigo if v.vendedor else '-',
+                'sucursal': v.sucursal.nombre if v.sucursal else 'Casa Matriz'
+            }
 
-    # Estilos
-    header_fill = PatternFill(start_color="8B7355", end_color="6F5B44", fill_type="solid")
-    white_font = Font(color="FFFFFF", bold=True)
-    border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    center_align = Alignment(horizontal="center")
-    
-    # Cabecera élégante
-    ws.merge_cells('A1:L1')
-    cell_title = ws['A1']
-    cell_title.value = f"LIBRO DE VENTAS - {request.empresa.nombre.upper()}"
-    cell_title.font = Font(size=16, bold=True, color="8B7355")
-    cell_title.alignment = center_align
-    
-    ws.merge_cells('A2:L2')
-    ws['A2'] = f"PERIODO: DE {fecha_desde} A {fecha_hasta}"
-    ws['A2'].alignment = center_align
-    ws['A2'].font = Font(size=11, italic=True)
+    def filas_dtes():
+        for d in iterar(dtes.order_by('-fecha_emision', '-folio')):
+            monto_factor = -1 if d.tipo_dte == '61' else 1
+            yield {
+                'fecha': d.fecha_emision,
+                'tipo': d.get_tipo_dte_display(),
+                'folio': d.folio or '-',
+                'rut': d.rut_receptor or '-',
+                'nombre': d.razon_social_receptor or 'Cliente General',
+                'neto': (d.monto_neto or 0) * monto_factor,
+                'iva': (d.monto_iva or 0) * monto_factor,
+                'total': (d.monto_total or 0) * monto_factor,
+                'estado': d.estado_sii.upper() if d.estado_sii else 'GENERADO',
+                'vendedor': (d.venta.vendedor.nombre if d.venta and d.venta.vendedor else 'Sin asignar'),
+                'vendedor_cod': (d.venta.vendedor.codigo if d.venta and d.venta.vendedor else '-'),
+                'sucursal': (d.venta.sucursal.nombre if d.venta and d.venta.sucursal else 'Casa Matriz')
+            }
 
-    # Encabezados de tabla
-    headers = ["FECHA", "TIPO DOCTO", "FOLIO", "RUT CLIENTE", "CLIENTE / RAZÓN SOCIAL", "NETO", "IVA", "TOTAL", "ESTADO SII", "VENDEDOR", "COD. VENDEDOR", "SUCURSAL"]
-    for col, text in enumerate(headers, 1):
-        cell = ws.cell(row=4, column=col)
-        cell.value = text
-        cell.fill = header_fill
-        cell.font = white_font
-        cell.alignment = center_align
-        cell.border = border
+    total_documentos = ventas.count() + dtes.count()
+    documentos = heapq.merge(
+        filas_ventas(), filas_dtes(), key=lambda x: (x['fecha'], sort_folio(x['folio'])), reverse=True
+    )
 
-    # Cuerpo de datos
-    current_row = 5
+    # --- GENERACION EXCEL (write-only) ---
+    miles = '#,##0'
+    excel = ExportacionExcel(
+        "Libro de Ventas",
+        f"LIBRO DE VENTAS - {empresa.nombre.upper()}",
+        [
+            Columna("FECHA", 12, centrado=True),
+            Columna("TIPO DOCTO", 18),
+            Columna("FOLIO", 10, centrado=True),
+            Columna("RUT CLIENTE", 15, centrado=True),
+            Columna("CLIENTE / RAZÓN SOCIAL", 45),
+            Columna("NETO", 14, miles),
+            Columna("IVA", 14, miles),
+            Columna("TOTAL", 14, miles),
+            Columna("ESTADO SII", 15, centrado=True),
+            Columna("VENDEDOR", 25),
+            Columna("COD. VENDEDOR", 15, centrado=True),
+            Columna("SUCURSAL", 20),
+        ],
+        subtitulo=f"PERIODO: DE {fecha_desde} A {fecha_hasta}",
+    )
+
+    # Título, período, fila en blanco y encabezados: los datos parten en la fila 5
+    escritos = 0
     for doc in documentos:
-        ws.cell(row=current_row, column=1, value=doc['fecha'].strftime('%d/%m/%Y')).alignment = center_align
-        ws.cell(row=current_row, column=2, value=doc['tipo'].upper())
-        ws.cell(row=current_row, column=3, value=doc['folio']).alignment = center_align
-        ws.cell(row=current_row, column=4, value=doc['rut']).alignment = center_align
-        ws.cell(row=current_row, column=5, value=doc['nombre'].upper())
-        
-        cell_neto = ws.cell(row=current_row, column=6, value=float(doc['neto']))
-        cell_iva = ws.cell(row=current_row, column=7, value=float(doc['iva']))
-        cell_total = ws.cell(row=current_row, column=8, value=float(doc['total']))
-        
-        for cell in [cell_neto, cell_iva, cell_total]:
-            cell.number_format = '#,##0'
-            cell.alignment = Alignment(horizontal="right")
-        
-        ws.cell(row=current_row, column=9, value=doc['estado']).alignment = center_align
-        ws.cell(row=current_row, column=10, value=doc['vendedor'].upper())
-        ws.cell(row=current_row, column=11, value=doc['vendedor_cod']).alignment = center_align
-        ws.cell(row=current_row, column=12, value=doc['sucursal'].upper())
-        
-        # Bordes suaves para filas
-        for col in range(1, 13):
-            ws.cell(row=current_row, column=col).border = border
-            
-        current_row += 1
+        excel.fila([
+            doc['fecha'].strftime('%d/%m/%Y'),
+            doc['tipo'].upper(),
+            doc['folio'],
+            doc['rut'],
+            doc['nombre'].upper(),
+            float(doc['neto']),
+            float(doc['iva']),
+            float(doc['total']),
+            doc['estado'],
+            doc['vendedor'].upper(),
+            doc['vendedor_cod'],
+            doc['sucursal'].upper(),
+        ])
+        escritos += 1
+        if escritos % 500 == 0:
+            progreso(escritos, total_documentos)
 
     # Fila de Totales
-    ws.cell(row=current_row+1, column=5, value="TOTALES GENERALES:").font = Font(bold=True)
-    ws.cell(row=current_row+1, column=5).alignment = Alignment(horizontal="right")
-    
-    for col_idx, col_let in enumerate(['F', 'G', 'H'], 6):
-        # La fórmula suma desde row 5 hasta current_row-1
-        formula = f"=SUM({col_let}5:{col_let}{current_row-1})"
-        cell_sum = ws.cell(row=current_row+1, column=col_idx, value=formula)
-        cell_sum.font = Font(bold=True)
-        cell_sum.number_format = '#,##0'
-        cell_sum.border = border
-        cell_sum.alignment = Alignment(horizontal="right")
+    ultima_fila = 4 + escritos
+    excel.espacio()
+    excel.total(
+        [None, None, None, None, "TOTALES GENERALES:"]
+        + [f"=SUM({columna}5:{columna}{ultima_fila})" for columna in ('F', 'G', 'H')]
+        + [None, None, None, None]
+    )
 
-    # Ajuste automático de anchos
-    widths = [12, 18, 10, 15, 45, 14, 14, 14, 15, 25, 15, 20]
-    for i, width in enumerate(widths, 1):
-        ws.column_dimensions[chr(64 + i) if i <= 26 else 'A' + chr(64 + i - 26)].width = width
-
-    # Retornar el archivo
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    filename = f"LibroVentas_{request.empresa.nombre.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    wb.save(response)
-    
-    return response
+    # Retornar el archivo (temporal en disco, no en memoria)
+    filename = f"LibroVentas_{empresa.nombre.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.xlsx"
+    return filename, CONTENT_TYPE_XLSX, excel.archivo()
 
 
 @login_required
@@ -6116,7 +5820,7 @@ def api_procesar_factura_consolidada(request):
         # Consolidados de ítems
         items_consolidados = {} # {articulo_id: {'articulo': obj, 'cantidad': X, 'precio_unitario': Y}}
         
-        for guia in guias:
+        for guia in guias.prefetch_related('ventadetalle_set__articulo'):
             for detalle in guia.ventadetalle_set.all():
                 art_id = detalle.articulo_id
                 if art_id in items_consolidados:
@@ -6161,16 +5865,12 @@ def api_procesar_factura_consolidada(request):
             estacion_trabajo=estacion
         )
 
-        # Crear detalles consolidados
-        for item in items_consolidados.values():
-            VentaDetalle.objects.create(
-                venta=nueva_venta,
-                articulo=item['articulo'],
-                cantidad=item['cantidad'],
-                precio_unitario=item['precio_unitario']
-            )
-
-        nueva_venta.calcular_totales()
+        # Crear detalles consolidados (un bulk_create y un solo cálculo de totales)
+        from .documentos import LineaVenta, crear_detalles
+        crear_detalles(nueva_venta, [
+            LineaVenta(item['articulo'], item['cantidad'], item['precio_unitario'])
+            for item in items_consolidados.values()
+        ])
 
         # Generar DTE
         dte_service = DTEService(request.empresa)
@@ -259,23 +259,15 @@ def procesar_venta_pos_directo(request, ticket_id):
                 dte_generado=dte
             )
             
-            # 5. Descontar stock
-            from inventario.models import Stock
+            # 5. Descontar stock (un solo posteo por documento, idempotente por venta)
+            from inventario.services import descontar_stock_venta
             
             bodega_caja = apertura_activa.caja.bodega
-            for detalle in ticket.ventadetalle_set.all():
-                stock = Stock.objects.filter(
-                    empresa=empresa,
-                    bodega=bodega_caja,
-                    articulo=detalle.articulo
-                ).first()
-                
-                if stock:
-                    stock.cantidad -= detalle.cantidad
-                    stock.save()
-                    print(f"[POS DIRECTO] Stock descontado: {detalle.articulo.nombre} - {detalle.cantidad}")
-                else:
-                    print(f"[POS DIRECTO] ADVERTENCIA: No se encontró stock para {detalle.articulo.nombre} en bodega {bodega_caja.nombre}")
+            if bodega_caja:
+                movimientos = descontar_stock_venta(ticket, bodega_caja)
+                print(f"[POS DIRECTO] Stock descontado: {movimientos} movimientos en bodega {bodega_caja.nombre}")
+            else:
+                print(f"[POS DIRECTO] ADVERTENCIA: La caja no tiene bodega asociada, no se descuenta stock")
             
             # 6. Marcar ticket como facturado
             ticket.facturado = True
@@ -287,9 +279,8 @@ def procesar_venta_pos_directo(request, ticket_id):
                 try:
                     estacion = EstacionTrabajo.objects.get(id=estacion_id, empresa=empresa)
                     if estacion.enviar_sii_directo:
-                        from facturacion_electronica.background_sender import get_background_sender
-                        sender = get_background_sender()
-                        if sender.enviar_dte(dte.id, empresa.id):
+                        from facturacion_electronica.cola_envio import encolar_dte
+                        if encolar_dte(dte.id, empresa.id):
                             print("[POS DIRECTO] DTE agregado a cola de envío")
                 except Exception as e_envio:
                     print(f"[POS DIRECTO] Error al enviar DTE: {e_envio}")